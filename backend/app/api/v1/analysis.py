@@ -2,6 +2,7 @@
 AI分析相关API路由
 """
 from fastapi import APIRouter, HTTPException, Path, Depends, Body, Query
+from fastapi.responses import StreamingResponse
 from typing import Dict, Any, Optional, List
 import logging
 import uuid
@@ -12,6 +13,10 @@ from app.utils.database import get_database
 from app.models.analysis import AnalysisRequest, TaskStatus, AnalysisRecord
 from app.tasks.ai_analysis import analyze_performance_task
 from app.services.ai_config import ai_config_manager
+from app.services.ai_analyzer import performance_analyzer
+from app.services.analysis_progress import stream_analysis_events
+from app.services.record_store import RecordStore
+from app.services.project_service import ProjectService
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +35,7 @@ async def analyze_performance(
     logger.info(f"收到性能记录分析请求: {performance_record_id}, 服务: {request.ai_service}")
     
     # 检查性能记录是否存在
-    performance_record = await db.performance_records.find_one({"trace_id": performance_record_id})
+    performance_record = await RecordStore(db).find_by_trace_id(performance_record_id)
     if not performance_record:
         logger.warning(f"性能记录不存在: {performance_record_id}")
         raise HTTPException(status_code=404, detail=f"性能记录不存在: {performance_record_id}")
@@ -38,8 +43,8 @@ async def analyze_performance(
     # 处理AI服务名称
     ai_service_name = request.ai_service
     if ai_service_name == "default":
-        # 从数据库加载最新的配置并使用默认服务
-        await ai_config_manager._load_from_database(db)
+        # 配置有变更时重新加载，并使用默认服务
+        await ai_config_manager.refresh_from_database(db)
         ai_service_name = ai_config_manager.default_service
         logger.info(f"使用默认AI服务: {ai_service_name}")
     else:
@@ -58,6 +63,40 @@ async def analyze_performance(
     # 创建分析ID
     analysis_id = f"analysis_{performance_record_id}_{int(datetime.utcnow().timestamp())}"
     
+    # 相似性能特征已有分析结果时直接返回，不再调用AI服务
+    if request.use_cache:
+        cached = await performance_analyzer.find_cached_analysis(performance_record, ai_service_name)
+        if cached:
+            now = datetime.utcnow()
+            await db.ai_analysis_results.insert_one({
+                "analysis_id": analysis_id,
+                "performance_record_id": performance_record_id,
+                "project_key": performance_record.get("project_key"),
+                "ai_service": ai_service_name,
+                "status": "SUCCESS",
+                "created_at": now,
+                "updated_at": now,
+                "results": {**cached["results"], "source": "cache"},
+                "task_id": "",
+                "priority": request.priority.value,
+                "analysis_type": "ai_analysis",
+                "cache": {
+                    "fingerprint": cached["fingerprint"],
+                    "similarity": cached["similarity"],
+                    "cached_at": cached["cached_at"]
+                }
+            })
+            logger.info(f"分析结果命中缓存: {analysis_id}, 相似度: {cached['similarity']}")
+            
+            return success_response({
+                "analysis_id": analysis_id,
+                "task_id": None,
+                "status": "SUCCESS",
+                "cache_hit": True,
+                "similarity": cached["similarity"],
+                "cached_at": cached["cached_at"].isoformat() if cached["cached_at"] else None
+            })
+    
     # 异步触发实际的分析任务
     # 将任务发送到Celery任务队列中处理
     try:
@@ -70,7 +109,8 @@ async def analyze_performance(
                 request.priority.value
             ],
             kwargs={
-                "analysis_id": analysis_id  # 传入analysis_id作为参数
+                "analysis_id": analysis_id,  # 传入analysis_id作为参数
+                "use_cache": request.use_cache
             }
         )
         
@@ -100,6 +140,8 @@ async def analyze_performance(
             "analysis_id": analysis_id,
             "task_id": task_id,
             "status": "PENDING",
+            "cache_hit": False,
+            "stream_url": f"/api/v1/analysis/stream/{analysis_id}",
             "estimated_completion": (datetime.utcnow() + timedelta(minutes=2)).isoformat()
         })
         
@@ -108,6 +150,27 @@ async def analyze_performance(
         raise HTTPException(status_code=500, detail=f"创建分析任务失败: {str(e)}")
 
 
+@router.get("/stream/{analysis_id}")
+async def stream_analysis(
+    analysis_id: str = Path(..., description="分析ID"),
+    db = Depends(get_database)
+):
+    """
+    以SSE推送分析进度和部分结果
+    
+    事件类型: partial（部分结果）、completed（完整结果）、failed（分析失败）
+    """
+    analysis = await db.ai_analysis_results.find_one({"analysis_id": analysis_id}, {"_id": 1})
+    if not analysis:
+        raise HTTPException(status_code=404, detail=f"分析记录不存在: {analysis_id}")
+    
+    return StreamingResponse(
+        stream_analysis_events(analysis_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/task-status/{task_id}")
 async def get_task_status(
     task_id: str = Path(..., description="任务ID"),
@@ -218,16 +281,15 @@ async def get_all_analysis_history(
     skip = (page - 1) * size
     cursor = db.ai_analysis_results.find(query).sort("created_at", -1).skip(skip).limit(size)
     
+    docs = await cursor.to_list(None)
+    
+    # 一次查询获取本页所有相关项目的名称
+    project_names = await ProjectService().get_project_names([doc.get("project_key") for doc in docs])
+    
     records = []
-    async for record in cursor:
+    for record in docs:
         # 获取相关项目信息
-        project_key = record.get("project_key")
-        project_name = "未知项目"
-        
-        if project_key:
-            project = await db.projects.find_one({"project_key": project_key})
-            if project:
-                project_name = project.get("name", "未知项目")
+        project_name = project_names.get(record.get("project_key")) or "未知项目"
         
         # 将MongoDB对象转换为可序列化的字典
         record_dict = {k: v for k, v in record.items() if k != "_id"}
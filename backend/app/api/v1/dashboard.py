@@ -61,15 +61,17 @@ async def get_recent_projects(limit: int = 5):
         # 获取最近活跃的项目
         projects, _ = await project_service.get_projects(page=1, size=limit)
         
-        # 获取每个项目的记录数
+        # 一次聚合查询获取所有项目的记录数
+        record_counts = await performance_service.get_record_counts_by_projects(
+            [project.project_key for project in projects]
+        )
         result = []
         for project in projects:
-            record_count = await performance_service.get_record_count_by_project(project.project_key)
             result.append({
                 "key": project.project_key,
                 "name": project.name,
                 "status": project.status,
-                "recordCount": record_count
+                "recordCount": record_counts.get(project.project_key, 0)
             })
         
         return success_response(data=result)
@@ -1,16 +1,22 @@
 """
 性能数据收集和查询API路由
 """
-from fastapi import APIRouter, HTTPException, Query, Header, Depends
+from fastapi import APIRouter, HTTPException, Query, Header, Depends, Response
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from datetime import datetime, timedelta
 import json
 import logging
 
 from app.utils.response import success_response, error_response, ErrorCode
-from app.models.performance import PerformanceRecord, PerformanceRecordCreate
+from app.models.performance import PerformanceRecord, PerformanceRecordCreate, ProfileAggregateBatch
 from app.services.performance_service import PerformanceService
 from app.services.project_service import ProjectService
+from app.services.regression_service import RegressionService
+from app.services.anomaly_service import anomaly_detector
+from app.services.auto_analysis_service import AutoAnalysisService
+from app.utils.flamegraph import FLAME_GRAPH_FORMATS
+from app.utils.routes import canonical_route, route_key, path_prefix_filter, MAX_PATH_FILTER_LENGTH
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -64,6 +70,35 @@ async def collect_performance_data(
         )
 
 
+@router.get("/config", summary="SDK拉取项目配置")
+async def get_sdk_config(
+    x_project_key: str = Header(..., alias="X-Project-Key", description="项目密钥"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match", description="SDK缓存的配置版本")
+):
+    """SDK轮询项目配置，配置未变化时返回304"""
+    try:
+        project_service = ProjectService()
+        sdk_config = await project_service.get_sdk_config(x_project_key)
+        if not sdk_config:
+            return error_response(
+                ErrorCode.INVALID_PROJECT_KEY,
+                "无效的项目密钥"
+            )
+        
+        etag = f'"{sdk_config["version"]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match and if_none_match.strip() == etag:
+            return Response(status_code=304, headers=headers)
+        
+        return JSONResponse(content=success_response(data=sdk_config), headers=headers)
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"获取SDK配置失败: {str(e)}"
+        )
+
+
 @router.get("/records", summary="查询性能记录")
 async def get_performance_records(
     project_key: str = Query(..., description="项目密钥"),
@@ -71,7 +106,8 @@ async def get_performance_records(
     size: int = Query(20, ge=1, le=100, description="每页数量"),
     start_time: Optional[datetime] = Query(None, description="开始时间"),
     end_time: Optional[datetime] = Query(None, description="结束时间"),
-    path: Optional[str] = Query(None, description="请求路径"),
+    path: Optional[str] = Query(None, max_length=MAX_PATH_FILTER_LENGTH, description="请求路径前缀（不区分大小写）"),
+    route: Optional[str] = Query(None, max_length=MAX_PATH_FILTER_LENGTH, description="路由模板，如 /users/{id}"),
     method: Optional[str] = Query(None, description="HTTP方法"),
     min_duration: Optional[float] = Query(None, description="最小耗时（秒）"),
     max_duration: Optional[float] = Query(None, description="最大耗时（秒）"),
@@ -100,7 +136,12 @@ async def get_performance_records(
             filters["timestamp"] = time_filter
         
         if path:
-            filters["request_info.path"] = {"$regex": path, "$options": "i"}
+            path_filter = path_prefix_filter(path)
+            if path_filter:
+                filters["request_info.normalized_path"] = path_filter
+        
+        if route:
+            filters["request_info.route"] = canonical_route(route)
         
         if method:
             filters["request_info.method"] = method
@@ -129,14 +170,15 @@ async def get_performance_records(
                 "records": [
                     {
                         "trace_id": record.trace_id,
-                        "request_path": record.request_info.path if hasattr(record.request_info, "path") else "",
-                        "request_method": record.request_info.method if hasattr(record.request_info, "method") else "GET",
-                        "duration": record.performance_metrics.total_duration if hasattr(record.performance_metrics, "total_duration") else 0,
-                        "cpu_time": record.performance_metrics.cpu_time if hasattr(record.performance_metrics, "cpu_time") else 0,
-                        "memory_peak": record.performance_metrics.memory_usage.peak_memory if hasattr(record.performance_metrics, "memory_usage") and hasattr(record.performance_metrics.memory_usage, "peak_memory") else 0,
-                        "status_code": record.response_info.status_code if hasattr(record.response_info, "status_code") else 200,
+                        "request_path": record.path,
+                        "request_method": record.method,
+                        "request_route": route_key(record.path, record.route),
+                        "duration": record.duration,
+                        "cpu_time": record.cpu_time,
+                        "memory_peak": record.memory_peak,
+                        "status_code": record.status_code,
                         "timestamp": record.timestamp.isoformat(),
-                        "function_call_count": len(record.function_calls) if record.function_calls else 0
+                        "function_call_count": record.function_call_count
                     }
                     for record in records
                 ],
@@ -177,6 +219,7 @@ async def get_performance_record_detail(trace_id: str):
                 "function_calls": record.function_calls,
                 "version_info": record.version_info,
                 "environment": record.environment,
+                "local_analysis": record.local_analysis,
                 "timestamp": record.timestamp.isoformat(),
                 "created_at": record.created_at.isoformat()
             }
@@ -329,6 +372,224 @@ async def get_slow_functions(
         )
 
 
+@router.get("/flamegraph/{project_key}", summary="获取合并火焰图")
+async def get_flame_graph(
+    project_key: str,
+    path: Optional[str] = Query(None, description="请求路径，为空时合并项目全部路由"),
+    method: Optional[str] = Query(None, description="请求方法"),
+    time_range: str = Query("24h", description="时间范围: 1h/6h/24h/7d/30d"),
+    start_time: Optional[datetime] = Query(None, description="开始时间，指定后忽略time_range"),
+    end_time: Optional[datetime] = Query(None, description="结束时间"),
+    format: str = Query("tree", description="输出格式: tree/collapsed/speedscope"),
+    min_weight: float = Query(0.001, ge=0, le=1, description="节点最小耗时占比，低于该值的节点被合并到父节点")
+):
+    """获取项目/路由在指定时间范围内跨请求合并的火焰图"""
+    try:
+        # 验证项目
+        project_service = ProjectService()
+        project = await project_service.get_project_by_key(project_key)
+        if not project:
+            return error_response(
+                ErrorCode.PROJECT_NOT_FOUND,
+                "项目不存在"
+            )
+        
+        if format not in FLAME_GRAPH_FORMATS:
+            return error_response(
+                ErrorCode.PARAMETER_ERROR,
+                "无效的输出格式"
+            )
+        
+        if start_time is None:
+            time_range_map = {
+                "1h": timedelta(hours=1),
+                "6h": timedelta(hours=6),
+                "24h": timedelta(hours=24),
+                "7d": timedelta(days=7),
+                "30d": timedelta(days=30)
+            }
+            if time_range not in time_range_map:
+                return error_response(
+                    ErrorCode.PARAMETER_ERROR,
+                    "无效的时间范围"
+                )
+            start_time = datetime.utcnow() - time_range_map[time_range]
+        
+        performance_service = PerformanceService()
+        flame_graph = await performance_service.get_flame_graph(
+            project_key=project_key,
+            start_time=start_time,
+            end_time=end_time,
+            path=path,
+            method=method.upper() if method else None,
+            output_format=format,
+            min_weight=min_weight
+        )
+        
+        return success_response(data=flame_graph)
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"获取火焰图失败: {str(e)}"
+        )
+
+
+@router.get("/diff/{project_key}", summary="版本/时间窗口性能对比")
+async def compare_performance(
+    project_key: str,
+    path: str = Query(..., description="请求路径"),
+    method: Optional[str] = Query(None, description="请求方法"),
+    baseline_version: Optional[str] = Query(None, description="基线应用版本号"),
+    baseline_commit: Optional[str] = Query(None, description="基线Git提交"),
+    baseline_start: Optional[datetime] = Query(None, description="基线开始时间"),
+    baseline_end: Optional[datetime] = Query(None, description="基线结束时间"),
+    target_version: Optional[str] = Query(None, description="对比应用版本号"),
+    target_commit: Optional[str] = Query(None, description="对比Git提交"),
+    target_start: Optional[datetime] = Query(None, description="对比开始时间"),
+    target_end: Optional[datetime] = Query(None, description="对比结束时间"),
+    hot_threshold: float = Query(0.01, gt=0, le=1, description="热点帧的最小耗时占比"),
+    limit: int = Query(50, ge=1, le=500, description="返回的函数数量")
+):
+    """对比同一路由在两个版本（或两个时间窗口）之间的函数耗时、热点帧和响应时间分位数变化"""
+    try:
+        # 验证项目
+        project_service = ProjectService()
+        project = await project_service.get_project_by_key(project_key)
+        if not project:
+            return error_response(
+                ErrorCode.PROJECT_NOT_FOUND,
+                "项目不存在"
+            )
+        
+        baseline = {
+            "app_version": baseline_version,
+            "git_commit": baseline_commit,
+            "start_time": baseline_start,
+            "end_time": baseline_end
+        }
+        target = {
+            "app_version": target_version,
+            "git_commit": target_commit,
+            "start_time": target_start,
+            "end_time": target_end
+        }
+        if baseline == target:
+            return error_response(
+                ErrorCode.PARAMETER_ERROR,
+                "基线与对比条件相同"
+            )
+        
+        # 未指定时间范围的按版本对比默认查询最近30天
+        default_start = datetime.utcnow() - timedelta(days=30)
+        for side in (baseline, target):
+            if side["start_time"] is None:
+                side["start_time"] = default_start
+        
+        performance_service = PerformanceService()
+        result = await performance_service.compare_profiles(
+            project_key=project_key,
+            path=path,
+            method=method.upper() if method else None,
+            baseline={k: v for k, v in baseline.items() if v is not None},
+            target={k: v for k, v in target.items() if v is not None},
+            hot_threshold=hot_threshold,
+            limit=limit
+        )
+        
+        return success_response(data=result)
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"性能对比失败: {str(e)}"
+        )
+
+
+@router.get("/regressions/{project_key}", summary="获取性能回归事件")
+async def get_regression_events(
+    project_key: str,
+    status: Optional[str] = Query(None, description="事件状态: open/resolved"),
+    limit: int = Query(50, ge=1, le=200, description="返回数量限制")
+):
+    """获取部署后自动检测到的性能回归事件"""
+    try:
+        # 验证项目
+        project_service = ProjectService()
+        project = await project_service.get_project_by_key(project_key)
+        if not project:
+            return error_response(
+                ErrorCode.PROJECT_NOT_FOUND,
+                "项目不存在"
+            )
+        
+        regression_service = RegressionService()
+        events = await regression_service.get_events(project_key, status, limit)
+        
+        return success_response(data={"events": events})
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"获取回归事件失败: {str(e)}"
+        )
+
+
+@router.get("/anomalies/{project_key}", summary="获取实时异常区间")
+async def get_anomalies(
+    project_key: str,
+    status: Optional[str] = Query(None, description="异常状态: open/closed"),
+    limit: int = Query(50, ge=1, le=200, description="返回数量限制")
+):
+    """获取数据上报时实时检测到的P95响应时间和5xx错误率异常区间"""
+    try:
+        # 验证项目
+        project_service = ProjectService()
+        project = await project_service.get_project_by_key(project_key)
+        if not project:
+            return error_response(
+                ErrorCode.PROJECT_NOT_FOUND,
+                "项目不存在"
+            )
+        
+        anomalies = await anomaly_detector.get_anomalies(project_key, status, limit)
+        
+        return success_response(data={"anomalies": anomalies})
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"获取异常区间失败: {str(e)}"
+        )
+
+
+@router.get("/alerts/{project_key}", summary="获取阈值告警")
+async def get_alerts(
+    project_key: str,
+    limit: int = Query(50, ge=1, le=200, description="返回数量限制")
+):
+    """获取按小时rollup检查的P95响应时间和错误率超过项目告警阈值的记录"""
+    try:
+        # 验证项目
+        project_service = ProjectService()
+        project = await project_service.get_project_by_key(project_key)
+        if not project:
+            return error_response(
+                ErrorCode.PROJECT_NOT_FOUND,
+                "项目不存在"
+            )
+        
+        alerts = await AutoAnalysisService().get_alerts(project_key, limit)
+        
+        return success_response(data={"alerts": alerts})
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"获取告警失败: {str(e)}"
+        )
+
+
 @router.post("/batch", summary="批量性能数据上报")
 async def batch_collect_performance_data(
     batch_data: dict,
@@ -398,3 +659,45 @@ async def batch_collect_performance_data(
             ErrorCode.SYSTEM_ERROR,
             f"批量性能数据收集失败: {str(e)}"
         )
+
+
+@router.post("/aggregates", summary="聚合性能数据上报")
+async def collect_profile_aggregates(
+    batch: ProfileAggregateBatch,
+    x_project_key: str = Header(..., alias="X-Project-Key", description="项目密钥")
+):
+    """接收SDK聚合模式下按窗口上报的调用栈聚合数据"""
+    try:
+        # 验证项目密钥
+        project_service = ProjectService()
+        project = await project_service.get_project_by_key(x_project_key)
+        if not project:
+            return error_response(
+                ErrorCode.INVALID_PROJECT_KEY,
+                "无效的项目密钥"
+            )
+        
+        if not getattr(project.config, "enabled", True):
+            return error_response(
+                ErrorCode.PERMISSION_ERROR,
+                "项目监控已禁用"
+            )
+        
+        performance_service = PerformanceService()
+        saved_count = await performance_service.save_profile_aggregates(
+            x_project_key,
+            batch.aggregates
+        )
+        
+        await project_service.update_last_activity(x_project_key)
+        
+        return success_response(
+            data={"saved_count": saved_count},
+            msg=f"聚合性能数据收集成功，共保存{saved_count}条聚合数据"
+        )
+        
+    except Exception as e:
+        return error_response(
+            ErrorCode.SYSTEM_ERROR,
+            f"聚合性能数据收集失败: {str(e)}"
+        )
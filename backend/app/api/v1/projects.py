@@ -9,6 +9,9 @@ from datetime import datetime, timedelta
 
 from app.utils.response import success_response, error_response
 from app.utils.database import get_database
+from app.models.project import ProjectConfig
+from app.services.project_service import ProjectService
+from app.services.record_store import RecordStore
 
 logger = logging.getLogger(__name__)
 
@@ -153,10 +156,19 @@ async def update_project(
         if field in project_data:
             update_data[field] = project_data[field]
     
+    # 项目配置在现有配置基础上合并并校验
+    if isinstance(project_data.get("config"), dict):
+        try:
+            merged_config = {**(project.get("config") or {}), **project_data["config"]}
+            update_data["config"] = ProjectConfig(**merged_config).dict()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"项目配置无效: {str(e)}")
+    
     await db.projects.update_one(
         {"project_key": project_key},
         {"$set": update_data}
     )
+    await ProjectService().invalidate_sdk_config(project_key)
     
     # 获取更新后的项目
     updated_project = await db.projects.find_one({"project_key": project_key})
@@ -187,6 +199,7 @@ async def delete_project(
     
     # 删除项目
     await db.projects.delete_one({"project_key": project_key})
+    await ProjectService().invalidate_sdk_config(project_key)
     
     return success_response({"message": "项目删除成功"})
 
@@ -206,12 +219,13 @@ async def get_project_stats(
         raise HTTPException(status_code=404, detail=f"项目不存在: {project_key}")
     
     # 查询性能记录总数
-    performance_count = await db.performance_records.count_documents({"project_key": project_key})
+    record_store = RecordStore(db)
+    performance_count = await record_store.count({"project_key": project_key})
     
     # 查询最近24小时的请求数
     today = datetime.utcnow()
     yesterday = today - timedelta(days=1)
-    today_requests = await db.performance_records.count_documents({
+    today_requests = await record_store.count({
         "project_key": project_key,
         "timestamp": {"$gte": yesterday}
     })
@@ -224,11 +238,11 @@ async def get_project_stats(
             "avg_response_time": {"$avg": "$performance_metrics.total_duration"}
         }}
     ]
-    avg_result = await db.performance_records.aggregate(pipeline).to_list(1)
+    avg_result = await record_store.aggregate(pipeline)
     avg_response_time = avg_result[0]["avg_response_time"] if avg_result else 0
     
     # 查询错误率
-    error_count = await db.performance_records.count_documents({
+    error_count = await record_store.count({
         "project_key": project_key,
         "response_info.status_code": {"$gte": 400}
     })
@@ -12,6 +12,8 @@ from pydantic import BaseModel
 from app.utils.response import success_response, error_response
 from app.utils.database import get_database
 from app.config.settings import settings
+from app.utils.cache import clear_cache as purge_cache, get_cache_metrics
+from app.services.ai_config import ai_config_manager
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -38,6 +40,9 @@ class AISettings(BaseModel):
     temperature: float = 0.7
     requestTimeout: int = 30
     autoAnalysis: bool = False
+    requestsPerMinute: int = 60
+    tokensPerMinute: int = 0
+    maxConcurrency: int = 8
 
 class NotificationSettings(BaseModel):
     emailEnabled: bool
@@ -156,14 +161,19 @@ async def update_settings(settings_data: SystemSettings, db = Depends(get_databa
             "updated_at": datetime.utcnow()
         }
         
+        # 递增配置版本号，各进程据此判断是否需要重新加载AI配置
         if current_settings:
-            await db.system_config.update_one(
-                {"config_key": "platform_settings"}, 
-                {"$set": update_data}
-            )
+            if current_settings.get("config_value") != settings_dict:
+                await db.system_config.update_one(
+                    {"config_key": "platform_settings"}, 
+                    {"$set": update_data, "$inc": {"version": 1}}
+                )
+                ai_config_manager.invalidate()
         else:
             update_data["created_at"] = datetime.utcnow()
+            update_data["version"] = 1
             await db.system_config.insert_one(update_data)
+            ai_config_manager.invalidate()
         
         return success_response({"success": True})
         
@@ -313,11 +323,12 @@ async def clear_cache(db = Depends(get_database)):
     logger.info("清理缓存")
     
     try:
-        # 实际应用中应该执行实际的缓存清理操作
-        # 这里模拟清理成功
+        deleted = await purge_cache()
+        logger.info(f"缓存清理完成, 删除键数量: {deleted}")
         return success_response({
             "success": True,
-            "message": "缓存清理成功"
+            "message": "缓存清理成功",
+            "deleted": deleted
         })
         
     except Exception as e:
@@ -325,6 +336,22 @@ async def clear_cache(db = Depends(get_database)):
         return error_response(500, f"清理缓存失败: {str(e)}")
 
 
+# 缓存命中统计
+@router.get("/cache-stats")
+async def get_cache_stats():
+    logger.info("获取缓存命中统计")
+    
+    try:
+        return success_response({
+            "pid": os.getpid(),
+            **get_cache_metrics()
+        })
+        
+    except Exception as e:
+        logger.error(f"获取缓存命中统计失败: {str(e)}")
+        return error_response(500, f"获取缓存命中统计失败: {str(e)}")
+
+
 # 导出配置
 @router.get("/export")
 async def export_config(db = Depends(get_database)):
@@ -381,9 +408,10 @@ async def import_config(
         
         await db.system_config.update_one(
             {"config_key": "platform_settings"},
-            {"$set": update_data},
+            {"$set": update_data, "$inc": {"version": 1}},
             upsert=True
         )
+        ai_config_manager.invalidate()
         
         return success_response({
             "success": True,
@@ -25,12 +25,73 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     aliyun_qianwen_api_key: str = ""
     ai_service_timeout: int = 30
+    ai_batch_max_in_flight: int = 32  # 批量分析时单个worker同时进行的分析数
+    ai_rate_limit_burst_seconds: int = 10  # 令牌桶容量（可突发的秒数）
+    ai_http2_enabled: bool = True  # 安装h2时对AI服务启用HTTP/2
+    ai_http_max_connections: int = 50  # 每个AI服务端点的最大连接数
+    ai_http_max_keepalive_connections: int = 20  # 保持的空闲连接数
+    ai_http_keepalive_expiry: float = 60.0  # 空闲连接保持时间（秒）
+    ai_http_connect_timeout: float = 10.0  # 建立连接超时（秒）
+    ai_analysis_cache_enabled: bool = True  # 复用相似性能特征的AI分析结果
+    ai_analysis_cache_ttl_hours: int = 168  # 分析结果缓存时间（小时）
+    ai_analysis_cache_similarity: float = 0.85  # 复用缓存的最低相似度
+    ai_prompt_call_tree_tokens: int = 1500  # 提示词中调用树摘要的token预算
+    ai_prompt_top_frames: int = 10  # 提示词中列出的自身耗时最多的函数数
+    ai_tiktoken_cache_dir: str = ""  # tiktoken编码文件缓存目录，离线部署时预置cl100k_base编码文件
+    
+    # 本地规则分析配置
+    local_analysis_enabled: bool = True  # 数据上报时运行规则分析
+    local_analysis_n_plus_one_min_calls: int = 5  # 同一父调用下重复调用次数达到该值视为N+1
+    local_analysis_serialization_min_calls: int = 3  # 单个请求中序列化次数达到该值视为重复序列化
+    local_analysis_min_share: float = 0.05  # N+1/序列化合计耗时占比的最低值
+    local_analysis_hotspot_min_share: float = 0.1  # 自身耗时占比达到该值视为热点
+    local_analysis_cpu_bound_ratio: float = 0.7  # CPU时间占比达到该值视为CPU密集
+    local_analysis_io_bound_ratio: float = 0.3  # CPU时间占比低于该值视为I/O等待为主
+    local_analysis_ai_min_duration: float = 0.5  # 需要AI分析的最短响应时间（秒）
+    local_analysis_explained_threshold: float = 0.6  # 规则解释的耗时占比低于该值时需要AI分析
     
     # 监控配置
     default_sampling_rate: float = 0.3
     max_batch_size: int = 100
     async_send_timeout: int = 5
     
+    # 回归检测配置
+    regression_baseline_days: int = 7  # 基线窗口（部署前天数）
+    regression_detection_hours: int = 24  # 部署后持续检测的小时数
+    regression_min_samples: int = 30  # 基线和部署后各自的最少请求数
+    regression_z_threshold: float = 3.0  # Mann-Whitney检验的z值阈值
+    regression_min_increase: float = 0.1  # 响应时间最小相对增幅（噪声容忍度）
+    
+    # 实时异常检测配置
+    anomaly_window_seconds: int = 30  # 检测窗口长度
+    anomaly_min_requests: int = 20  # 窗口内最少请求数
+    anomaly_warmup_windows: int = 5  # 基线预热所需窗口数
+    anomaly_smoothing: float = 0.1  # EWMA平滑系数
+    anomaly_z_threshold: float = 4.0  # 偏离基线的标准差倍数
+    anomaly_min_increase: float = 0.5  # P95最小相对增幅
+    anomaly_min_error_rate: float = 0.05  # 触发错误率异常的最低5xx比例
+    anomaly_max_routes: int = 10000  # 每个进程跟踪的最大路由数
+    anomaly_traffic_drop_ratio: float = 0.1  # 窗口请求数低于基线该比例时视为流量骤降
+    anomaly_idle_seconds: int = 3600  # 路由停止上报超过该时长后关闭其异常并不再跟踪
+    
+    # 自动分析与告警配置
+    auto_analysis_per_route_window: int = 1  # 每个路由每小时窗口最多分析的链路数
+    auto_analysis_dedup_hours: int = 24  # 相同指纹在该时间内只分析一次
+    alert_min_requests: int = 10  # 触发阈值告警的窗口最少请求数
+    
+    # rollup配置
+    rollup_max_stacks: int = 500  # 单个rollup文档保留的不同调用栈上限，超出的新调用栈合并为 [other]
+    
+    # 性能记录存储布局：single（单集合+TTL索引）或 daily（按天分区集合，过期分区整体删除）
+    performance_storage_layout: str = "single"
+    
+    # 分层保留配置（项目配置可覆盖前三项）
+    retention_full_days: int = 7  # 保留完整链路的天数
+    retention_exemplar_days: int = 90  # 保留样本链路的天数（不超过性能记录TTL索引的90天）
+    retention_hourly_rollup_days: int = 30  # 小时rollup合并为天级rollup前保留的天数
+    retention_batch_size: int = 1000  # 每批处理的记录数
+    retention_max_batches: int = 50  # 每个项目每个层级单次运行最多处理的批数
+    
     # 安全配置
     cors_origins: str = "http://localhost:3000,http://127.0.0.1:3000,http://localhost:8080,http://localhost"
     max_request_size: int = 10485760  # 10MB
@@ -12,6 +12,8 @@ from app.middleware.cors import setup_cors
 from app.middleware.response import setup_response_middleware
 from app.api.v1 import projects, performance, analysis, dashboard, settings as settings_api
 from app.utils.database import init_database, close_database
+from app.services.ai_analyzer import performance_analyzer
+from app.services.anomaly_service import anomaly_detector
 
 
 # 配置日志
@@ -29,11 +31,14 @@ async def lifespan(app: FastAPI):
     logger.info("正在启动性能分析平台后端服务...")
     await init_database()
     logger.info("数据库初始化完成")
+    anomaly_detector.start()
     
     yield
     
     # 关闭时清理
     logger.info("正在关闭后端服务...")
+    await anomaly_detector.stop()
+    await performance_analyzer.clients.close()
     await close_database()
     logger.info("数据库连接已关闭")
 
@@ -56,6 +56,7 @@ class AnalysisResults(BaseModel):
     optimization_suggestions: List[OptimizationSuggestion] = Field(default=[], description="优化建议")
     risk_assessment: RiskAssessment = Field(default=RiskAssessment(), description="风险评估")
     summary: Optional[str] = Field(None, description="分析总结")
+    source: str = Field(default="ai", description="结果来源(ai/rule/cache)")
 
 
 class AnalysisRequest(BaseModel):
@@ -63,6 +64,7 @@ class AnalysisRequest(BaseModel):
     ai_service: str = Field(default="default", description="AI服务名称")
     priority: AnalysisPriority = Field(default=AnalysisPriority.NORMAL, description="任务优先级")
     parameters: Optional[Dict[str, Any]] = Field(default=None, description="自定义分析参数")
+    use_cache: bool = Field(default=True, description="是否复用相似性能特征的缓存分析结果")
 
 
 class BatchAnalysisRequest(BaseModel):
@@ -15,6 +15,7 @@ class FunctionCall(BaseModel):
     file_path: str = Field(..., description="文件路径")
     line_number: int = Field(..., description="行号")
     duration: float = Field(..., ge=0, description="函数执行耗时（秒）")
+    call_count: int = Field(default=1, ge=1, description="合并的调用次数（同一父调用下重复调用同一函数）")
     depth: int = Field(..., ge=0, description="调用深度")
     call_order: int = Field(..., ge=0, description="调用顺序")
 
@@ -23,6 +24,8 @@ class RequestInfo(BaseModel):
     """请求信息模型"""
     method: str = Field(..., description="HTTP方法")
     path: str = Field(..., description="请求路径")
+    normalized_path: Optional[str] = Field(None, description="规范化路径（小写，用于路径前缀搜索）")
+    route: Optional[str] = Field(None, description="路由模板，如 /users/{id}")
     query_params: Dict[str, Any] = Field(default_factory=dict, description="查询参数")
     headers: Dict[str, str] = Field(default_factory=dict, description="请求头")
     user_agent: Optional[str] = Field(None, description="用户代理")
@@ -79,6 +82,25 @@ class Environment(BaseModel):
     server_info: Optional[str] = Field(None, description="服务器信息")
 
 
+# 聚合模式上报的样例链路的采样模式（请求已计入聚合数据）
+EXEMPLAR_SAMPLING_MODE = "exemplar"
+
+
+class SamplingInfo(BaseModel):
+    """采样信息模型"""
+    mode: str = Field(default="fixed", description="采样模式: fixed/adaptive/exemplar")
+    sampling_rate: float = Field(default=1.0, gt=0, le=1.0, description="生效的采样率")
+    forced: bool = Field(default=False, description="是否为路由覆盖补采")
+    
+    @property
+    def weight(self) -> float:
+        """还原真实请求量时该记录代表的请求数
+
+        路由覆盖补采的请求必定被采样，旧版SDK仍上报当时的自适应采样率，按1条计。
+        """
+        return 1.0 if self.forced else 1.0 / self.sampling_rate
+
+
 class PerformanceRecordCreate(BaseModel):
     """创建性能记录请求模型"""
     trace_id: str = Field(..., description="调用链路唯一标识")
@@ -88,6 +110,7 @@ class PerformanceRecordCreate(BaseModel):
     function_calls: List[FunctionCall] = Field(default_factory=list, description="函数调用链路")
     version_info: Optional[VersionInfo] = Field(None, description="版本信息")
     environment: Optional[Environment] = Field(None, description="环境信息")
+    sampling_info: Optional[SamplingInfo] = Field(None, description="采样信息")
 
 
 class PerformanceRecord(PerformanceRecordCreate):
@@ -95,6 +118,13 @@ class PerformanceRecord(PerformanceRecordCreate):
     project_key: str = Field(..., description="关联项目标识")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="记录时间戳")
     created_at: datetime = Field(default_factory=datetime.utcnow, description="创建时间")
+    local_analysis: Optional[Dict[str, Any]] = Field(None, description="数据上报时的规则分析结果")
+    function_call_count: int = Field(default=0, ge=0, description="函数调用数量（列表查询不读取调用链路）")
+    
+    @property
+    def is_exemplar(self) -> bool:
+        """是否为聚合模式的样例链路"""
+        return self.sampling_info is not None and self.sampling_info.mode == EXEMPLAR_SAMPLING_MODE
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
@@ -107,6 +137,9 @@ class PerformanceRecord(PerformanceRecordCreate):
             "function_calls": [fc.dict() for fc in self.function_calls],
             "version_info": self.version_info.dict() if self.version_info else None,
             "environment": self.environment.dict() if self.environment else None,
+            "sampling_info": self.sampling_info.dict() if self.sampling_info else None,
+            "local_analysis": self.local_analysis,
+            "function_call_count": self.function_call_count,
             "timestamp": self.timestamp,
             "created_at": self.created_at
         }
@@ -127,10 +160,100 @@ class PerformanceRecord(PerformanceRecordCreate):
             data["version_info"] = VersionInfo(**data["version_info"])
         if "environment" in data and data["environment"]:
             data["environment"] = Environment(**data["environment"])
+        if "sampling_info" in data and data["sampling_info"]:
+            data["sampling_info"] = SamplingInfo(**data["sampling_info"])
         
         return cls(**data)
 
 
+# 列表查询的投影：只读取摘要字段，旧记录没有 function_call_count 时由服务端计算调用链路长度
+RECORD_SUMMARY_PROJECTION = {
+    "_id": 0,
+    "trace_id": 1,
+    "project_key": 1,
+    "request_info.method": 1,
+    "request_info.path": 1,
+    "request_info.route": 1,
+    "response_info.status_code": 1,
+    "performance_metrics.total_duration": 1,
+    "performance_metrics.cpu_time": 1,
+    "performance_metrics.memory_usage.peak_memory": 1,
+    "timestamp": 1,
+    "function_call_count": {"$ifNull": ["$function_call_count", {"$size": {"$ifNull": ["$function_calls", []]}}]}
+}
+
+
+class PerformanceRecordSummary(BaseModel):
+    """性能记录摘要模型（列表查询使用，不包含调用链路）"""
+    trace_id: str = Field(..., description="调用链路唯一标识")
+    project_key: Optional[str] = Field(None, description="关联项目标识")
+    method: str = Field(default="GET", description="HTTP方法")
+    path: str = Field(default="", description="请求路径")
+    route: Optional[str] = Field(None, description="路由模板")
+    status_code: int = Field(default=200, description="HTTP状态码")
+    duration: float = Field(default=0.0, description="总耗时（秒）")
+    cpu_time: float = Field(default=0.0, description="CPU时间（秒）")
+    memory_peak: int = Field(default=0, description="峰值内存使用（MB）")
+    function_call_count: int = Field(default=0, description="函数调用数量")
+    timestamp: datetime = Field(..., description="记录时间戳")
+    
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "PerformanceRecordSummary":
+        """从按 RECORD_SUMMARY_PROJECTION 投影的文档创建实例"""
+        request_info = doc.get("request_info") or {}
+        metrics = doc.get("performance_metrics") or {}
+        return cls(
+            trace_id=doc["trace_id"],
+            project_key=doc.get("project_key"),
+            method=request_info.get("method") or "GET",
+            path=request_info.get("path") or "",
+            route=request_info.get("route"),
+            status_code=(doc.get("response_info") or {}).get("status_code", 200),
+            duration=metrics.get("total_duration", 0.0),
+            cpu_time=metrics.get("cpu_time", 0.0),
+            memory_peak=(metrics.get("memory_usage") or {}).get("peak_memory", 0),
+            function_call_count=doc.get("function_call_count") or 0,
+            timestamp=doc["timestamp"]
+        )
+
+
+class StackSample(BaseModel):
+    """折叠调用栈模型（collapsed-stack格式）"""
+    stack: str = Field(..., description="以分号连接的从根到叶的帧名称")
+    count: int = Field(default=0, ge=0, description="调用次数")
+    self_time: float = Field(default=0.0, ge=0, description="自身耗时合计（秒）")
+
+
+class LatencyHistogram(BaseModel):
+    """响应时间直方图模型"""
+    bounds: List[float] = Field(default_factory=list, description="桶上界（秒）")
+    counts: List[int] = Field(default_factory=list, description="各桶请求数，最后一个桶为超出上界的请求")
+
+
+class ProfileAggregateCreate(BaseModel):
+    """SDK上报的路由窗口聚合数据模型"""
+    method: str = Field(..., description="HTTP方法")
+    path: str = Field(..., description="请求路径")
+    route: Optional[str] = Field(None, description="路由模板，旧版SDK不上报")
+    window_start: datetime = Field(..., description="聚合窗口开始时间")
+    window_end: datetime = Field(..., description="聚合窗口结束时间")
+    source: Optional[str] = Field(None, description="上报进程标识")
+    request_count: int = Field(..., ge=0, description="采样请求数")
+    weighted_count: float = Field(default=0.0, ge=0, description="按采样率还原的请求数")
+    error_count: int = Field(default=0, ge=0, description="5xx请求数")
+    duration_sum: float = Field(default=0.0, ge=0, description="总耗时合计（秒）")
+    duration_max: float = Field(default=0.0, ge=0, description="最大耗时（秒）")
+    latency_histogram: LatencyHistogram = Field(default_factory=LatencyHistogram, description="响应时间直方图")
+    stacks: List[StackSample] = Field(default_factory=list, description="加权调用栈表")
+    exemplar_trace_ids: List[str] = Field(default_factory=list, description="样例链路trace_id")
+    version_info: Optional[VersionInfo] = Field(None, description="版本信息")
+
+
+class ProfileAggregateBatch(BaseModel):
+    """聚合数据批量上报模型"""
+    aggregates: List[ProfileAggregateCreate] = Field(..., description="聚合数据列表")
+
+
 class FunctionCallDetail(BaseModel):
     """函数调用详情模型"""
     trace_id: str = Field(..., description="关联的调用链路标识")
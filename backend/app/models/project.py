@@ -2,7 +2,7 @@
 项目数据模型
 """
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 import uuid
 
@@ -12,6 +12,13 @@ class ProjectConfig(BaseModel):
     sampling_rate: float = Field(default=0.3, ge=0.0, le=1.0, description="性能采样率")
     enabled: bool = Field(default=True, description="是否启用监控")
     auto_analysis: bool = Field(default=False, description="是否启用自动AI分析")
+    auto_analysis_budget: int = Field(default=20, ge=0, description="每天自动AI分析的最大次数")
+    adaptive_sampling: bool = Field(default=False, description="是否启用SDK自适应采样")
+    exclude_patterns: Optional[List[str]] = Field(None, description="SDK排除路径模式，为空时使用SDK本地配置")
+    include_patterns: Optional[List[str]] = Field(None, description="SDK包含路径模式，为空时使用SDK本地配置")
+    retention_full_days: Optional[int] = Field(None, ge=1, description="保留完整链路的天数，为空时使用系统默认值")
+    retention_exemplar_days: Optional[int] = Field(None, ge=1, description="保留样本链路的天数，为空时使用系统默认值")
+    retention_hourly_rollup_days: Optional[int] = Field(None, ge=1, description="小时级rollup保留天数，为空时使用系统默认值")
     alert_threshold: Dict[str, Any] = Field(
         default={
             "response_time": 2.0,
@@ -79,4 +86,14 @@ class Project(ProjectBase):
         """从字典创建实例"""
         if "config" in data and isinstance(data["config"], dict):
             data["config"] = ProjectConfig(**data["config"])
-        return cls(**data)
\ No newline at end of file
+        return cls(**data)
+
+
+# 下发给SDK的配置项（SDK通过ProfilerManager.update_config热更新）
+SDK_CONFIG_FIELDS = (
+    "enabled",
+    "sampling_rate",
+    "adaptive_sampling",
+    "exclude_patterns",
+    "include_patterns"
+)
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""
+性能记录路径字段回填工具
+
+为升级前写入的性能记录补充 request_info.normalized_path（规范化路径）和 request_info.route（路由模板），
+使其可以被路径前缀搜索和路由模板过滤匹配。只处理缺少 normalized_path 的记录，重复运行是安全的。
+
+用法: python -m app.scripts.backfill_record_routes --batch-size 1000 [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from app.config.settings import settings
+from app.services.record_store import RecordStore, LAYOUT_DAILY, clear_partition_cache
+from app.utils.routes import normalize_path, route_key
+
+
+def route_update(doc) -> UpdateOne:
+    """单条记录的路径字段更新操作"""
+    request_info = doc.get("request_info") or {}
+    path = request_info.get("path") or "/"
+    route = request_info.get("route")
+    return UpdateOne({"_id": doc["_id"]}, {"$set": {
+        "request_info.normalized_path": normalize_path(path),
+        "request_info.route": route_key(path, route)
+    }})
+
+
+async def backfill(batch_size: int, dry_run: bool):
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.mongodb_database]
+    clear_partition_cache()
+    # 按分区布局列出集合，single 布局下分区列表为空，只处理 performance_records
+    store = RecordStore(db, layout=LAYOUT_DAILY)
+
+    updated = 0
+    try:
+        for collection in await store.collections_for_range():
+            pending = {"request_info.normalized_path": {"$exists": False}}
+            last_id = None
+            while True:
+                query = {**pending, "_id": {"$gt": last_id}} if last_id is not None else pending
+                docs = await collection.find(query, {"request_info.path": 1, "request_info.route": 1}) \
+                    .sort("_id", 1).limit(batch_size).to_list(None)
+                if not docs:
+                    break
+                last_id = docs[-1]["_id"]
+                if not dry_run:
+                    await collection.bulk_write([route_update(doc) for doc in docs], ordered=False)
+                updated += len(docs)
+                print(f"{collection.name}: 已处理 {updated} 条")
+    finally:
+        client.close()
+
+    print(f"回填完成{'（试运行）' if dry_run else ''}: 共 {updated} 条记录")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能记录路径字段回填工具")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批处理的记录数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计不写入")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
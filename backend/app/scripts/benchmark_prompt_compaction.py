@@ -0,0 +1,97 @@
+"""
+AI分析提示词压缩基准测试
+
+生成不同深度和规模的合成调用链路，对比：
+- raw: 旧方式，预处理结果携带完整性能记录（raw_data）时序列化后的大小
+- compact: 调用树压缩为token预算内摘要后的完整提示词大小
+以及构建提示词（预处理 + 压缩 + 格式化）的耗时。
+
+用法: python -m app.scripts.benchmark_prompt_compaction --budget 1500
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, Any, List
+
+from app.config.settings import settings
+from app.services.ai_analyzer import PerformanceAnalyzer
+from app.utils.prompt_compaction import count_tokens, load_encoding
+
+# (调用深度, 每层分支数, 叶子重复调用次数)
+TRACE_SHAPES = [(20, 2, 10), (100, 2, 50), (300, 3, 200), (1000, 2, 500)]
+
+
+def synthetic_record(depth: int, branches: int, repeats: int, seed: int = 0) -> Dict[str, Any]:
+    """生成一条合成性能记录：一条深调用链，每层有若干短分支，末端重复调用查询函数"""
+    rng = random.Random(seed)
+    function_calls: List[Dict[str, Any]] = []
+
+    def add(parent_id, level, name, file_path, duration):
+        call_id = f"call_{len(function_calls)}"
+        function_calls.append({
+            "call_id": call_id,
+            "parent_call_id": parent_id,
+            "function_name": name,
+            "file_path": file_path,
+            "line_number": rng.randint(1, 500),
+            "duration": duration,
+            "depth": level,
+            "call_order": len(function_calls)
+        })
+        return call_id
+
+    total = 2.0
+    parent = add(None, 0, "dispatch", "/usr/lib/python3.11/site-packages/flask/app.py", total)
+    for level in range(1, depth):
+        for branch in range(branches):
+            add(parent, level, f"helper_{branch}", f"/srv/app/services/module_{level % 13}.py", rng.uniform(0.0001, 0.002))
+        parent = add(parent, level, f"layer_{level % 17}", f"/srv/app/handlers/layer_{level % 17}.py", total * (1 - level / depth / 2))
+    for _ in range(repeats):
+        add(parent, depth, "execute_query", "/srv/app/db/repository.py", rng.uniform(0.0005, 0.003))
+
+    return {
+        "request_info": {"method": "GET", "path": "/api/orders"},
+        "response_info": {"status_code": 200},
+        "performance_metrics": {"total_duration": total, "cpu_time": 0.6, "memory_usage": {"peak_memory": 120}},
+        "function_calls": function_calls
+    }
+
+
+def measure(analyzer: PerformanceAnalyzer, record: Dict[str, Any], rounds: int) -> Dict[str, Any]:
+    processed = analyzer._preprocess_performance_data(record)
+    raw_tokens = count_tokens(json.dumps({**processed, "raw_data": record}, ensure_ascii=False, default=str))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        prompt = analyzer._build_analysis_prompt(analyzer._preprocess_performance_data(record))
+    elapsed = (time.perf_counter() - start) / rounds
+
+    return {"raw_tokens": raw_tokens, "prompt_tokens": count_tokens(prompt), "build_ms": elapsed * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI分析提示词压缩基准测试")
+    parser.add_argument("--budget", type=int, default=settings.ai_prompt_call_tree_tokens, help="调用树摘要的token预算")
+    parser.add_argument("--rounds", type=int, default=5, help="每种链路构建提示词的次数")
+    args = parser.parse_args()
+
+    settings.ai_prompt_call_tree_tokens = args.budget
+    analyzer = PerformanceAnalyzer()
+    # 同步加载编码，保证所有轮次使用同一种计数方式
+    encoding = load_encoding()
+
+    print(f"调用树token预算: {args.budget}（{'tiktoken计数' if encoding is not None else '字符估算'}）")
+    print(f"{'深度':>6} {'调用数':>8} {'raw tokens':>12} {'prompt tokens':>14} {'压缩比':>8} {'构建耗时':>10}")
+    for depth, branches, repeats in TRACE_SHAPES:
+        record = synthetic_record(depth, branches, repeats)
+        result = measure(analyzer, record, args.rounds)
+        print(
+            f"{depth:>6} {len(record['function_calls']):>8} {result['raw_tokens']:>12} "
+            f"{result['prompt_tokens']:>14} {result['raw_tokens'] / result['prompt_tokens']:>7.1f}x "
+            f"{result['build_ms']:>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
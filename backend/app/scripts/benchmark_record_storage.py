@@ -0,0 +1,135 @@
+"""
+性能记录存储布局基准测试
+
+在临时数据库中生成相同的合成记录，分别以 single（单集合+TTL索引）和 daily（按天分区）布局写入，
+对比常用查询和过期删除的耗时：
+- stats_24h: 单个项目最近24小时按小时分组的统计聚合
+- page_1 / page_20: 单个项目最近7天记录列表的第1页和第20页
+- trace_lookup: 按trace_id查询记录详情
+- expire_day: 删除最旧一天的记录（single 为 delete_many，daily 为删除分区集合）
+
+需要可用的 MongoDB（使用 settings 中的连接配置），结束后删除临时数据库。
+
+用法: python -m app.scripts.benchmark_record_storage --days 30 --per-day 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config.settings import settings
+from app.services.record_store import RecordStore, LAYOUT_SINGLE, LAYOUT_DAILY, PARTITION_INDEXES, clear_partition_cache
+
+PROJECTS = ["proj_a", "proj_b", "proj_c", "proj_d"]
+PATHS = ["/api/orders", "/api/users", "/api/items", "/api/cart", "/api/search"]
+
+
+def synthetic_records(day: datetime, count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    records = []
+    for _ in range(count):
+        duration = rng.lognormvariate(-2.5, 1.0)
+        records.append({
+            "trace_id": uuid.uuid4().hex,
+            "project_key": rng.choice(PROJECTS),
+            "timestamp": day + timedelta(seconds=rng.randint(0, 86399)),
+            "request_info": {"method": "GET", "path": rng.choice(PATHS)},
+            "response_info": {"status_code": 500 if rng.random() < 0.02 else 200},
+            "performance_metrics": {"total_duration": duration, "cpu_time": duration * 0.4},
+            "function_calls": [
+                {"call_id": f"c{i}", "function_name": f"step_{i}", "duration": duration / 5} for i in range(5)
+            ]
+        })
+    return records
+
+
+async def timed(coro_factory, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await coro_factory()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+async def run_queries(store: RecordStore, now: datetime, trace_ids: List[str], rounds: int) -> Dict[str, float]:
+    project_query = {"project_key": "proj_a", "timestamp": {"$gte": now - timedelta(days=7)}}
+    stats_pipeline = [
+        {"$match": {"project_key": "proj_a", "timestamp": {"$gte": now - timedelta(hours=24)}}},
+        {"$group": {
+            "_id": {"$dateToString": {"format": "%Y-%m-%d %H:00", "date": "$timestamp"}},
+            "count": {"$sum": 1},
+            "avg_duration": {"$avg": "$performance_metrics.total_duration"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+    return {
+        "stats_24h": await timed(lambda: store.aggregate(stats_pipeline), rounds),
+        "page_1": await timed(lambda: store.find_page(project_query, 0, 20), rounds),
+        "page_20": await timed(lambda: store.find_page(project_query, 380, 20), rounds),
+        "trace_lookup": await timed(lambda: store.find_by_trace_id(random.choice(trace_ids)), rounds)
+    }
+
+
+async def benchmark(days: int, per_day: int, rounds: int):
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db_name = f"{settings.mongodb_database}_storage_benchmark"
+    db = client[db_name]
+    await client.drop_database(db_name)
+    clear_partition_cache()
+
+    single = RecordStore(db, layout=LAYOUT_SINGLE)
+    daily = RecordStore(client[f"{db_name}_daily"], layout=LAYOUT_DAILY)
+    await client.drop_database(f"{db_name}_daily")
+    for keys, options in PARTITION_INDEXES:
+        await single.collection.create_index(keys, **options)
+    await single.collection.create_index("timestamp", expireAfterSeconds=days * 86400 * 2)
+
+    rng = random.Random(0)
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    oldest_day = (now - timedelta(days=days - 1)).replace(hour=0)
+    trace_ids: List[str] = []
+    try:
+        print(f"写入 {days} 天 x {per_day} 条记录...")
+        for offset in range(days):
+            day = oldest_day + timedelta(days=offset)
+            records = synthetic_records(day, per_day, rng)
+            trace_ids.extend(record["trace_id"] for record in records[:10])
+            await single.collection.insert_many([dict(record) for record in records], ordered=False)
+            partition = await daily.partition_for(day)
+            await partition.insert_many(records, ordered=False)
+
+        results = {}
+        for name, store in (("single", single), ("daily", daily)):
+            results[name] = await run_queries(store, now, trace_ids, rounds)
+
+        start = time.perf_counter()
+        await single.collection.delete_many({"timestamp": {"$lt": oldest_day + timedelta(days=1)}})
+        results["single"]["expire_day"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        await daily.drop_partitions_before(oldest_day + timedelta(days=1))
+        results["daily"]["expire_day"] = (time.perf_counter() - start) * 1000
+
+        print(f"{'查询':<14} {'single':>12} {'daily':>12}")
+        for query in results["single"]:
+            print(f"{query:<14} {results['single'][query]:>10.1f}ms {results['daily'][query]:>10.1f}ms")
+    finally:
+        await client.drop_database(db_name)
+        await client.drop_database(f"{db_name}_daily")
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能记录存储布局基准测试")
+    parser.add_argument("--days", type=int, default=30, help="生成数据的天数")
+    parser.add_argument("--per-day", type=int, default=20000, help="每天的记录数")
+    parser.add_argument("--rounds", type=int, default=20, help="每个查询执行的次数")
+    args = parser.parse_args()
+
+    asyncio.run(benchmark(args.days, args.per_day, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
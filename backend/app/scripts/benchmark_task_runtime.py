@@ -0,0 +1,70 @@
+"""
+Celery 任务运行时基准测试
+
+对比两种任务执行方式的吞吐量（任务数/秒）：
+- per_task: 旧方式，每个任务新建事件循环、连接数据库并创建索引
+- worker: 每个 worker 进程复用同一个事件循环和连接池
+
+需要可用的 MongoDB 和 Redis（使用 settings 中的连接配置）。
+
+用法: python -m app.scripts.benchmark_task_runtime --tasks 200
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app.utils.database import db_manager, init_database
+from app.tasks import runtime
+
+logger = logging.getLogger(__name__)
+
+
+async def task_body():
+    """模拟一个典型任务的数据库访问：读取一条性能记录"""
+    await db_manager.get_performance_record("benchmark_missing_record")
+
+
+def run_per_task(count: int) -> float:
+    """旧方式：每个任务独立初始化"""
+    start = time.perf_counter()
+    for _ in range(count):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(init_database())
+            loop.run_until_complete(task_body())
+        finally:
+            loop.close()
+    return time.perf_counter() - start
+
+
+def run_worker(count: int) -> float:
+    """新方式：worker 进程级运行时"""
+    runtime.init_worker_runtime()
+    try:
+        start = time.perf_counter()
+        for _ in range(count):
+            runtime.run_async(task_body())
+        return time.perf_counter() - start
+    finally:
+        runtime.shutdown_worker_runtime()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Celery任务运行时基准测试")
+    parser.add_argument("--tasks", type=int, default=200, help="每种方式执行的任务数")
+    args = parser.parse_args()
+
+    per_task = run_per_task(args.tasks)
+    worker = run_worker(args.tasks)
+
+    print(f"任务数: {args.tasks}")
+    print(f"per_task: {per_task:.2f}s, {args.tasks / per_task:.1f} 任务/秒")
+    print(f"worker:   {worker:.2f}s, {args.tasks / worker:.1f} 任务/秒")
+    print(f"提升: {per_task / worker:.1f}x")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
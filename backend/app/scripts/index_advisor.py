@@ -0,0 +1,92 @@
+"""
+MongoDB索引检查工具
+
+对照 app/utils/indexes.py 中的索引注册表检查数据库：
+- 缺少的索引、未登记的索引（通常是已被复合索引取代的旧索引）、长期未使用的索引（$indexStats）
+- 对 QUERY_SHAPES 中登记的每个服务查询执行 explain，报告使用全集合扫描（COLLSCAN）的查询
+
+未登记的索引不会自动删除，确认后加 --drop-unregistered 删除。
+已有TTL索引的过期时间与注册表不同时不会自动修改（缩短会立即删除数据），确认后加 --update-ttl 修改。
+
+用法: python -m app.scripts.index_advisor [--create [--update-ttl]] [--explain] [--drop-unregistered]
+"""
+import argparse
+import asyncio
+import logging
+from typing import Dict, Any, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config.settings import settings
+from app.utils.indexes import INDEX_REGISTRY, QUERY_SHAPES, ensure_indexes, check_indexes
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """执行计划树中的所有阶段名"""
+    stages = [plan.get("stage")]
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            stages.extend(plan_stages(plan[child]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return [stage for stage in stages if stage]
+
+
+async def explain_query(db, collection: str, query: Dict[str, Any], sort) -> List[str]:
+    """查询的获胜执行计划阶段"""
+    command = {"find": collection, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    result = await db.command("explain", command, verbosity="queryPlanner")
+    return plan_stages(result["queryPlanner"]["winningPlan"])
+
+
+async def advise(create: bool, explain: bool, drop_unregistered: bool, update_ttl: bool = False):
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.mongodb_database]
+    try:
+        if create:
+            result = await ensure_indexes(db, update_ttl=update_ttl)
+            print(f"创建索引: 成功 {result['created']} 个, 更新TTL {result['modified']} 个, 失败 {result['failed']} 个")
+
+        report = await check_indexes(db)
+        for name, entry in report.items():
+            for kind in ("missing", "unregistered", "unused"):
+                for index_name in entry[kind]:
+                    print(f"{kind:<13} {name}.{index_name}")
+        if not report:
+            print("索引与注册表一致")
+
+        if explain:
+            collscans = 0
+            for collection, description, query, sort in QUERY_SHAPES:
+                stages = await explain_query(db, collection, query, sort)
+                if "COLLSCAN" in stages:
+                    collscans += 1
+                    print(f"COLLSCAN      {collection}: {description}")
+            print(f"共检查 {len(QUERY_SHAPES)} 个查询, 全集合扫描 {collscans} 个")
+
+        if drop_unregistered:
+            for name, entry in report.items():
+                for index_name in entry["unregistered"]:
+                    if name in INDEX_REGISTRY:
+                        await db[name].drop_index(index_name)
+                        print(f"已删除索引 {name}.{index_name}")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MongoDB索引检查工具")
+    parser.add_argument("--create", action="store_true", help="检查前按注册表创建索引")
+    parser.add_argument("--explain", action="store_true", help="对登记的服务查询执行explain")
+    parser.add_argument("--drop-unregistered", action="store_true", help="删除未登记的索引")
+    parser.add_argument("--update-ttl", action="store_true", help="创建索引时按注册表修改已有TTL索引的过期时间")
+    args = parser.parse_args()
+
+    asyncio.run(advise(args.create, args.explain, args.drop_unregistered, args.update_ttl))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,123 @@
+"""
+性能记录存储布局迁移工具
+
+将 performance_records 集合中的记录按时间戳复制到按天分区集合（performance_records_YYYYMMDD）。
+按 _id 分批处理，复制进度保存在 detector_state 集合中，中断后再次运行会从上次位置继续；
+目标分区中已存在的记录（trace_id重复）会被跳过，重复运行是安全的。
+加 --delete-source 时已处理的记录会从原集合删除，原集合中剩余的就是未处理的记录，
+因此不使用也不保存复制进度，每次从头扫描。
+
+迁移步骤：
+1. 设置 PERFORMANCE_STORAGE_LAYOUT=daily 并重启服务（新记录写入分区，旧记录仍可从原集合查询）
+2. 运行本工具复制历史记录，确认无误后加 --delete-source 再运行一次，从原集合删除已迁移的记录
+
+用法: python -m app.scripts.migrate_record_storage --batch-size 1000 [--delete-source] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+
+from app.config.settings import settings
+from app.services.record_store import RecordStore, LAYOUT_DAILY, partition_name, clear_partition_cache
+
+logger = logging.getLogger(__name__)
+
+# 迁移进度记录的文档ID
+MIGRATION_STATE_ID = "record_storage_migration"
+
+# 重复键错误码
+DUPLICATE_KEY_ERROR = 11000
+
+
+async def copy_batch(store: RecordStore, docs, dry_run: bool) -> int:
+    """将一批记录写入对应分区，返回新写入的记录数"""
+    by_partition = defaultdict(list)
+    for doc in docs:
+        by_partition[partition_name(doc["timestamp"])].append(doc)
+
+    inserted = 0
+    for partition_docs in by_partition.values():
+        if dry_run:
+            inserted += len(partition_docs)
+            continue
+        collection = await store.partition_for(partition_docs[0]["timestamp"])
+        try:
+            result = await collection.insert_many(partition_docs, ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            inserted += e.details.get("nInserted", 0)
+    return inserted
+
+
+async def migrate(batch_size: int, delete_source: bool, dry_run: bool, restart: bool):
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.mongodb_database]
+    store = RecordStore(db, layout=LAYOUT_DAILY)
+    source = db.performance_records
+    state_collection = db.detector_state
+    clear_partition_cache()
+
+    # 复制进度之前的记录仍在原集合中，删除模式从上次复制位置继续会漏删
+    state = None if restart or delete_source else await state_collection.find_one({"_id": MIGRATION_STATE_ID})
+    last_id = state.get("last_id") if state else None
+    if last_id is not None:
+        print(f"从上次进度继续: _id > {last_id}")
+
+    copied = scanned = deleted = 0
+    started = datetime.utcnow()
+    try:
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            docs = await source.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+            if not docs:
+                break
+
+            scanned += len(docs)
+            copied += await copy_batch(store, docs, dry_run)
+            last_id = docs[-1]["_id"]
+
+            if not dry_run:
+                if delete_source:
+                    result = await source.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+                    deleted += result.deleted_count
+                else:
+                    await state_collection.update_one(
+                        {"_id": MIGRATION_STATE_ID},
+                        {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}},
+                        upsert=True
+                    )
+            print(f"已处理 {scanned} 条, 写入分区 {copied} 条, 删除原记录 {deleted} 条")
+
+        # 原记录已全部迁移，清除复制进度
+        if delete_source and not dry_run:
+            await state_collection.delete_one({"_id": MIGRATION_STATE_ID})
+    finally:
+        client.close()
+
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    print(f"迁移完成{'（试运行）' if dry_run else ''}: 扫描 {scanned} 条, 写入分区 {copied} 条, "
+          f"删除原记录 {deleted} 条, 耗时 {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能记录按天分区迁移工具")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批处理的记录数")
+    parser.add_argument("--delete-source", action="store_true", help="写入分区后从原集合删除记录")
+    parser.add_argument("--dry-run", action="store_true", help="只统计不写入")
+    parser.add_argument("--restart", action="store_true", help="忽略已保存的进度，从头开始")
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.batch_size, args.delete_source, args.dry_run, args.restart))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
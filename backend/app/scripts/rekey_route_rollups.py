@@ -0,0 +1,68 @@
+"""
+路由rollup按路由模板重建工具
+
+升级前的小时和天级rollup以原始请求路径为键（如 /users/123、/users/456），升级后按路由模板
+（/users/{id}）写入。本工具将旧文档合并到对应模板的同一时间桶（计数、直方图、调用栈以$inc累加），
+然后删除旧文档。路径已是模板的文档不处理，重复运行是安全的。
+
+用法: python -m app.scripts.rekey_route_rollups --batch-size 500 [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config.settings import settings
+from app.services.retention_service import capped_merge_updates
+from app.utils.routes import canonical_route
+
+
+async def rekey_collection(collection, batch_size: int, dry_run: bool) -> int:
+    """重建单个rollup集合，返回合并的文档数"""
+    merged = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(None)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        stale = [doc for doc in docs if canonical_route(doc["path"]) != doc["path"]]
+        if stale and not dry_run:
+            operations = await capped_merge_updates(
+                collection, stale, lambda doc: doc["bucket"], lambda doc: canonical_route(doc["path"])
+            )
+            await collection.bulk_write(operations, ordered=True)
+            await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stale]}})
+        merged += len(stale)
+        print(f"{collection.name}: 已合并 {merged} 条")
+    return merged
+
+
+async def rekey(batch_size: int, dry_run: bool):
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    db = client[settings.mongodb_database]
+    total = 0
+    try:
+        for name in ("route_rollups", "route_rollups_daily"):
+            total += await rekey_collection(db[name], batch_size, dry_run)
+    finally:
+        client.close()
+
+    print(f"重建完成{'（试运行）' if dry_run else ''}: 共合并 {total} 条rollup")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路由rollup按路由模板重建工具")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批处理的rollup数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计不写入")
+    args = parser.parse_args()
+
+    asyncio.run(rekey(args.batch_size, args.dry_run))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -3,62 +3,207 @@ AI分析算法实现
 """
 import json
 import asyncio
-from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 from datetime import datetime, timedelta
 import logging
 
+from app.config.settings import settings
 from app.services.ai_config import ai_config_manager, AIProvider, AIServiceConfig
+from app.services.ai_clients import ProviderClientRegistry
+from app.services.analysis_cache import AnalysisCacheService, ANALYSIS_PROMPT_VERSION
+from app.services.local_analyzer import local_analyzer
+from app.services.rate_limiter import RateLimiterRegistry, RateLimitExceeded, parse_retry_after
+from app.utils.prompt_compaction import count_tokens, summarize_call_tree
 from app.models.analysis import AnalysisResults, BottleneckAnalysis, OptimizationSuggestion, RiskAssessment
 from app.utils.database import get_database
 
 logger = logging.getLogger(__name__)
 
+# 接收模型增量输出的回调
+ContentCallback = Callable[[str], Awaitable[None]]
+# 每次（重新）发起流式请求前的回调，丢弃上一次尝试已输出的内容
+RestartCallback = Callable[[], Awaitable[None]]
+
+
+def openai_stream_delta(chunk: Dict[str, Any]) -> Optional[str]:
+    """提取OpenAI兼容流式响应（DeepSeek）中的增量文本"""
+    choices = chunk.get("choices") or []
+    return choices[0].get("delta", {}).get("content") if choices else None
+
+
+def qianwen_stream_delta(chunk: Dict[str, Any]) -> Optional[str]:
+    """提取阿里千问流式响应中的增量文本"""
+    output = chunk.get("output", {})
+    if output.get("choices"):
+        return output["choices"][0].get("message", {}).get("content")
+    return output.get("text")
+
 
 class PerformanceAnalyzer:
     """性能分析器"""
     
     def __init__(self):
         self.config_manager = ai_config_manager
+        self.rate_limiters = RateLimiterRegistry()
+        self.clients = ProviderClientRegistry()
     
     async def analyze_performance(
         self,
         performance_data: Dict[str, Any],
-        ai_service: str = None
+        ai_service: str = None,
+        use_cache: bool = True,
+        on_content: Optional[ContentCallback] = None,
+        on_restart: Optional[RestartCallback] = None
     ) -> AnalysisResults:
-        """分析性能数据"""
+        """分析性能数据
+
+        Args:
+            performance_data: 性能记录
+            ai_service: AI服务名称
+            use_cache: 是否复用缓存的分析结果
+            on_content: 流式输出时接收模型增量文本的回调
+            on_restart: 每次发起流式请求前的回调，重试时据此重置已接收的增量文本
+        """
         try:
-            # 获取数据库连接以加载最新配置
-            db = get_database()
-            
-            # 检查数据库连接是否有效
-            if db is None:
-                raise ValueError("数据库连接不可用")
-            
-            # 获取AI服务配置（从数据库动态加载最新配置）
-            service_config = await self.config_manager.get_service_async(ai_service, db)
-            if not service_config or not service_config.enabled:
-                raise ValueError(f"AI服务 '{ai_service}' 不可用")
+            service_config = await self._get_service_config(ai_service)
             
             # 预处理性能数据
             processed_data = self._preprocess_performance_data(performance_data)
             
-            # 调用对应的AI服务
-            if service_config.provider == AIProvider.OPENAI:
-                return await self._analyze_with_openai(processed_data, service_config)
-            elif service_config.provider == AIProvider.ALIYUN_QIANWEN:
-                return await self._analyze_with_qianwen(processed_data, service_config)
-            elif service_config.provider == AIProvider.DEEPSEEK:
-                return await self._analyze_with_deepseek(processed_data, service_config)
-            elif service_config.provider == AIProvider.CUSTOM:
-                return await self._analyze_with_custom_ai(processed_data, service_config)
-            else:
-                return await self._analyze_with_fallback(processed_data)
+            # 相似性能特征已有AI分析结果时直接复用
+            cache_scope = self._cache_scope(service_config, performance_data.get("project_key"))
+            if use_cache:
+                cached = await AnalysisCacheService().lookup(processed_data, cache_scope)
+                if cached:
+                    return AnalysisResults(**{**cached["results"], "source": "cache"})
+            
+            # 按服务的速率限制调用，收到429时降低并发并重试
+            limiter = self.rate_limiters.get(service_config)
+            tokens = count_tokens(self._build_analysis_prompt(processed_data)) + service_config.max_tokens
+            for attempt in range(service_config.max_retries + 1):
+                try:
+                    async with limiter.slot(tokens):
+                        result = await self._call_provider(processed_data, service_config, on_content, on_restart)
+                    limiter.on_success()
+                    if result.source == "ai":
+                        await AnalysisCacheService().store(processed_data, cache_scope, result.dict())
+                    return result
+                except RateLimitExceeded as e:
+                    limiter.on_rate_limited(e.retry_after)
+                    if attempt < service_config.max_retries:
+                        await asyncio.sleep(e.retry_after or service_config.retry_delay * (2 ** attempt))
+            
+            logger.error(f"AI服务持续限流，使用规则分析: {service_config.provider.value}")
+            return await self._analyze_with_fallback(processed_data)
                 
         except Exception as e:
             logger.error(f"性能分析失败: {str(e)}")
             # 返回基础分析结果
             return await self._analyze_with_fallback(performance_data)
     
+    async def find_cached_analysis(
+        self,
+        performance_data: Dict[str, Any],
+        ai_service: str = None
+    ) -> Optional[Dict[str, Any]]:
+        """查找性能数据可复用的缓存分析结果，未命中返回None"""
+        try:
+            service_config = await self._get_service_config(ai_service)
+            processed_data = self._preprocess_performance_data(performance_data)
+            return await AnalysisCacheService().lookup(
+                processed_data, self._cache_scope(service_config, performance_data.get("project_key"))
+            )
+        except Exception as e:
+            logger.error(f"查找缓存分析结果失败: {str(e)}")
+            return None
+    
+    async def _get_service_config(self, ai_service: str = None) -> AIServiceConfig:
+        """获取可用的AI服务配置"""
+        # 获取数据库连接以加载最新配置
+        db = get_database()
+        
+        # 检查数据库连接是否有效
+        if db is None:
+            raise ValueError("数据库连接不可用")
+        
+        # 获取AI服务配置（从数据库动态加载最新配置）
+        service_config = await self.config_manager.get_service_async(ai_service, db)
+        if not service_config or not service_config.enabled:
+            raise ValueError(f"AI服务 '{ai_service}' 不可用")
+        return service_config
+    
+    def _cache_scope(self, service_config: AIServiceConfig, project_key: Optional[str]) -> Dict[str, Any]:
+        """分析缓存的范围：项目、服务、模型和提示词版本，分析结果不跨项目复用"""
+        template = self.config_manager.get_template("performance_analysis") or ""
+        template_digest = hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+        return {
+            "project_key": project_key,
+            "provider": service_config.provider.value,
+            "model": service_config.model,
+            "prompt_version": f"{ANALYSIS_PROMPT_VERSION}:{template_digest}"
+        }
+    
+    async def _call_provider(
+        self,
+        processed_data: Dict[str, Any],
+        service_config: AIServiceConfig,
+        on_content: Optional[ContentCallback] = None,
+        on_restart: Optional[RestartCallback] = None
+    ) -> AnalysisResults:
+        """调用对应的AI服务（支持流式输出的服务通过 on_content 回调增量内容）"""
+        if service_config.provider == AIProvider.OPENAI:
+            return await self._analyze_with_openai(processed_data, service_config)
+        elif service_config.provider == AIProvider.ALIYUN_QIANWEN:
+            return await self._analyze_with_qianwen(processed_data, service_config, on_content, on_restart)
+        elif service_config.provider == AIProvider.DEEPSEEK:
+            return await self._analyze_with_deepseek(processed_data, service_config, on_content, on_restart)
+        elif service_config.provider == AIProvider.CUSTOM:
+            return await self._analyze_with_custom_ai(processed_data, service_config)
+        else:
+            return await self._analyze_with_fallback(processed_data)
+    
+    async def _stream_completion(
+        self,
+        client,
+        service_config: AIServiceConfig,
+        request_data: Dict[str, Any],
+        headers: Dict[str, str],
+        extract_delta: Callable[[Dict[str, Any]], Optional[str]],
+        on_content: Optional[ContentCallback] = None,
+        on_restart: Optional[RestartCallback] = None
+    ) -> str:
+        """以SSE流式调用AI服务，返回完整的输出文本
+
+        每次重试都会重新调用本方法，先通过 on_restart 丢弃上一次尝试已推送的增量内容。
+        """
+        if on_restart:
+            await on_restart()
+        async with client.stream(
+            "POST",
+            service_config.endpoint,
+            json=request_data,
+            headers=headers,
+            timeout=service_config.timeout
+        ) as response:
+            if response.status_code == 429:
+                raise RateLimitExceeded(parse_retry_after(response.headers.get("retry-after")))
+            response.raise_for_status()
+            
+            content = ""
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if not data or data == "[DONE]":
+                    continue
+                delta = extract_delta(json.loads(data))
+                if delta:
+                    content += delta
+                    if on_content:
+                        await on_content(delta)
+            return content
+    
     def _preprocess_performance_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """预处理性能数据"""
         try:
@@ -87,6 +232,7 @@ class PerformanceAnalyzer:
             return {
                 "basic_info": {
                     "request_path": request_info.get("path", ""),
+                    "request_route": request_info.get("route"),
                     "request_method": request_info.get("method", ""),
                     "status_code": data.get("response_info", {}).get("status_code", 200),
                     "framework": data.get("environment", {}).get("framework_version", "")
@@ -102,12 +248,19 @@ class PerformanceAnalyzer:
                 "slow_functions": slow_functions[:10],  # 取前10个最慢的函数
                 "call_patterns": call_patterns,
                 "bottleneck_types": bottleneck_types,
-                "raw_data": data
+                # 上报时已保存的规则分析结果，旧记录现场计算
+                "local_analysis": data.get("local_analysis") or local_analyzer.analyze(data),
+                # 调用树压缩为token预算内的摘要，不携带原始函数调用列表
+                "call_tree_summary": summarize_call_tree(
+                    function_calls,
+                    token_budget=settings.ai_prompt_call_tree_tokens,
+                    top_k=settings.ai_prompt_top_frames
+                )["text"]
             }
             
         except Exception as e:
             logger.error(f"预处理性能数据失败: {str(e)}")
-            return {"raw_data": data}
+            return {}
     
     def _analyze_call_patterns(self, function_calls: List[Dict[str, Any]]) -> Dict[str, Any]:
         """分析函数调用模式"""
@@ -234,25 +387,28 @@ class PerformanceAnalyzer:
             # 构建分析提示
             prompt = self._build_analysis_prompt(processed_data)
             
-            # 调用OpenAI API
-            client = openai.AsyncOpenAI(api_key=service_config.api_key)
+            # 调用OpenAI API（复用池化的客户端）
+            client = self.clients.get_openai_client(service_config)
             
-            response = await client.chat.completions.create(
-                model=service_config.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "你是一个专业的Python性能分析专家。请分析给定的性能数据，识别瓶颈并提供优化建议。返回结构化的JSON格式结果。"
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=service_config.temperature,
-                max_tokens=service_config.max_tokens,
-                timeout=service_config.timeout
-            )
+            try:
+                response = await client.chat.completions.create(
+                    model=service_config.model,
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "你是一个专业的Python性能分析专家。请分析给定的性能数据，识别瓶颈并提供优化建议。返回结构化的JSON格式结果。"
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=service_config.temperature,
+                    max_tokens=service_config.max_tokens,
+                    timeout=service_config.timeout
+                )
+            except openai.RateLimitError as e:
+                raise RateLimitExceeded(parse_retry_after(e.response.headers.get("retry-after"))) from e
             
             # 解析AI响应
             ai_response = response.choices[0].message.content
@@ -260,11 +416,13 @@ class PerformanceAnalyzer:
             # 尝试解析为JSON
             try:
                 parsed_result = json.loads(ai_response)
-                return self._parse_ai_result(parsed_result, processed_data)
+                return await self._parse_ai_result(parsed_result, processed_data)
             except json.JSONDecodeError:
                 # 如果无法解析为JSON，使用文本解析
-                return self._parse_text_result(ai_response, processed_data)
+                return await self._parse_text_result(ai_response, processed_data)
                 
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"OpenAI分析失败: {str(e)}")
             return await self._analyze_with_fallback(processed_data)
@@ -288,32 +446,41 @@ class PerformanceAnalyzer:
                 }
             }
             
-            # 调用自定义AI服务
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    service_config.endpoint,
-                    json=request_data,
-                    headers=service_config.headers,
-                    timeout=aiohttp.ClientTimeout(total=service_config.timeout)
-                ) as response:
-                    
-                    if response.status == 200:
-                        result = await response.json()
-                        return self._parse_custom_ai_result(result, processed_data)
-                    else:
-                        logger.error(f"自定义AI服务返回错误: {response.status}")
-                        return await self._analyze_with_fallback(processed_data)
+            # 调用自定义AI服务（复用池化的会话）
+            session = self.clients.get_aiohttp_session(service_config)
+            async with session.post(
+                service_config.endpoint,
+                json=request_data,
+                headers=service_config.headers,
+                timeout=aiohttp.ClientTimeout(total=service_config.timeout)
+            ) as response:
+                
+                if response.status == 429:
+                    raise RateLimitExceeded(parse_retry_after(response.headers.get("Retry-After")))
+                if response.status == 200:
+                    result = await response.json()
+                    return await self._parse_custom_ai_result(result, processed_data)
+                else:
+                    logger.error(f"自定义AI服务返回错误: {response.status}")
+                    return await self._analyze_with_fallback(processed_data)
                         
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"自定义AI分析失败: {str(e)}")
             return await self._analyze_with_fallback(processed_data)
 
-    async def _analyze_with_qianwen(self, processed_data: Dict[str, Any], service_config: AIServiceConfig) -> AnalysisResults:
+    async def _analyze_with_qianwen(
+        self,
+        processed_data: Dict[str, Any],
+        service_config: AIServiceConfig,
+        on_content: Optional[ContentCallback] = None,
+        on_restart: Optional[RestartCallback] = None
+    ) -> AnalysisResults:
         """使用阿里千问进行分析"""
         try:
-            import httpx
             import json
-            from tenacity import retry, stop_after_attempt, wait_exponential
+            from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
             
             # 构建提示语
             prompt = self._build_analysis_prompt(processed_data)
@@ -336,22 +503,25 @@ class PerformanceAnalyzer:
                 "parameters": {
                     "max_tokens": service_config.max_tokens,
                     "temperature": service_config.temperature,
-                    "result_format": "json"
+                    "result_format": "json",
+                    "incremental_output": True  # 流式输出只返回增量内容
                 }
             }
+            headers = {**service_config.headers, "X-DashScope-SSE": "enable", "Accept": "text/event-stream"}
+            
+            # 复用池化的HTTP客户端
+            client = self.clients.get_http_client(service_config)
             
             # 防止网络问题，使用 tenacity 进行重试
+            # 429交由速率限制器处理，不在此重试
             @retry(stop=stop_after_attempt(service_config.max_retries), 
-                  wait=wait_exponential(multiplier=1, min=1, max=10))
+                  wait=wait_exponential(multiplier=1, min=1, max=10),
+                  retry=retry_if_not_exception_type(RateLimitExceeded))
             async def call_qianwen_api():
-                async with httpx.AsyncClient(timeout=service_config.timeout) as client:
-                    response = await client.post(
-                        service_config.endpoint,
-                        json=request_data,
-                        headers=service_config.headers
-                    )
-                    response.raise_for_status()
-                    return response.json()
+                content = await self._stream_completion(
+                    client, service_config, request_data, headers, qianwen_stream_delta, on_content, on_restart
+                )
+                return {"output": {"text": content}}
         
             # 调用API
             logger.info(f"调用阿里千问 API: {service_config.endpoint}")
@@ -490,22 +660,29 @@ class PerformanceAnalyzer:
                 except json.JSONDecodeError as e:
                     # 结果不是JSON格式，采用文本解析
                     logger.warning(f"千问响应不是JSON格式，尝试用文本解析: {content}, 错误: {str(e)}")
-                    return self._parse_text_result(content, processed_data)
+                    return await self._parse_text_result(content, processed_data)
             
             # 处理异常情况
             logger.error(f"千问响应格式异常: {api_response}")
             return await self._analyze_with_fallback(processed_data)
             
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"使用阿里千问分析失败: {str(e)}")
             return await self._analyze_with_fallback(processed_data)
 
-    async def _analyze_with_deepseek(self, processed_data: Dict[str, Any], service_config: AIServiceConfig) -> AnalysisResults:
+    async def _analyze_with_deepseek(
+        self,
+        processed_data: Dict[str, Any],
+        service_config: AIServiceConfig,
+        on_content: Optional[ContentCallback] = None,
+        on_restart: Optional[RestartCallback] = None
+    ) -> AnalysisResults:
         """使用DeepSeek进行分析"""
         try:
-            import httpx
             import json
-            from tenacity import retry, stop_after_attempt, wait_exponential
+            from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
             
             # 构建提示语
             prompt = self._build_analysis_prompt(processed_data)
@@ -525,21 +702,23 @@ class PerformanceAnalyzer:
                 ],
                 "temperature": service_config.temperature,
                 "max_tokens": service_config.max_tokens,
-                "stream": False  # 确保非流式输出
+                "stream": True  # 流式输出，边生成边解析
             }
             
+            # 复用池化的HTTP客户端
+            client = self.clients.get_http_client(service_config)
+            
             # 防止网络问题，使用 tenacity 进行重试
+            # 429交由速率限制器处理，不在此重试
             @retry(stop=stop_after_attempt(service_config.max_retries), 
-                  wait=wait_exponential(multiplier=1, min=1, max=10))
+                  wait=wait_exponential(multiplier=1, min=1, max=10),
+                  retry=retry_if_not_exception_type(RateLimitExceeded))
             async def call_deepseek_api():
-                async with httpx.AsyncClient(timeout=service_config.timeout) as client:
-                    response = await client.post(
-                        service_config.endpoint,
-                        json=request_data,
-                        headers=service_config.headers
-                    )
-                    response.raise_for_status()
-                    return response.json()
+                content = await self._stream_completion(
+                    client, service_config, request_data, service_config.headers, openai_stream_delta,
+                    on_content, on_restart
+                )
+                return {"choices": [{"message": {"content": content}}]}
         
             # 调用API
             logger.info(f"调用DeepSeek API: {service_config.endpoint}")
@@ -651,12 +830,14 @@ class PerformanceAnalyzer:
                 except json.JSONDecodeError as e:
                     # 结果不是JSON格式，采用文本解析
                     logger.warning(f"DeepSeek响应不是JSON格式，尝试用文本解析: {content}, 错误: {str(e)}")
-                    return self._parse_text_result(content, processed_data)
+                    return await self._parse_text_result(content, processed_data)
             
             # 处理异常情况
             logger.error(f"DeepSeek响应内容为空: {api_response}")
             return await self._analyze_with_fallback(processed_data)
             
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"使用DeepSeek分析失败: {str(e)}")
             return await self._analyze_with_fallback(processed_data)
@@ -672,8 +853,9 @@ class PerformanceAnalyzer:
             # 计算性能评分
             performance_score = self._calculate_performance_score(performance_summary)
             
-            # 生成瓶颈分析
-            bottleneck_analysis = []
+            # 生成瓶颈分析：规则分析发现定位到具体函数，排在前面
+            local_analysis = data.get("local_analysis") or {}
+            bottleneck_analysis = local_analyzer.to_bottlenecks(local_analysis)
             for bt in bottleneck_types:
                 bottleneck_analysis.append(BottleneckAnalysis(
                     type=bt["type"],
@@ -684,7 +866,8 @@ class PerformanceAnalyzer:
                 ))
             
             # 生成优化建议
-            optimization_suggestions = self._generate_fallback_suggestions(
+            optimization_suggestions = local_analyzer.to_suggestions(local_analysis)
+            optimization_suggestions += self._generate_fallback_suggestions(
                 performance_summary, bottleneck_types
             )
             
@@ -695,7 +878,8 @@ class PerformanceAnalyzer:
                 performance_score=performance_score,
                 bottleneck_analysis=bottleneck_analysis,
                 optimization_suggestions=optimization_suggestions,
-                risk_assessment=risk_assessment
+                risk_assessment=risk_assessment,
+                source="rule"
             )
             
         except Exception as e:
@@ -704,7 +888,8 @@ class PerformanceAnalyzer:
                 performance_score=50.0,
                 bottleneck_analysis=[],
                 optimization_suggestions=[],
-                risk_assessment=RiskAssessment()
+                risk_assessment=RiskAssessment(),
+                source="rule"
             )
     
     def _build_analysis_prompt(self, processed_data: Dict[str, Any]) -> str:
@@ -723,7 +908,9 @@ class PerformanceAnalyzer:
             slow_func_text += f"{i}. {func.get('function_name', 'unknown')} - {func.get('duration', 0):.3f}秒\n"
             slow_func_text += f"   文件: {func.get('file_path', 'unknown')}\n"
         
-        return template.format(
+        call_tree = processed_data.get("call_tree_summary", "")
+        
+        prompt = template.format(
             request_path=basic_info.get("request_path", ""),
             request_method=basic_info.get("request_method", ""),
             status_code=basic_info.get("status_code", ""),
@@ -733,8 +920,19 @@ class PerformanceAnalyzer:
             memory_peak=perf_summary.get("memory_peak", 0),
             function_count=perf_summary.get("function_count", 0),
             slow_function_count=perf_summary.get("slow_function_count", 0),
-            slow_functions=slow_func_text
+            slow_functions=slow_func_text,
+            call_tree=call_tree
         )
+        # 自定义模板没有调用树占位符时附加在末尾
+        if call_tree and "{call_tree}" not in template:
+            prompt += f"\n## 调用树摘要\n{call_tree}\n"
+        
+        # 附加规则分析已确认的问题，模型重点分析规则无法解释的部分
+        findings = (processed_data.get("local_analysis") or {}).get("findings", [])
+        if findings:
+            prompt += "\n## 规则分析已发现的问题\n"
+            prompt += "".join(f"- [{finding['type']}] {finding['description']}\n" for finding in findings)
+        return prompt
     
     def _calculate_performance_score(self, performance_summary: Dict[str, Any]) -> float:
         """计算性能评分"""
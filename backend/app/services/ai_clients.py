@@ -0,0 +1,122 @@
+"""
+AI服务HTTP客户端注册表
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config.settings import settings
+from app.services.ai_config import AIServiceConfig
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def endpoint_origin(endpoint: str) -> str:
+    """提取服务端点的协议、主机和端口，同一来源的请求共用连接池"""
+    parts = urlsplit(endpoint or "")
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def credential_fingerprint(api_key: str, base_url: str) -> str:
+    """API密钥和服务地址的摘要，用作客户端缓存键，避免密钥出现在内存键和日志中"""
+    digest = hashlib.sha256(f"{api_key or ''}\0{base_url or ''}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ProviderClientRegistry:
+    """按服务提供商和端点缓存长连接客户端
+
+    连接池绑定创建时的事件循环，因此按事件循环区分客户端（API进程和每个
+    worker进程各只有一个循环）；事件循环关闭后对应的客户端会被丢弃。
+    """
+
+    def __init__(self):
+        self._clients: Dict[Tuple[int, str, str], Tuple[asyncio.AbstractEventLoop, Any]] = {}
+
+    def _get(self, kind: str, key: str, factory):
+        loop = asyncio.get_running_loop()
+        self._prune()
+        client_key = (id(loop), kind, key)
+        entry = self._clients.get(client_key)
+        if entry is None:
+            entry = (loop, factory())
+            self._clients[client_key] = entry
+            logger.info(f"创建AI服务客户端: {kind} {key}")
+        return entry[1]
+
+    def _prune(self):
+        for client_key, (loop, _) in list(self._clients.items()):
+            if loop.is_closed():
+                del self._clients[client_key]
+
+    def get_http_client(self, service_config: AIServiceConfig) -> httpx.AsyncClient:
+        """获取指定端点的httpx客户端（支持时启用HTTP/2）"""
+        def create():
+            return httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE and settings.ai_http2_enabled,
+                limits=httpx.Limits(
+                    max_connections=settings.ai_http_max_connections,
+                    max_keepalive_connections=settings.ai_http_max_keepalive_connections,
+                    keepalive_expiry=settings.ai_http_keepalive_expiry
+                ),
+                timeout=httpx.Timeout(service_config.timeout, connect=settings.ai_http_connect_timeout)
+            )
+
+        return self._get("httpx", f"{service_config.provider.value}:{endpoint_origin(service_config.endpoint)}", create)
+
+    def get_aiohttp_session(self, service_config: AIServiceConfig):
+        """获取指定端点的aiohttp会话"""
+        import aiohttp
+
+        def create():
+            return aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.ai_http_max_connections,
+                    keepalive_timeout=settings.ai_http_keepalive_expiry
+                )
+            )
+
+        return self._get("aiohttp", f"{service_config.provider.value}:{endpoint_origin(service_config.endpoint)}", create)
+
+    def get_openai_client(self, service_config: AIServiceConfig):
+        """获取OpenAI客户端，底层复用池化的httpx客户端"""
+        import openai
+
+        http_client = self.get_http_client(service_config)
+
+        def create():
+            return openai.AsyncOpenAI(
+                api_key=service_config.api_key,
+                base_url=service_config.params.get("base_url") or None,
+                http_client=http_client
+            )
+
+        fingerprint = credential_fingerprint(service_config.api_key, service_config.params.get("base_url", ""))
+        return self._get("openai", fingerprint, create)
+
+    async def close(self):
+        """关闭当前事件循环上的所有客户端"""
+        loop = asyncio.get_running_loop()
+        for client_key, (client_loop, client) in list(self._clients.items()):
+            if client_loop is not loop:
+                continue
+            try:
+                # OpenAI客户端复用的httpx客户端单独关闭
+                if client_key[1] == "aiohttp":
+                    await client.close()
+                elif client_key[1] == "httpx":
+                    await client.aclose()
+            except Exception as e:
+                logger.error(f"关闭AI服务客户端失败: {str(e)}")
+            del self._clients[client_key]
+        self._prune()
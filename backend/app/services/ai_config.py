@@ -2,6 +2,7 @@
 AI服务配置管理
 """
 import os
+import time
 import yaml
 import json
 from typing import Dict, Any, Optional, List
@@ -11,6 +12,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 检查数据库配置版本的最小间隔（秒）
+CONFIG_CHECK_INTERVAL = 5.0
+
 
 class AIProvider(Enum):
     """AI服务提供商"""
@@ -48,6 +52,11 @@ class AIServiceConfig:
     # 成本控制
     cost_per_token: float = 0.0
     daily_limit: float = 100.0  # 每日成本限制（美元）
+    
+    # 速率限制（0表示不限制）
+    requests_per_minute: int = 60
+    tokens_per_minute: int = 0
+    max_concurrency: int = 8
 
 
 class AIConfigManager:
@@ -62,6 +71,10 @@ class AIConfigManager:
         self.default_service: str = "openai"
         self.analysis_templates: Dict[str, str] = {}
         
+        # 已加载的数据库配置版本及最近一次检查时间
+        self._db_version = None
+        self._last_check = 0.0
+        
         self._load_config()
     
     def _load_env_vars(self):
@@ -164,7 +177,10 @@ class AIConfigManager:
                     max_retries=service_config.get("max_retries", 3),
                     retry_delay=service_config.get("retry_delay", 1.0),
                     cost_per_token=service_config.get("cost_per_token", 0.0),
-                    daily_limit=service_config.get("daily_limit", 100.0)
+                    daily_limit=service_config.get("daily_limit", 100.0),
+                    requests_per_minute=service_config.get("requests_per_minute", 60),
+                    tokens_per_minute=service_config.get("tokens_per_minute", 0),
+                    max_concurrency=service_config.get("max_concurrency", 8)
                 )
             
             # 解析默认服务
@@ -204,6 +220,9 @@ class AIConfigManager:
 ## 最慢的函数调用
 {slow_functions}
 
+## 调用树摘要
+{call_tree}
+
 请提供：
 1. 性能评分（0-100分）
 2. 主要性能瓶颈分析
@@ -351,21 +370,68 @@ class AIConfigManager:
                             }
                         )
                     
+                    # 速率限制配置
+                    service = self.services.get(self.default_service)
+                    if service is not None:
+                        service.requests_per_minute = ai_config.get("requestsPerMinute", service.requests_per_minute)
+                        service.tokens_per_minute = ai_config.get("tokensPerMinute", service.tokens_per_minute)
+                        service.max_concurrency = ai_config.get("maxConcurrency", service.max_concurrency)
+                    
                     logger.info(f"从数据库加载AI配置成功，默认服务: {self.default_service}")
             
         except Exception as e:
             logger.error(f"从数据库加载AI配置失败: {str(e)}")
     
+    async def refresh_from_database(self, db, force: bool = False) -> bool:
+        """配置版本变化时才从数据库重新加载配置
+        
+        每 CONFIG_CHECK_INTERVAL 秒最多检查一次平台设置的版本号（只读取版本字段），
+        版本与已加载的一致时直接使用内存中的配置。
+        
+        Returns:
+            是否重新加载了配置
+        """
+        if db is None:
+            return False
+        
+        now = time.monotonic()
+        if not force and self._db_version is not None and now - self._last_check < CONFIG_CHECK_INTERVAL:
+            return False
+        self._last_check = now
+        
+        try:
+            doc = await db.system_config.find_one(
+                {"config_key": "platform_settings"},
+                {"version": 1, "updated_at": 1}
+            )
+            # 兼容没有版本号的旧配置，使用更新时间作为版本
+            version = (doc.get("version"), doc.get("updated_at")) if doc else (None, None)
+            if not force and version == self._db_version:
+                return False
+            
+            await self._load_from_database(db)
+            self._db_version = version
+            logger.info(f"AI配置已更新，版本: {version[0]}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"检查AI配置版本失败: {str(e)}")
+            return False
+    
+    def invalidate(self):
+        """标记配置已变更，下次获取时重新加载"""
+        self._db_version = None
+        self._last_check = 0.0
+    
     def get_service(self, service_name: Optional[str] = None) -> Optional[AIServiceConfig]:
         """获取AI服务配置"""
         service_name = service_name or self.default_service
         return self.services.get(service_name)
     
     async def get_service_async(self, service_name: Optional[str] = None, db=None) -> Optional[AIServiceConfig]:
-        """获取AI服务配置（支持从数据库动态加载）"""
-        # 如果提供了数据库连接，则从数据库加载最新配置
+        """获取AI服务配置（数据库配置变更后自动重新加载）"""
         if db is not None:
-            await self._load_from_database(db)
+            await self.refresh_from_database(db)
         
         service_name = service_name or self.default_service
         return self.services.get(service_name)
@@ -0,0 +1,163 @@
+"""
+AI分析结果缓存
+"""
+import hashlib
+import json
+import math
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.utils.routes import route_key
+
+logger = logging.getLogger(__name__)
+
+# 提示词版本，修改内置提示词或结果解析逻辑时递增，使旧缓存失效
+ANALYSIS_PROMPT_VERSION = "4"
+
+# 相似度计算时比较的慢函数数量
+FINGERPRINT_FUNCTIONS = 5
+# 同一路由参与相似度比较的最多缓存条数
+SIMILARITY_CANDIDATES = 20
+
+
+def duration_bucket(seconds: float) -> int:
+    """响应时间按2的幂分桶（毫秒），相近的耗时落入同一桶"""
+    milliseconds = (seconds or 0) * 1000
+    return int(math.log2(milliseconds)) if milliseconds >= 1 else 0
+
+
+def profile_features(processed_data: Dict[str, Any]) -> Dict[str, Any]:
+    """从预处理后的性能数据提取用于缓存匹配的特征"""
+    basic_info = processed_data.get("basic_info", {})
+    summary = processed_data.get("performance_summary", {})
+    slow_functions = processed_data.get("slow_functions", [])[:FINGERPRINT_FUNCTIONS]
+    return {
+        "method": (basic_info.get("request_method") or "").upper(),
+        # 按路由模板匹配，/orders/1 与 /orders/2 共用缓存
+        "path": route_key(basic_info.get("request_path") or "", basic_info.get("request_route")),
+        "duration_bucket": duration_bucket(summary.get("total_duration", 0)),
+        "functions": sorted({
+            f"{fc.get('file_path', '')}:{fc.get('function_name', '')}" for fc in slow_functions
+        }),
+        "bottlenecks": sorted({
+            f"{bt.get('type')}:{bt.get('severity')}" for bt in processed_data.get("bottleneck_types", [])
+        })
+    }
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def scope_key(features: Dict[str, Any], scope: Dict[str, Any]) -> str:
+    """同一项目、服务、模型、提示词版本和路由的缓存范围"""
+    return _digest({**scope, "method": features["method"], "path": features["path"]})
+
+
+def profile_fingerprint(features: Dict[str, Any], scope: Dict[str, Any]) -> str:
+    """性能特征和分析配置的指纹"""
+    return _digest({**scope, **features})
+
+
+def _jaccard(a: List[str], b: List[str]) -> float:
+    # 双方都没有特征时无从比较，按不相似处理
+    if not a and not b:
+        return 0.0
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b)
+
+
+def feature_similarity(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """两份性能特征的相似度(0-1)：慢函数、瓶颈类型和耗时分桶加权"""
+    bucket_distance = abs(a["duration_bucket"] - b["duration_bucket"])
+    bucket_score = 1.0 if bucket_distance == 0 else 0.5 if bucket_distance == 1 else 0.0
+    return (
+        0.5 * _jaccard(a["functions"], b["functions"])
+        + 0.3 * _jaccard(a["bottlenecks"], b["bottlenecks"])
+        + 0.2 * bucket_score
+    )
+
+
+class AnalysisCacheService:
+    """AI分析结果缓存服务
+
+    以性能特征指纹为键保存AI分析结果，完全相同的特征直接命中；否则在同一路由的
+    缓存中按相似度查找，不低于阈值时复用结果。
+    """
+
+    def __init__(self):
+        self.db = get_database()
+        self.collection = self.db.ai_analysis_cache if self.db is not None else None
+
+    async def lookup(self, processed_data: Dict[str, Any], scope: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """查找可复用的分析结果"""
+        if not settings.ai_analysis_cache_enabled or self.collection is None:
+            return None
+
+        try:
+            features = profile_features(processed_data)
+            fingerprint = profile_fingerprint(features, scope)
+            now = datetime.utcnow()
+
+            best = await self.collection.find_one(
+                {"fingerprint": fingerprint, "expires_at": {"$gt": now}}
+            )
+            similarity = 1.0
+            if best is None:
+                cursor = self.collection.find(
+                    {"scope_key": scope_key(features, scope), "expires_at": {"$gt": now}},
+                    {"fingerprint": 1, "features": 1, "results": 1, "created_at": 1}
+                ).sort("created_at", -1).limit(SIMILARITY_CANDIDATES)
+                similarity = 0.0
+                for doc in await cursor.to_list(SIMILARITY_CANDIDATES):
+                    score = feature_similarity(features, doc["features"])
+                    if score > similarity:
+                        best, similarity = doc, score
+                if best is None or similarity < settings.ai_analysis_cache_similarity:
+                    return None
+
+            await self.collection.update_one(
+                {"fingerprint": best["fingerprint"]},
+                {"$inc": {"hit_count": 1}, "$set": {"last_hit_at": now}}
+            )
+            logger.info(f"AI分析缓存命中: {best['fingerprint'][:12]}, 相似度 {similarity:.2f}")
+            return {
+                "results": best["results"],
+                "fingerprint": best["fingerprint"],
+                "similarity": round(similarity, 4),
+                "cached_at": best.get("created_at")
+            }
+
+        except Exception as e:
+            logger.error(f"查询AI分析缓存失败: {str(e)}")
+            return None
+
+    async def store(self, processed_data: Dict[str, Any], scope: Dict[str, Any], results: Dict[str, Any]):
+        """保存AI分析结果"""
+        if not settings.ai_analysis_cache_enabled or self.collection is None:
+            return
+
+        try:
+            features = profile_features(processed_data)
+            fingerprint = profile_fingerprint(features, scope)
+            now = datetime.utcnow()
+            await self.collection.update_one(
+                {"fingerprint": fingerprint},
+                {
+                    "$set": {
+                        "scope_key": scope_key(features, scope),
+                        "scope": scope,
+                        "features": features,
+                        "results": results,
+                        "created_at": now,
+                        "expires_at": now + timedelta(hours=settings.ai_analysis_cache_ttl_hours)
+                    },
+                    "$setOnInsert": {"hit_count": 0}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"保存AI分析缓存失败: {str(e)}")
@@ -0,0 +1,97 @@
+"""
+批量AI分析执行器
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from app.config.settings import settings
+from app.models.analysis import AnalysisRecord, AnalysisStatus, AnalysisPriority
+from app.services.ai_analyzer import performance_analyzer, PerformanceAnalyzer
+from app.utils.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisExecutor:
+    """批量分析执行器
+
+    在单个worker的事件循环中同时进行多个分析，实际的调用速率和并发由
+    PerformanceAnalyzer 按服务的速率限制控制（Redis共享额度，收到429时自适应降低并发）。
+    """
+
+    def __init__(self, analyzer: Optional[PerformanceAnalyzer] = None, max_in_flight: Optional[int] = None):
+        self.analyzer = analyzer or performance_analyzer
+        self.max_in_flight = max_in_flight or settings.ai_batch_max_in_flight
+
+    async def analyze_record(
+        self,
+        performance_record_id: str,
+        ai_service: Optional[str] = None,
+        priority: str = 'normal',
+        task_id: str = ""
+    ) -> Dict[str, Any]:
+        """分析单条性能记录并保存分析结果"""
+        performance_record = await db_manager.get_performance_record(performance_record_id)
+        if not performance_record:
+            raise ValueError(f"性能记录不存在: {performance_record_id}")
+
+        analysis_results = await self.analyzer.analyze_performance(performance_record, ai_service=ai_service)
+
+        now = datetime.utcnow()
+        analysis_record = AnalysisRecord(
+            analysis_id=f"analysis_{performance_record_id}_{int(now.timestamp())}",
+            performance_record_id=performance_record_id,
+            project_key=performance_record.get("project_key", "unknown"),
+            ai_service=ai_service or "fallback",
+            results=analysis_results,
+            task_id=task_id,
+            status=AnalysisStatus.SUCCESS,
+            created_at=now,
+            updated_at=now,
+            priority=AnalysisPriority(priority),
+            analysis_type="ai_analysis"
+        )
+        await db_manager.save_analysis_record(analysis_record)
+
+        return {
+            'record_id': performance_record_id,
+            'analysis_id': analysis_record.analysis_id,
+            'status': 'success',
+            'performance_score': analysis_results.performance_score
+        }
+
+    async def run(
+        self,
+        performance_record_ids: List[str],
+        ai_service: Optional[str] = None,
+        priority: str = 'normal',
+        task_id: str = ""
+    ) -> Dict[str, Any]:
+        """并发分析一批性能记录"""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def analyze(record_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self.analyze_record(record_id, ai_service, priority, task_id)
+                except Exception as e:
+                    logger.error(f"批量分析失败: {record_id}, {str(e)}")
+                    return {'record_id': record_id, 'status': 'failed', 'error': str(e)}
+
+        started = datetime.utcnow()
+        results = await asyncio.gather(*[analyze(record_id) for record_id in performance_record_ids])
+        elapsed = (datetime.utcnow() - started).total_seconds()
+
+        success_count = sum(1 for result in results if result['status'] == 'success')
+        logger.info(f"批量分析完成: 成功 {success_count}/{len(results)}, 耗时 {elapsed:.1f}秒")
+
+        return {
+            'status': 'success',
+            'total_count': len(results),
+            'success_count': success_count,
+            'failed_count': len(results) - success_count,
+            'elapsed_seconds': round(elapsed, 3),
+            'results': results
+        }
@@ -0,0 +1,196 @@
+"""
+AI分析进度推送
+"""
+import asyncio
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from app.utils.database import get_database, get_redis
+from app.utils.partial_json import PartialJSONParser
+
+logger = logging.getLogger(__name__)
+
+# 分析进度Redis频道前缀
+PROGRESS_CHANNEL_PREFIX = "analysis_progress:"
+# 分析结束的状态
+TERMINAL_STATUSES = ("SUCCESS", "FAILURE", "CANCELED")
+
+# 流式输出阶段的进度范围
+STREAM_PROGRESS_START = 30
+STREAM_PROGRESS_END = 75
+# 两次写入部分结果之间的最小间隔（秒）
+PERSIST_INTERVAL = 0.5
+# SSE连接的最长保持时间（秒），与任务超时一致
+STREAM_TIMEOUT = 330
+
+
+def progress_channel(analysis_id: str) -> str:
+    return f"{PROGRESS_CHANNEL_PREFIX}{analysis_id}"
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化为SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class AnalysisProgressReporter:
+    """流式分析进度上报
+
+    增量解析模型输出，将已完整的部分（瓶颈、建议、风险等）写入分析记录的
+    partial_results 字段，并通过Redis频道推送给SSE连接。
+    """
+
+    def __init__(self, analysis_id: str, on_progress: Optional[Callable[[int], None]] = None):
+        self.analysis_id = analysis_id
+        self.on_progress = on_progress
+        self.parser = PartialJSONParser()
+        self.progress = STREAM_PROGRESS_START
+        self._persisted_at = 0.0
+        self._pending = False
+
+    async def reset(self):
+        """重新开始接收模型输出（请求重试），丢弃上一次尝试已解析的部分结果"""
+        started = bool(self.parser.buffer)
+        self.parser = PartialJSONParser()
+        self.progress = STREAM_PROGRESS_START
+        if not started:
+            return
+
+        await self.publish("partial", {"progress": self.progress, "partial_results": {}})
+        self._pending = True
+        await self.flush()
+
+    async def on_content(self, delta: str):
+        """接收模型输出的增量文本"""
+        if not self.parser.feed(delta):
+            return
+
+        sections = self.parser.snapshot()
+        completed = len(self.parser.fields) + sum(len(items) for items in self.parser.items.values())
+        self.progress = min(STREAM_PROGRESS_END, STREAM_PROGRESS_START + completed * 5)
+
+        await self.publish("partial", {"progress": self.progress, "partial_results": sections})
+        if self.on_progress:
+            self.on_progress(self.progress)
+
+        # 按间隔写入数据库，新连接的SSE客户端可以读取到最近的部分结果
+        self._pending = True
+        if time.monotonic() - self._persisted_at >= PERSIST_INTERVAL:
+            await self.flush()
+
+    async def flush(self):
+        """写入尚未保存的部分结果"""
+        if not self._pending:
+            return
+        self._pending = False
+        self._persisted_at = time.monotonic()
+        try:
+            db = get_database()
+            await db.ai_analysis_results.update_one(
+                {"analysis_id": self.analysis_id},
+                {"$set": {
+                    "status": "IN_PROGRESS",
+                    "progress": self.progress,
+                    "partial_results": self.parser.snapshot(),
+                    "updated_at": datetime.utcnow()
+                }}
+            )
+        except Exception as e:
+            logger.error(f"保存部分分析结果失败: {str(e)}")
+
+    async def complete(self, results: Dict[str, Any]):
+        await self.publish("completed", {"progress": 100, "results": results})
+
+    async def fail(self, error: str):
+        await self.publish("failed", {"error": error})
+
+    async def publish(self, event: str, data: Dict[str, Any]):
+        try:
+            redis = get_redis()
+            if redis is not None:
+                await redis.publish(
+                    progress_channel(self.analysis_id),
+                    json.dumps({"event": event, "data": data}, ensure_ascii=False, default=str)
+                )
+        except Exception as e:
+            logger.error(f"推送分析进度失败: {str(e)}")
+
+
+def _snapshot_event(doc: Dict[str, Any]) -> str:
+    status = doc.get("status")
+    if status == "SUCCESS":
+        return format_sse("completed", {"progress": 100, "results": doc.get("results")})
+    if status in TERMINAL_STATUSES:
+        return format_sse("failed", {"status": status, "error": doc.get("error")})
+    return format_sse("partial", {
+        "progress": doc.get("progress", 0),
+        "partial_results": doc.get("partial_results") or {}
+    })
+
+
+async def stream_analysis_events(analysis_id: str, poll_interval: float = 1.0) -> AsyncIterator[str]:
+    """推送分析进度的SSE事件流
+
+    先发送数据库中的当前状态，之后转发Redis频道中的进度事件；没有Redis或
+    没有新事件时按间隔检查分析记录，分析结束后关闭流。
+    """
+    db = get_database()
+    redis = get_redis()
+    pubsub = None
+    deadline = time.monotonic() + STREAM_TIMEOUT
+
+    try:
+        if redis is not None:
+            pubsub = redis.pubsub()
+            await pubsub.subscribe(progress_channel(analysis_id))
+
+        # 订阅之后再读取当前状态，避免遗漏两者之间的事件
+        doc = await db.ai_analysis_results.find_one({"analysis_id": analysis_id})
+        if doc is None:
+            return
+        last_event = _snapshot_event(doc)
+        yield last_event
+        if doc.get("status") in TERMINAL_STATUSES:
+            return
+
+        while time.monotonic() < deadline:
+            message = None
+            if pubsub is not None:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=poll_interval)
+            else:
+                await asyncio.sleep(poll_interval)
+
+            if message:
+                payload = json.loads(message["data"])
+                yield format_sse(payload["event"], payload["data"])
+                if payload["event"] in ("completed", "failed"):
+                    return
+                continue
+
+            doc = await db.ai_analysis_results.find_one(
+                {"analysis_id": analysis_id},
+                {"status": 1, "progress": 1, "partial_results": 1, "results": 1, "error": 1}
+            )
+            if doc is None:
+                return
+            if doc.get("status") in TERMINAL_STATUSES:
+                yield _snapshot_event(doc)
+                return
+            if pubsub is None:
+                event = _snapshot_event(doc)
+                if event != last_event:
+                    last_event = event
+                    yield event
+
+        yield format_sse("timeout", {"analysis_id": analysis_id})
+
+    finally:
+        if pubsub is not None:
+            try:
+                await pubsub.unsubscribe(progress_channel(analysis_id))
+                await pubsub.close()
+            except Exception as e:
+                logger.error(f"关闭进度订阅失败: {str(e)}")
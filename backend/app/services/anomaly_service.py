@@ -0,0 +1,292 @@
+"""
+数据上报实时异常检测服务
+"""
+from typing import List, Optional, Dict, Any, Tuple, Set
+from collections import OrderedDict
+from datetime import datetime
+import asyncio
+import math
+import time
+import uuid
+import logging
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.models.performance import PerformanceRecord
+from app.utils.routes import route_key
+from app.utils.latency import LATENCY_BUCKETS, latency_bucket_index, histogram_percentile
+
+logger = logging.getLogger(__name__)
+
+# 异常类型
+ANOMALY_LATENCY = "latency_p95"
+ANOMALY_ERROR_RATE = "error_rate"
+ANOMALY_TRAFFIC_DROP = "traffic_drop"
+
+
+class RouteBaseline:
+    """单个路由的当前窗口计数和EWMA基线"""
+
+    __slots__ = (
+        "window_start", "last_seen", "count", "errors", "duration_max", "latency_counts",
+        "windows", "p95_mean", "p95_var", "error_rate", "count_mean", "active"
+    )
+
+    def __init__(self, window_start: float):
+        self.window_start = window_start
+        self.last_seen = window_start
+        self.count = 0
+        self.errors = 0
+        self.duration_max = 0.0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.windows = 0
+        self.p95_mean = 0.0
+        self.p95_var = 0.0
+        self.error_rate = 0.0
+        self.count_mean = 0.0
+        # 进行中的异常: {异常类型: 异常ID}
+        self.active: Dict[str, str] = {}
+
+    def reset_window(self, window_start: float):
+        self.window_start = window_start
+        self.count = 0
+        self.errors = 0
+        self.duration_max = 0.0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class AnomalyDetector:
+    """路由级实时异常检测器
+
+    每条记录只更新所属路由当前窗口的计数和直方图（O(1)）；窗口结束时计算窗口P95、5xx比例和请求数，
+    与EWMA基线比较，连续异常的窗口合并为一个异常区间写入数据库。窗口由下一条记录或定时检查关闭，
+    停止上报的路由同样会被检测（流量骤降）。基线保存在进程内存中，超出路由数上限时淘汰最久未访问的路由，
+    被淘汰或长时间无上报的路由的进行中异常会被关闭。
+    """
+
+    def __init__(self):
+        self._routes: "OrderedDict[Tuple[str, str, str], RouteBaseline]" = OrderedDict()
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            db = get_database()
+            self._collection = db.anomaly_windows if db is not None else None
+        return self._collection
+
+    async def observe(self, project_key: str, record: PerformanceRecord, now: Optional[float] = None):
+        """记录一条性能数据，窗口结束时执行检测"""
+        try:
+            now = time.time() if now is None else now
+            key = (project_key, record.request_info.method, route_key(record.request_info.path, record.request_info.route))
+
+            route = self._routes.get(key)
+            if route is None:
+                route = RouteBaseline(now)
+                self._routes[key] = route
+                if len(self._routes) > settings.anomaly_max_routes:
+                    await self._evict(self._routes.popitem(last=False)[1])
+            else:
+                self._routes.move_to_end(key)
+
+            if now - route.window_start >= settings.anomaly_window_seconds:
+                await self._advance(key, route, now)
+
+            duration = record.performance_metrics.total_duration
+            route.last_seen = now
+            route.count += 1
+            route.duration_max = max(route.duration_max, duration)
+            route.latency_counts[latency_bucket_index(duration)] += 1
+            if record.response_info.status_code >= 500:
+                route.errors += 1
+
+        except Exception as e:
+            logger.error(f"实时异常检测失败: {str(e)}")
+
+    async def tick(self, now: Optional[float] = None):
+        """关闭已到期但没有新记录的窗口，清理长时间无上报的路由"""
+        now = time.time() if now is None else now
+        for key, route in list(self._routes.items()):
+            try:
+                if now - route.last_seen >= settings.anomaly_idle_seconds:
+                    self._routes.pop(key, None)
+                    await self._evict(route)
+                elif now - route.window_start >= settings.anomaly_window_seconds:
+                    await self._advance(key, route, now)
+            except Exception as e:
+                logger.error(f"异常检测定时检查失败: {key}, {str(e)}")
+
+    def start(self):
+        """启动定时检查（在应用事件循环中运行）"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._tick_loop())
+
+    async def stop(self):
+        """停止定时检查"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(settings.anomaly_window_seconds)
+            await self.tick()
+
+    async def _advance(self, key: Tuple[str, str, str], route: RouteBaseline, now: float):
+        """结束路由的当前窗口并开始新窗口"""
+        window_start = route.window_start
+        findings, evaluated = self._close_window(route)
+        route.reset_window(now)
+        if findings or route.active:
+            await self._record_findings(key, route, findings, evaluated, window_start, now)
+
+    async def _evict(self, route: RouteBaseline):
+        """路由不再跟踪时关闭其进行中的异常，避免异常区间永远保持open"""
+        for anomaly_id in route.active.values():
+            await self.collection.update_one(
+                {"anomaly_id": anomaly_id},
+                {"$set": {"status": "closed", "updated_at": datetime.utcnow()}}
+            )
+        route.active.clear()
+
+    def _close_window(self, route: RouteBaseline) -> Tuple[Dict[str, Dict[str, float]], Set[str]]:
+        """结束当前窗口，返回 ({异常类型: 详情}, 本窗口可判定的异常类型)，并用正常窗口更新基线
+
+        请求数不足的窗口无法判定响应时间和错误率，进行中的这两类异常保持不变，只判定流量骤降。
+        """
+        findings: Dict[str, Dict[str, float]] = {}
+        evaluated: Set[str] = set()
+        alpha = settings.anomaly_smoothing
+        warmed_up = route.windows >= settings.anomaly_warmup_windows
+
+        if warmed_up:
+            evaluated.add(ANOMALY_TRAFFIC_DROP)
+            if (route.count_mean >= settings.anomaly_min_requests
+                    and route.count < route.count_mean * settings.anomaly_traffic_drop_ratio):
+                findings[ANOMALY_TRAFFIC_DROP] = {"value": float(route.count), "baseline": route.count_mean}
+
+        if route.count < settings.anomaly_min_requests:
+            return findings, evaluated
+
+        p95 = histogram_percentile(route.latency_counts, 95, route.duration_max)
+        error_rate = route.errors / route.count
+
+        if warmed_up:
+            evaluated.update((ANOMALY_LATENCY, ANOMALY_ERROR_RATE))
+            std = math.sqrt(route.p95_var)
+            if (p95 > route.p95_mean + settings.anomaly_z_threshold * std
+                    and p95 > route.p95_mean * (1 + settings.anomaly_min_increase)):
+                findings[ANOMALY_LATENCY] = {"value": p95, "baseline": route.p95_mean}
+
+            # 以基线错误率为期望做二项分布z检验
+            expected = route.error_rate
+            variance = route.count * max(expected * (1 - expected), 1e-4)
+            z_score = (route.errors - route.count * expected) / math.sqrt(variance)
+            if error_rate >= settings.anomaly_min_error_rate and z_score > settings.anomaly_z_threshold:
+                findings[ANOMALY_ERROR_RATE] = {"value": error_rate, "baseline": expected}
+
+        # 异常窗口不参与基线更新，避免持续异常时基线被拉高
+        if ANOMALY_LATENCY not in findings:
+            if route.windows == 0:
+                route.p95_mean = p95
+            else:
+                delta = p95 - route.p95_mean
+                route.p95_mean += alpha * delta
+                route.p95_var = (1 - alpha) * (route.p95_var + alpha * delta * delta)
+        if ANOMALY_ERROR_RATE not in findings:
+            if route.windows == 0:
+                route.error_rate = error_rate
+            else:
+                route.error_rate += alpha * (error_rate - route.error_rate)
+        if route.windows == 0:
+            route.count_mean = float(route.count)
+        else:
+            route.count_mean += alpha * (route.count - route.count_mean)
+        route.windows += 1
+
+        return findings, evaluated
+
+    async def _record_findings(
+        self,
+        key: Tuple[str, str, str],
+        route: RouteBaseline,
+        findings: Dict[str, Dict[str, float]],
+        evaluated: Set[str],
+        window_start: float,
+        window_end: float
+    ):
+        """开启、延长或结束异常区间（本窗口无法判定的异常类型保持不变）"""
+        project_key, method, path = key
+        start = datetime.utcfromtimestamp(window_start)
+        end = datetime.utcfromtimestamp(window_end)
+
+        for anomaly_type in list(route.active):
+            if anomaly_type in evaluated and anomaly_type not in findings:
+                anomaly_id = route.active.pop(anomaly_type)
+                await self.collection.update_one(
+                    {"anomaly_id": anomaly_id},
+                    {"$set": {"status": "closed", "updated_at": datetime.utcnow()}}
+                )
+
+        for anomaly_type, detail in findings.items():
+            anomaly_id = route.active.get(anomaly_type)
+            if anomaly_id:
+                await self.collection.update_one(
+                    {"anomaly_id": anomaly_id},
+                    {
+                        "$set": {"end_time": end, "updated_at": datetime.utcnow()},
+                        "$max": {"peak_value": detail["value"]},
+                        "$inc": {"window_count": 1}
+                    }
+                )
+            else:
+                anomaly_id = str(uuid.uuid4())
+                route.active[anomaly_type] = anomaly_id
+                await self.collection.insert_one({
+                    "anomaly_id": anomaly_id,
+                    "project_key": project_key,
+                    "method": method,
+                    "path": path,
+                    "anomaly_type": anomaly_type,
+                    "start_time": start,
+                    "end_time": end,
+                    "peak_value": detail["value"],
+                    "baseline_value": detail["baseline"],
+                    "window_count": 1,
+                    "status": "open",
+                    "created_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                })
+                logger.warning(
+                    f"检测到实时异常: {project_key} {method} {path} {anomaly_type} "
+                    f"当前值 {detail['value']:.4f}, 基线 {detail['baseline']:.4f}"
+                )
+
+    async def get_anomalies(
+        self,
+        project_key: str,
+        status: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """获取项目的异常区间"""
+        try:
+            query: Dict[str, Any] = {"project_key": project_key}
+            if status:
+                query["status"] = status
+
+            cursor = self.collection.find(query, {"_id": 0}).sort("start_time", -1).limit(limit)
+            return await cursor.to_list(None)
+
+        except Exception as e:
+            logger.error(f"获取异常区间失败: {str(e)}")
+            raise
+
+
+# 全局异常检测器实例
+anomaly_detector = AnomalyDetector()
@@ -0,0 +1,290 @@
+"""
+自动AI分析调度与阈值告警服务
+"""
+from typing import List, Optional, Dict, Any, Set, Tuple, Callable, Awaitable
+from datetime import datetime, timedelta
+import hashlib
+import json
+import uuid
+import logging
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.models.project import ProjectConfig
+from app.services.analysis_cache import duration_bucket
+from app.utils.routes import route_key
+from app.utils.latency import LATENCY_BUCKETS, histogram_percentile
+from app.services.rollup_service import RollupService, bucket_start, ROLLUP_BUCKET
+
+logger = logging.getLogger(__name__)
+
+# 调度进度记录的文档ID
+SCHEDULER_STATE_ID = "auto_analysis_scheduler"
+
+# 候选状态
+CANDIDATE_PENDING = "pending"
+CANDIDATE_QUEUED = "queued"
+CANDIDATE_DUPLICATE = "duplicate"
+CANDIDATE_SKIPPED = "skipped"
+
+# 告警指标
+ALERT_RESPONSE_TIME = "response_time"
+ALERT_ERROR_RATE = "error_rate"
+
+# 提交自动分析任务的回调：(trace_id, project_key) -> analysis_id
+AnalysisDispatcher = Callable[[str, str], Awaitable[str]]
+
+RouteWindow = Tuple[str, str, str, datetime]
+
+
+def candidate_fingerprint(record: Dict[str, Any]) -> str:
+    """候选链路的指纹：路由、耗时分桶和规则发现，同一指纹只分析一次"""
+    request_info = record.get("request_info") or {}
+    local_analysis = record.get("local_analysis") or {}
+    metrics = record.get("performance_metrics") or {}
+    features = {
+        "method": (request_info.get("method") or "").upper(),
+        "path": route_key(request_info.get("path"), request_info.get("route")),
+        "duration_bucket": duration_bucket(metrics.get("total_duration", 0)),
+        "findings": sorted(
+            f"{finding.get('type')}:{finding.get('function', '')}"
+            for finding in local_analysis.get("findings", [])
+        )
+    }
+    return hashlib.sha1(json.dumps(features, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AutoAnalysisService:
+    """自动分析调度服务类
+
+    数据上报时，规则无法解释的慢链路按 (项目, 路由, 小时窗口, 指纹) 合并写入候选集合，
+    只保留最慢的一条作为代表。调度任务只读取已关闭窗口中的待处理候选（按索引查询，
+    不扫描性能记录）：每个路由窗口选出请求最多的指纹，跳过近期已分析过的指纹，
+    在项目每日预算内提交AI分析；同时检查新关闭的rollup小时桶是否超过项目的告警阈值。
+    """
+
+    def __init__(self):
+        self.db = get_database()
+        self.rollup_service = RollupService()
+        self.candidates_collection = self.db.analysis_candidates if self.db is not None else None
+        self.alerts_collection = self.db.alert_events if self.db is not None else None
+        self.state_collection = self.db.detector_state if self.db is not None else None
+        self.projects_collection = self.db.projects if self.db is not None else None
+
+    async def add_candidate(self, project_key: str, record: Dict[str, Any]):
+        """将规则无法解释的慢链路合并到所在路由窗口的候选"""
+        request_info = record.get("request_info") or {}
+        duration = (record.get("performance_metrics") or {}).get("total_duration", 0)
+        now = datetime.utcnow()
+
+        # 以聚合管道更新：相同指纹只计数，耗时更长时替换代表链路
+        await self.candidates_collection.update_one(
+            {
+                "project_key": project_key,
+                "method": request_info.get("method"),
+                "path": route_key(request_info.get("path"), request_info.get("route")),
+                "bucket": bucket_start(record.get("timestamp") or now),
+                "fingerprint": candidate_fingerprint(record)
+            },
+            [{"$set": {
+                "trace_id": {"$cond": [
+                    {"$gt": [duration, {"$ifNull": ["$duration", -1]}]}, record.get("trace_id"), "$trace_id"
+                ]},
+                "duration": {"$max": [duration, {"$ifNull": ["$duration", 0]}]},
+                "count": {"$add": [{"$ifNull": ["$count", 0]}, 1]},
+                "status": {"$ifNull": ["$status", CANDIDATE_PENDING]},
+                "created_at": {"$ifNull": ["$created_at", now]},
+                "updated_at": now
+            }}],
+            upsert=True
+        )
+
+    async def run(self, dispatch: AnalysisDispatcher, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """执行一轮告警检查和自动分析调度"""
+        now = now or datetime.utcnow()
+        current_bucket = bucket_start(now)
+
+        # 未保存的配置项使用默认值（默认告警阈值、分析预算）
+        projects = {}
+        async for project in self.projects_collection.find(
+            {"status": "active"}, {"_id": 0, "project_key": 1, "config": 1}
+        ):
+            try:
+                projects[project["project_key"]] = ProjectConfig(**(project.get("config") or {})).dict()
+            except Exception as e:
+                logger.error(f"项目配置无效: {project['project_key']}, {str(e)}")
+
+        state = await self.state_collection.find_one({"_id": SCHEDULER_STATE_ID})
+        last_bucket = state.get("last_bucket") if state else None
+        if last_bucket is None:
+            last_bucket = current_bucket - ROLLUP_BUCKET * 2
+
+        alerted = await self.check_alerts(projects, last_bucket, current_bucket)
+
+        queued = 0
+        for project_key, config in projects.items():
+            if not config.get("auto_analysis"):
+                continue
+            try:
+                queued += await self.schedule_project(project_key, config, current_bucket, alerted, dispatch, now)
+            except Exception as e:
+                logger.error(f"自动分析调度失败: {project_key}, {str(e)}")
+
+        await self.state_collection.update_one(
+            {"_id": SCHEDULER_STATE_ID},
+            {"$set": {"last_bucket": current_bucket - ROLLUP_BUCKET, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+        logger.info(f"自动分析调度完成: 告警数 {len(alerted)}, 提交分析数 {queued}")
+        return {"alerts": len(alerted), "queued": queued}
+
+    async def check_alerts(
+        self,
+        projects: Dict[str, Dict[str, Any]],
+        last_bucket: datetime,
+        current_bucket: datetime
+    ) -> Set[RouteWindow]:
+        """检查新关闭的rollup小时桶，P95响应时间或错误率超过项目阈值时写入告警"""
+        routes: Dict[RouteWindow, Dict[str, Any]] = {}
+        cursor = self.rollup_service.rollup_collection.find(
+            {"bucket": {"$gt": last_bucket, "$lt": current_bucket}, "project_key": {"$in": list(projects)}},
+            {"_id": 0, "stacks": 0}
+        )
+        async for doc in cursor:
+            key = (doc["project_key"], doc["method"], doc["path"], doc["bucket"])
+            route = routes.get(key)
+            if route is None:
+                route = {
+                    "request_count": 0, "error_count": 0, "duration_max": 0.0,
+                    "latency_counts": [0] * (len(LATENCY_BUCKETS) + 1)
+                }
+                routes[key] = route
+            route["request_count"] += doc.get("request_count", 0)
+            route["error_count"] += doc.get("error_count", 0)
+            route["duration_max"] = max(route["duration_max"], doc.get("duration_max", 0.0))
+            for index, count in (doc.get("latency_counts") or {}).items():
+                if int(index) < len(route["latency_counts"]):
+                    route["latency_counts"][int(index)] += count
+
+        alerted: Set[RouteWindow] = set()
+        for key, route in routes.items():
+            if route["request_count"] < settings.alert_min_requests:
+                continue
+            thresholds = projects[key[0]].get("alert_threshold") or {}
+            values = {
+                ALERT_RESPONSE_TIME: histogram_percentile(route["latency_counts"], 95, route["duration_max"]),
+                ALERT_ERROR_RATE: route["error_count"] / route["request_count"]
+            }
+            for metric, value in values.items():
+                threshold = thresholds.get(metric)
+                if threshold is None or value <= threshold:
+                    continue
+                alerted.add(key)
+                await self._save_alert(key, metric, value, threshold, route["request_count"])
+
+        return alerted
+
+    async def _save_alert(self, key: RouteWindow, metric: str, value: float, threshold: float, request_count: int):
+        project_key, method, path, bucket = key
+        now = datetime.utcnow()
+        await self.alerts_collection.update_one(
+            {"project_key": project_key, "method": method, "path": path, "bucket": bucket, "metric": metric},
+            {
+                "$set": {
+                    "value": round(value, 6),
+                    "threshold": threshold,
+                    "request_count": request_count,
+                    "updated_at": now
+                },
+                "$setOnInsert": {"alert_id": str(uuid.uuid4()), "created_at": now}
+            },
+            upsert=True
+        )
+        logger.warning(f"触发告警: {project_key} {method} {path} {metric}={value:.4f} > {threshold}")
+
+    async def schedule_project(
+        self,
+        project_key: str,
+        config: Dict[str, Any],
+        current_bucket: datetime,
+        alerted: Set[RouteWindow],
+        dispatch: AnalysisDispatcher,
+        now: datetime
+    ) -> int:
+        """为单个项目选择已关闭窗口中的代表链路并提交分析，返回提交数"""
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        budget = config["auto_analysis_budget"]
+        used = await self.candidates_collection.count_documents(
+            {"project_key": project_key, "status": CANDIDATE_QUEUED, "queued_at": {"$gte": day_start}}
+        )
+
+        cursor = self.candidates_collection.find(
+            {"project_key": project_key, "status": CANDIDATE_PENDING, "bucket": {"$lt": current_bucket}},
+            {"_id": 0}
+        )
+        windows: Dict[RouteWindow, List[Dict[str, Any]]] = {}
+        async for candidate in cursor:
+            key = (project_key, candidate["method"], candidate["path"], candidate["bucket"])
+            windows.setdefault(key, []).append(candidate)
+
+        # 每个路由窗口选出请求最多（其次最慢）的指纹，其余标记为跳过
+        selected: List[Tuple[RouteWindow, Dict[str, Any]]] = []
+        skipped: List[Dict[str, Any]] = []
+        for key, candidates in windows.items():
+            candidates.sort(key=lambda c: (c.get("count", 0), c.get("duration", 0)), reverse=True)
+            selected.extend((key, candidate) for candidate in candidates[:settings.auto_analysis_per_route_window])
+            skipped.extend(candidates[settings.auto_analysis_per_route_window:])
+
+        # 触发告警的路由优先，其次按累计耗时
+        selected.sort(key=lambda item: (item[0] in alerted, item[1].get("count", 0) * item[1].get("duration", 0)), reverse=True)
+
+        queued = 0
+        over_budget: List[Dict[str, Any]] = []
+        dedup_since = now - timedelta(hours=settings.auto_analysis_dedup_hours)
+        for key, candidate in selected:
+            duplicate = await self.candidates_collection.find_one({
+                "project_key": project_key,
+                "fingerprint": candidate["fingerprint"],
+                "status": CANDIDATE_QUEUED,
+                "queued_at": {"$gte": dedup_since}
+            }, {"_id": 0, "analysis_id": 1})
+            if duplicate:
+                await self._set_status(candidate, CANDIDATE_DUPLICATE, analysis_id=duplicate.get("analysis_id"))
+                continue
+            if used + queued >= budget:
+                over_budget.append(candidate)
+                continue
+
+            analysis_id = await dispatch(candidate["trace_id"], project_key)
+            await self._set_status(candidate, CANDIDATE_QUEUED, analysis_id=analysis_id, queued_at=now)
+            queued += 1
+
+        for candidate in skipped:
+            await self._set_status(candidate, CANDIDATE_SKIPPED, reason="route_window")
+        for candidate in over_budget:
+            await self._set_status(candidate, CANDIDATE_SKIPPED, reason="budget")
+
+        return queued
+
+    async def _set_status(self, candidate: Dict[str, Any], status: str, **fields):
+        await self.candidates_collection.update_one(
+            {
+                "project_key": candidate["project_key"],
+                "method": candidate["method"],
+                "path": candidate["path"],
+                "bucket": candidate["bucket"],
+                "fingerprint": candidate["fingerprint"]
+            },
+            {"$set": {"status": status, "updated_at": datetime.utcnow(), **fields}}
+        )
+
+    async def get_alerts(self, project_key: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取项目的阈值告警"""
+        try:
+            cursor = self.alerts_collection.find({"project_key": project_key}, {"_id": 0}).sort("bucket", -1).limit(limit)
+            return await cursor.to_list(None)
+
+        except Exception as e:
+            logger.error(f"获取告警失败: {str(e)}")
+            raise
@@ -0,0 +1,133 @@
+"""
+性能记录计数器服务
+"""
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+import logging
+
+from pymongo import UpdateOne
+
+from app.utils.database import get_database
+from app.models.performance import EXEMPLAR_SAMPLING_MODE
+from app.services.record_store import RecordStore
+
+logger = logging.getLogger(__name__)
+
+# 全局计数器文档ID
+GLOBAL_COUNTER_ID = "global"
+
+
+def project_counter_id(project_key: str) -> str:
+    """项目计数器文档ID"""
+    return f"project:{project_key}"
+
+
+class CounterService:
+    """计数器服务类
+
+    在数据上报时以$inc维护全局和项目级的记录数、耗时合计和错误数，
+    仪表盘统计只需读取单个文档。记录按TTL过期后计数会偏大，由定时任务全量校准。
+    """
+
+    def __init__(self):
+        self.db = get_database()
+        self.collection = self.db.counters if self.db is not None else None
+        self.record_store = RecordStore(self.db)
+    
+    @property
+    def performance_collection(self):
+        """未分区的性能记录集合"""
+        return self.record_store.collection
+    
+    @performance_collection.setter
+    def performance_collection(self, collection):
+        self.record_store.collection = collection
+
+    async def increment_record(self, project_key: str, duration: float, is_error: bool):
+        """上报一条记录后递增计数器（一次往返更新全局和项目计数器）"""
+        try:
+            update = {
+                "$inc": {
+                    "record_count": 1,
+                    "duration_sum": duration,
+                    "error_count": 1 if is_error else 0
+                },
+                "$set": {"updated_at": datetime.utcnow()}
+            }
+            await self.collection.bulk_write([
+                UpdateOne({"_id": GLOBAL_COUNTER_ID}, update, upsert=True),
+                UpdateOne({"_id": project_counter_id(project_key)}, update, upsert=True)
+            ], ordered=False)
+        except Exception as e:
+            logger.error(f"更新计数器失败: {str(e)}")
+
+    async def get_global(self) -> Optional[Dict[str, Any]]:
+        """获取全局计数器"""
+        return await self.collection.find_one({"_id": GLOBAL_COUNTER_ID})
+
+    async def get_projects(self, project_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取项目计数器 {项目密钥: 计数器}"""
+        ids = [project_counter_id(key) for key in project_keys]
+        cursor = self.collection.find({"_id": {"$in": ids}})
+        return {doc["_id"][len("project:"):]: doc for doc in await cursor.to_list(None)}
+
+    async def reconcile(self) -> Dict[str, Any]:
+        """按性能记录全量重算计数器
+
+        聚合耗时较长，期间上报的$inc不能被覆盖：先读取计数器快照，聚合后只以$inc补上
+        重算值与快照的差值，聚合期间的递增得以保留。重算只统计快照之前写入的记录
+        （timestamp早于快照前取的截止时间），快照之后写入的记录只由其$inc计数一次；
+        快照时正在上报（已写入记录、尚未递增）的少量记录由下次校准修正。
+        """
+        try:
+            cutoff = datetime.utcnow()
+            snapshot = {
+                doc["_id"]: doc for doc in await self.collection.find({}).to_list(None)
+            }
+            pipeline = [
+                # 样例链路已随聚合数据上报，上报时不计数，校准时同样排除
+                {"$match": {
+                    "timestamp": {"$lt": cutoff},
+                    "sampling_info.mode": {"$ne": EXEMPLAR_SAMPLING_MODE}
+                }},
+                {"$group": {
+                    "_id": "$project_key",
+                    "record_count": {"$sum": 1},
+                    "duration_sum": {"$sum": "$performance_metrics.total_duration"},
+                    "error_count": {"$sum": {"$cond": [{"$gte": ["$response_info.status_code", 500]}, 1, 0]}}
+                }}
+            ]
+            results = await self.record_store.aggregate(pipeline, allowDiskUse=True)
+
+            now = datetime.utcnow()
+            totals = {"record_count": 0, "duration_sum": 0.0, "error_count": 0}
+            recounted = {}
+            for result in results:
+                counters = {field: result[field] for field in totals}
+                for field in totals:
+                    totals[field] += counters[field]
+                recounted[project_counter_id(result["_id"])] = counters
+            # 已无记录的项目计数清零
+            zero = {field: 0 for field in totals}
+            for counter_id in snapshot:
+                if counter_id.startswith("project:") and counter_id not in recounted:
+                    recounted[counter_id] = zero
+            recounted[GLOBAL_COUNTER_ID] = totals
+
+            operations = []
+            for counter_id, counters in recounted.items():
+                current = snapshot.get(counter_id, {})
+                delta = {field: counters[field] - current.get(field, 0) for field in totals}
+                operations.append(UpdateOne(
+                    {"_id": counter_id},
+                    {"$inc": delta, "$set": {"reconciled_at": now}},
+                    upsert=True
+                ))
+            await self.collection.bulk_write(operations, ordered=False)
+
+            logger.info(f"计数器校准完成: 项目数 {len(results)}, 记录数 {totals['record_count']}")
+            return {"projects": len(results), **totals}
+
+        except Exception as e:
+            logger.error(f"计数器校准失败: {str(e)}")
+            raise
@@ -0,0 +1,333 @@
+"""
+基于规则的本地性能分析
+
+数据上报时对每条调用链路运行，毫秒级完成，结果随性能记录一起保存；
+规则能解释大部分耗时的请求不再需要调用AI服务。
+"""
+import time
+import logging
+from typing import Dict, Any, List, Tuple
+
+from app.config.settings import settings
+from app.models.analysis import BottleneckAnalysis, OptimizationSuggestion
+from app.utils.stacks import frame_name
+
+logger = logging.getLogger(__name__)
+
+# 规则版本，修改检测规则时递增，便于区分旧记录上的分析结果
+LOCAL_RULES_VERSION = "2"
+
+# 发现类型
+FINDING_N_PLUS_ONE = "n_plus_one"
+FINDING_HOTSPOT = "hotspot"
+FINDING_SERIALIZATION = "serialization"
+FINDING_IO_WAIT = "io_wait"
+FINDING_CPU_BOUND = "cpu_bound"
+
+# 序列化相关的函数名：明确的序列化方法直接匹配，通用名称需位于序列化模块中
+SERIALIZATION_METHODS = {
+    "serialize", "deserialize", "to_dict", "to_json", "from_json", "model_dump",
+    "model_dump_json", "model_validate_json", "jsonify", "to_representation", "to_internal_value"
+}
+SERIALIZATION_GENERIC = {"dumps", "loads", "dump", "load", "encode", "decode", "default", "iterencode", "raw_decode"}
+SERIALIZATION_MODULES = ("json", "pickle", "marshal", "msgpack", "yaml", "serializ", "pydantic")
+
+# 同一父调用下多次调用同一函数时，用于判断是否为数据库/远程调用的提示（仅影响建议措辞）
+DATABASE_HINTS = ("sql", "query", "execute", "fetch", "cursor", "orm", "db", "mongo", "redis")
+
+# 只保存影响最大的若干条发现
+MAX_FINDINGS = 10
+# 单独列出的自身耗时热点数
+MAX_HOTSPOTS = 5
+# 自身耗时占比达到该值的热点视为已解释（耗时集中在单个函数内）
+DOMINANT_HOTSPOT_SHARE = 0.3
+
+
+def is_serialization_call(function_name: str, file_path: str) -> bool:
+    """判断函数调用是否为序列化/反序列化操作"""
+    name = (function_name or "").rsplit(".", 1)[-1]
+    if name in SERIALIZATION_METHODS:
+        return True
+    if name in SERIALIZATION_GENERIC:
+        path = (file_path or "").lower()
+        return any(module in path for module in SERIALIZATION_MODULES)
+    return False
+
+
+def _severity(share: float) -> str:
+    if share >= 0.3:
+        return "high"
+    if share >= 0.1:
+        return "medium"
+    return "low"
+
+
+class LocalAnalyzer:
+    """基于规则的本地分析器
+
+    只依据调用链路的父子结构和上报的CPU时间判断：
+    - N+1：同一父调用下重复调用同一函数，且合计耗时占比显著
+    - 热点：按自身耗时（总耗时减去子调用耗时）统计的函数
+    - 重复序列化：单个请求中多次执行的序列化/反序列化
+    - I/O与CPU：由CPU时间占总耗时的比例判断
+    全部计算对调用数线性。
+    """
+
+    def analyze(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """分析一条性能记录（字典格式），返回可直接保存的分析结果"""
+        started = time.perf_counter()
+        metrics = record.get("performance_metrics") or {}
+        total_duration = metrics.get("total_duration", 0) or 0
+        cpu_time = metrics.get("cpu_time", 0) or 0
+        function_calls = record.get("function_calls") or []
+
+        frames: Dict[str, str] = {}
+        call_frames: List[str] = []
+        child_time: Dict[str, float] = {}
+        # (父调用ID, 帧名称) -> [调用次数, 合计耗时]
+        sibling_groups: Dict[Tuple[Any, str], List[float]] = {}
+        for call in function_calls:
+            # SDK将同一父调用下的重复调用合并为一条，调用次数记录在 call_count 中
+            count = call.get("call_count", 1)
+            call_id = call.get("call_id")
+            frame = frame_name(call.get("function_name", "unknown"), call.get("file_path", ""), call.get("line_number", 0))
+            frames[call_id] = frame
+            call_frames.append(frame)
+            duration = call.get("duration", 0.0)
+            parent_id = call.get("parent_call_id")
+            if parent_id is not None:
+                child_time[parent_id] = child_time.get(parent_id, 0.0) + duration
+                group = sibling_groups.get((parent_id, frame))
+                if group is None:
+                    group = [0, 0.0]
+                    sibling_groups[(parent_id, frame)] = group
+                group[0] += count
+                group[1] += duration
+
+        # 按帧统计自身耗时和序列化调用
+        self_times: Dict[str, List[float]] = {}
+        serialization: Dict[str, List[float]] = {}
+        for call, frame in zip(function_calls, call_frames):
+            call_id = call.get("call_id")
+            count = call.get("call_count", 1)
+            duration = call.get("duration", 0.0)
+            entry = self_times.get(frame)
+            if entry is None:
+                entry = [0, 0.0]
+                self_times[frame] = entry
+            entry[0] += count
+            entry[1] += max(duration - child_time.get(call_id, 0.0), 0.0)
+            if is_serialization_call(call.get("function_name", ""), call.get("file_path", "")):
+                entry = serialization.get(frame)
+                if entry is None:
+                    entry = [0, 0.0]
+                    serialization[frame] = entry
+                entry[0] += count
+                entry[1] += duration
+
+        base = total_duration if total_duration > 0 else sum(entry[1] for entry in self_times.values())
+        findings: List[Dict[str, Any]] = []
+        explained = 0.0
+        explained_frames = set()
+
+        if base > 0:
+            explained += self._find_serialization(serialization, base, findings, explained_frames)
+            explained += self._find_n_plus_one(sibling_groups, frames, serialization, base, findings, explained_frames)
+            explained += self._find_hotspots(self_times, base, findings, explained_frames)
+
+        # 定位到函数的发现按耗时占比排序，I/O与CPU的整体判断放在最后
+        findings.sort(key=lambda finding: finding["share"], reverse=True)
+        findings = findings[:MAX_FINDINGS]
+        kind, cpu_ratio = self._classify(total_duration, cpu_time, findings)
+
+        explained_ratio = min(explained / base, 1.0) if base > 0 else 1.0
+        return {
+            "rules_version": LOCAL_RULES_VERSION,
+            "kind": kind,
+            "cpu_ratio": cpu_ratio,
+            "findings": findings,
+            "explained_ratio": round(explained_ratio, 4),
+            "needs_ai": (
+                total_duration >= settings.local_analysis_ai_min_duration
+                and explained_ratio < settings.local_analysis_explained_threshold
+            ),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+
+    def _find_n_plus_one(
+        self,
+        sibling_groups: Dict[Tuple[Any, str], List[float]],
+        frames: Dict[str, str],
+        serialization: Dict[str, List[float]],
+        base: float,
+        findings: List[Dict[str, Any]],
+        explained_frames: set
+    ) -> float:
+        explained = 0.0
+        for (parent_id, frame), (count, duration) in sibling_groups.items():
+            share = duration / base
+            if count < settings.local_analysis_n_plus_one_min_calls or share < settings.local_analysis_min_share:
+                continue
+            # 重复序列化单独报告
+            if frame in serialization:
+                continue
+            explained += duration
+            explained_frames.add(frame)
+            findings.append({
+                "type": FINDING_N_PLUS_ONE,
+                "severity": _severity(share),
+                "function": frame,
+                "parent": frames.get(parent_id, ""),
+                "count": int(count),
+                "duration": round(duration, 6),
+                "share": round(share, 4),
+                "description": f"{frames.get(parent_id, '调用方')} 中重复调用 {frame} {int(count)} 次，"
+                               f"合计{duration * 1000:.1f}ms，占总耗时{share * 100:.1f}%"
+            })
+        return explained
+
+    def _find_serialization(
+        self,
+        serialization: Dict[str, List[float]],
+        base: float,
+        findings: List[Dict[str, Any]],
+        explained_frames: set
+    ) -> float:
+        explained = 0.0
+        for frame, (count, duration) in serialization.items():
+            share = duration / base
+            if count < settings.local_analysis_serialization_min_calls or share < settings.local_analysis_min_share:
+                continue
+            explained += duration
+            explained_frames.add(frame)
+            findings.append({
+                "type": FINDING_SERIALIZATION,
+                "severity": _severity(share),
+                "function": frame,
+                "count": int(count),
+                "duration": round(duration, 6),
+                "share": round(share, 4),
+                "description": f"单个请求中执行 {frame} {int(count)} 次，"
+                               f"合计{duration * 1000:.1f}ms，占总耗时{share * 100:.1f}%"
+            })
+        return explained
+
+    def _find_hotspots(
+        self,
+        self_times: Dict[str, List[float]],
+        base: float,
+        findings: List[Dict[str, Any]],
+        explained_frames: set
+    ) -> float:
+        explained = 0.0
+        ranked = sorted(self_times.items(), key=lambda item: item[1][1], reverse=True)[:MAX_HOTSPOTS]
+        for frame, (count, self_time) in ranked:
+            share = self_time / base
+            if share < settings.local_analysis_hotspot_min_share:
+                break
+            # 已由N+1或序列化规则报告的函数不再重复列出
+            if frame in explained_frames:
+                continue
+            # 只有耗时集中的热点算作已解释
+            if share >= DOMINANT_HOTSPOT_SHARE:
+                explained += self_time
+            findings.append({
+                "type": FINDING_HOTSPOT,
+                "severity": _severity(share),
+                "function": frame,
+                "count": int(count),
+                "duration": round(self_time, 6),
+                "share": round(share, 4),
+                "description": f"{frame} 自身耗时{self_time * 1000:.1f}ms（{int(count)}次调用），"
+                               f"占总耗时{share * 100:.1f}%"
+            })
+        return explained
+
+    def _classify(
+        self,
+        total_duration: float,
+        cpu_time: float,
+        findings: List[Dict[str, Any]]
+    ) -> Tuple[str, float]:
+        """按CPU时间占比判断请求是CPU密集还是I/O等待为主
+
+        旧版SDK以总耗时代替CPU时间上报，CPU时间缺失或不小于总耗时时无法判断。
+        """
+        if total_duration <= 0 or cpu_time <= 0 or cpu_time >= total_duration:
+            return "unknown", 0.0
+
+        cpu_ratio = min(cpu_time / total_duration, 1.0)
+        if cpu_ratio >= settings.local_analysis_cpu_bound_ratio:
+            findings.append({
+                "type": FINDING_CPU_BOUND,
+                "severity": _severity(cpu_ratio),
+                "function": "",
+                "duration": round(cpu_time, 6),
+                "share": round(cpu_ratio, 4),
+                "description": f"CPU时间{cpu_time * 1000:.1f}ms，占总耗时{cpu_ratio * 100:.1f}%，以计算为主"
+            })
+            return "cpu_bound", round(cpu_ratio, 4)
+        if cpu_ratio <= settings.local_analysis_io_bound_ratio:
+            wait = total_duration - cpu_time
+            findings.append({
+                "type": FINDING_IO_WAIT,
+                "severity": _severity(1 - cpu_ratio),
+                "function": "",
+                "duration": round(wait, 6),
+                "share": round(1 - cpu_ratio, 4),
+                "description": f"等待时间{wait * 1000:.1f}ms，占总耗时{(1 - cpu_ratio) * 100:.1f}%，以I/O等待为主"
+            })
+            return "io_bound", round(cpu_ratio, 4)
+        return "mixed", round(cpu_ratio, 4)
+
+    def to_bottlenecks(self, local_analysis: Dict[str, Any]) -> List[BottleneckAnalysis]:
+        """将规则发现转换为瓶颈分析"""
+        return [
+            BottleneckAnalysis(
+                type=finding["type"],
+                severity=finding["severity"],
+                function=finding.get("function") or "system_analysis",
+                description=finding["description"],
+                impact=finding["share"]
+            )
+            for finding in local_analysis.get("findings", [])
+        ]
+
+    def to_suggestions(self, local_analysis: Dict[str, Any]) -> List[OptimizationSuggestion]:
+        """根据规则发现生成优化建议"""
+        suggestions = []
+        for finding in local_analysis.get("findings", []):
+            priority = "high" if finding["severity"] == "high" else "medium"
+            function = finding.get("function", "")
+            if finding["type"] == FINDING_N_PLUS_ONE:
+                is_database = any(hint in function.lower() for hint in DATABASE_HINTS)
+                suggestions.append(OptimizationSuggestion(
+                    category="database" if is_database else "code",
+                    priority=priority,
+                    title="消除N+1调用",
+                    description=f"{finding['description']}。建议改为批量查询或预加载"
+                                f"（如 IN 查询、select_related/prefetch_related），在循环外一次获取所需数据",
+                    code_example="# 批量获取，避免在循环中逐条查询\nitems = Item.objects.filter(order_id__in=order_ids)",
+                    expected_improvement=f"预计可减少约{finding['share'] * 100:.0f}%的响应时间"
+                ))
+            elif finding["type"] == FINDING_SERIALIZATION:
+                suggestions.append(OptimizationSuggestion(
+                    category="code",
+                    priority=priority,
+                    title="减少重复序列化",
+                    description=f"{finding['description']}。建议对同一对象只序列化一次并复用结果，"
+                                f"或改用更快的序列化库（如 orjson）",
+                    expected_improvement=f"预计可减少约{finding['share'] * 100 / 2:.0f}%的响应时间"
+                ))
+            elif finding["type"] == FINDING_HOTSPOT:
+                suggestions.append(OptimizationSuggestion(
+                    category="code",
+                    priority=priority,
+                    title="优化热点函数",
+                    description=f"{finding['description']}。建议检查该函数的算法复杂度或缓存其计算结果"
+                ))
+        return suggestions
+
+
+# 全局本地分析器实例
+local_analyzer = LocalAnalyzer()
@@ -5,8 +5,23 @@ from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import logging
 
+from app.config.settings import settings
 from app.utils.database import get_database
-from app.models.performance import PerformanceRecord, PerformanceRecordCreate, FunctionCallDetail
+from app.utils.cache import cached, ttl_for_span, invalidate_project_cache
+from app.utils.flamegraph import render_flame_graph
+from app.utils.profile_diff import diff_profiles
+from app.utils.routes import normalize_path, route_key
+from app.services.rollup_service import RollupService
+from app.services.anomaly_service import anomaly_detector
+from app.services.local_analyzer import local_analyzer
+from app.services.auto_analysis_service import AutoAnalysisService
+from app.services.project_service import ProjectService
+from app.services.counter_service import CounterService
+from app.services.record_store import RecordStore
+from app.models.performance import (
+    PerformanceRecord, PerformanceRecordCreate, PerformanceRecordSummary, FunctionCallDetail,
+    ProfileAggregateCreate, RECORD_SUMMARY_PROJECTION
+)
 
 logger = logging.getLogger(__name__)
 
@@ -16,9 +31,21 @@ class PerformanceService:
     
     def __init__(self):
         self.db = get_database()
-        self.performance_collection = self.db.performance_records if self.db is not None else None
+        self.record_store = RecordStore(self.db)
         self.function_calls_collection = self.db.function_calls if self.db is not None else None
         self.analysis_collection = self.db.ai_analysis_results if self.db is not None else None
+        self.aggregates_collection = self.db.profile_aggregates if self.db is not None else None
+        self.rollup_service = RollupService()
+        self.counter_service = CounterService()
+    
+    @property
+    def performance_collection(self):
+        """未分区的性能记录集合"""
+        return self.record_store.collection
+    
+    @performance_collection.setter
+    def performance_collection(self, collection):
+        self.record_store.collection = collection
     
     async def save_performance_record(
         self, 
@@ -32,9 +59,29 @@ class PerformanceService:
                 project_key=project_key,
                 **performance_data.dict()
             )
+            request_info = record.request_info
+            request_info.normalized_path = normalize_path(request_info.path)
+            request_info.route = route_key(request_info.path, request_info.route)
+            record.function_call_count = len(record.function_calls)
+            
+            # 规则分析随主记录一起保存
+            record_doc = record.to_dict()
+            if settings.local_analysis_enabled:
+                try:
+                    record.local_analysis = local_analyzer.analyze(record_doc)
+                    record_doc["local_analysis"] = record.local_analysis
+                except Exception as e:
+                    logger.error(f"规则分析失败: {record.trace_id}, {str(e)}")
             
             # 保存主记录
-            await self.performance_collection.insert_one(record.to_dict())
+            await self.record_store.insert(record_doc)
+            
+            # 规则无法解释的慢链路作为自动分析候选
+            if record.local_analysis and record.local_analysis.get("needs_ai"):
+                try:
+                    await AutoAnalysisService().add_candidate(project_key, record_doc)
+                except Exception as e:
+                    logger.error(f"写入自动分析候选失败: {record.trace_id}, {str(e)}")
             
             # 保存详细的函数调用记录
             if record.function_calls:
@@ -51,6 +98,7 @@ class PerformanceService:
                         },
                         execution_info={
                             "duration": func_call.duration,
+                            "call_count": func_call.call_count,
                             "start_time": record.timestamp,
                             "end_time": record.timestamp
                         },
@@ -75,6 +123,22 @@ class PerformanceService:
                 if function_call_details:
                     await self.function_calls_collection.insert_many(function_call_details)
             
+            # 聚合模式的样例链路已随聚合数据计入rollup，只保存链路
+            if not record.is_exemplar:
+                # 合并到路由rollup并更新计数器
+                await self.rollup_service.add_record(project_key, record)
+                await self.counter_service.increment_record(
+                    project_key,
+                    record.performance_metrics.total_duration,
+                    record.response_info.status_code >= 500
+                )
+                
+                # 实时异常检测
+                await anomaly_detector.observe(project_key, record)
+            
+            # 使统计缓存失效
+            await invalidate_project_cache(project_key)
+            
             logger.info(f"保存性能记录成功: {record.trace_id}")
             return record
             
@@ -82,29 +146,53 @@ class PerformanceService:
             logger.error(f"保存性能记录失败: {str(e)}")
             raise
     
+    async def save_profile_aggregates(
+        self,
+        project_key: str,
+        aggregates: List[ProfileAggregateCreate]
+    ) -> int:
+        """保存SDK上报的路由窗口聚合数据"""
+        try:
+            if not aggregates:
+                return 0
+            
+            now = datetime.utcnow()
+            documents = []
+            for aggregate in aggregates:
+                doc = aggregate.dict()
+                doc["project_key"] = project_key
+                doc["created_at"] = now
+                documents.append(doc)
+            
+            await self.aggregates_collection.insert_many(documents, ordered=False)
+            for aggregate in aggregates:
+                await self.rollup_service.add_aggregate(project_key, aggregate)
+            await invalidate_project_cache(project_key)
+            logger.info(f"保存聚合数据成功: {project_key}, 路由数: {len(documents)}")
+            return len(documents)
+            
+        except Exception as e:
+            logger.error(f"保存聚合数据失败: {str(e)}")
+            raise
+    
     async def get_performance_records(
         self,
         filters: Optional[Dict[str, Any]] = None,
         page: int = 1,
         size: int = 20
-    ) -> Tuple[List[PerformanceRecord], int]:
-        """获取性能记录列表"""
+    ) -> Tuple[List[PerformanceRecordSummary], int]:
+        """获取性能记录列表（只投影摘要字段，不读取调用链路）"""
         try:
             query = filters or {}
             
             # 计算总数
-            total = await self.performance_collection.count_documents(query)
+            total = await self.record_store.count(query)
             
             # 分页查询
             skip = (page - 1) * size
-            cursor = self.performance_collection.find(query).skip(skip).limit(size).sort("timestamp", -1)
-            
-            records = []
-            async for doc in cursor:
-                doc.pop("_id", None)
-                records.append(PerformanceRecord.from_dict(doc))
+            docs = await self.record_store.find_page(query, skip, size, RECORD_SUMMARY_PROJECTION)
             
-            return records, total
+            return [PerformanceRecordSummary.from_doc(doc) for doc in docs], total
             
         except Exception as e:
             logger.error(f"获取性能记录列表失败: {str(e)}")
@@ -113,7 +201,7 @@ class PerformanceService:
     async def get_performance_record_by_trace_id(self, trace_id: str) -> Optional[PerformanceRecord]:
         """根据trace_id获取性能记录详情"""
         try:
-            doc = await self.performance_collection.find_one({"trace_id": trace_id})
+            doc = await self.record_store.find_by_trace_id(trace_id)
             if doc:
                 doc.pop("_id", None)
                 return PerformanceRecord.from_dict(doc)
@@ -123,6 +211,7 @@ class PerformanceService:
             logger.error(f"获取性能记录详情失败: {str(e)}")
             raise
     
+    @cached("performance_stats", ttl=lambda args: ttl_for_span(args.get("start_time")))
     async def get_performance_stats(
         self,
         project_key: str,
@@ -172,7 +261,7 @@ class PerformanceService:
             ]
             
             # 执行聚合查询
-            results = await self.performance_collection.aggregate(pipeline).to_list(None)
+            results = await self.record_store.aggregate(pipeline)
             
             # 格式化结果
             time_series = []
@@ -212,6 +301,7 @@ class PerformanceService:
             logger.error(f"获取性能统计失败: {str(e)}")
             raise
     
+    @cached("performance_trends", ttl=lambda args: ttl_for_span(args.get("start_time")))
     async def get_performance_trends(
         self,
         project_key: str,
@@ -310,7 +400,7 @@ class PerformanceService:
             {"$sort": {"_id": 1}}
         ]
         
-        results = await self.performance_collection.aggregate(pipeline).to_list(None)
+        results = await self.record_store.aggregate(pipeline)
         
         return [
             {
@@ -344,7 +434,8 @@ class PerformanceService:
             },
             {
                 "$group": {
-                    "_id": "$request_info.path",
+                    # 按路由模板分组，未回填模板的旧记录按原始路径分组
+                    "_id": {"$ifNull": ["$request_info.route", "$request_info.path"]},
                     "avg_duration": {"$avg": "$performance_metrics.total_duration"},
                     "request_count": {"$sum": 1},
                     "total_duration": {"$sum": "$performance_metrics.total_duration"}
@@ -354,7 +445,7 @@ class PerformanceService:
             {"$limit": limit}
         ]
         
-        results = await self.performance_collection.aggregate(pipeline).to_list(None)
+        results = await self.record_store.aggregate(pipeline)
         
         return [
             {
@@ -366,6 +457,7 @@ class PerformanceService:
             for result in results
         ]
 
+    @cached("slow_functions", ttl=300)
     async def get_slow_functions(
         self,
         project_key: str,
@@ -375,10 +467,10 @@ class PerformanceService:
         """获取慢函数统计"""
         try:
             # 首先获取项目的trace_id列表
-            trace_ids = await self.performance_collection.find(
+            trace_ids = await self.record_store.find_all(
                 {"project_key": project_key},
                 {"trace_id": 1}
-            ).to_list(None)
+            )
             
             trace_id_list = [doc["trace_id"] for doc in trace_ids]
             
@@ -497,14 +589,96 @@ class PerformanceService:
                 "error": str(e)
             }
     
+    async def get_flame_graph(
+        self,
+        project_key: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        path: Optional[str] = None,
+        method: Optional[str] = None,
+        output_format: str = "tree",
+        min_weight: float = 0.001
+    ) -> Dict[str, Any]:
+        """获取跨请求合并的火焰图（基于路由rollup中的调用栈表）"""
+        try:
+            query = self.rollup_service.build_query(
+                project_key=project_key,
+                start_time=start_time,
+                end_time=end_time,
+                path=path,
+                method=method
+            )
+            stacks, request_count = await self.rollup_service.get_stack_table(query)
+            
+            name = f"{method or '*'} {path or '*'}"
+            result = render_flame_graph(stacks, output_format, min_weight, name)
+            result.update({
+                "project_key": project_key,
+                "path": path,
+                "method": method,
+                "request_count": request_count
+            })
+            return result
+            
+        except Exception as e:
+            logger.error(f"获取火焰图失败: {str(e)}")
+            raise
+    
+    async def compare_profiles(
+        self,
+        project_key: str,
+        path: str,
+        baseline: Dict[str, Any],
+        target: Dict[str, Any],
+        method: Optional[str] = None,
+        hot_threshold: float = 0.01,
+        limit: int = 50
+    ) -> Dict[str, Any]:
+        """对比同一路由在两个版本或两个时间窗口的性能差异
+
+        Args:
+            baseline/target: 对比条件，包含 start_time、end_time，可选 app_version、git_commit
+        """
+        try:
+            summaries = []
+            for side in (baseline, target):
+                query = self.rollup_service.build_query(
+                    project_key=project_key,
+                    start_time=side["start_time"],
+                    end_time=side.get("end_time"),
+                    path=path,
+                    method=method,
+                    app_version=side.get("app_version"),
+                    git_commit=side.get("git_commit")
+                )
+                summaries.append(await self.rollup_service.get_route_summary(query))
+            
+            result = diff_profiles(summaries[0], summaries[1], hot_threshold, limit)
+            result.update({
+                "project_key": project_key,
+                "path": path,
+                "method": method,
+                "baseline_filter": {k: v.isoformat() if isinstance(v, datetime) else v for k, v in baseline.items()},
+                "target_filter": {k: v.isoformat() if isinstance(v, datetime) else v for k, v in target.items()}
+            })
+            return result
+            
+        except Exception as e:
+            logger.error(f"性能差异对比失败: {str(e)}")
+            raise
+    
     async def get_total_records_count(self) -> int:
-        """获取性能记录总数"""
+        """获取性能记录总数（读取计数器，缺失时使用集合元数据估算）"""
         try:
-            return await self.performance_collection.count_documents({})
+            counters = await self.counter_service.get_global()
+            if counters:
+                return int(counters.get("record_count", 0))
+            return await self.record_store.estimated_count()
         except Exception as e:
             logger.error(f"获取性能记录总数失败: {str(e)}")
             return 0
     
+    @cached("analysis_count", ttl=60)
     async def get_analysis_count_since(self, start_time: datetime) -> int:
         """获取指定时间之后的分析数量"""
         try:
@@ -516,19 +690,26 @@ class PerformanceService:
             return 0
     
     async def get_average_response_time(self) -> float:
-        """获取所有项目的平均响应时间"""
+        """获取所有项目的平均响应时间（读取计数器）"""
         try:
+            counters = await self.counter_service.get_global()
+            if counters and counters.get("record_count"):
+                avg_duration = counters.get("duration_sum", 0.0) / counters["record_count"]
+                return round(avg_duration * 1000, 3)  # 转换为毫秒并保留3位小数
+            
+            # 计数器尚未建立时只统计最近一天的数据，避免全集合聚合
             pipeline = [
+                {"$match": {"timestamp": {"$gte": datetime.utcnow() - timedelta(days=1)}}},
                 {"$group": {
                     "_id": None,
                     "avg_duration": {"$avg": "$performance_metrics.total_duration"}
                 }}
             ]
             
-            result = await self.performance_collection.aggregate(pipeline).to_list(1)
+            result = await self.record_store.aggregate(pipeline)
             if result and len(result) > 0:
                 avg_duration = result[0].get("avg_duration", 0)
-                return round(avg_duration * 1000, 3)  # 转换为毫秒并保留3位小数
+                return round(avg_duration * 1000, 3)
             return 0
         except Exception as e:
             logger.error(f"获取平均响应时间失败: {str(e)}")
@@ -536,36 +717,50 @@ class PerformanceService:
     
     async def get_record_count_by_project(self, project_key: str) -> int:
         """获取指定项目的记录数量"""
+        counts = await self.get_record_counts_by_projects([project_key])
+        return counts.get(project_key, 0)
+    
+    async def get_record_counts_by_projects(self, project_keys: List[str]) -> Dict[str, int]:
+        """批量获取多个项目的记录数量（读取计数器，缺失的项目回退到聚合查询）"""
         try:
-            return await self.performance_collection.count_documents({
-                "project_key": project_key
-            })
+            if not project_keys:
+                return {}
+            
+            counters = await self.counter_service.get_projects(project_keys)
+            counts = {key: int(doc.get("record_count", 0)) for key, doc in counters.items()}
+            
+            missing = [key for key in project_keys if key not in counts]
+            if missing:
+                pipeline = [
+                    {"$match": {"project_key": {"$in": missing}}},
+                    {"$group": {"_id": "$project_key", "count": {"$sum": 1}}}
+                ]
+                results = await self.record_store.aggregate(pipeline)
+                counts.update({result["_id"]: result["count"] for result in results})
+            
+            return {key: counts.get(key, 0) for key in project_keys}
         except Exception as e:
-            logger.error(f"获取项目记录数量失败: {str(e)}")
-            return 0
+            logger.error(f"批量获取项目记录数量失败: {str(e)}")
+            return {key: 0 for key in project_keys}
     
     async def get_recent_analysis(self, limit: int = 5) -> List[Dict[str, Any]]:
         """获取最近的分析结果"""
         try:
-            cursor = self.analysis_collection.find().sort("created_at", -1).limit(limit)
+            cursor = self.analysis_collection.find(
+                {}, {"_id": 0, "project_key": 1, "analysis_type": 1, "status": 1, "created_at": 1}
+            ).sort("created_at", -1).limit(limit)
+            docs = await cursor.to_list(None)
+            
+            # 一次查询获取所有相关项目的名称
+            project_names = await ProjectService().get_project_names(
+                [doc.get("project_key") for doc in docs]
+            )
             
             analysis_results = []
-            async for doc in cursor:
-                doc.pop("_id", None)
-                
-                # 获取项目名称
+            for doc in docs:
                 project_key = doc.get("project_key")
-                project_name = project_key
-                try:
-                    project_service = ProjectService()
-                    project = await project_service.get_project_by_key(project_key)
-                    if project:
-                        project_name = project.name
-                except Exception:
-                    pass
-                
                 analysis_results.append({
-                    "projectName": project_name,
+                    "projectName": project_names.get(project_key) or project_key,
                     "type": doc.get("analysis_type", "AI分析"),
                     "status": doc.get("status", "completed"),
                     "createdAt": doc.get("created_at").isoformat() if doc.get("created_at") else None
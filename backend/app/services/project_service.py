@@ -3,13 +3,20 @@
 """
 from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
+import hashlib
+import json
 import logging
 
-from app.utils.database import get_database
-from app.models.project import Project, ProjectCreate, ProjectUpdate
+from app.utils.database import get_database, RedisUtils
+from app.models.project import Project, ProjectCreate, ProjectUpdate, ProjectConfig, SDK_CONFIG_FIELDS
+from app.services.record_store import RecordStore
 
 logger = logging.getLogger(__name__)
 
+# SDK配置缓存
+SDK_CONFIG_CACHE_PREFIX = "sdk_config:"
+SDK_CONFIG_CACHE_TTL = 300  # 秒，配置变更时主动失效
+
 
 class ProjectService:
     """项目管理服务类"""
@@ -58,6 +65,23 @@ class ProjectService:
             logger.error(f"获取项目失败: {str(e)}")
             raise
     
+    async def get_project_names(self, project_keys: List[str]) -> Dict[str, str]:
+        """批量获取项目名称 {项目密钥: 项目名称}"""
+        try:
+            keys = list({key for key in project_keys if key})
+            if not keys:
+                return {}
+            
+            cursor = self.collection.find(
+                {"project_key": {"$in": keys}},
+                {"_id": 0, "project_key": 1, "name": 1}
+            )
+            return {doc["project_key"]: doc.get("name") for doc in await cursor.to_list(None)}
+            
+        except Exception as e:
+            logger.error(f"批量获取项目名称失败: {str(e)}")
+            raise
+    
     async def get_project_by_name(self, name: str) -> Optional[Project]:
         """根据项目名称获取项目"""
         try:
@@ -125,6 +149,7 @@ class ProjectService:
                 {"project_key": project_key},
                 {"$set": update_data}
             )
+            await self.invalidate_sdk_config(project_key)
             
             # 返回更新后的项目
             return await self.get_project_by_key(project_key)
@@ -145,6 +170,7 @@ class ProjectService:
                     }
                 }
             )
+            await self.invalidate_sdk_config(project_key)
             
             return result.modified_count > 0
             
@@ -152,6 +178,49 @@ class ProjectService:
             logger.error(f"归档项目失败: {str(e)}")
             raise
     
+    async def get_sdk_config(self, project_key: str) -> Optional[Dict[str, Any]]:
+        """获取下发给SDK的项目配置（优先读取Redis缓存）
+        
+        Returns:
+            包含project_key、version（配置内容摘要，用作ETag）和config的字典，项目不存在时返回None
+        """
+        cache_key = f"{SDK_CONFIG_CACHE_PREFIX}{project_key}"
+        cached = await RedisUtils.cache_get(cache_key)
+        if cached:
+            try:
+                return json.loads(cached)
+            except (TypeError, ValueError):
+                logger.warning(f"SDK配置缓存损坏，重新加载: {project_key}")
+        
+        doc = await self.collection.find_one(
+            {"project_key": project_key},
+            {"_id": 0, "config": 1, "status": 1}
+        )
+        if not doc:
+            return None
+        
+        project_config = ProjectConfig(**(doc.get("config") or {}))
+        sdk_config = {field: getattr(project_config, field) for field in SDK_CONFIG_FIELDS}
+        # 归档项目停止采集
+        if doc.get("status") == "archived":
+            sdk_config["enabled"] = False
+        
+        version = hashlib.sha1(
+            json.dumps(sdk_config, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        payload = {
+            "project_key": project_key,
+            "version": version,
+            "config": sdk_config
+        }
+        
+        await RedisUtils.cache_set(cache_key, json.dumps(payload), expire=SDK_CONFIG_CACHE_TTL)
+        return payload
+    
+    async def invalidate_sdk_config(self, project_key: str) -> bool:
+        """使SDK配置缓存失效"""
+        return await RedisUtils.cache_delete(f"{SDK_CONFIG_CACHE_PREFIX}{project_key}")
+    
     async def update_last_activity(self, project_key: str) -> bool:
         """更新项目最后活跃时间"""
         try:
@@ -170,17 +239,17 @@ class ProjectService:
         """获取项目统计信息"""
         try:
             # 从性能记录集合获取统计数据
-            performance_collection = self.db.performance_records
+            record_store = RecordStore(self.db)
             analysis_collection = self.db.ai_analysis_results
             
             # 总请求数
-            total_requests = await performance_collection.count_documents(
+            total_requests = await record_store.count(
                 {"project_key": project_key}
             )
             
             # 今日请求数
             today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_requests = await performance_collection.count_documents({
+            today_requests = await record_store.count({
                 "project_key": project_key,
                 "timestamp": {"$gte": today_start}
             })
@@ -195,7 +264,7 @@ class ProjectService:
                 }}
             ]
             
-            avg_stats = await performance_collection.aggregate(pipeline).to_list(1)
+            avg_stats = await record_store.aggregate(pipeline)
             avg_duration = avg_stats[0]["avg_duration"] if avg_stats else 0
             max_duration = avg_stats[0]["max_duration"] if avg_stats else 0
             
@@ -0,0 +1,210 @@
+"""
+AI服务速率限制
+"""
+import asyncio
+import hashlib
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from app.config.settings import settings
+from app.services.ai_config import AIServiceConfig
+from app.utils.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 速率限制键前缀
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+# 令牌桶Lua脚本：按Redis服务器时间补充令牌，令牌足够时扣减并返回0，否则返回需要等待的秒数
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RateLimitExceeded(Exception):
+    """AI服务返回429（请求过多）"""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__(f"AI服务请求频率超限，建议等待 {retry_after} 秒" if retry_after else "AI服务请求频率超限")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数）"""
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """进程内令牌桶"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, cost: float) -> float:
+        """尝试扣减令牌，成功返回0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class SharedTokenBucket:
+    """Redis共享令牌桶，多个worker共用同一份额度；Redis不可用时退化为进程内令牌桶"""
+
+    def __init__(self, key: str, rate: float, capacity: float):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.local = TokenBucket(rate, capacity)
+
+    async def try_acquire(self, cost: float) -> float:
+        redis = get_redis()
+        if redis is not None:
+            try:
+                wait = await redis.eval(TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, cost)
+                return float(wait)
+            except Exception as e:
+                logger.warning(f"共享速率限制不可用，使用进程内限制: {str(e)}")
+        return self.local.try_acquire(cost)
+
+    async def acquire(self, cost: float = 1.0):
+        """等待直到获得指定数量的令牌"""
+        # 单次请求超过桶容量时按容量计，避免永远无法获得
+        cost = min(cost, self.capacity)
+        while True:
+            wait = await self.try_acquire(cost)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """自适应并发限制（AIMD）
+
+    收到429时并发上限减半，连续成功后逐步加一，直到配置的最大并发。
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, increase_after: int = 10):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.increase_after = increase_after
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self._successes >= self.increase_after and self.limit < self.max_limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_rate_limited(self):
+        self.limit = max(float(self.min_limit), self.limit / 2)
+        self._successes = 0
+
+
+class ProviderRateLimiter:
+    """单个AI服务的速率限制：请求数/分钟、token数/分钟和自适应并发"""
+
+    def __init__(self, service_config: AIServiceConfig):
+        # 同一API密钥的额度在各worker之间共享
+        identity = hashlib.sha1(
+            f"{service_config.endpoint}:{service_config.api_key}".encode("utf-8")
+        ).hexdigest()[:12]
+        prefix = f"{RATE_LIMIT_PREFIX}{service_config.provider.value}:{identity}"
+        burst = settings.ai_rate_limit_burst_seconds
+
+        self.requests = None
+        if service_config.requests_per_minute > 0:
+            rate = service_config.requests_per_minute / 60.0
+            self.requests = SharedTokenBucket(f"{prefix}:rpm", rate, max(1.0, rate * burst))
+
+        self.tokens = None
+        if service_config.tokens_per_minute > 0:
+            rate = service_config.tokens_per_minute / 60.0
+            self.tokens = SharedTokenBucket(f"{prefix}:tpm", rate, max(1.0, rate * burst))
+
+        self.concurrency = AdaptiveConcurrencyLimiter(max(service_config.max_concurrency, 1))
+        self._paused_until = 0.0
+
+    @asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        """获取一次调用的执行许可"""
+        await self.concurrency.acquire()
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            if self.requests is not None:
+                await self.requests.acquire(1)
+            if self.tokens is not None and tokens > 0:
+                await self.tokens.acquire(tokens)
+            yield
+        finally:
+            await self.concurrency.release()
+
+    def on_success(self):
+        self.concurrency.on_success()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        self.concurrency.on_rate_limited()
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"AI服务返回429，并发上限降为 {int(self.concurrency.limit)}")
+
+
+class RateLimiterRegistry:
+    """按服务配置缓存速率限制器，配置变化时重建"""
+
+    def __init__(self):
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+
+    def get(self, service_config: AIServiceConfig) -> ProviderRateLimiter:
+        key = (
+            f"{service_config.provider.value}:{service_config.endpoint}:{service_config.api_key}:"
+            f"{service_config.requests_per_minute}:{service_config.tokens_per_minute}:{service_config.max_concurrency}"
+        )
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = ProviderRateLimiter(service_config)
+            self._limiters[key] = limiter
+        return limiter
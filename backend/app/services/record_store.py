@@ -0,0 +1,209 @@
+"""
+性能记录存储路由
+"""
+from typing import List, Optional, Dict, Any, Set
+from datetime import datetime, timedelta
+import re
+import time
+import logging
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.utils.indexes import INDEX_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 存储布局：单集合（TTL索引过期）或按天分区集合（整集合删除过期）
+LAYOUT_SINGLE = "single"
+LAYOUT_DAILY = "daily"
+
+# 未分区的性能记录集合，按天分区后仍保存切换布局之前写入（未迁移）的记录
+BASE_COLLECTION = "performance_records"
+PARTITION_PATTERN = re.compile(r"^performance_records_(\d{8})$")
+
+# 分区集合的索引（沿用注册表中的性能记录索引，不设置TTL，过期数据按分区删除）
+PARTITION_INDEXES = [
+    (keys, options) for keys, options in INDEX_REGISTRY[BASE_COLLECTION]
+    if "expireAfterSeconds" not in options
+]
+
+# 分区列表缓存（进程内），新建分区时立即加入
+PARTITION_CACHE_SECONDS = 60
+_partition_cache: Dict[str, Any] = {"names": None, "expires_at": 0.0}
+_indexed_partitions: Set[str] = set()
+
+
+def partition_name(timestamp: datetime) -> str:
+    """时间所在的天分区集合名"""
+    return f"{BASE_COLLECTION}_{timestamp:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[datetime]:
+    """分区集合名对应的日期，非分区集合返回None"""
+    match = PARTITION_PATTERN.match(name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d")
+
+
+def query_time_range(query: Optional[Dict[str, Any]]):
+    """从查询条件的timestamp字段提取时间范围 (start, end)，未限定的一端为None"""
+    condition = (query or {}).get("timestamp")
+    if isinstance(condition, datetime):
+        return condition, condition
+    if not isinstance(condition, dict):
+        return None, None
+    return condition.get("$gte") or condition.get("$gt"), condition.get("$lte") or condition.get("$lt")
+
+
+def clear_partition_cache():
+    """清空分区列表缓存（迁移、删除分区后调用）"""
+    _partition_cache["names"] = None
+    _partition_cache["expires_at"] = 0.0
+
+
+class RecordStore:
+    """性能记录存储路由类
+
+    single 布局下所有操作直接作用于 performance_records 集合；daily 布局下记录按时间戳写入
+    performance_records_YYYYMMDD 分区集合，查询根据条件中的 timestamp 范围只访问相关分区
+    （聚合通过 $unionWith 合并为一次查询），保留期之外的分区整集合删除，避免TTL逐条删除的写放大。
+    performance_records 本身视为最旧的分区参与查询，以读取切换布局前的历史记录。
+    """
+
+    def __init__(self, db=None, layout: Optional[str] = None):
+        self.db = db if db is not None else get_database()
+        self.layout = layout or settings.performance_storage_layout
+        self.collection = self.db.performance_records if self.db is not None else None
+
+    @property
+    def partitioned(self) -> bool:
+        return self.layout == LAYOUT_DAILY
+
+    async def list_partitions(self) -> List[str]:
+        """已存在的分区集合名，按日期从新到旧"""
+        now = time.monotonic()
+        if _partition_cache["names"] is None or _partition_cache["expires_at"] <= now:
+            names = await self.db.list_collection_names(filter={"name": {"$regex": PARTITION_PATTERN.pattern}})
+            _partition_cache["names"] = sorted(names, reverse=True)
+            _partition_cache["expires_at"] = now + PARTITION_CACHE_SECONDS
+        return list(_partition_cache["names"])
+
+    async def collections_for_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Any]:
+        """时间范围涉及的集合，按时间从新到旧，最后是未分区集合"""
+        if not self.partitioned:
+            return [self.collection]
+
+        start_day = start.replace(hour=0, minute=0, second=0, microsecond=0) if start else None
+        collections = []
+        for name in await self.list_partitions():
+            day = partition_day(name)
+            if start_day and day < start_day:
+                continue
+            if end and day > end:
+                continue
+            collections.append(self.db[name])
+        collections.append(self.collection)
+        return collections
+
+    async def collections_for_query(self, query: Optional[Dict[str, Any]]) -> List[Any]:
+        return await self.collections_for_range(*query_time_range(query))
+
+    async def partition_for(self, timestamp: datetime):
+        """记录写入的集合，首次写入分区时创建索引"""
+        if not self.partitioned:
+            return self.collection
+
+        name = partition_name(timestamp)
+        if name not in _indexed_partitions:
+            collection = self.db[name]
+            for keys, options in PARTITION_INDEXES:
+                await collection.create_index(keys, **options)
+            _indexed_partitions.add(name)
+            names = _partition_cache["names"]
+            if names is not None and name not in names:
+                _partition_cache["names"] = sorted(names + [name], reverse=True)
+        return self.db[name]
+
+    async def insert(self, record_doc: Dict[str, Any]):
+        """写入一条性能记录"""
+        collection = await self.partition_for(record_doc["timestamp"])
+        await collection.insert_one(record_doc)
+
+    async def find_by_trace_id(self, trace_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """按trace_id查找记录（分区布局下从最新分区开始逐个查找）"""
+        for collection in await self.collections_for_range():
+            doc = await collection.find_one({"trace_id": trace_id}, projection)
+            if doc:
+                return doc
+        return None
+
+    async def count(self, query: Dict[str, Any]) -> int:
+        """统计满足条件的记录数"""
+        total = 0
+        for collection in await self.collections_for_query(query):
+            total += await collection.count_documents(query)
+        return total
+
+    async def estimated_count(self) -> int:
+        """按集合元数据估算记录总数"""
+        total = 0
+        for collection in await self.collections_for_range():
+            total += await collection.estimated_document_count()
+        return total
+
+    async def find_page(
+        self, query: Dict[str, Any], skip: int, limit: int, projection: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """按时间倒序分页查询（分区按时间从新到旧，整页跳过的分区只计数不读取）"""
+        collections = await self.collections_for_query(query)
+        if len(collections) == 1:
+            return await collections[0].find(query, projection).skip(skip).limit(limit).sort("timestamp", -1).to_list(None)
+
+        docs: List[Dict[str, Any]] = []
+        for collection in collections:
+            if len(docs) >= limit:
+                break
+            if skip:
+                count = await collection.count_documents(query)
+                if skip >= count:
+                    skip -= count
+                    continue
+            cursor = collection.find(query, projection).skip(skip).limit(limit - len(docs)).sort("timestamp", -1)
+            docs.extend(await cursor.to_list(None))
+            skip = 0
+        return docs
+
+    async def find_all(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """查询满足条件的全部记录"""
+        docs: List[Dict[str, Any]] = []
+        for collection in await self.collections_for_query(query):
+            docs.extend(await collection.find(query, projection).to_list(None))
+        return docs
+
+    async def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> List[Dict[str, Any]]:
+        """执行聚合管道，第一个阶段为$match时据此选择分区，多个分区以$unionWith合并"""
+        match = pipeline[0].get("$match") if pipeline else None
+        collections = await self.collections_for_query(match)
+        if len(collections) > 1:
+            head = [{"$match": match}] if match is not None else []
+            unions = [{"$unionWith": {"coll": collection.name, "pipeline": head}} for collection in collections[1:]]
+            rest = pipeline[1:] if match is not None else pipeline
+            pipeline = head + unions + rest
+        return await collections[0].aggregate(pipeline, **kwargs).to_list(None)
+
+    async def drop_partitions_before(self, cutoff: datetime) -> List[str]:
+        """删除整天早于截止时间的分区"""
+        if not self.partitioned:
+            return []
+
+        dropped = []
+        for name in await self.list_partitions():
+            if partition_day(name) + timedelta(days=1) <= cutoff:
+                await self.db.drop_collection(name)
+                _indexed_partitions.discard(name)
+                dropped.append(name)
+        if dropped:
+            clear_partition_cache()
+            logger.info(f"删除过期分区: {', '.join(dropped)}")
+        return dropped
@@ -0,0 +1,233 @@
+"""
+部署后性能回归检测服务
+"""
+from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+import math
+import uuid
+import logging
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.utils.profile_diff import diff_profiles, latency_summary
+from app.services.rollup_service import RollupService, bucket_start, ROLLUP_BUCKET
+
+logger = logging.getLogger(__name__)
+
+# 检测进度记录的文档ID
+DETECTOR_STATE_ID = "regression_detector"
+
+
+def mann_whitney_z(baseline_counts: List[int], target_counts: List[int]) -> float:
+    """基于响应时间直方图计算Mann-Whitney U检验的z值（含同桶并列校正）
+
+    z值为正表示部署后的响应时间整体偏大。
+    """
+    n1 = sum(baseline_counts)
+    n2 = sum(target_counts)
+    total = n1 + n2
+    if n1 == 0 or n2 == 0 or total < 2:
+        return 0.0
+
+    u_statistic = 0.0
+    baseline_below = 0
+    tie_term = 0.0
+    for baseline_count, target_count in zip(baseline_counts, target_counts):
+        # 同一个桶内的样本视为并列，各计0.5
+        u_statistic += target_count * (baseline_below + 0.5 * baseline_count)
+        baseline_below += baseline_count
+        ties = baseline_count + target_count
+        tie_term += ties ** 3 - ties
+
+    mean = n1 * n2 / 2.0
+    variance = n1 * n2 / 12.0 * ((total + 1) - tie_term / (total * (total - 1)))
+    if variance <= 0:
+        return 0.0
+    return (u_statistic - mean) / math.sqrt(variance)
+
+
+def _relative_increase(before: float, after: float) -> float:
+    if before <= 0:
+        return 0.0
+    return (after - before) / before
+
+
+class RegressionService:
+    """回归检测服务类
+
+    每次运行只处理上次运行之后新关闭的rollup小时桶：对其中出现的每个
+    (路由, 版本) 组合，将部署后的响应时间直方图与部署前基线窗口做Mann-Whitney检验，
+    显著且超过噪声容忍度时写入回归事件。
+    """
+
+    def __init__(self):
+        self.db = get_database()
+        self.rollup_service = RollupService()
+        self.events_collection = self.db.regression_events if self.db is not None else None
+        self.state_collection = self.db.detector_state if self.db is not None else None
+
+    async def run_detection(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """执行一轮增量检测"""
+        current_bucket = bucket_start(now or datetime.utcnow())
+        detection_window = timedelta(hours=settings.regression_detection_hours)
+
+        state = await self.state_collection.find_one({"_id": DETECTOR_STATE_ID})
+        last_bucket = state.get("last_bucket") if state else None
+        if last_bucket is None:
+            last_bucket = current_bucket - detection_window
+
+        # 找出新关闭的桶中出现的带版本信息的 (路由, 版本) 组合
+        pipeline = [
+            {"$match": {
+                "bucket": {"$gt": last_bucket, "$lt": current_bucket},
+                "$or": [{"git_commit": {"$ne": None}}, {"app_version": {"$ne": None}}]
+            }},
+            {"$group": {"_id": {
+                "project_key": "$project_key",
+                "method": "$method",
+                "path": "$path",
+                "app_version": "$app_version",
+                "git_commit": "$git_commit"
+            }}}
+        ]
+        groups = await self.rollup_service.rollup_collection.aggregate(pipeline).to_list(None)
+
+        regressions = 0
+        for group in groups:
+            try:
+                if await self.evaluate(group["_id"], current_bucket):
+                    regressions += 1
+            except Exception as e:
+                logger.error(f"回归检测失败: {group['_id']}, {str(e)}")
+
+        await self.state_collection.update_one(
+            {"_id": DETECTOR_STATE_ID},
+            {"$set": {"last_bucket": current_bucket - ROLLUP_BUCKET, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+        logger.info(f"回归检测完成: 处理组合数 {len(groups)}, 回归数 {regressions}")
+        return {"processed_groups": len(groups), "regressions": regressions}
+
+    async def evaluate(self, key: Dict[str, Any], current_bucket: datetime) -> Optional[Dict[str, Any]]:
+        """检测单个 (路由, 版本) 组合，发现回归时写入并返回事件"""
+        version_filter = {"app_version": key.get("app_version"), "git_commit": key.get("git_commit")}
+        route_filter = {"project_key": key["project_key"], "path": key["path"], "method": key["method"]}
+
+        first = await self.rollup_service.rollup_collection.find_one(
+            {**route_filter, **version_filter},
+            {"bucket": 1},
+            sort=[("bucket", 1)]
+        )
+        if not first:
+            return None
+
+        # 只检测部署后一段时间内的版本
+        deploy_bucket = first["bucket"]
+        if deploy_bucket < current_bucket - timedelta(hours=settings.regression_detection_hours):
+            return None
+
+        target_query = self.rollup_service.build_query(
+            project_key=key["project_key"],
+            start_time=deploy_bucket,
+            end_time=current_bucket - ROLLUP_BUCKET,
+            path=key["path"],
+            method=key["method"],
+            app_version=key.get("app_version"),
+            git_commit=key.get("git_commit")
+        )
+        baseline_query = self.rollup_service.build_query(
+            project_key=key["project_key"],
+            start_time=deploy_bucket - timedelta(days=settings.regression_baseline_days),
+            end_time=deploy_bucket - ROLLUP_BUCKET,
+            path=key["path"],
+            method=key["method"]
+        )
+        if key.get("git_commit"):
+            baseline_query["git_commit"] = {"$ne": key["git_commit"]}
+        else:
+            baseline_query["app_version"] = {"$ne": key.get("app_version")}
+
+        target = await self.rollup_service.get_route_summary(target_query)
+        baseline = await self.rollup_service.get_route_summary(baseline_query)
+        if min(baseline["request_count"], target["request_count"]) < settings.regression_min_samples:
+            return None
+
+        z_score = mann_whitney_z(baseline["latency_counts"], target["latency_counts"])
+        baseline_latency = latency_summary(baseline)
+        target_latency = latency_summary(target)
+        increase = max(
+            _relative_increase(baseline_latency["avg_duration"], target_latency["avg_duration"]),
+            _relative_increase(baseline_latency["p95"], target_latency["p95"])
+        )
+
+        event_filter = {**route_filter, **version_filter}
+        if z_score < settings.regression_z_threshold or increase < settings.regression_min_increase:
+            # 之前判定的回归已恢复
+            await self.events_collection.update_one(
+                {**event_filter, "status": "open"},
+                {"$set": {"status": "resolved", "updated_at": datetime.utcnow()}}
+            )
+            return None
+
+        diff = diff_profiles(baseline, target, limit=20)
+        functions = [item for item in diff["functions"] if item["total_time_delta"] > 0][:5]
+
+        link_params = {
+            "path": key["path"],
+            "method": key["method"],
+            "baseline_start": (deploy_bucket - timedelta(days=settings.regression_baseline_days)).isoformat(),
+            "baseline_end": (deploy_bucket - ROLLUP_BUCKET).isoformat(),
+            "target_start": deploy_bucket.isoformat()
+        }
+        if key.get("git_commit"):
+            link_params["target_commit"] = key["git_commit"]
+        else:
+            link_params["target_version"] = key.get("app_version")
+
+        now = datetime.utcnow()
+        event = {
+            **event_filter,
+            "deploy_bucket": deploy_bucket,
+            "z_score": round(z_score, 3),
+            "latency_increase": round(increase, 4),
+            "baseline": baseline_latency,
+            "target": target_latency,
+            "latency_shift": diff["latency_shift"],
+            "functions": functions,
+            "new_hot_frames": diff["new_hot_frames"],
+            "diff_url": f"/api/v1/performance/diff/{key['project_key']}?{urlencode(link_params)}",
+            "status": "open",
+            "updated_at": now
+        }
+        await self.events_collection.update_one(
+            event_filter,
+            {"$set": event, "$setOnInsert": {"event_id": str(uuid.uuid4()), "created_at": now}},
+            upsert=True
+        )
+
+        logger.warning(
+            f"检测到性能回归: {key['project_key']} {key['method']} {key['path']} "
+            f"版本 {key.get('app_version')}/{key.get('git_commit')}, z={z_score:.2f}, 增幅 {increase:.1%}"
+        )
+        return event
+
+    async def get_events(
+        self,
+        project_key: str,
+        status: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """获取项目的回归事件"""
+        try:
+            query: Dict[str, Any] = {"project_key": project_key}
+            if status:
+                query["status"] = status
+
+            cursor = self.events_collection.find(query, {"_id": 0}).sort("updated_at", -1).limit(limit)
+            return await cursor.to_list(None)
+
+        except Exception as e:
+            logger.error(f"获取回归事件失败: {str(e)}")
+            raise
@@ -0,0 +1,373 @@
+"""
+分层数据保留与降采样服务
+"""
+from typing import List, Optional, Dict, Any, Set, Tuple, Callable
+from datetime import datetime, timedelta
+import logging
+
+from pymongo import UpdateOne
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.services.rollup_service import bucket_start, cap_stacks, stack_room, ROLLUP_BUCKET
+from app.services.record_store import RecordStore
+from app.utils.routes import route_key
+
+logger = logging.getLogger(__name__)
+
+# 保留进度报告的文档ID
+RETENTION_STATE_ID = "retention_compactor"
+
+# 性能记录的保留层级，未设置表示完整链路
+TIER_EXEMPLAR = "exemplar"
+
+# 样本链路的保留原因
+REASON_SLOWEST = "slowest"
+REASON_ERROR = "error"
+REASON_ANALYZED = "analyzed"
+
+# 统计存储节省的集合
+MEASURED_COLLECTIONS = ["performance_records", "function_calls", "route_rollups", "route_rollups_daily"]
+
+# 项目可覆盖的保留配置项
+RETENTION_FIELDS = ["retention_full_days", "retention_exemplar_days", "retention_hourly_rollup_days"]
+
+# 样本链路查询只取选择样本所需的字段
+EXEMPLAR_PROJECTION = {
+    "_id": 0,
+    "trace_id": 1,
+    "request_info.method": 1,
+    "request_info.path": 1,
+    "request_info.route": 1,
+    "response_info.status_code": 1,
+    "performance_metrics.total_duration": 1,
+    "retention_reason": 1
+}
+
+
+def retention_policy(config: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """合并项目覆盖配置与系统默认值，保证各层级天数递增"""
+    config = config or {}
+    policy = {field: config.get(field) or getattr(settings, field) for field in RETENTION_FIELDS}
+    policy["retention_exemplar_days"] = max(policy["retention_exemplar_days"], policy["retention_full_days"])
+    return policy
+
+
+def day_start(timestamp: datetime) -> datetime:
+    """计算时间所在的天桶"""
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def daily_rollup_update(doc: Dict[str, Any]) -> UpdateOne:
+    """将小时rollup文档合并到所在天桶的$inc更新"""
+    return rollup_merge_update(doc, bucket=day_start(doc["bucket"]))
+
+
+def rollup_merge_update(doc: Dict[str, Any], bucket: datetime, path: Optional[str] = None) -> UpdateOne:
+    """将rollup文档以$inc方式合并到指定时间桶（和路由）的rollup文档"""
+    increments: Dict[str, Any] = {
+        "request_count": doc.get("request_count", 0),
+        "weighted_count": doc.get("weighted_count", 0.0),
+        "error_count": doc.get("error_count", 0),
+        "duration_sum": doc.get("duration_sum", 0.0)
+    }
+    for index, count in (doc.get("latency_counts") or {}).items():
+        if count:
+            increments[f"latency_counts.{index}"] = count
+
+    names: Dict[str, Any] = {"updated_at": datetime.utcnow()}
+    for key, entry in (doc.get("stacks") or {}).items():
+        increments[f"stacks.{key}.count"] = entry.get("count", 0)
+        increments[f"stacks.{key}.self_time"] = entry.get("self_time", 0.0)
+        names[f"stacks.{key}.stack"] = entry.get("stack")
+
+    return UpdateOne(
+        rollup_filter(doc, bucket, path),
+        {
+            "$inc": increments,
+            "$max": {"duration_max": doc.get("duration_max", 0.0)},
+            "$set": names,
+            "$setOnInsert": {"created_at": datetime.utcnow()}
+        },
+        upsert=True
+    )
+
+
+def rollup_filter(doc: Dict[str, Any], bucket: datetime, path: Optional[str] = None) -> Dict[str, Any]:
+    """rollup文档合并到指定时间桶（和路由）后的唯一键"""
+    return {
+        "project_key": doc["project_key"],
+        "method": doc["method"],
+        "path": path or doc["path"],
+        "bucket": bucket,
+        "app_version": doc.get("app_version"),
+        "git_commit": doc.get("git_commit")
+    }
+
+
+def merge_rollup_docs(
+    docs: List[Dict[str, Any]],
+    bucket_of: Callable[[Dict[str, Any]], datetime],
+    path_of: Optional[Callable[[Dict[str, Any]], str]] = None
+) -> List[Dict[str, Any]]:
+    """在内存中合并目标相同的rollup文档，每个目标rollup只生成一次更新"""
+    merged: Dict[Tuple, Dict[str, Any]] = {}
+    for doc in docs:
+        target = rollup_filter(doc, bucket_of(doc), path_of(doc) if path_of else None)
+        key = tuple(target.values())
+        current = merged.get(key)
+        if current is None:
+            current = merged[key] = {
+                **target, "request_count": 0, "weighted_count": 0.0, "error_count": 0,
+                "duration_sum": 0.0, "duration_max": 0.0, "latency_counts": {}, "stacks": {}
+            }
+        for field in ("request_count", "weighted_count", "error_count", "duration_sum"):
+            current[field] += doc.get(field, 0)
+        current["duration_max"] = max(current["duration_max"], doc.get("duration_max", 0.0))
+        for index, count in (doc.get("latency_counts") or {}).items():
+            current["latency_counts"][index] = current["latency_counts"].get(index, 0) + count
+        for stack_id, entry in (doc.get("stacks") or {}).items():
+            stack = current["stacks"].setdefault(stack_id, {"stack": entry.get("stack"), "count": 0, "self_time": 0.0})
+            stack["count"] += entry.get("count", 0)
+            stack["self_time"] += entry.get("self_time", 0.0)
+    return list(merged.values())
+
+
+async def capped_merge_updates(
+    collection,
+    docs: List[Dict[str, Any]],
+    bucket_of: Callable[[Dict[str, Any]], datetime],
+    path_of: Optional[Callable[[Dict[str, Any]], str]] = None
+) -> List[UpdateOne]:
+    """将rollup文档合并到目标集合的$inc更新，目标文档的调用栈数量不超过上限"""
+    operations = []
+    for merged in merge_rollup_docs(docs, bucket_of, path_of):
+        if merged["stacks"]:
+            known, room = await stack_room(collection, rollup_filter(merged, merged["bucket"]), list(merged["stacks"]))
+            merged["stacks"] = cap_stacks(merged["stacks"], known, room)
+        operations.append(rollup_merge_update(merged, bucket=merged["bucket"]))
+    return operations
+
+
+class RetentionService:
+    """分层保留服务类
+
+    按项目的保留策略分层压缩历史数据：
+    - 完整层（retention_full_days内）：保留全部链路
+    - 样本层（retention_exemplar_days内）：每个路由每小时只保留最慢的链路、一条错误链路和已做过AI分析的链路，
+      函数级耗时由rollup调用栈表保留
+    - rollup层：小时rollup超过retention_hourly_rollup_days后合并为天级rollup，保留一年
+
+    每次最多处理 retention_max_batches 批、每批 retention_batch_size 条，未处理完的留到下次运行。
+    按天分区存储时，超出所有项目样本层保留期的分区整集合删除。
+    """
+
+    def __init__(self):
+        self.db = get_database()
+        self.record_store = RecordStore(self.db)
+        self.function_calls_collection = self.db.function_calls if self.db is not None else None
+        self.analysis_collection = self.db.ai_analysis_results if self.db is not None else None
+        self.rollup_collection = self.db.route_rollups if self.db is not None else None
+        self.daily_collection = self.db.route_rollups_daily if self.db is not None else None
+        self.projects_collection = self.db.projects if self.db is not None else None
+        self.state_collection = self.db.detector_state if self.db is not None else None
+
+    @property
+    def performance_collection(self):
+        """未分区的性能记录集合"""
+        return self.record_store.collection
+
+    @performance_collection.setter
+    def performance_collection(self, collection):
+        self.record_store.collection = collection
+
+    async def run(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """对所有项目执行一轮分层压缩，返回处理统计和存储节省"""
+        now = now or datetime.utcnow()
+        sizes_before = await self._collection_sizes()
+        max_exemplar_days = settings.retention_exemplar_days
+
+        report = {
+            "projects": 0,
+            "exemplars_kept": 0,
+            "records_deleted": 0,
+            "function_calls_deleted": 0,
+            "rollups_downsampled": 0,
+            "batches": 0
+        }
+        async for project in self.projects_collection.find({}, {"_id": 0, "project_key": 1, "config": 1}):
+            try:
+                policy = retention_policy(project.get("config"))
+                max_exemplar_days = max(max_exemplar_days, policy["retention_exemplar_days"])
+                await self.compact_project(project["project_key"], policy, now, report)
+                report["projects"] += 1
+            except Exception as e:
+                logger.error(f"数据分层压缩失败: {project['project_key']}, {str(e)}")
+
+        dropped = await self.record_store.drop_partitions_before(now - timedelta(days=max_exemplar_days))
+        report["partitions_dropped"] = dropped
+
+        sizes_after = await self._collection_sizes()
+        report["storage"] = {
+            name: {"size_before": size, "size_after": sizes_after.get(name, 0)}
+            for name, size in sizes_before.items()
+        }
+        report["bytes_freed"] = sum(sizes_before.values()) - sum(sizes_after.values())
+
+        await self.state_collection.update_one(
+            {"_id": RETENTION_STATE_ID},
+            {"$set": {"last_run": now, "last_report": report}},
+            upsert=True
+        )
+        logger.info(
+            f"数据分层压缩完成: 删除链路 {report['records_deleted']}, 保留样本 {report['exemplars_kept']}, "
+            f"降采样rollup {report['rollups_downsampled']}, 释放 {report['bytes_freed']} 字节"
+        )
+        return report
+
+    async def compact_project(self, project_key: str, policy: Dict[str, int], now: datetime, report: Dict[str, Any]):
+        """按保留策略压缩单个项目的数据"""
+        full_cutoff = now - timedelta(days=policy["retention_full_days"])
+        exemplar_cutoff = now - timedelta(days=policy["retention_exemplar_days"])
+        # 天级对齐，避免同一天的数据一部分在小时rollup、一部分在天级rollup
+        hourly_cutoff = day_start(now - timedelta(days=policy["retention_hourly_rollup_days"]))
+
+        # 按天分区时只处理完整层之前的分区，批数预算在分区之间共享
+        collections = await self.record_store.collections_for_range(end=full_cutoff)
+        start_batches = report["batches"]
+        for collection in collections:
+            await self._expire_exemplars(collection, project_key, exemplar_cutoff, report, start_batches)
+        start_batches = report["batches"]
+        for collection in collections:
+            await self._select_exemplars(collection, project_key, full_cutoff, report, start_batches)
+        await self._downsample_rollups(project_key, hourly_cutoff, report)
+
+    def _has_budget(self, report: Dict[str, Any], start_batches: int) -> bool:
+        return report["batches"] - start_batches < settings.retention_max_batches
+
+    async def _select_exemplars(
+        self, collection, project_key: str, cutoff: datetime, report: Dict[str, Any], start_batches: int
+    ):
+        """完整层到期的链路逐小时筛选样本，其余删除"""
+        pending = {"project_key": project_key, "retention_tier": None, "timestamp": {"$lt": cutoff}}
+
+        while self._has_budget(report, start_batches):
+            oldest = await collection.find_one(
+                pending, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)]
+            )
+            if not oldest:
+                break
+
+            hour = bucket_start(oldest["timestamp"])
+            hour_range = {"$gte": hour, "$lt": min(hour + ROLLUP_BUCKET, cutoff)}
+            # 按耗时降序处理，每个路由第一条未见过的记录就是该小时内剩余记录中最慢的
+            docs = await collection.find(
+                {**pending, "timestamp": hour_range}, EXEMPLAR_PROJECTION
+            ).sort("performance_metrics.total_duration", -1).limit(settings.retention_batch_size).to_list(None)
+            report["batches"] += 1
+
+            existing = await collection.find(
+                {"project_key": project_key, "retention_tier": TIER_EXEMPLAR, "timestamp": hour_range},
+                EXEMPLAR_PROJECTION
+            ).to_list(None)
+            exemplars, deleted = await self._split_exemplars(docs, existing)
+
+            for reason, trace_ids in exemplars.items():
+                await collection.update_many(
+                    {"trace_id": {"$in": trace_ids}},
+                    {"$set": {"retention_tier": TIER_EXEMPLAR, "retention_reason": reason}}
+                )
+                report["exemplars_kept"] += len(trace_ids)
+            await self._delete_traces(collection, deleted, report)
+
+    async def _split_exemplars(
+        self, docs: List[Dict[str, Any]], existing: List[Dict[str, Any]]
+    ) -> Tuple[Dict[str, List[str]], List[str]]:
+        """将同一小时内的记录分为样本（按保留原因）和待删除记录"""
+        seen: Set[Tuple[str, str, str]] = set()
+        for doc in existing:
+            seen.add((*self._route(doc), doc.get("retention_reason")))
+
+        trace_ids = [doc["trace_id"] for doc in docs]
+        analyzed = set(await self.analysis_collection.distinct(
+            "performance_record_id", {"performance_record_id": {"$in": trace_ids}}
+        )) if trace_ids else set()
+
+        exemplars: Dict[str, List[str]] = {}
+        deleted: List[str] = []
+        for doc in docs:
+            route = self._route(doc)
+            is_error = (doc.get("response_info") or {}).get("status_code", 0) >= 500
+            if (*route, REASON_SLOWEST) not in seen:
+                reason = REASON_SLOWEST
+                if is_error:
+                    seen.add((*route, REASON_ERROR))
+            elif is_error and (*route, REASON_ERROR) not in seen:
+                reason = REASON_ERROR
+            elif doc["trace_id"] in analyzed:
+                reason = REASON_ANALYZED
+            else:
+                deleted.append(doc["trace_id"])
+                continue
+            seen.add((*route, reason))
+            exemplars.setdefault(reason, []).append(doc["trace_id"])
+
+        return exemplars, deleted
+
+    @staticmethod
+    def _route(doc: Dict[str, Any]) -> Tuple[str, str]:
+        request_info = doc.get("request_info") or {}
+        return request_info.get("method"), route_key(request_info.get("path"), request_info.get("route"))
+
+    async def _expire_exemplars(
+        self, collection, project_key: str, cutoff: datetime, report: Dict[str, Any], start_batches: int
+    ):
+        """删除超出样本层保留期的链路"""
+        while self._has_budget(report, start_batches):
+            docs = await collection.find(
+                {"project_key": project_key, "timestamp": {"$lt": cutoff}}, {"_id": 0, "trace_id": 1}
+            ).limit(settings.retention_batch_size).to_list(None)
+            if not docs:
+                break
+            report["batches"] += 1
+            await self._delete_traces(collection, [doc["trace_id"] for doc in docs], report)
+
+    async def _delete_traces(self, collection, trace_ids: List[str], report: Dict[str, Any]):
+        if not trace_ids:
+            return
+        result = await collection.delete_many({"trace_id": {"$in": trace_ids}})
+        report["records_deleted"] += result.deleted_count
+        result = await self.function_calls_collection.delete_many({"trace_id": {"$in": trace_ids}})
+        report["function_calls_deleted"] += result.deleted_count
+
+    async def _downsample_rollups(self, project_key: str, cutoff: datetime, report: Dict[str, Any]):
+        """将超出保留期的小时rollup合并为天级rollup"""
+        start_batches = report["batches"]
+        while self._has_budget(report, start_batches):
+            docs = await self.rollup_collection.find(
+                {"project_key": project_key, "bucket": {"$lt": cutoff}}
+            ).sort("bucket", 1).limit(settings.retention_batch_size).to_list(None)
+            if not docs:
+                break
+            report["batches"] += 1
+
+            # 先写入天级rollup再删除小时rollup，中途失败时最多重复合并一批
+            operations = await capped_merge_updates(self.daily_collection, docs, lambda doc: day_start(doc["bucket"]))
+            await self.daily_collection.bulk_write(operations, ordered=False)
+            await self.rollup_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+            report["rollups_downsampled"] += len(docs)
+
+    async def _collection_sizes(self) -> Dict[str, int]:
+        """读取集合（含性能记录分区）的数据大小（字节）"""
+        names = list(MEASURED_COLLECTIONS)
+        if self.record_store.partitioned:
+            names.extend(await self.record_store.list_partitions())
+        sizes = {}
+        for name in names:
+            try:
+                stats = await self.db.command("collStats", name)
+                sizes[name] = int(stats.get("size", 0))
+            except Exception as e:
+                logger.warning(f"读取集合大小失败: {name}, {str(e)}")
+                sizes[name] = 0
+        return sizes
@@ -0,0 +1,274 @@
+"""
+路由小时级聚合（rollup）服务
+"""
+from typing import List, Optional, Dict, Any, Tuple, Set
+from datetime import datetime, timedelta
+import logging
+
+from app.config.settings import settings
+from app.utils.database import get_database
+from app.models.performance import PerformanceRecord, ProfileAggregateCreate
+from app.utils.routes import canonical_route, route_key
+from app.utils.latency import LATENCY_BUCKETS, latency_bucket_index
+from app.utils.stacks import OTHER_STACK, stack_key, collapse_function_calls, merge_stack_entries
+
+logger = logging.getLogger(__name__)
+
+# rollup时间桶粒度
+ROLLUP_BUCKET = timedelta(hours=1)
+
+
+def cap_stacks(entries: Dict[str, Dict[str, Any]], known: Set[str], room: int) -> Dict[str, Dict[str, Any]]:
+    """限制写入rollup文档的调用栈数量
+
+    entries 为 {存储键: {"stack", "count", "self_time"}}。文档中已有的调用栈照常累加，
+    新调用栈按自身耗时保留至多 room 个，其余合并到 OTHER_STACK。
+    """
+    other_key = stack_key(OTHER_STACK)
+    capped = {key: entry for key, entry in entries.items() if key in known or key == other_key}
+    new_keys = sorted(
+        (key for key in entries if key not in capped),
+        key=lambda key: entries[key].get("self_time", 0.0),
+        reverse=True
+    )
+    for key in new_keys[room:]:
+        other = capped.setdefault(other_key, {"stack": OTHER_STACK, "count": 0, "self_time": 0.0})
+        capped[other_key] = {
+            "stack": OTHER_STACK,
+            "count": other.get("count", 0) + entries[key].get("count", 0),
+            "self_time": other.get("self_time", 0.0) + entries[key].get("self_time", 0.0)
+        }
+    for key in new_keys[:room]:
+        capped[key] = entries[key]
+    return capped
+
+
+async def stack_room(collection, query: Dict[str, Any], keys: List[str]) -> Tuple[Set[str], int]:
+    """读取rollup文档中已存在的调用栈键，以及还可以新增的调用栈数
+
+    并发写入同一文档时读到的数量可能略旧，上限是近似的（超出量不超过并发写入的新调用栈数）。
+    """
+    projection: Dict[str, Any] = {
+        "_id": 0,
+        "stack_total": {"$size": {"$objectToArray": {"$ifNull": ["$stacks", {}]}}}
+    }
+    projection.update({f"stacks.{key}.count": 1 for key in keys})
+    doc = await collection.find_one(query, projection)
+    if not doc:
+        return set(), settings.rollup_max_stacks
+    return set(doc.get("stacks") or {}), max(settings.rollup_max_stacks - doc.get("stack_total", 0), 0)
+
+
+def bucket_start(timestamp: datetime) -> datetime:
+    """计算时间所在的小时桶"""
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class RollupService:
+    """路由rollup服务类
+
+    按 (项目, 路由, 小时, 版本) 维护请求计数、响应时间直方图和加权调用栈表，
+    在数据上报时增量更新，供火焰图、版本对比等跨请求查询使用。
+    超出保留期的小时rollup由分层保留任务合并为天级rollup，查询时一并读取。
+    """
+
+    def __init__(self):
+        self.db = get_database()
+        self.rollup_collection = self.db.route_rollups if self.db is not None else None
+        self.daily_collection = self.db.route_rollups_daily if self.db is not None else None
+
+    async def add_record(self, project_key: str, record: PerformanceRecord):
+        """将单条性能记录合并到rollup"""
+        try:
+            duration = record.performance_metrics.total_duration
+            latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+            latency_counts[latency_bucket_index(duration)] = 1
+
+            stacks = collapse_function_calls([fc.dict() for fc in record.function_calls])
+
+            await self._upsert(
+                project_key=project_key,
+                method=record.request_info.method,
+                path=route_key(record.request_info.path, record.request_info.route),
+                timestamp=record.timestamp,
+                version_info=record.version_info.dict() if record.version_info else None,
+                request_count=1,
+                weighted_count=record.sampling_info.weight if record.sampling_info else 1.0,
+                error_count=1 if record.response_info.status_code >= 500 else 0,
+                duration_sum=duration,
+                duration_max=duration,
+                latency_counts=latency_counts,
+                stacks=stacks
+            )
+        except Exception as e:
+            logger.error(f"合并性能记录到rollup失败: {str(e)}")
+
+    async def add_aggregate(self, project_key: str, aggregate: ProfileAggregateCreate):
+        """将SDK上报的窗口聚合数据合并到rollup"""
+        try:
+            # SDK直方图的桶上界可能与后端不同，按上界映射到后端的桶
+            latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+            bounds = aggregate.latency_histogram.bounds
+            for index, count in enumerate(aggregate.latency_histogram.counts):
+                target = latency_bucket_index(bounds[index]) if index < len(bounds) else len(LATENCY_BUCKETS)
+                latency_counts[target] += count
+
+            stacks = {sample.stack: (sample.count, sample.self_time) for sample in aggregate.stacks}
+
+            await self._upsert(
+                project_key=project_key,
+                method=aggregate.method,
+                path=route_key(aggregate.path, aggregate.route),
+                timestamp=aggregate.window_start.replace(tzinfo=None),
+                version_info=aggregate.version_info.dict() if aggregate.version_info else None,
+                request_count=aggregate.request_count,
+                weighted_count=aggregate.weighted_count or float(aggregate.request_count),
+                error_count=aggregate.error_count,
+                duration_sum=aggregate.duration_sum,
+                duration_max=aggregate.duration_max,
+                latency_counts=latency_counts,
+                stacks=stacks
+            )
+        except Exception as e:
+            logger.error(f"合并聚合数据到rollup失败: {str(e)}")
+
+    async def _upsert(
+        self,
+        project_key: str,
+        method: str,
+        path: str,
+        timestamp: datetime,
+        version_info: Optional[Dict[str, Any]],
+        request_count: int,
+        weighted_count: float,
+        error_count: int,
+        duration_sum: float,
+        duration_max: float,
+        latency_counts: List[int],
+        stacks: Dict[str, Tuple[int, float]]
+    ):
+        """以$inc方式增量更新rollup文档"""
+        version_info = version_info or {}
+        bucket = bucket_start(timestamp)
+
+        increments: Dict[str, Any] = {
+            "request_count": request_count,
+            "weighted_count": weighted_count,
+            "error_count": error_count,
+            "duration_sum": duration_sum
+        }
+        for index, count in enumerate(latency_counts):
+            if count:
+                increments[f"latency_counts.{index}"] = count
+
+        query = {
+            "project_key": project_key,
+            "method": method,
+            "path": path,
+            "bucket": bucket,
+            "app_version": version_info.get("app_version"),
+            "git_commit": version_info.get("git_commit")
+        }
+
+        # 高基数路由的调用栈不能无限增长（文档16MB上限，且每次$inc的字段数随之增长）
+        entries = {
+            stack_key(stack): {"stack": stack, "count": count, "self_time": self_time}
+            for stack, (count, self_time) in stacks.items()
+        }
+        if entries:
+            known, room = await stack_room(self.rollup_collection, query, list(entries))
+            entries = cap_stacks(entries, known, room)
+
+        names: Dict[str, Any] = {"updated_at": datetime.utcnow()}
+        for key, entry in entries.items():
+            increments[f"stacks.{key}.count"] = entry["count"]
+            increments[f"stacks.{key}.self_time"] = entry["self_time"]
+            names[f"stacks.{key}.stack"] = entry["stack"]
+
+        await self.rollup_collection.update_one(
+            query,
+            {
+                "$inc": increments,
+                "$max": {"duration_max": duration_max},
+                "$set": names,
+                "$setOnInsert": {"created_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+
+    def build_query(
+        self,
+        project_key: str,
+        start_time: datetime,
+        end_time: Optional[datetime] = None,
+        path: Optional[str] = None,
+        method: Optional[str] = None,
+        app_version: Optional[str] = None,
+        git_commit: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """构建rollup查询条件"""
+        query: Dict[str, Any] = {
+            "project_key": project_key,
+            "bucket": {"$gte": bucket_start(start_time)}
+        }
+        if end_time:
+            query["bucket"]["$lte"] = end_time
+        if path:
+            # rollup按路由模板存储，原始路径和框架模板写法都转换为模板
+            query["path"] = canonical_route(path)
+        if method:
+            query["method"] = method
+        if app_version:
+            query["app_version"] = app_version
+        if git_commit:
+            query["git_commit"] = git_commit
+        return query
+
+    async def _find_rollups(self, query: Dict[str, Any], projection: Dict[str, Any]):
+        """依次查询小时rollup和降采样后的天级rollup（同一时段只存在于其中一个集合）"""
+        for collection in (self.rollup_collection, self.daily_collection):
+            if collection is None:
+                continue
+            async for doc in collection.find(query, projection):
+                yield doc
+
+    async def get_route_summary(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """合并查询范围内的计数、响应时间直方图和调用栈表"""
+        summary: Dict[str, Any] = {
+            "request_count": 0,
+            "weighted_count": 0.0,
+            "error_count": 0,
+            "duration_sum": 0.0,
+            "duration_max": 0.0,
+            "latency_counts": [0] * (len(LATENCY_BUCKETS) + 1),
+            "stacks": {}
+        }
+        stacks: Dict[str, List[float]] = summary["stacks"]
+
+        async for doc in self._find_rollups(query, {"_id": 0}):
+            summary["request_count"] += doc.get("request_count", 0)
+            summary["weighted_count"] += doc.get("weighted_count", 0.0)
+            summary["error_count"] += doc.get("error_count", 0)
+            summary["duration_sum"] += doc.get("duration_sum", 0.0)
+            summary["duration_max"] = max(summary["duration_max"], doc.get("duration_max", 0.0))
+            for index, count in (doc.get("latency_counts") or {}).items():
+                if int(index) < len(summary["latency_counts"]):
+                    summary["latency_counts"][int(index)] += count
+            merge_stack_entries(stacks, doc.get("stacks"))
+
+        return summary
+
+    async def get_stack_table(self, query: Dict[str, Any]) -> Tuple[Dict[str, List[float]], int]:
+        """合并查询范围内的调用栈表
+
+        Returns:
+            ({调用栈: [调用次数, 自身耗时]}, 覆盖的请求数)
+        """
+        merged: Dict[str, List[float]] = {}
+        request_count = 0
+
+        async for doc in self._find_rollups(query, {"_id": 0, "stacks": 1, "request_count": 1}):
+            request_count += doc.get("request_count", 0)
+            merge_stack_entries(merged, doc.get("stacks"))
+
+        return merged, request_count
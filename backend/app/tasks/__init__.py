@@ -1,3 +1,6 @@
 # 任务模块
 from app.tasks import ai_analysis
-from app.tasks import ai_analysis_fix
\ No newline at end of file
+from app.tasks import ai_analysis_fix
+from app.tasks import regression
+from app.tasks import maintenance
+from app.tasks import auto_analysis
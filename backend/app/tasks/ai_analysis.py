@@ -1,7 +1,6 @@
 """
 Celery异步任务
 """
-import asyncio
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import logging
@@ -9,9 +8,11 @@ import logging
 from celery import Celery
 from app.config.settings import settings
 from app.services.ai_analyzer import performance_analyzer
-from app.utils.database import db_manager, init_database
+from app.services.analysis_executor import AnalysisExecutor
+from app.services.analysis_progress import AnalysisProgressReporter
+from app.utils.database import db_manager
+from app.tasks.runtime import run_async
 from app.models.analysis import AnalysisRecord, AnalysisStatus, AnalysisPriority
-from app.utils.database import get_database
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +21,7 @@ celery_app = Celery(
     'performance_monitor',
     broker=settings.redis_url,
     backend=settings.redis_url,
-    include=['app.tasks.ai_analysis']
+    include=['app.tasks.ai_analysis', 'app.tasks.regression', 'app.tasks.maintenance', 'app.tasks.auto_analysis']
 )
 
 # 配置Celery
@@ -37,24 +38,14 @@ celery_app.conf.update(
 )
 
 
-# 初始化数据库连接
-async def initialize_database():
-    """初始化数据库连接"""
-    try:
-        await init_database()
-        logger.info("数据库连接初始化成功")
-    except Exception as e:
-        logger.error(f"数据库连接初始化失败: {str(e)}")
-        raise
-
-
 @celery_app.task(bind=True, name='ai_analysis.analyze_performance')
 def analyze_performance_task(
     self,
     performance_record_id: str,
     ai_service: Optional[str] = None,
     priority: str = 'normal',
-    analysis_id: Optional[str] = None  # 新增参数，接受API传入的analysis_id
+    analysis_id: Optional[str] = None,  # 新增参数，接受API传入的analysis_id
+    use_cache: bool = True
 ):
     """
     异步分析性能数据
@@ -64,17 +55,11 @@ def analyze_performance_task(
         ai_service: AI服务名称
         priority: 分析优先级
         analysis_id: 分析ID（可选，由API传入）
+        use_cache: 是否复用缓存的分析结果
     """
-    # 初始化事件循环
-    loop = None
     try:
         logger.info(f"开始执行性能分析任务: {performance_record_id}, AI服务: {ai_service}, 优先级: {priority}")
         
-        # 初始化数据库连接
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(initialize_database())
-        
         # 更新任务状态
         self.update_state(
             state='PROGRESS',
@@ -82,7 +67,7 @@ def analyze_performance_task(
         )
         
         # 获取性能记录
-        performance_record = loop.run_until_complete(
+        performance_record = run_async(
             db_manager.get_performance_record(performance_record_id)
         )
         
@@ -95,14 +80,29 @@ def analyze_performance_task(
             meta={'step': 'analyzing', 'progress': 30}
         )
         
+        # 流式输出时推送已解析的部分结果
+        reporter = None
+        if analysis_id:
+            reporter = AnalysisProgressReporter(
+                analysis_id,
+                on_progress=lambda progress: self.update_state(
+                    state='PROGRESS',
+                    meta={'step': 'analyzing', 'progress': progress}
+                )
+            )
+        
         # 执行AI分析（传递数据库连接以加载最新配置）
-        db = get_database()
-        analysis_results = loop.run_until_complete(
+        analysis_results = run_async(
             performance_analyzer.analyze_performance(
                 performance_record,
-                ai_service=ai_service
+                ai_service=ai_service,
+                use_cache=use_cache,
+                on_content=reporter.on_content if reporter else None,
+                on_restart=reporter.reset if reporter else None
             )
         )
+        if reporter:
+            run_async(reporter.flush())
         
         # 更新任务状态
         self.update_state(
@@ -116,7 +116,7 @@ def analyze_performance_task(
         # 检查是否已存在分析记录
         existing_record = None
         if analysis_id:
-            existing_record = loop.run_until_complete(
+            existing_record = run_async(
                 db_manager.get_analysis_record_by_id(analysis_id)
             )
         
@@ -128,7 +128,7 @@ def analyze_performance_task(
             existing_record.updated_at = datetime.utcnow()
             
             # 保存到数据库
-            loop.run_until_complete(db_manager.save_analysis_record(existing_record))
+            run_async(db_manager.save_analysis_record(existing_record))
             
             analysis_record = existing_record
         else:
@@ -148,7 +148,7 @@ def analyze_performance_task(
             )
             
             # 保存到数据库
-            loop.run_until_complete(db_manager.save_analysis_record(analysis_record))
+            run_async(db_manager.save_analysis_record(analysis_record))
         
         # 更新任务状态
         self.update_state(
@@ -162,7 +162,7 @@ def analyze_performance_task(
         )
         
         # 更新任务状态记录
-        loop.run_until_complete(
+        run_async(
             db_manager.update_task_status(
                 self.request.id,
                 "SUCCESS",
@@ -170,6 +170,8 @@ def analyze_performance_task(
                 datetime.utcnow()
             )
         )
+        if reporter:
+            run_async(reporter.complete(analysis_results.dict()))
         
         return {
             'status': 'success',
@@ -194,39 +196,34 @@ def analyze_performance_task(
         
         # 保存失败记录
         try:
-            if loop:
-                # 使用传入的analysis_id，如果不为空的话
-                final_analysis_id = analysis_id or f"analysis_{performance_record_id}_{int(datetime.utcnow().timestamp())}"
-                
-                analysis_record = AnalysisRecord(
-                    analysis_id=final_analysis_id,
-                    performance_record_id=performance_record_id,
-                    project_key="unknown",
-                    ai_service=ai_service or "fallback",
-                    results=None,
-                    task_id=self.request.id,
-                    status=AnalysisStatus.FAILURE,
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow(),
-                    priority=AnalysisPriority(priority),
-                    analysis_type="ai_analysis"  # 设置默认分析类型
-                )
-                loop.run_until_complete(db_manager.save_analysis_record(analysis_record))
+            # 使用传入的analysis_id，如果不为空的话
+            final_analysis_id = analysis_id or f"analysis_{performance_record_id}_{int(datetime.utcnow().timestamp())}"
+            
+            analysis_record = AnalysisRecord(
+                analysis_id=final_analysis_id,
+                performance_record_id=performance_record_id,
+                project_key="unknown",
+                ai_service=ai_service or "fallback",
+                results=None,
+                task_id=self.request.id,
+                status=AnalysisStatus.FAILURE,
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow(),
+                priority=AnalysisPriority(priority),
+                analysis_type="ai_analysis"  # 设置默认分析类型
+            )
+            run_async(db_manager.save_analysis_record(analysis_record))
+            if analysis_id:
+                run_async(AnalysisProgressReporter(analysis_id).fail(str(e)))
         except Exception as inner_e:
             logger.error(f"保存失败记录时出错: {str(inner_e)}")
         
         raise
-    finally:
-        # 关闭事件循环
-        if loop:
-            try:
-                loop.close()
-            except Exception as e:
-                logger.error(f"关闭事件循环时出错: {str(e)}")
 
 
-@celery_app.task(name='ai_analysis.batch_analyze_performance')
+@celery_app.task(bind=True, name='ai_analysis.batch_analyze_performance', time_limit=3600)
 def batch_analyze_performance_task(
+    self,
     performance_record_ids: list,
     ai_service: Optional[str] = None,
     priority: str = 'normal'
@@ -234,44 +231,22 @@ def batch_analyze_performance_task(
     """
     批量分析性能数据
     
+    在当前worker内并发执行，调用速率由AI服务的速率限制控制
+    
     Args:
         performance_record_ids: 性能记录ID列表
         ai_service: AI服务名称
         priority: 分析优先级
     """
     try:
-        results = []
-        total_count = len(performance_record_ids)
-        
-        for i, record_id in enumerate(performance_record_ids):
-            try:
-                # 调用单个分析任务
-                result = analyze_performance_task.apply_async(
-                    args=[record_id, ai_service, priority],
-                    countdown=i * 2  # 间隔2秒执行，避免同时处理过多任务
-                )
-                
-                results.append({
-                    'record_id': record_id,
-                    'task_id': result.id,
-                    'status': 'queued'
-                })
-                
-            except Exception as e:
-                logger.error(f"批量分析任务创建失败: {record_id}, {str(e)}")
-                results.append({
-                    'record_id': record_id,
-                    'status': 'failed',
-                    'error': str(e)
-                })
-        
-        return {
-            'status': 'success',
-            'total_count': total_count,
-            'queued_count': sum(1 for r in results if r['status'] == 'queued'),
-            'failed_count': sum(1 for r in results if r['status'] == 'failed'),
-            'results': results
-        }
+        return run_async(
+            AnalysisExecutor().run(
+                performance_record_ids,
+                ai_service=ai_service,
+                priority=priority,
+                task_id=self.request.id
+            )
+        )
         
     except Exception as e:
         logger.error(f"批量分析任务失败: {str(e)}")
@@ -290,7 +265,7 @@ def cleanup_old_analysis_task(days: int = 30):
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
         # 删除旧的分析记录
-        result = asyncio.run(
+        result = run_async(
             db_manager.cleanup_old_analysis_records(cutoff_date)
         )
         
@@ -330,14 +305,14 @@ def generate_performance_report_task(
         end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
         
         # 获取时间范围内的性能数据
-        performance_records = asyncio.run(
+        performance_records = run_async(
             db_manager.get_performance_records_by_date_range(
                 project_key, start_dt, end_dt
             )
         )
         
         # 获取分析结果
-        analysis_records = asyncio.run(
+        analysis_records = run_async(
             db_manager.get_analysis_records_by_date_range(
                 project_key, start_dt, end_dt
             )
@@ -394,7 +369,7 @@ def generate_performance_report_task(
         
         # 保存报告
         report_id = f"report_{project_key}_{int(datetime.utcnow().timestamp())}"
-        asyncio.run(
+        run_async(
             db_manager.save_performance_report(report_id, report_data)
         )
         
@@ -415,6 +390,10 @@ celery_app.conf.task_routes = {
     'ai_analysis.batch_analyze_performance': {'queue': 'batch'},
     'ai_analysis.cleanup_old_analysis': {'queue': 'maintenance'},
     'ai_analysis.performance_report': {'queue': 'reports'},
+    'regression.detect_regressions': {'queue': 'maintenance'},
+    'maintenance.reconcile_counters': {'queue': 'maintenance'},
+    'maintenance.compact_retention': {'queue': 'maintenance'},
+    'auto_analysis.schedule': {'queue': 'maintenance'},
 }
 
 # 定时任务配置
@@ -426,4 +405,20 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(hour=2, minute=0),  # 每天凌晨2点执行
         'args': (30,)  # 保留30天的数据
     },
+    'detect-regressions': {
+        'task': 'regression.detect_regressions',
+        'schedule': crontab(minute=5),  # 每小时第5分钟执行，处理上一个已关闭的小时桶
+    },
+    'compact-retention': {
+        'task': 'maintenance.compact_retention',
+        'schedule': crontab(hour=2, minute=30),  # 每天凌晨2点30分执行，随后的计数器校准会反映删除的记录
+    },
+    'reconcile-counters': {
+        'task': 'maintenance.reconcile_counters',
+        'schedule': crontab(hour=3, minute=0),  # 每天凌晨3点执行
+    },
+    'schedule-auto-analysis': {
+        'task': 'auto_analysis.schedule',
+        'schedule': crontab(minute=10),  # 每小时第10分钟执行，rollup小时桶关闭后检查告警并提交分析
+    },
 }
\ No newline at end of file
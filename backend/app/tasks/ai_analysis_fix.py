@@ -1,14 +1,14 @@
 """
 修正版的Celery任务实现，接受传入的analysis_id参数
 """
-import asyncio
 from typing import Dict, Any, Optional
 from datetime import datetime
 import logging
 
 from app.tasks.ai_analysis import celery_app
 from app.services.ai_analyzer import performance_analyzer
-from app.utils.database import db_manager, init_database
+from app.utils.database import db_manager
+from app.tasks.runtime import run_async
 from app.models.analysis import AnalysisRecord, AnalysisStatus, AnalysisPriority
 
 logger = logging.getLogger(__name__)
@@ -30,16 +30,9 @@ def analyze_performance_fixed_task(
         ai_service: AI服务名称
         priority: 分析优先级
     """
-    # 初始化事件循环
-    loop = None
     try:
         logger.info(f"开始执行修正版性能分析任务: {performance_record_id}, 分析ID: {analysis_id}, AI服务: {ai_service}")
         
-        # 初始化数据库连接
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(initialize_database())
-        
         # 更新任务状态
         self.update_state(
             state='PROGRESS',
@@ -47,7 +40,7 @@ def analyze_performance_fixed_task(
         )
         
         # 获取性能记录
-        performance_record = loop.run_until_complete(
+        performance_record = run_async(
             db_manager.get_performance_record(performance_record_id)
         )
         
@@ -61,7 +54,7 @@ def analyze_performance_fixed_task(
         )
         
         # 执行AI分析
-        analysis_results = loop.run_until_complete(
+        analysis_results = run_async(
             performance_analyzer.analyze_performance(
                 performance_record,
                 ai_service=ai_service
@@ -75,7 +68,7 @@ def analyze_performance_fixed_task(
         )
         
         # 查询已存在的分析记录
-        existing_record = loop.run_until_complete(
+        existing_record = run_async(
             db_manager.get_analysis_record_by_id(analysis_id)
         )
         
@@ -96,7 +89,7 @@ def analyze_performance_fixed_task(
             )
             
             # 保存到数据库
-            loop.run_until_complete(db_manager.save_analysis_record(analysis_record))
+            run_async(db_manager.save_analysis_record(analysis_record))
         else:
             logger.info(f"更新已存在的分析记录: {analysis_id}")
             # 更新已存在的记录
@@ -105,7 +98,7 @@ def analyze_performance_fixed_task(
             existing_record.updated_at = datetime.utcnow()
             
             # 保存到数据库
-            loop.run_until_complete(db_manager.save_analysis_record(existing_record))
+            run_async(db_manager.save_analysis_record(existing_record))
         
         # 更新任务状态
         self.update_state(
@@ -119,7 +112,7 @@ def analyze_performance_fixed_task(
         )
         
         # 更新任务状态记录
-        loop.run_until_complete(
+        run_async(
             db_manager.update_task_status(
                 self.request.id,
                 "SUCCESS",
@@ -150,21 +143,13 @@ def analyze_performance_fixed_task(
         )
         
         # 更新任务状态记录
-        if loop:
-            loop.run_until_complete(
-                db_manager.update_task_status(
-                    self.request.id,
-                    "FAILURE",
-                    0,
-                    datetime.utcnow()
-                )
+        run_async(
+            db_manager.update_task_status(
+                self.request.id,
+                "FAILURE",
+                0,
+                datetime.utcnow()
             )
+        )
         
         raise
-    finally:
-        # 关闭事件循环
-        if loop:
-            try:
-                loop.close()
-            except Exception as e:
-                logger.error(f"关闭事件循环时出错: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+自动分析调度任务
+"""
+from datetime import datetime
+import logging
+
+from app.tasks.ai_analysis import celery_app, analyze_performance_task
+from app.tasks.runtime import run_async
+from app.services.auto_analysis_service import AutoAnalysisService
+from app.services.ai_config import ai_config_manager
+from app.utils.database import get_database
+
+logger = logging.getLogger(__name__)
+
+
+async def dispatch_analysis(trace_id: str, project_key: str) -> str:
+    """创建分析记录并提交AI分析任务，返回分析ID"""
+    db = get_database()
+    await ai_config_manager.refresh_from_database(db)
+    ai_service = ai_config_manager.default_service
+    now = datetime.utcnow()
+    analysis_id = f"analysis_{trace_id}_{int(now.timestamp())}"
+
+    celery_task = analyze_performance_task.apply_async(
+        args=[trace_id, ai_service, 'low'],
+        kwargs={"analysis_id": analysis_id}
+    )
+    await db.ai_analysis_results.insert_one({
+        "analysis_id": analysis_id,
+        "performance_record_id": trace_id,
+        "project_key": project_key,
+        "ai_service": ai_service,
+        "status": "PENDING",
+        "created_at": now,
+        "updated_at": now,
+        "results": None,
+        "task_id": celery_task.id,
+        "priority": 'low',
+        "analysis_type": "auto_analysis"
+    })
+    return analysis_id
+
+
+@celery_app.task(name='auto_analysis.schedule')
+def schedule_auto_analysis_task():
+    """
+    检查新关闭的rollup小时桶的告警阈值，并为开启自动分析的项目提交代表性慢链路的AI分析
+    """
+    try:
+        result = run_async(AutoAnalysisService().run(dispatch_analysis))
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as e:
+        logger.error(f"自动分析调度任务失败: {str(e)}")
+        raise
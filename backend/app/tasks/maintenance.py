@@ -0,0 +1,48 @@
+"""
+数据维护任务
+"""
+import logging
+
+from app.tasks.ai_analysis import celery_app
+from app.tasks.runtime import run_async
+from app.services.counter_service import CounterService
+from app.services.retention_service import RetentionService
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name='maintenance.reconcile_counters')
+def reconcile_counters_task():
+    """
+    按性能记录全量校准仪表盘计数器（修正记录过期删除等造成的偏差）
+    """
+    try:
+        result = run_async(CounterService().reconcile())
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as e:
+        logger.error(f"计数器校准任务失败: {str(e)}")
+        raise
+
+
+
+@celery_app.task(name='maintenance.compact_retention')
+def compact_retention_task():
+    """
+    按分层保留策略压缩历史数据：完整链路到期后只保留样本链路，小时rollup到期后合并为天级rollup
+    """
+    try:
+        result = run_async(RetentionService().run())
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as e:
+        logger.error(f"数据分层压缩任务失败: {str(e)}")
+        raise
@@ -0,0 +1,28 @@
+"""
+性能回归检测任务
+"""
+import logging
+
+from app.tasks.ai_analysis import celery_app
+from app.tasks.runtime import run_async
+from app.services.regression_service import RegressionService
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name='regression.detect_regressions')
+def detect_regressions_task():
+    """
+    增量检测部署后的性能回归，只处理上次运行后新关闭的rollup小时桶
+    """
+    try:
+        result = run_async(RegressionService().run_detection())
+        
+        return {
+            'status': 'success',
+            **result
+        }
+        
+    except Exception as e:
+        logger.error(f"回归检测任务失败: {str(e)}")
+        raise
@@ -0,0 +1,65 @@
+"""
+Celery worker 异步运行时
+
+每个 worker 进程只创建一个事件循环和一组数据库连接池，在 worker_process_init
+信号中初始化，所有任务复用，避免每个任务重复创建事件循环、连接数据库和创建索引。
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+from app.utils.database import init_database, close_database
+from app.services.ai_analyzer import performance_analyzer
+
+logger = logging.getLogger(__name__)
+
+# 当前进程的事件循环
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """获取 worker 进程的事件循环，未初始化时（如 solo/threads 池）按需初始化"""
+    if _loop is None or _loop.is_closed():
+        init_worker_runtime()
+    return _loop
+
+
+def run_async(coro: Awaitable[Any]) -> Any:
+    """在 worker 事件循环中执行协程"""
+    return get_loop().run_until_complete(coro)
+
+
+@worker_process_init.connect
+def init_worker_runtime(**kwargs):
+    """初始化 worker 进程的事件循环和数据库连接（不创建索引）"""
+    global _loop
+
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    try:
+        _loop.run_until_complete(init_database(create_indexes_on_start=False))
+        logger.info("worker数据库连接初始化成功")
+    except Exception as e:
+        _loop.close()
+        _loop = None
+        logger.error(f"worker数据库连接初始化失败: {str(e)}")
+        raise
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_runtime(**kwargs):
+    """关闭 worker 进程的AI服务客户端、数据库连接和事件循环"""
+    global _loop
+
+    if _loop is None or _loop.is_closed():
+        return
+    try:
+        _loop.run_until_complete(performance_analyzer.clients.close())
+        _loop.run_until_complete(close_database())
+    except Exception as e:
+        logger.error(f"关闭worker连接时出错: {str(e)}")
+    finally:
+        _loop.close()
+        _loop = None
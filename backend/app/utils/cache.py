@@ -0,0 +1,255 @@
+"""
+服务方法响应缓存模块
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Union
+
+from app.utils.database import get_redis
+
+logger = logging.getLogger(__name__)
+
+# 缓存键前缀
+CACHE_PREFIX = "cache:"
+# 缓存代数键前缀，数据上报时递增代数使旧缓存失效
+CACHE_GENERATION_PREFIX = "cache_gen:"
+# 单飞锁键前缀
+CACHE_LOCK_PREFIX = "cache_lock:"
+# 不区分项目的全局缓存使用的项目标识
+GLOBAL_SCOPE = "all"
+
+# 同一项目两次失效之间的最小间隔（秒），避免每条上报都写Redis
+INVALIDATION_INTERVAL = 5.0
+# 单飞锁超时时间（秒）
+LOCK_TIMEOUT = 10
+# 等待其他进程计算结果的轮询间隔和次数
+LOCK_WAIT_INTERVAL = 0.05
+LOCK_WAIT_ATTEMPTS = 40
+
+# 缓存命中统计 {命名空间: {"hits": n, "misses": n}}
+cache_metrics: Dict[str, Dict[str, int]] = {}
+
+# 进程内正在计算的缓存 {缓存键: Future}
+_inflight: Dict[str, asyncio.Future] = {}
+# 最近一次失效时间 {项目标识: 时间戳}
+_last_invalidation: Dict[str, float] = {}
+# 节流期间等待执行的尾沿失效 {项目标识: Task}
+_pending_invalidation: Dict[str, asyncio.Task] = {}
+
+
+def ttl_for_span(start_time: Optional[datetime]) -> int:
+    """按查询时间跨度确定缓存时间，跨度越长数据越稳定"""
+    if start_time is None:
+        return 60
+    span = (datetime.utcnow() - start_time.replace(tzinfo=None)).total_seconds()
+    if span <= 3600:
+        return 30
+    if span <= 86400:
+        return 120
+    if span <= 7 * 86400:
+        return 600
+    return 1800
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"无法序列化的类型: {type(value)}")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if "__datetime__" in obj and len(obj) == 1:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def _record(namespace: str, outcome: str):
+    metrics = cache_metrics.setdefault(namespace, {"hits": 0, "misses": 0})
+    metrics[outcome] += 1
+
+
+def _key_part(value: Any, ttl: int) -> Any:
+    # 时间参数按缓存时间取整，使相近时刻的请求命中同一缓存
+    if isinstance(value, datetime):
+        return int(value.replace(tzinfo=None).timestamp()) // max(ttl, 1)
+    return value
+
+
+def cached(namespace: str, ttl: Union[int, Callable[[Dict[str, Any]], int]] = 60):
+    """缓存异步服务方法的返回值
+
+    缓存键包含方法参数和所属项目的缓存代数（参数中的 project_key，缺省为全局），
+    数据上报时递增代数即可使该项目和全局的缓存失效。并发未命中时只有一个调用者
+    计算结果：进程内共享同一个Future，跨进程通过Redis锁等待结果。
+
+    Args:
+        namespace: 缓存命名空间
+        ttl: 缓存时间（秒），或根据调用参数计算缓存时间的函数
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            redis = get_redis()
+            if redis is None:
+                return await func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {name: value for name, value in bound.arguments.items() if name != "self"}
+            expire = ttl(arguments) if callable(ttl) else ttl
+            scope = arguments.get("project_key") or GLOBAL_SCOPE
+
+            try:
+                generation = await redis.get(f"{CACHE_GENERATION_PREFIX}{scope}") or "0"
+                digest = hashlib.sha1(json.dumps(
+                    {name: _key_part(value, expire) for name, value in arguments.items()},
+                    sort_keys=True, default=str
+                ).encode("utf-8")).hexdigest()[:16]
+                key = f"{CACHE_PREFIX}{namespace}:{scope}:{generation}:{digest}"
+
+                value = await redis.get(key)
+                if value is not None:
+                    _record(namespace, "hits")
+                    return json.loads(value, object_hook=_decode)
+            except Exception as e:
+                logger.error(f"读取缓存失败: {str(e)}")
+                return await func(*args, **kwargs)
+
+            _record(namespace, "misses")
+
+            # 进程内单飞
+            future = _inflight.get(key)
+            if future is not None:
+                return await asyncio.shield(future)
+
+            future = asyncio.get_running_loop().create_future()
+            _inflight[key] = future
+            try:
+                result = await _compute(redis, key, expire, func, args, kwargs)
+                future.set_result(result)
+                return result
+            except Exception as e:
+                future.set_exception(e)
+                # 没有其他等待者时避免"Future exception was never retrieved"警告
+                future.exception()
+                raise
+            finally:
+                _inflight.pop(key, None)
+
+        return wrapper
+
+    return decorator
+
+
+async def _compute(redis, key: str, expire: int, func, args, kwargs) -> Any:
+    """跨进程单飞：持有锁的进程计算并写入缓存，其他进程等待结果"""
+    lock_key = f"{CACHE_LOCK_PREFIX}{key}"
+    acquired = False
+    try:
+        acquired = await redis.set(lock_key, "1", nx=True, ex=LOCK_TIMEOUT)
+        if not acquired:
+            for _ in range(LOCK_WAIT_ATTEMPTS):
+                await asyncio.sleep(LOCK_WAIT_INTERVAL)
+                value = await redis.get(key)
+                if value is not None:
+                    return json.loads(value, object_hook=_decode)
+    except Exception as e:
+        logger.error(f"获取缓存锁失败: {str(e)}")
+
+    result = await func(*args, **kwargs)
+
+    try:
+        await redis.setex(key, expire, json.dumps(result, default=_encode))
+        if acquired:
+            await redis.delete(lock_key)
+    except Exception as e:
+        logger.error(f"写入缓存失败: {str(e)}")
+
+    return result
+
+
+async def invalidate_project_cache(project_key: str, force: bool = False):
+    """使项目和全局缓存失效（按项目节流）
+
+    节流期间的失效请求不会丢弃：在节流间隔结束时补做一次失效（尾沿），
+    保证突发写入之后的查询最多读到 INVALIDATION_INTERVAL 秒前的缓存。
+    """
+    now = time.monotonic()
+    elapsed = now - _last_invalidation.get(project_key, 0.0)
+    if not force and elapsed < INVALIDATION_INTERVAL:
+        if project_key not in _pending_invalidation:
+            _pending_invalidation[project_key] = asyncio.get_running_loop().create_task(
+                _trailing_invalidation(project_key, INVALIDATION_INTERVAL - elapsed)
+            )
+        return
+    _last_invalidation[project_key] = now
+
+    try:
+        redis = get_redis()
+        if redis is None:
+            return
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.incr(f"{CACHE_GENERATION_PREFIX}{project_key}")
+        pipeline.incr(f"{CACHE_GENERATION_PREFIX}{GLOBAL_SCOPE}")
+        await pipeline.execute()
+    except Exception as e:
+        logger.error(f"缓存失效失败: {str(e)}")
+
+
+async def _trailing_invalidation(project_key: str, delay: float):
+    """节流间隔结束后补做一次失效"""
+    try:
+        await asyncio.sleep(delay)
+    finally:
+        _pending_invalidation.pop(project_key, None)
+    await invalidate_project_cache(project_key, force=True)
+
+
+async def clear_cache(prefixes=(CACHE_PREFIX, "sdk_config:")) -> int:
+    """清除所有响应缓存，返回删除的键数量"""
+    redis = get_redis()
+    if redis is None:
+        return 0
+
+    deleted = 0
+    for prefix in prefixes:
+        batch = []
+        async for key in redis.scan_iter(match=f"{prefix}*", count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                deleted += await redis.delete(*batch)
+                batch = []
+        if batch:
+            deleted += await redis.delete(*batch)
+    return deleted
+
+
+def get_cache_metrics() -> Dict[str, Any]:
+    """获取缓存命中统计"""
+    namespaces = {}
+    total_hits = 0
+    total_misses = 0
+    for namespace, metrics in cache_metrics.items():
+        requests = metrics["hits"] + metrics["misses"]
+        namespaces[namespace] = {
+            **metrics,
+            "hit_rate": round(metrics["hits"] / requests, 4) if requests else 0.0
+        }
+        total_hits += metrics["hits"]
+        total_misses += metrics["misses"]
+
+    total = total_hits + total_misses
+    return {
+        "hits": total_hits,
+        "misses": total_misses,
+        "hit_rate": round(total_hits / total, 4) if total else 0.0,
+        "namespaces": namespaces
+    }
@@ -10,7 +10,7 @@ from datetime import datetime
 
 from app.config.settings import settings
 from app.models.analysis import AnalysisRecord
-from app.models.analysis import AnalysisRecord
+from app.utils.indexes import ensure_indexes, check_indexes
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +20,13 @@ mongodb_database = None
 redis_client: Optional[aioredis.Redis] = None
 
 
-async def init_database():
-    """初始化数据库连接"""
+async def init_database(create_indexes_on_start: bool = True):
+    """初始化数据库连接
+    
+    Args:
+        create_indexes_on_start: 是否创建索引。索引由API服务启动时统一创建，
+            Celery worker 只建立连接
+    """
     global mongodb_client, mongodb_database, redis_client
     
     try:
@@ -53,7 +58,8 @@ async def init_database():
         logger.info("Redis连接成功")
         
         # 创建索引
-        await create_indexes()
+        if create_indexes_on_start:
+            await create_indexes()
         
     except Exception as e:
         logger.error(f"数据库初始化失败: {str(e)}")
@@ -74,65 +80,20 @@ async def close_database():
 
 
 async def create_indexes():
-    """创建数据库索引"""
+    """按索引注册表创建数据库索引，并检查缺失、未登记和未使用的索引"""
     if mongodb_database is None:
         return
     
     try:
-        # 项目集合索引
-        projects_collection = mongodb_database.projects
-        await projects_collection.create_index("project_key", unique=True)
-        await projects_collection.create_index("name")
-        await projects_collection.create_index("status")
-        await projects_collection.create_index("created_at")
-        await projects_collection.create_index("last_activity")
-        
-        # 性能记录集合索引
-        performance_collection = mongodb_database.performance_records
-        await performance_collection.create_index("project_key")
-        await performance_collection.create_index("trace_id", unique=True)
-        await performance_collection.create_index([("project_key", 1), ("timestamp", -1)])
-        await performance_collection.create_index("request_info.path")
-        await performance_collection.create_index("request_info.method")
-        await performance_collection.create_index("response_info.status_code")
-        await performance_collection.create_index("performance_metrics.total_duration")
-        # 修复索引冲突问题，使用带过期时间的索引
-        await performance_collection.create_index("timestamp", expireAfterSeconds=7776000)  # 90天过期
-        
-        # 函数调用集合索引
-        function_calls_collection = mongodb_database.function_calls
-        await function_calls_collection.create_index("trace_id")
-        await function_calls_collection.create_index("call_id", unique=True)
-        await function_calls_collection.create_index([("trace_id", 1), ("call_context.call_order", 1)])
-        await function_calls_collection.create_index("function_info.name")
-        await function_calls_collection.create_index("execution_info.duration")
-        await function_calls_collection.create_index("performance_tags")
-        
-        # AI分析结果集合索引
-        analysis_collection = mongodb_database.ai_analysis_results
-        await analysis_collection.create_index("project_key")
-        await analysis_collection.create_index("analysis_id", unique=True)
-        await analysis_collection.create_index("trace_id")
-        await analysis_collection.create_index("status")
-        await analysis_collection.create_index([("project_key", 1), ("created_at", -1)])
-        await analysis_collection.create_index("analysis_type")
-        # 为AI分析结果也添加过期时间索引
-        await analysis_collection.create_index("created_at", expireAfterSeconds=7776000)  # 90天过期
-        
-        # 系统配置集合索引
-        config_collection = mongodb_database.system_config
-        await config_collection.create_index("config_key", unique=True)
-        await config_collection.create_index("category")
-        await config_collection.create_index("is_active")
-        
-        logger.info("数据库索引创建完成")
+        result = await ensure_indexes(mongodb_database)
+        logger.info(
+            f"数据库索引创建完成: 成功 {result['created']} 个, "
+            f"更新TTL {result['modified']} 个, 失败 {result['failed']} 个"
+        )
+        await check_indexes(mongodb_database)
         
     except Exception as e:
-        # 处理索引冲突等错误
-        if "IndexOptionsConflict" in str(e):
-            logger.warning(f"索引已存在且配置不同，跳过创建: {str(e)}")
-        else:
-            logger.error(f"创建索引失败: {str(e)}")
+        logger.error(f"创建索引失败: {str(e)}")
 
 
 def get_database():
@@ -337,8 +298,8 @@ class DatabaseManager:
             if db is None:
                 raise Exception("数据库未初始化")
             
-            collection = db.performance_records
-            record = await collection.find_one({"trace_id": record_id})
+            from app.services.record_store import RecordStore
+            record = await RecordStore(db).find_by_trace_id(record_id)
             
             if record:
                 record.pop("_id", None)  # 移除MongoDB的_id字段
@@ -397,7 +358,7 @@ class DatabaseManager:
             if db is None:
                 raise Exception("数据库未初始化")
             
-            collection = db.performance_records
+            from app.services.record_store import RecordStore
             query = {
                 "project_key": project_key,
                 "timestamp": {
@@ -406,11 +367,10 @@ class DatabaseManager:
                 }
             }
             
-            cursor = collection.find(query).sort("timestamp", 1)
-            records = []
-            async for record in cursor:
+            records = await RecordStore(db).find_all(query)
+            records.sort(key=lambda record: record["timestamp"])
+            for record in records:
                 record.pop("_id", None)
-                records.append(record)
             
             return records
         except Exception as e:
@@ -0,0 +1,181 @@
+"""
+火焰图数据构建工具
+"""
+from typing import Dict, Any, List, Optional
+
+# 支持的输出格式
+FLAME_GRAPH_FORMATS = ("tree", "collapsed", "speedscope")
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class FlameNode:
+    """火焰图节点"""
+
+    __slots__ = ("name", "self_time", "count", "total", "children")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.self_time = 0.0
+        self.count = 0
+        self.total = 0.0
+        self.children: Dict[str, "FlameNode"] = {}
+
+
+def build_flame_tree(stacks: Dict[str, List[float]]) -> FlameNode:
+    """由 {collapsed调用栈: [调用次数, 自身耗时]} 构建火焰图树，并计算各节点总耗时"""
+    root = FlameNode("root")
+    for stack, (count, self_time) in stacks.items():
+        node = root
+        for frame in stack.split(";"):
+            child = node.children.get(frame)
+            if child is None:
+                child = FlameNode(frame)
+                node.children[frame] = child
+            node = child
+        node.self_time += self_time
+        node.count += int(count)
+
+    # 后序遍历累加总耗时（迭代实现，避免深调用栈递归过深）
+    order = []
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        order.append(node)
+        pending.extend(node.children.values())
+    for node in reversed(order):
+        node.total = node.self_time + sum(child.total for child in node.children.values())
+
+    return root
+
+
+def prune_flame_tree(root: FlameNode, min_weight: float) -> int:
+    """裁剪总耗时占比低于阈值的节点，被裁剪节点的耗时计入父节点自身耗时
+
+    Returns:
+        被裁剪的节点数
+    """
+    threshold = root.total * min_weight
+    if threshold <= 0:
+        return 0
+
+    pruned = 0
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        for name in list(node.children):
+            child = node.children[name]
+            if child.total < threshold:
+                node.self_time += child.total
+                del node.children[name]
+                pruned += 1
+            else:
+                pending.append(child)
+    return pruned
+
+
+def _walk(root: FlameNode):
+    """深度优先遍历，返回 (节点, 从根开始的帧路径)，不包含虚拟根节点"""
+    pending = [(child, [child.name]) for child in reversed(list(root.children.values()))]
+    while pending:
+        node, path = pending.pop()
+        yield node, path
+        for child in reversed(list(node.children.values())):
+            pending.append((child, path + [child.name]))
+
+
+def to_tree(root: FlameNode) -> Dict[str, Any]:
+    """输出嵌套树格式（d3-flame-graph / ECharts可直接使用）"""
+    def convert(node: FlameNode) -> Dict[str, Any]:
+        return {
+            "name": node.name,
+            "value": round(node.total, 6),
+            "self_time": round(node.self_time, 6),
+            "count": node.count,
+            "children": []
+        }
+
+    result = convert(root)
+    pending = [(root, result)]
+    while pending:
+        node, converted = pending.pop()
+        for child in sorted(node.children.values(), key=lambda c: c.total, reverse=True):
+            child_converted = convert(child)
+            converted["children"].append(child_converted)
+            pending.append((child, child_converted))
+    return result
+
+
+def to_collapsed(root: FlameNode) -> str:
+    """输出collapsed-stack文本格式（flamegraph.pl / speedscope可直接导入），权重单位为微秒"""
+    lines = []
+    for node, path in _walk(root):
+        weight = int(round(node.self_time * 1_000_000))
+        if weight > 0:
+            lines.append(f"{';'.join(path)} {weight}")
+    return "\n".join(lines)
+
+
+def to_speedscope(root: FlameNode, name: str) -> Dict[str, Any]:
+    """输出speedscope的sampled格式JSON"""
+    frames: List[Dict[str, str]] = []
+    frame_index: Dict[str, int] = {}
+    samples: List[List[int]] = []
+    weights: List[float] = []
+
+    for node, path in _walk(root):
+        if node.self_time <= 0:
+            continue
+        sample = []
+        for frame in path:
+            index = frame_index.get(frame)
+            if index is None:
+                index = len(frames)
+                frame_index[frame] = index
+                frames.append({"name": frame})
+            sample.append(index)
+        samples.append(sample)
+        weights.append(node.self_time)
+
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights
+        }],
+        "name": name,
+        "exporter": "pystrument"
+    }
+
+
+def render_flame_graph(
+    stacks: Dict[str, List[float]],
+    output_format: str = "tree",
+    min_weight: float = 0.001,
+    name: Optional[str] = None
+) -> Dict[str, Any]:
+    """合并、裁剪并按指定格式输出火焰图"""
+    root = build_flame_tree(stacks)
+    total_time = root.total
+    pruned = prune_flame_tree(root, min_weight)
+
+    if output_format == "collapsed":
+        data: Any = to_collapsed(root)
+    elif output_format == "speedscope":
+        data = to_speedscope(root, name or "flame graph")
+    else:
+        data = to_tree(root)
+
+    return {
+        "format": output_format,
+        "total_time": round(total_time, 6),
+        "stack_count": len(stacks),
+        "pruned_nodes": pruned,
+        "data": data
+    }
@@ -0,0 +1,339 @@
+"""
+MongoDB索引注册表
+
+所有集合的索引在此统一声明，服务启动时据此创建索引并检查索引使用情况。
+新增查询时在 QUERY_SHAPES 中登记查询形态，测试会验证每个查询都有索引可用（不出现 COLLSCAN）。
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple, Optional
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# 索引定义: (索引键列表, create_index 选项)
+IndexSpec = Tuple[List[Tuple[str, int]], Dict[str, Any]]
+
+# 已存在同名/同键但选项不同的索引
+INDEX_CONFLICT_CODES = {85, 86}
+
+# 创建后超过该天数仍未被使用的索引才报告为未使用（$indexStats 计数在服务重启后清零）
+INDEX_USAGE_MIN_DAYS = 7
+
+INDEX_REGISTRY: Dict[str, List[IndexSpec]] = {
+    "projects": [
+        ([("project_key", 1)], {"unique": True}),
+        ([("name", 1)], {}),
+        ([("status", 1)], {}),
+        ([("created_at", 1)], {}),
+    ],
+    "performance_records": [
+        ([("trace_id", 1)], {"unique": True}),
+        # 项目记录列表、统计聚合、保留期清理
+        ([("project_key", 1), ("timestamp", -1)], {}),
+        # 记录列表按路径前缀、路由模板、状态码过滤，按时间倒序
+        ([("project_key", 1), ("request_info.normalized_path", 1), ("timestamp", -1)], {}),
+        ([("project_key", 1), ("request_info.route", 1), ("timestamp", -1)], {}),
+        ([("project_key", 1), ("response_info.status_code", 1), ("timestamp", -1)], {}),
+        ([("project_key", 1), ("retention_tier", 1), ("timestamp", 1)], {}),
+        ([("timestamp", 1)], {"expireAfterSeconds": 7776000}),  # 90天过期
+    ],
+    "function_calls": [
+        ([("call_id", 1)], {"unique": True}),
+        ([("trace_id", 1), ("call_context.call_order", 1)], {}),
+        ([("created_at", 1)], {"expireAfterSeconds": 7776000}),  # 90天过期
+    ],
+    "profile_aggregates": [
+        ([("window_start", 1)], {"expireAfterSeconds": 7776000}),  # 90天过期
+    ],
+    "route_rollups": [
+        (
+            [("project_key", 1), ("path", 1), ("bucket", 1), ("method", 1), ("app_version", 1), ("git_commit", 1)],
+            {"unique": True}
+        ),
+        ([("project_key", 1), ("bucket", -1)], {}),
+        ([("project_key", 1), ("path", 1), ("app_version", 1), ("bucket", 1)], {}),
+        ([("project_key", 1), ("path", 1), ("git_commit", 1), ("bucket", 1)], {}),
+        ([("bucket", 1)], {"expireAfterSeconds": 31536000}),  # 365天过期
+    ],
+    "route_rollups_daily": [
+        (
+            [("project_key", 1), ("path", 1), ("bucket", 1), ("method", 1), ("app_version", 1), ("git_commit", 1)],
+            {"unique": True}
+        ),
+        ([("project_key", 1), ("bucket", -1)], {}),
+        ([("bucket", 1)], {"expireAfterSeconds": 31536000}),  # 365天过期
+    ],
+    "regression_events": [
+        ([("project_key", 1), ("path", 1), ("method", 1), ("app_version", 1), ("git_commit", 1)], {"unique": True}),
+        ([("project_key", 1), ("updated_at", -1)], {}),
+    ],
+    "ai_analysis_cache": [
+        ([("fingerprint", 1)], {"unique": True}),
+        ([("scope_key", 1), ("created_at", -1)], {}),
+        ([("expires_at", 1)], {"expireAfterSeconds": 0}),
+    ],
+    "anomaly_windows": [
+        ([("anomaly_id", 1)], {"unique": True}),
+        ([("project_key", 1), ("start_time", -1)], {}),
+    ],
+    "analysis_candidates": [
+        ([("project_key", 1), ("method", 1), ("path", 1), ("bucket", 1), ("fingerprint", 1)], {"unique": True}),
+        ([("project_key", 1), ("status", 1), ("bucket", 1)], {}),
+        ([("project_key", 1), ("status", 1), ("queued_at", 1)], {}),
+        ([("project_key", 1), ("fingerprint", 1), ("status", 1), ("queued_at", 1)], {}),
+        ([("created_at", 1)], {"expireAfterSeconds": 604800}),  # 7天过期
+    ],
+    "alert_events": [
+        ([("project_key", 1), ("method", 1), ("path", 1), ("bucket", 1), ("metric", 1)], {"unique": True}),
+        ([("project_key", 1), ("bucket", -1)], {}),
+    ],
+    "ai_analysis_results": [
+        ([("analysis_id", 1)], {"unique": True}),
+        ([("trace_id", 1)], {}),
+        ([("performance_record_id", 1)], {}),
+        ([("project_key", 1), ("created_at", -1)], {}),
+        # 全部分析历史按状态、类型过滤，按创建时间倒序
+        ([("status", 1), ("created_at", -1)], {}),
+        ([("analysis_type", 1), ("created_at", -1)], {}),
+        ([("created_at", 1)], {"expireAfterSeconds": 15552000}),  # 180天过期
+    ],
+    "system_config": [
+        ([("config_key", 1)], {"unique": True}),
+    ],
+}
+
+_NOW = datetime(2024, 1, 1)
+
+# 服务中的查询形态: (集合, 说明, 查询条件, 排序)，聚合管道取第一个$match阶段
+QUERY_SHAPES: List[Tuple[str, str, Dict[str, Any], Optional[List[Tuple[str, int]]]]] = [
+    ("projects", "项目详情", {"project_key": "proj"}, None),
+    ("projects", "按名称查找项目", {"name": "demo"}, None),
+    ("projects", "活跃项目", {"status": "active"}, None),
+    ("projects", "项目列表", {}, [("created_at", -1)]),
+
+    ("performance_records", "链路详情", {"trace_id": "t"}, None),
+    ("performance_records", "记录列表", {"project_key": "proj"}, [("timestamp", -1)]),
+    ("performance_records", "记录列表按时间和方法、耗时过滤", {
+        "project_key": "proj",
+        "timestamp": {"$gte": _NOW - timedelta(days=1), "$lte": _NOW},
+        "request_info.method": "GET",
+        "performance_metrics.total_duration": {"$gte": 1.0}
+    }, [("timestamp", -1)]),
+    ("performance_records", "记录列表按路径前缀过滤", {
+        "project_key": "proj", "request_info.normalized_path": {"$regex": "^/api/orders"}
+    }, [("timestamp", -1)]),
+    ("performance_records", "记录列表按路由模板过滤", {
+        "project_key": "proj", "request_info.route": "/api/orders/{id}"
+    }, [("timestamp", -1)]),
+    ("performance_records", "记录列表按状态码过滤", {
+        "project_key": "proj", "response_info.status_code": 500
+    }, [("timestamp", -1)]),
+    ("performance_records", "项目错误数", {"project_key": "proj", "response_info.status_code": {"$gte": 400}}, None),
+    ("performance_records", "项目统计聚合", {"project_key": "proj", "timestamp": {"$gte": _NOW}}, None),
+    ("performance_records", "多项目记录数", {"project_key": {"$in": ["proj_a", "proj_b"]}}, None),
+    ("performance_records", "系统概览24小时平均耗时", {"timestamp": {"$gte": _NOW}}, None),
+    ("performance_records", "保留期待压缩记录", {
+        "project_key": "proj", "retention_tier": None, "timestamp": {"$lt": _NOW}
+    }, [("timestamp", 1)]),
+    ("performance_records", "保留期到期记录", {"project_key": "proj", "timestamp": {"$lt": _NOW}}, None),
+
+    ("function_calls", "链路函数调用", {"trace_id": "t"}, [("call_context.call_order", 1)]),
+    ("function_calls", "慢函数统计", {"trace_id": {"$in": ["t1", "t2"]}, "execution_info.duration": {"$gte": 0.1}}, None),
+
+    ("route_rollups", "路由rollup", {"project_key": "proj", "path": "/api", "bucket": {"$gte": _NOW}}, None),
+    ("route_rollups", "版本rollup", {"project_key": "proj", "path": "/api", "app_version": "1.0"}, [("bucket", 1)]),
+    ("route_rollups", "提交rollup", {"project_key": "proj", "path": "/api", "git_commit": "abc"}, [("bucket", 1)]),
+    ("route_rollups", "自动分析扫描", {
+        "bucket": {"$gt": _NOW - timedelta(hours=2), "$lt": _NOW}, "project_key": {"$in": ["proj"]}
+    }, None),
+    ("route_rollups", "回归检测扫描", {
+        "bucket": {"$gt": _NOW - timedelta(hours=2), "$lt": _NOW},
+        "$or": [{"git_commit": {"$ne": None}}, {"app_version": {"$ne": None}}]
+    }, None),
+    ("route_rollups", "rollup降采样", {"project_key": "proj", "bucket": {"$lt": _NOW}}, [("bucket", 1)]),
+    ("route_rollups_daily", "天级rollup", {"project_key": "proj", "path": "/api", "bucket": {"$gte": _NOW}}, None),
+
+    ("regression_events", "回归事件列表", {"project_key": "proj", "status": "open"}, [("updated_at", -1)]),
+    ("anomaly_windows", "异常区间列表", {"project_key": "proj", "status": "open"}, [("start_time", -1)]),
+    ("analysis_candidates", "待分析候选", {"project_key": "proj", "status": "pending", "bucket": {"$lt": _NOW}}, None),
+    ("analysis_candidates", "当日分析预算", {"project_key": "proj", "status": "queued", "queued_at": {"$gte": _NOW}}, None),
+    ("analysis_candidates", "重复候选", {
+        "project_key": "proj", "fingerprint": "f", "status": "queued", "queued_at": {"$gte": _NOW}
+    }, None),
+    ("alert_events", "告警列表", {"project_key": "proj"}, [("bucket", -1)]),
+    ("ai_analysis_cache", "缓存精确匹配", {"fingerprint": "f", "expires_at": {"$gt": _NOW}}, None),
+    ("ai_analysis_cache", "缓存相似匹配", {"scope_key": "s", "expires_at": {"$gt": _NOW}}, [("created_at", -1)]),
+
+    ("ai_analysis_results", "分析详情", {"analysis_id": "a"}, None),
+    ("ai_analysis_results", "链路最新分析", {"trace_id": "t"}, [("created_at", -1)]),
+    ("ai_analysis_results", "已分析链路", {"performance_record_id": {"$in": ["t1", "t2"]}}, None),
+    ("ai_analysis_results", "项目分析历史", {
+        "project_key": "proj", "created_at": {"$gte": _NOW - timedelta(days=7)}
+    }, [("created_at", -1)]),
+    ("ai_analysis_results", "优化建议汇总", {
+        "project_key": "proj", "status": "completed", "analysis_results": {"$exists": True, "$ne": None}
+    }, None),
+    ("ai_analysis_results", "全部分析历史", {}, [("created_at", -1)]),
+    ("ai_analysis_results", "分析历史按状态过滤", {"status": "completed"}, [("created_at", -1)]),
+    ("ai_analysis_results", "分析历史按类型过滤", {"analysis_type": "auto_analysis"}, [("created_at", -1)]),
+    ("ai_analysis_results", "近期分析数", {"created_at": {"$gte": _NOW}}, None),
+
+    ("system_config", "平台设置", {"config_key": "platform_settings"}, None),
+]
+
+
+def index_key(keys: List[Tuple[str, int]]) -> Tuple[Tuple[str, int], ...]:
+    """索引键的可比较形式"""
+    return tuple(
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in keys
+    )
+
+
+def query_fields(query: Dict[str, Any]) -> set:
+    """查询条件涉及的字段（$and 中的字段一并计入，$or 需要每个分支都有索引，不计入）"""
+    fields = set()
+    for name, condition in query.items():
+        if name == "$and":
+            for clause in condition:
+                fields |= query_fields(clause)
+        elif not name.startswith("$"):
+            fields.add(name)
+    return fields
+
+
+def serving_index(collection: str, query: Dict[str, Any],
+                  sort: Optional[List[Tuple[str, int]]] = None) -> Optional[List[Tuple[str, int]]]:
+    """注册表中可用于该查询的索引（首字段出现在查询条件中，或索引前缀与排序一致），无可用索引返回None
+
+    优先选择按顺序覆盖最多查询字段的索引，与查询优化器的候选规则一致（不评估选择性）。
+    """
+    fields = query_fields(query)
+    best, best_score = None, 0
+    for keys, _ in INDEX_REGISTRY.get(collection, []):
+        score = 0
+        for field, _direction in keys:
+            if field not in fields:
+                break
+            score += 1
+        if not score and sort:
+            prefix = index_key(keys[:len(sort)])
+            reverse = tuple((field, -direction) for field, direction in index_key(sort))
+            if prefix in (index_key(sort), reverse):
+                score = 1
+        if score > best_score:
+            best, best_score = keys, score
+    return best
+
+
+async def ensure_indexes(db, collections: Optional[List[str]] = None, update_ttl: bool = False) -> Dict[str, int]:
+    """按注册表创建索引，单个索引失败不影响其余索引
+
+    TTL索引的过期时间与已有索引不同时只记录警告（缩短过期时间会立即删除已有数据），
+    指定 update_ttl 时才通过 collMod 修改；其他选项冲突同样只记录警告。
+    """
+    result = {"created": 0, "modified": 0, "failed": 0}
+    for name in collections or list(INDEX_REGISTRY):
+        collection = db[name]
+        for keys, options in INDEX_REGISTRY[name]:
+            try:
+                await collection.create_index(keys, **options)
+                result["created"] += 1
+            except OperationFailure as e:
+                if e.code in INDEX_CONFLICT_CODES and "expireAfterSeconds" in options:
+                    if not update_ttl:
+                        result["failed"] += 1
+                        logger.warning(
+                            f"TTL索引过期时间与注册表不同，未修改（确认后使用 index_advisor --create --update-ttl 更新）: "
+                            f"{name} {keys} -> {options['expireAfterSeconds']}s"
+                        )
+                        continue
+                    if await _update_ttl(db, name, keys, options["expireAfterSeconds"]):
+                        result["modified"] += 1
+                        continue
+                result["failed"] += 1
+                logger.warning(f"索引已存在且配置不同，跳过创建: {name} {keys}: {str(e)}")
+            except Exception as e:
+                result["failed"] += 1
+                logger.error(f"创建索引失败: {name} {keys}: {str(e)}")
+    return result
+
+
+async def _update_ttl(db, name: str, keys: List[Tuple[str, int]], expire_after_seconds: int) -> bool:
+    """修改已有TTL索引的过期时间"""
+    try:
+        await db.command("collMod", name, index={
+            "keyPattern": dict(keys), "expireAfterSeconds": expire_after_seconds
+        })
+        logger.info(f"已更新TTL索引过期时间: {name} {keys} -> {expire_after_seconds}s")
+        return True
+    except Exception as e:
+        logger.warning(f"更新TTL索引过期时间失败: {name} {keys}: {str(e)}")
+        return False
+
+
+async def index_usage(collection) -> Dict[Tuple[Tuple[str, int], ...], Dict[str, Any]]:
+    """通过 $indexStats 获取集合各索引的使用次数 {索引键: {"name", "ops", "since"}}"""
+    usage = {}
+    async for stat in collection.aggregate([{"$indexStats": {}}]):
+        usage[index_key(stat["key"].items())] = {
+            "name": stat["name"],
+            "ops": stat.get("accesses", {}).get("ops", 0),
+            "since": stat.get("accesses", {}).get("since")
+        }
+    return usage
+
+
+async def check_indexes(db, now: Optional[datetime] = None) -> Dict[str, Dict[str, List[str]]]:
+    """检查索引与注册表是否一致，返回 {集合: {"missing", "unregistered", "unused"}}
+
+    - missing: 注册表中有但数据库中不存在（创建失败）
+    - unregistered: 数据库中存在但未登记，可能是已被新索引取代的旧索引
+    - unused: 存在超过 INDEX_USAGE_MIN_DAYS 天仍未被查询使用
+    """
+    now = now or datetime.utcnow()
+    min_since = now - timedelta(days=INDEX_USAGE_MIN_DAYS)
+    report: Dict[str, Dict[str, List[str]]] = {}
+
+    for name, specs in INDEX_REGISTRY.items():
+        collection = db[name]
+        try:
+            existing = {
+                index_key(info["key"]): index_name
+                for index_name, info in (await collection.index_information()).items()
+                if index_name != "_id_"
+            }
+            try:
+                usage = await index_usage(collection)
+            except OperationFailure as e:
+                logger.debug(f"无法获取索引使用统计: {name}: {str(e)}")
+                usage = {}
+        except Exception as e:
+            logger.warning(f"检查索引失败: {name}: {str(e)}")
+            continue
+
+        registered = {index_key(keys) for keys, _ in specs}
+        entry = {
+            "missing": [_format_key(key) for key in registered if key not in existing],
+            "unregistered": [existing[key] for key in existing if key not in registered],
+            "unused": [
+                stat["name"] for key, stat in usage.items()
+                if key in existing and stat["ops"] == 0 and stat["since"] and stat["since"] < min_since
+            ]
+        }
+        if any(entry.values()):
+            report[name] = entry
+
+    for name, entry in report.items():
+        for kind, label in (("missing", "缺少索引"), ("unregistered", "未登记索引"), ("unused", "未使用索引")):
+            if entry[kind]:
+                logger.warning(f"{label}: {name}: {', '.join(sorted(entry[kind]))}")
+    if not report:
+        logger.info("索引检查完成，与注册表一致")
+    return report
+
+
+def _format_key(key: Tuple[Tuple[str, int], ...]) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in key)
@@ -0,0 +1,37 @@
+"""
+响应时间直方图工具
+"""
+from typing import List
+
+# 响应时间直方图的桶上界（秒），与SDK聚合模式保持一致，最后一个桶收集超出上界的请求
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def latency_bucket_index(duration: float) -> int:
+    """计算响应时间所在的直方图桶"""
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if duration <= bound:
+            return index
+    return len(LATENCY_BUCKETS)
+
+
+def histogram_percentile(latency_counts: List[int], percentile: float, duration_max: float = 0.0) -> float:
+    """由响应时间直方图估算分位数（桶内线性插值）"""
+    total = sum(latency_counts)
+    if total <= 0:
+        return 0.0
+
+    rank = total * percentile / 100.0
+    cumulative = 0
+    for index, count in enumerate(latency_counts):
+        if count <= 0:
+            continue
+        if cumulative + count >= rank:
+            lower = LATENCY_BUCKETS[index - 1] if index > 0 else 0.0
+            if index < len(LATENCY_BUCKETS):
+                upper = LATENCY_BUCKETS[index]
+            else:
+                upper = max(duration_max, lower)
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+    return duration_max
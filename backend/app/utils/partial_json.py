@@ -0,0 +1,109 @@
+"""
+流式JSON增量解析模块
+"""
+import json
+from typing import Any, Dict, List
+
+
+class PartialJSONParser:
+    """增量解析流式输出的JSON对象
+
+    逐段输入模型输出的文本，跳过对象之前的内容（如 ```json 代码块标记），
+    解析出已经完整的顶层字段；正在输出的数组字段返回已完整的元素，
+    使瓶颈、建议等部分可以在完整响应到达之前展示。每个字符只扫描一次。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.items: Dict[str, List[Any]] = {}
+        self.done = False
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key = None
+        self._value_start = None
+        self._array_key = None
+        self._item_start = None
+
+    def feed(self, text: str) -> bool:
+        """追加文本，返回是否解析出新的字段或数组元素"""
+        self.buffer += text
+        changed = False
+        buffer = self.buffer
+
+        while self._pos < len(buffer) and not self.done:
+            i = self._pos
+            c = buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._value_start is None:
+                        self._key = json.loads(buffer[self._string_start:i + 1])
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+            elif c == ":" and self._depth == 1:
+                self._value_start = i + 1
+            elif c in "{[":
+                if self._depth == 1 and c == "[" and not buffer[self._value_start:i].strip():
+                    self._array_key = self._key
+                    self.items[self._key] = []
+                    self._item_start = i + 1
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 2 and c == "]" and self._array_key is not None:
+                    changed |= self._add_item(buffer[self._item_start:i])
+                    self._array_key = None
+                self._depth -= 1
+                if self._depth == 0:
+                    changed |= self._add_field(buffer[self._value_start:i] if self._value_start is not None else "")
+                    self.done = True
+            elif c == ",":
+                if self._depth == 1:
+                    changed |= self._add_field(buffer[self._value_start:i])
+                elif self._depth == 2 and self._array_key is not None:
+                    changed |= self._add_item(buffer[self._item_start:i])
+                    self._item_start = i + 1
+
+        return changed
+
+    def _add_field(self, raw: str) -> bool:
+        key = self._key
+        self._key = None
+        self._value_start = None
+        if key is None or not raw.strip():
+            return False
+        try:
+            self.fields[key] = json.loads(raw)
+        except ValueError:
+            return False
+        self.items.pop(key, None)
+        return True
+
+    def _add_item(self, raw: str) -> bool:
+        if not raw.strip():
+            return False
+        try:
+            self.items[self._array_key].append(json.loads(raw))
+        except ValueError:
+            return False
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """已解析的部分结果"""
+        return {**self.items, **self.fields}
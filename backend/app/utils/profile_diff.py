@@ -0,0 +1,130 @@
+"""
+性能差异对比工具
+"""
+from typing import Dict, Any, List, Tuple
+
+from app.utils.latency import histogram_percentile
+
+# 对比的响应时间分位数
+DIFF_PERCENTILES = (50, 90, 95, 99)
+
+
+def function_times(stacks: Dict[str, List[float]]) -> Dict[str, Tuple[float, float]]:
+    """由调用栈表计算每个函数的 (自身耗时, 总耗时)
+
+    总耗时按调用栈去重累加，递归调用不会被重复计算。
+    """
+    times: Dict[str, List[float]] = {}
+    for stack, (_, self_time) in stacks.items():
+        frames = stack.split(";")
+        leaf = frames[-1]
+        for frame in set(frames):
+            entry = times.get(frame)
+            if entry is None:
+                entry = [0.0, 0.0]
+                times[frame] = entry
+            entry[1] += self_time
+            if frame == leaf:
+                entry[0] += self_time
+    return {frame: (entry[0], entry[1]) for frame, entry in times.items()}
+
+
+def _percent_change(before: float, after: float) -> float:
+    if before <= 0:
+        return 0.0 if after <= 0 else 100.0
+    return round((after - before) / before * 100, 2)
+
+
+def latency_summary(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """计算单侧的请求量、错误率、平均耗时和分位数"""
+    request_count = summary["request_count"]
+    result = {
+        "request_count": request_count,
+        "weighted_count": round(summary["weighted_count"], 2),
+        "error_rate": round(summary["error_count"] / request_count, 4) if request_count else 0.0,
+        "avg_duration": round(summary["duration_sum"] / request_count, 6) if request_count else 0.0
+    }
+    for percentile in DIFF_PERCENTILES:
+        result[f"p{percentile}"] = round(
+            histogram_percentile(summary["latency_counts"], percentile, summary["duration_max"]), 6
+        )
+    return result
+
+
+def diff_profiles(
+    baseline: Dict[str, Any],
+    target: Dict[str, Any],
+    hot_threshold: float = 0.01,
+    limit: int = 50
+) -> Dict[str, Any]:
+    """对比两组rollup汇总数据
+
+    函数耗时按单请求平均值对比，避免两侧流量不同造成偏差；
+    总耗时占比不低于 hot_threshold 的函数视为热点帧。
+    """
+    baseline_times = function_times(baseline["stacks"])
+    target_times = function_times(target["stacks"])
+    baseline_requests = max(baseline["request_count"], 1)
+    target_requests = max(target["request_count"], 1)
+    baseline_total = sum(entry[1] for entry in baseline["stacks"].values())
+    target_total = sum(entry[1] for entry in target["stacks"].values())
+
+    functions = []
+    for frame in set(baseline_times) | set(target_times):
+        before_self, before_total = baseline_times.get(frame, (0.0, 0.0))
+        after_self, after_total = target_times.get(frame, (0.0, 0.0))
+        before_self /= baseline_requests
+        before_total /= baseline_requests
+        after_self /= target_requests
+        after_total /= target_requests
+        functions.append({
+            "function": frame,
+            "baseline_self_time": round(before_self, 6),
+            "target_self_time": round(after_self, 6),
+            "self_time_delta": round(after_self - before_self, 6),
+            "baseline_total_time": round(before_total, 6),
+            "target_total_time": round(after_total, 6),
+            "total_time_delta": round(after_total - before_total, 6),
+            "total_time_change": _percent_change(before_total, after_total)
+        })
+    functions.sort(key=lambda item: abs(item["total_time_delta"]), reverse=True)
+
+    def hot_frames(times: Dict[str, Tuple[float, float]], total: float) -> Dict[str, float]:
+        if total <= 0:
+            return {}
+        return {
+            frame: round(frame_total / total, 4)
+            for frame, (_, frame_total) in times.items()
+            if frame_total / total >= hot_threshold
+        }
+
+    baseline_hot = hot_frames(baseline_times, baseline_total)
+    target_hot = hot_frames(target_times, target_total)
+
+    baseline_latency = latency_summary(baseline)
+    target_latency = latency_summary(target)
+    latency_shift = {}
+    for key in ["avg_duration"] + [f"p{percentile}" for percentile in DIFF_PERCENTILES]:
+        latency_shift[key] = {
+            "baseline": baseline_latency[key],
+            "target": target_latency[key],
+            "delta": round(target_latency[key] - baseline_latency[key], 6),
+            "change": _percent_change(baseline_latency[key], target_latency[key])
+        }
+
+    return {
+        "baseline": baseline_latency,
+        "target": target_latency,
+        "latency_shift": latency_shift,
+        "functions": functions[:limit],
+        "new_hot_frames": [
+            {"function": frame, "share": share}
+            for frame, share in sorted(target_hot.items(), key=lambda item: item[1], reverse=True)
+            if frame not in baseline_times
+        ],
+        "removed_hot_frames": [
+            {"function": frame, "share": share}
+            for frame, share in sorted(baseline_hot.items(), key=lambda item: item[1], reverse=True)
+            if frame not in target_times
+        ]
+    }
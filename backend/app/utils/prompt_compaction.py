@@ -0,0 +1,302 @@
+"""
+AI分析提示词压缩工具
+
+将性能记录中的函数调用列表压缩为指定token预算内的调用树摘要：
+- 相同调用路径合并为一条（调用次数累加）
+- 按自身耗时列出最耗时的函数
+- 耗时占比过低的子树折叠到父节点，单链调用中无自身耗时的中间帧省略
+"""
+import logging
+import os
+import re
+import threading
+from typing import Dict, Any, List
+
+from app.config.settings import settings
+from app.utils.flamegraph import FlameNode, prune_flame_tree
+from app.utils.stacks import frame_name
+
+logger = logging.getLogger(__name__)
+
+# tiktoken编码，首次计数时在后台线程加载；加载完成前及加载失败时按字符估算
+_ENCODING = None
+_encoding_loader = None
+
+# 依次尝试的子树折叠阈值（占总耗时比例），直到摘要不超过预算
+COLLAPSE_THRESHOLDS = (0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2)
+# 调用树的最大缩进层级
+MAX_INDENT = 16
+# 为截断提示行预留的token数
+TRUNCATION_RESERVE = 16
+
+TREE_HEADER = "### 调用树（已折叠）"
+
+_FRAME_PATTERN = re.compile(r"^(.*) \((.*):(\d+)\)$")
+
+
+def load_encoding():
+    """加载tiktoken的cl100k_base编码，未安装或加载失败时返回None
+
+    本地没有编码文件时tiktoken会联网下载（无超时），离线部署应通过
+    ai_tiktoken_cache_dir 指定预置编码文件的目录。
+    """
+    global _ENCODING
+    if _ENCODING is not None:
+        return _ENCODING
+    try:
+        import tiktoken
+        if settings.ai_tiktoken_cache_dir:
+            os.environ.setdefault("TIKTOKEN_CACHE_DIR", settings.ai_tiktoken_cache_dir)
+        _ENCODING = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.info(f"tiktoken编码不可用，按字符估算token数: {str(e)}")
+    return _ENCODING
+
+
+def _get_encoding():
+    """返回已加载的编码；首次调用时启动后台加载，不阻塞调用方"""
+    global _encoding_loader
+    if _ENCODING is None and _encoding_loader is None:
+        _encoding_loader = threading.Thread(target=load_encoding, name="tiktoken-loader", daemon=True)
+        _encoding_loader.start()
+    return _ENCODING
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数
+
+    tiktoken编码可用时使用cl100k_base编码精确计数；否则按字符估算：
+    中文等非ASCII字符每个约1个token，ASCII字符约3个1个token（代码和路径偏保守）。
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    return non_ascii + (len(text) - non_ascii + 2) // 3
+
+
+def short_frame(frame: str) -> str:
+    """缩短帧名称中的文件路径，只保留最后两级"""
+    match = _FRAME_PATTERN.match(frame)
+    if not match:
+        return frame
+    name, file_path, line = match.groups()
+    parts = file_path.replace("\\", "/").rsplit("/", 2)
+    return f"{name} ({'/'.join(parts[-2:])}:{line})"
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f}ms"
+
+
+def build_call_tree(function_calls: List[Dict[str, Any]]) -> FlameNode:
+    """由函数调用列表构建调用树，相同调用路径合并为一个节点（调用次数和自身耗时累加）
+
+    直接按父子关系建树，复杂度与调用数成线性，不生成collapsed调用栈文本。
+    """
+    calls_by_id: Dict[str, Dict[str, Any]] = {}
+    child_time: Dict[str, float] = {}
+    for call in function_calls:
+        call_id = call.get("call_id")
+        if call_id is None:
+            continue
+        calls_by_id[call_id] = call
+        parent_id = call.get("parent_call_id")
+        if parent_id is not None:
+            child_time[parent_id] = child_time.get(parent_id, 0.0) + call.get("duration", 0.0)
+
+    root = FlameNode("root")
+    node_of: Dict[str, FlameNode] = {}
+
+    def resolve(call_id: str) -> FlameNode:
+        # 向上找到第一个已建节点的祖先，再自顶向下创建（避免深调用栈递归过深）
+        pending = []
+        current = call_id
+        while current in calls_by_id and current not in node_of:
+            pending.append(current)
+            current = calls_by_id[current].get("parent_call_id")
+            if len(pending) > len(calls_by_id):
+                break  # 防御父子关系成环
+        node = node_of.get(current, root)
+        for pending_id in reversed(pending):
+            call = calls_by_id[pending_id]
+            name = frame_name(call.get("function_name", "unknown"), call.get("file_path", ""), call.get("line_number", 0))
+            child = node.children.get(name)
+            if child is None:
+                child = FlameNode(name)
+                node.children[name] = child
+            node_of[pending_id] = child
+            node = child
+        return node
+
+    for call_id, call in calls_by_id.items():
+        node = resolve(call_id)
+        node.self_time += max(call.get("duration", 0.0) - child_time.get(call_id, 0.0), 0.0)
+        node.count += 1
+
+    # 后序遍历累加总耗时
+    order = []
+    pending_nodes = [root]
+    while pending_nodes:
+        node = pending_nodes.pop()
+        order.append(node)
+        pending_nodes.extend(node.children.values())
+    for node in reversed(order):
+        node.total = node.self_time + sum(child.total for child in node.children.values())
+
+    return root
+
+
+def top_self_time_frames(root: FlameNode, top_k: int) -> List[Dict[str, Any]]:
+    """按自身耗时排序的前 top_k 个函数
+
+    函数的总耗时只累加调用路径上最外层的一次，递归调用不会被重复计算。
+    """
+    frames: Dict[str, List[float]] = {}
+    on_path: Dict[str, int] = {}
+    pending = [(child, False) for child in root.children.values()]
+    while pending:
+        node, leaving = pending.pop()
+        if leaving:
+            on_path[node.name] -= 1
+            continue
+        entry = frames.get(node.name)
+        if entry is None:
+            entry = [0.0, 0.0, 0]
+            frames[node.name] = entry
+        entry[0] += node.self_time
+        entry[2] += node.count
+        if not on_path.get(node.name):
+            entry[1] += node.total
+        on_path[node.name] = on_path.get(node.name, 0) + 1
+        pending.append((node, True))
+        pending.extend((child, False) for child in node.children.values())
+
+    ranked = sorted(frames.items(), key=lambda item: item[1][0], reverse=True)[:top_k]
+    return [
+        {"frame": frame, "self_time": self_time, "total_time": total_time, "count": count}
+        for frame, (self_time, total_time, count) in ranked
+        if self_time > 0
+    ]
+
+
+def _iter_nodes(root: FlameNode):
+    pending = list(root.children.values())
+    while pending:
+        node = pending.pop()
+        yield node
+        pending.extend(node.children.values())
+
+
+def _chain_label(chain: List[FlameNode], threshold: float, names: Dict[str, str]) -> str:
+    """单链调用的显示文本
+
+    连续的递归调用合并为 "函数 ×次数"；保留首尾帧和自身耗时显著的帧，
+    其余中间帧省略为 "…N层"。
+    """
+    runs: List[List[Any]] = []  # [帧名称, 连续次数, 最大自身耗时]
+    for node in chain:
+        if runs and runs[-1][0] == node.name:
+            runs[-1][1] += 1
+            runs[-1][2] = max(runs[-1][2], node.self_time)
+        else:
+            runs.append([node.name, 1, node.self_time])
+
+    parts: List[str] = []
+    elided = 0
+    last = len(runs) - 1
+    for i, (name, repeat, self_time) in enumerate(runs):
+        if 0 < i < last and repeat == 1 and self_time < threshold:
+            elided += 1
+            continue
+        if elided:
+            parts.append(f"…{elided}层")
+            elided = 0
+        label = names.get(name)
+        if label is None:
+            label = short_frame(name)
+            names[name] = label
+        parts.append(f"{label} ×{repeat}" if repeat > 1 else label)
+    return " > ".join(parts)
+
+
+def render_call_tree(root: FlameNode, threshold: float) -> List[str]:
+    """将调用树渲染为缩进文本，每行一个单链调用"""
+    lines: List[str] = []
+    names: Dict[str, str] = {}
+    pending = [(child, 0) for child in sorted(root.children.values(), key=lambda c: c.total)]
+    while pending:
+        node, level = pending.pop()
+        chain = [node]
+        while len(chain[-1].children) == 1:
+            chain.append(next(iter(chain[-1].children.values())))
+        tail = chain[-1]
+        lines.append(
+            f"{'  ' * min(level, MAX_INDENT)}- {_chain_label(chain, threshold, names)} "
+            f"[总{_ms(node.total)}, 自身{_ms(tail.self_time)}, {tail.count}次]"
+        )
+        for child in sorted(tail.children.values(), key=lambda c: c.total):
+            pending.append((child, level + 1))
+    return lines
+
+
+def summarize_call_tree(
+    function_calls: List[Dict[str, Any]],
+    token_budget: int,
+    top_k: int = 10
+) -> Dict[str, Any]:
+    """将函数调用列表压缩为不超过 token_budget 的调用树摘要
+
+    Returns:
+        text: 摘要文本；tokens: 摘要token数；node_count: 合并相同路径后的调用树节点数；
+        pruned_nodes: 被折叠的子树数；truncated: 是否在折叠后仍需截断
+    """
+    root = build_call_tree(function_calls)
+    if not root.children:
+        return {"text": "", "tokens": 0, "node_count": 0, "pruned_nodes": 0, "truncated": False}
+    node_count = sum(1 for _ in _iter_nodes(root))
+
+    hot_lines = ["### 自身耗时最多的函数"]
+    for i, frame in enumerate(top_self_time_frames(root, top_k), 1):
+        hot_lines.append(
+            f"{i}. {short_frame(frame['frame'])} 自身{_ms(frame['self_time'])}, "
+            f"总{_ms(frame['total_time'])}, {frame['count']}次"
+        )
+    hot_text = "\n".join(hot_lines)
+    tree_budget = token_budget - count_tokens(hot_text) - count_tokens(TREE_HEADER) - 2
+
+    pruned = 0
+    lines: List[str] = []
+    for min_weight in COLLAPSE_THRESHOLDS:
+        # 阈值递增，在已裁剪的树上继续裁剪，结果与从头裁剪相同
+        pruned += prune_flame_tree(root, min_weight)
+        lines = render_call_tree(root, root.total * min_weight)
+        if count_tokens("\n".join(lines)) <= tree_budget:
+            break
+
+    truncated = count_tokens("\n".join(lines)) > tree_budget
+    if truncated:
+        # 折叠后仍超出预算时按耗时顺序保留前面的行
+        kept: List[str] = []
+        used = TRUNCATION_RESERVE
+        for line in lines:
+            used += count_tokens(line) + 1
+            if used > tree_budget:
+                break
+            kept.append(line)
+        kept.append(f"- …其余{len(lines) - len(kept)}条调用链已省略")
+        lines = kept
+
+    sections = [hot_text]
+    if tree_budget > TRUNCATION_RESERVE:
+        sections.append(TREE_HEADER + "\n" + "\n".join(lines))
+    text = "\n\n".join(sections)
+    return {
+        "text": text,
+        "tokens": count_tokens(text),
+        "node_count": node_count,
+        "pruned_nodes": pruned,
+        "truncated": truncated
+    }
@@ -0,0 +1,65 @@
+"""
+请求路径规范化
+"""
+import re
+from typing import Dict, Any, Optional
+
+# 路径段中的动态参数，按顺序匹配，替换为占位符
+SEGMENT_PATTERNS = [
+    (re.compile(r"^\d+$"), "{id}"),
+    (re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"), "{uuid}"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "{date}"),
+    (re.compile(r"^[0-9a-f]{16,}$"), "{hash}"),
+    # 较长且包含数字的字母数字串（令牌、短链接等）
+    (re.compile(r"^(?=.*\d)[0-9a-z_\-]{20,}$"), "{token}"),
+]
+
+# 框架路由模板中的参数写法，统一转换为 {name}
+PLACEHOLDER_PATTERNS = [
+    (re.compile(r"\(\?P<(\w+)>[^)]*\)"), r"{\1}"),  # 正则命名分组，如 Django re_path 的 (?P<pk>[0-9]+)
+    (re.compile(r"<(?:[^:<>]+:)?(\w+)>"), r"{\1}"),  # Flask/Django 的 <int:id>、<id>
+    (re.compile(r"\{(\w+):[^}]*\}"), r"{\1}"),      # Starlette 的 {id:int}
+]
+
+# 路径搜索条件的最大长度
+MAX_PATH_FILTER_LENGTH = 512
+
+
+def normalize_path(path: str) -> str:
+    """规范化路径：去掉查询字符串、转小写、合并重复斜杠、去掉末尾斜杠"""
+    path = (path or "/").split("?", 1)[0].split("#", 1)[0].strip().lower()
+    path = "/" + "/".join(segment for segment in path.split("/") if segment)
+    return path
+
+
+def route_template(path: str) -> str:
+    """由规范化路径推断路由模板，如 /users/123 -> /users/{id}"""
+    segments = []
+    for segment in normalize_path(path).split("/")[1:]:
+        for pattern, placeholder in SEGMENT_PATTERNS:
+            if pattern.match(segment):
+                segment = placeholder
+                break
+        segments.append(segment)
+    return "/" + "/".join(segments)
+
+
+def canonical_route(route: str) -> str:
+    """将框架的路由模板统一为 /users/{id} 形式（如 /users/<int:id>、users/(?P<id>\\d+)/$、/users/{id:int}）"""
+    route = route.strip().lstrip("^").rstrip("$")
+    for pattern, replacement in PLACEHOLDER_PATTERNS:
+        route = pattern.sub(replacement, route)
+    return route_template(route)
+
+
+def route_key(path: str, route: Optional[str] = None) -> str:
+    """记录的路由维度：优先使用SDK上报的路由模板，旧版SDK不上报模板时由路径推断"""
+    return canonical_route(route) if route else route_template(path)
+
+
+def path_prefix_filter(prefix: str) -> Optional[Dict[str, Any]]:
+    """规范化路径的前缀匹配条件（锚定的转义正则，可使用索引范围扫描），根路径不限制返回None"""
+    prefix = normalize_path(prefix)
+    if prefix == "/":
+        return None
+    return {"$regex": "^" + re.escape(prefix)}
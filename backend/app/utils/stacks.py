@@ -0,0 +1,74 @@
+"""
+调用栈表工具
+"""
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+
+# 被裁剪或超出上限的调用栈合并到该栈名下（与SDK聚合模式一致）
+OTHER_STACK = "[other]"
+
+
+def frame_name(function_name: str, file_path: str, line_number: int) -> str:
+    """生成调用栈中的帧名称（与SDK保持一致）"""
+    return f"{function_name} ({file_path}:{line_number})"
+
+
+def stack_key(stack: str) -> str:
+    """调用栈的存储键（调用栈文本包含'.'等字符，不能直接作为MongoDB字段名）"""
+    return hashlib.sha1(stack.encode("utf-8")).hexdigest()[:16]
+
+
+def collapse_function_calls(function_calls: List[Dict[str, Any]]) -> Dict[str, Tuple[int, float]]:
+    """将扁平化的函数调用列表折叠为 {调用栈: (调用次数, 自身耗时)}"""
+    calls_by_id = {}
+    child_time: Dict[str, float] = {}
+    for call in function_calls:
+        call_id = call.get("call_id")
+        if call_id is None:
+            continue
+        calls_by_id[call_id] = call
+        parent_id = call.get("parent_call_id")
+        if parent_id is not None:
+            child_time[parent_id] = child_time.get(parent_id, 0.0) + call.get("duration", 0.0)
+
+    stack_cache: Dict[str, str] = {}
+
+    def stack_of(call_id: str) -> str:
+        # 向上查找到第一个已缓存的祖先，再自顶向下补全缓存
+        pending = []
+        current = call_id
+        while current in calls_by_id and current not in stack_cache:
+            pending.append(current)
+            current = calls_by_id[current].get("parent_call_id")
+            if len(pending) > len(calls_by_id):
+                break
+        prefix = stack_cache.get(current)
+        for pending_id in reversed(pending):
+            call = calls_by_id[pending_id]
+            name = frame_name(call.get("function_name", "unknown"), call.get("file_path", ""), call.get("line_number", 0))
+            prefix = f"{prefix};{name}" if prefix else name
+            stack_cache[pending_id] = prefix
+        return stack_cache[call_id]
+
+    collapsed: Dict[str, Tuple[int, float]] = {}
+    for call_id, call in calls_by_id.items():
+        stack = stack_of(call_id)
+        self_time = max(call.get("duration", 0.0) - child_time.get(call_id, 0.0), 0.0)
+        count, total = collapsed.get(stack, (0, 0.0))
+        collapsed[stack] = (count + call.get("call_count", 1), total + self_time)
+
+    return collapsed
+
+
+def merge_stack_entries(merged: Dict[str, List[float]], entries: Optional[Dict[str, Dict[str, Any]]]):
+    """将rollup文档的调用栈条目 {存储键: {"stack", "count", "self_time"}} 累加到 {调用栈: [调用次数, 自身耗时]}"""
+    for entry in (entries or {}).values():
+        stack = entry.get("stack")
+        if not stack:
+            continue
+        current = merged.get(stack)
+        if current is None:
+            merged[stack] = [entry.get("count", 0), entry.get("self_time", 0.0)]
+        else:
+            current[0] += entry.get("count", 0)
+            current[1] += entry.get("self_time", 0.0)
@@ -0,0 +1,157 @@
+"""
+测试共用的内存版MongoDB集合
+
+只实现服务层用到的查询和更新操作，测试模块通过 `from conftest import ...` 导入。
+"""
+from types import SimpleNamespace
+
+
+def field(doc, name):
+    """按点号路径取字段值"""
+    for part in name.split("."):
+        doc = (doc or {}).get(part)
+    return doc
+
+
+def matches(doc, query):
+    """简单的查询匹配，支持等值、点号路径和常用比较操作符"""
+    for name, condition in (query or {}).items():
+        value = field(doc, name)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$exists" and (value is not None) != bool(operand):
+                    return False
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$lte" and not (value is not None and value <= operand):
+                    return False
+                if op == "$gt" and not (value is not None and value > operand):
+                    return False
+                if op == "$gte" and not (value is not None and value >= operand):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    """模拟Motor游标，每次取数据计为集合的一次数据库往返"""
+
+    def __init__(self, docs, collection=None):
+        self.docs = docs
+        self.collection = collection
+
+    def sort(self, key=None, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)] if key else []
+        for name, order in reversed(keys):
+            self.docs.sort(key=lambda doc: (field(doc, name) is None, field(doc, name)), reverse=order == -1)
+        return self
+
+    def skip(self, count):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def _fetch(self):
+        if self.collection is not None:
+            self.collection.round_trips += 1
+        return self.docs
+
+    async def to_list(self, length=None):
+        return self._fetch()
+
+    def __aiter__(self):
+        self._iter = iter(self._fetch())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """内存版集合，记录find查询条件和数据库往返次数"""
+
+    def __init__(self, docs=None):
+        self.docs = [dict(doc) for doc in docs or []]
+        self.queries = []
+        self.round_trips = 0
+
+    def find(self, query=None, projection=None):
+        self.queries.append(query)
+        return FakeCursor([dict(doc) for doc in self.docs if matches(doc, query)], self)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self.round_trips += 1
+        cursor = FakeCursor([dict(doc) for doc in self.docs if matches(doc, query)])
+        cursor.sort(sort)
+        return cursor.docs[0] if cursor.docs else None
+
+    async def count_documents(self, query):
+        self.round_trips += 1
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def distinct(self, name, query=None):
+        self.round_trips += 1
+        return list({field(doc, name) for doc in self.docs if matches(doc, query)})
+
+    async def insert_one(self, doc):
+        self.round_trips += 1
+        self.docs.append(dict(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        self.round_trips += 1
+        self.docs.extend(dict(doc) for doc in docs)
+        return SimpleNamespace(inserted_ids=[doc.get("_id") for doc in docs])
+
+    async def create_index(self, keys, **kwargs):
+        self.round_trips += 1
+
+    async def update_one(self, query, update, upsert=False):
+        self.round_trips += 1
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0)
+            doc = {name: value for name, value in query.items() if not isinstance(value, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            self.docs.append(doc)
+        self._apply(doc, update)
+        return SimpleNamespace(matched_count=1)
+
+    async def update_many(self, query, update):
+        self.round_trips += 1
+        matched = [doc for doc in self.docs if matches(doc, query)]
+        for doc in matched:
+            self._apply(doc, update)
+        return SimpleNamespace(matched_count=len(matched))
+
+    async def delete_one(self, query):
+        self.round_trips += 1
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query):
+        self.round_trips += 1
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for name, value in update.get("$inc", {}).items():
+            doc[name] = doc.get(name, 0) + value
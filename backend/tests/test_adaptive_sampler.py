@@ -0,0 +1,159 @@
+"""
+SDK自适应采样测试用例
+"""
+import pytest
+import sys
+import os
+from unittest.mock import patch
+
+# 添加SDK路径到系统路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdk'))
+
+from performance_monitor.core.sampler import AdaptiveSampler
+from performance_monitor.core.profiler import ProfilerManager
+from performance_monitor.utils.config import Config
+
+
+class FakeClock:
+    """可控的单调时钟"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_config(**kwargs):
+    """创建测试配置"""
+    options = {
+        "project_key": "test_project",
+        "api_endpoint": "http://localhost:8000",
+        "async_send": False,
+        "adaptive_sampling": True,
+        "sampling_rate": 0.5,
+        "max_profiles_per_second": 10.0,
+        "sampling_adjust_interval": 1.0,
+        "sampling_smoothing": 1.0,
+        "route_coverage_interval": 0
+    }
+    options.update(kwargs)
+    return Config.from_dict(options)
+
+
+class TestAdaptiveSampler:
+    """自适应采样器测试"""
+
+    @pytest.fixture
+    def clock(self):
+        clock = FakeClock()
+        with patch("performance_monitor.core.sampler.time.monotonic", clock):
+            yield clock
+
+    def test_rate_drops_under_traffic_spike(self, clock):
+        """高流量时采样率下降到预算以内"""
+        sampler = AdaptiveSampler(make_config())
+
+        # 1秒内1000个请求，预算为每秒10次分析
+        for _ in range(1000):
+            sampler.decide("GET /api/users")
+        clock.now += 1.0
+        sampler.decide("GET /api/users")
+
+        assert sampler.rate == pytest.approx(0.01)
+
+    def test_rate_rises_when_traffic_is_sparse(self, clock):
+        """低流量时采样率上升，但不超过上限"""
+        sampler = AdaptiveSampler(make_config(max_sampling_rate=0.8))
+
+        for _ in range(5):
+            sampler.decide("GET /api/users")
+        clock.now += 1.0
+        sampler.decide("GET /api/users")
+
+        assert sampler.rate == pytest.approx(0.8)
+
+    def test_cpu_budget_limits_rate(self, clock):
+        """分析CPU占比预算生效"""
+        config = make_config(
+            sampling_rate=1.0,
+            max_profiles_per_second=0,
+            max_profiling_cpu_percent=1.0
+        )
+        sampler = AdaptiveSampler(config)
+
+        # 100个请求全部采样，每次分析耗时1ms CPU，共占用10%
+        for _ in range(100):
+            assert sampler.decide("GET /api/orders")
+            sampler.record_cost(0.001)
+        clock.now += 1.0
+        sampler.decide("GET /api/orders")
+
+        assert sampler.rate == pytest.approx(0.1)
+
+    def test_route_coverage_is_guaranteed(self, clock):
+        """采样率极低时每个路由仍保证最小覆盖"""
+        config = make_config(
+            sampling_rate=0.001,
+            min_sampling_rate=0.001,
+            max_sampling_rate=0.01,
+            route_coverage_interval=60.0
+        )
+        sampler = AdaptiveSampler(config)
+
+        with patch("performance_monitor.core.sampler.random.random", return_value=0.99):
+            first = sampler.decide("GET /api/rare")
+            second = sampler.decide("GET /api/rare")
+            clock.now += 61.0
+            third = sampler.decide("GET /api/rare")
+
+        assert first["forced"] is True
+        assert second is None
+        assert third["forced"] is True
+        # 补采的请求必定被采样，不按自适应采样率放大请求量
+        assert first["sampling_rate"] == pytest.approx(1.0)
+
+
+class TestProfilerManagerSampling:
+    """分析器管理器采样集成测试"""
+
+    def test_sampling_info_recorded_in_record(self):
+        """采样信息写入性能记录"""
+        manager = ProfilerManager(make_config(sampling_rate=1.0, max_profiles_per_second=0))
+
+        with patch.object(manager.data_sender, "send_sync") as send_sync:
+            trace_id = manager.start_profiling({"method": "GET", "path": "/api/users"})
+            assert trace_id
+            assert manager.stop_profiling({"status_code": 200})
+
+        record = send_sync.call_args[0][0]
+        assert record["sampling_info"]["mode"] == "adaptive"
+        assert record["sampling_info"]["sampling_rate"] == pytest.approx(1.0)
+
+    def test_update_config_toggles_sampler(self):
+        """运行时切换自适应采样"""
+        manager = ProfilerManager(make_config(adaptive_sampling=False))
+        assert manager.sampler is None
+
+        manager.update_config(adaptive_sampling=True)
+        assert manager.sampler is not None
+
+        manager.update_config(sampling_rate=0.2)
+        assert manager.sampler.rate == pytest.approx(0.2)
+
+        manager.update_config(adaptive_sampling=False)
+        assert manager.sampler is None
+
+    def test_in_request_sampling_cost_counted(self):
+        """请求执行期间的采样开销计入CPU预算"""
+        manager = ProfilerManager(make_config(sampling_rate=1.0, max_profiles_per_second=0))
+
+        with patch.object(manager.data_sender, "send_sync"), \
+             patch.object(manager.sampler, "record_cost") as record_cost, \
+             patch("performance_monitor.core.collector.SAMPLE_CPU_COST", 0.5):
+            manager.start_profiling({"method": "GET", "path": "/api/users"})
+            sum(i * i for i in range(200000))
+            manager.stop_profiling({"status_code": 200})
+
+        # 数百次采样按每次0.5秒估算，远大于启动/停止本身的CPU时间
+        assert record_cost.call_args_list[-1][0][0] > 1.0
@@ -0,0 +1,92 @@
+"""
+AI服务客户端复用测试用例
+"""
+import json
+import logging
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.services.ai_analyzer import PerformanceAnalyzer
+from app.services.ai_clients import ProviderClientRegistry
+from app.services.ai_config import AIServiceConfig, AIProvider
+
+
+@pytest_asyncio.fixture
+async def mock_llm():
+    """模拟LLM服务，记录每个请求使用的客户端连接"""
+    connections = []
+
+    async def handle(request):
+        connections.append(request.transport.get_extra_info("peername"))
+        chunk = json.dumps({"choices": [{"delta": {"content": json.dumps({"performance_score": 91})}}]})
+        return web.Response(text=f"data: {chunk}\n\ndata: [DONE]\n\n", content_type="text/event-stream")
+
+    app = web.Application()
+    app.router.add_post("/chat/completions", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/chat/completions", connections
+    await runner.cleanup()
+
+
+def make_config(endpoint, provider=AIProvider.DEEPSEEK, **kwargs):
+    return AIServiceConfig(provider=provider, endpoint=endpoint, requests_per_minute=0, **kwargs)
+
+
+class TestProviderClientRegistry:
+    """客户端注册表测试"""
+
+    @pytest.mark.asyncio
+    async def test_clients_shared_per_endpoint(self):
+        registry = ProviderClientRegistry()
+
+        first = registry.get_http_client(make_config("https://api.deepseek.com/chat/completions"))
+        second = registry.get_http_client(make_config("https://api.deepseek.com/v2/chat/completions"))
+        other = registry.get_http_client(make_config("https://dashscope.aliyuncs.com/api/v1", AIProvider.ALIYUN_QIANWEN))
+
+        assert first is second
+        assert other is not first
+
+        await registry.close()
+        assert first.is_closed and other.is_closed
+        assert registry.get_http_client(make_config("https://api.deepseek.com/chat/completions")) is not first
+        await registry.close()
+
+    @pytest.mark.asyncio
+    async def test_openai_client_keyed_without_api_key(self, caplog):
+        registry = ProviderClientRegistry()
+        endpoint = "https://api.openai.com/v1/chat/completions"
+
+        with caplog.at_level(logging.INFO, logger="app.services.ai_clients"):
+            first = registry.get_openai_client(make_config(endpoint, AIProvider.OPENAI, api_key="sk-secret-a"))
+            same = registry.get_openai_client(make_config(endpoint, AIProvider.OPENAI, api_key="sk-secret-a"))
+            other = registry.get_openai_client(make_config(endpoint, AIProvider.OPENAI, api_key="sk-secret-b"))
+
+        assert first is same
+        assert other is not first
+        assert not any("sk-secret" in str(client_key) for client_key in registry._clients)
+        assert "sk-secret" not in caplog.text
+        await registry.close()
+
+    @pytest.mark.asyncio
+    async def test_analyses_reuse_connection(self, mock_llm):
+        endpoint, connections = mock_llm
+        analyzer = PerformanceAnalyzer()
+        analyzer.config_manager = Mock()
+        analyzer.config_manager.get_service_async = AsyncMock(return_value=make_config(endpoint))
+        analyzer.config_manager.get_template = Mock(return_value="分析 {request_path}")
+        record = {"request_info": {"path": "/api/orders"}, "performance_metrics": {"total_duration": 0.5}}
+
+        with patch("app.services.ai_analyzer.get_database", return_value=Mock()):
+            for _ in range(5):
+                result = await analyzer.analyze_performance(record, ai_service="deepseek")
+                assert result.performance_score == 91
+
+        await analyzer.clients.close()
+        assert len(connections) == 5
+        assert len(set(connections)) == 1
@@ -0,0 +1,77 @@
+"""
+AI配置缓存测试用例
+"""
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.services import ai_config
+from app.services.ai_config import AIConfigManager
+
+
+def make_db(version=1, default_service="deepseek"):
+    db = Mock()
+    doc = {
+        "config_key": "platform_settings",
+        "version": version,
+        "config_value": {"ai": {"defaultService": default_service, "apiKey": "sk-test"}}
+    }
+
+    async def find_one(query, projection=None):
+        if projection is not None:
+            return {key: doc[key] for key in projection if key in doc}
+        return doc
+
+    db.system_config.find_one = AsyncMock(side_effect=find_one)
+    return db, doc
+
+
+@pytest.fixture
+def manager():
+    with patch.object(AIConfigManager, "_load_config"):
+        yield AIConfigManager()
+
+
+def full_loads(db):
+    return sum(1 for call in db.system_config.find_one.call_args_list if len(call.args) < 2)
+
+
+class TestAIConfigCache:
+    """AI配置版本缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_unchanged_version_skips_reload(self, manager):
+        db, _ = make_db()
+
+        assert await manager.refresh_from_database(db) is True
+        with patch.object(ai_config, "CONFIG_CHECK_INTERVAL", 0):
+            assert await manager.refresh_from_database(db) is False
+            await manager.get_service_async(None, db)
+
+        assert full_loads(db) == 1
+        assert manager.default_service == "deepseek"
+
+    @pytest.mark.asyncio
+    async def test_version_change_reloads(self, manager):
+        db, doc = make_db()
+        await manager.refresh_from_database(db)
+
+        doc["version"] = 2
+        doc["config_value"]["ai"]["defaultService"] = "openai-gpt4"
+        with patch.object(ai_config, "CONFIG_CHECK_INTERVAL", 0):
+            assert await manager.refresh_from_database(db) is True
+
+        assert full_loads(db) == 2
+        assert manager.default_service == "openai"
+
+    @pytest.mark.asyncio
+    async def test_check_interval_throttles_version_probe(self, manager):
+        db, _ = make_db()
+        await manager.refresh_from_database(db)
+        calls = db.system_config.find_one.call_count
+
+        await manager.refresh_from_database(db)
+        assert db.system_config.find_one.call_count == calls
+
+        # 本进程修改配置后立即生效
+        manager.invalidate()
+        assert await manager.refresh_from_database(db) is True
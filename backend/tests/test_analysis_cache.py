@@ -0,0 +1,137 @@
+"""
+AI分析结果缓存测试用例
+"""
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.models.analysis import AnalysisResults
+from app.services.ai_analyzer import PerformanceAnalyzer
+from app.services.ai_config import AIServiceConfig, AIProvider
+from app.services.analysis_cache import profile_features, profile_fingerprint, feature_similarity
+from conftest import FakeCollection
+
+
+def make_record(duration=0.8, functions=("query_orders", "serialize", "render"), project_key="proj_a",
+                path="/api/orders"):
+    return {
+        "project_key": project_key,
+        "request_info": {"path": path, "method": "GET"},
+        "performance_metrics": {"total_duration": duration, "cpu_time": duration * 0.9},
+        "function_calls": [
+            {"function_name": name, "file_path": "app/views.py", "duration": 0.2 + i * 0.01}
+            for i, name in enumerate(functions)
+        ]
+    }
+
+
+@pytest.fixture
+def collection():
+    collection = FakeCollection()
+    database = Mock()
+    database.ai_analysis_cache = collection
+    with patch("app.services.analysis_cache.get_database", return_value=database), \
+         patch("app.services.ai_analyzer.get_database", return_value=database), \
+         patch("app.services.rate_limiter.get_redis", return_value=None):
+        yield collection
+
+
+def make_analyzer(model="deepseek-chat"):
+    config = AIServiceConfig(provider=AIProvider.DEEPSEEK, model=model, endpoint="http://llm.local/chat")
+    analyzer = PerformanceAnalyzer()
+    analyzer.config_manager = Mock()
+    analyzer.config_manager.get_service_async = AsyncMock(return_value=config)
+    analyzer.config_manager.get_template = Mock(return_value="分析 {request_path}")
+    analyzer._call_provider = AsyncMock(return_value=AnalysisResults(performance_score=77))
+    return analyzer
+
+
+class TestProfileFingerprint:
+    """性能特征指纹测试"""
+
+    def test_nearby_durations_share_fingerprint(self):
+        analyzer = PerformanceAnalyzer()
+        scope = {"provider": "deepseek", "model": "deepseek-chat", "prompt_version": "1"}
+        first = profile_features(analyzer._preprocess_performance_data(make_record(0.80)))
+        second = profile_features(analyzer._preprocess_performance_data(make_record(0.90)))
+        slower = profile_features(analyzer._preprocess_performance_data(make_record(3.0)))
+
+        assert profile_fingerprint(first, scope) == profile_fingerprint(second, scope)
+        assert profile_fingerprint(first, scope) != profile_fingerprint(slower, scope)
+        assert profile_fingerprint(first, scope) != profile_fingerprint(first, {**scope, "model": "other"})
+
+    def test_similarity(self):
+        analyzer = PerformanceAnalyzer()
+        base = profile_features(analyzer._preprocess_performance_data(make_record()))
+        other = profile_features(analyzer._preprocess_performance_data(make_record(functions=("a", "b", "c"))))
+
+        assert feature_similarity(base, base) == pytest.approx(1.0)
+        assert feature_similarity(base, other) < 0.85
+
+    def test_empty_profiles_not_similar(self):
+        analyzer = PerformanceAnalyzer()
+        empty = profile_features(analyzer._preprocess_performance_data(make_record(0.8, functions=())))
+        slower = profile_features(analyzer._preprocess_performance_data(make_record(1.6, functions=())))
+
+        assert feature_similarity(empty, slower) < 0.85
+
+
+class TestAnalysisCache:
+    """分析结果复用测试"""
+
+    @pytest.mark.asyncio
+    async def test_similar_trace_reuses_result(self, collection):
+        analyzer = make_analyzer()
+
+        first = await analyzer.analyze_performance(make_record(0.80), ai_service="deepseek")
+        second = await analyzer.analyze_performance(make_record(0.85), ai_service="deepseek")
+
+        assert first.source == "ai"
+        assert second.source == "cache"
+        assert second.performance_score == 77
+        assert analyzer._call_provider.await_count == 1
+        assert collection.docs[0]["hit_count"] == 1
+
+        hit = await analyzer.find_cached_analysis(make_record(0.9), ai_service="deepseek")
+        assert hit["similarity"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_paths_of_same_route_share_entry(self, collection):
+        analyzer = make_analyzer()
+
+        await analyzer.analyze_performance(make_record(path="/api/orders/1"), ai_service="deepseek")
+        second = await analyzer.analyze_performance(make_record(path="/api/orders/2"), ai_service="deepseek")
+
+        assert second.source == "cache"
+        assert len(collection.docs) == 1
+        assert collection.docs[0]["features"]["path"] == "/api/orders/{id}"
+
+    @pytest.mark.asyncio
+    async def test_different_profile_or_model_misses(self, collection):
+        analyzer = make_analyzer()
+        await analyzer.analyze_performance(make_record(), ai_service="deepseek")
+
+        await analyzer.analyze_performance(make_record(functions=("a", "b", "c")), ai_service="deepseek")
+        await make_analyzer(model="deepseek-reasoner").analyze_performance(make_record(), ai_service="deepseek")
+        await analyzer.analyze_performance(make_record(), ai_service="deepseek", use_cache=False)
+
+        assert analyzer._call_provider.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_results_not_shared_across_projects(self, collection):
+        analyzer = make_analyzer()
+
+        await analyzer.analyze_performance(make_record(project_key="proj_a"), ai_service="deepseek")
+        other = await analyzer.analyze_performance(make_record(project_key="proj_b"), ai_service="deepseek")
+
+        assert other.source == "ai"
+        assert analyzer._call_provider.await_count == 2
+        assert await analyzer.find_cached_analysis(make_record(project_key="proj_c"), ai_service="deepseek") is None
+
+    @pytest.mark.asyncio
+    async def test_rule_results_not_cached(self, collection):
+        analyzer = make_analyzer()
+        analyzer._call_provider = AsyncMock(return_value=AnalysisResults(performance_score=50, source="rule"))
+
+        await analyzer.analyze_performance(make_record(), ai_service="deepseek")
+
+        assert collection.docs == []
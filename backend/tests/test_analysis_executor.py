@@ -0,0 +1,158 @@
+"""
+批量AI分析执行器测试用例
+
+使用本地模拟的LLM服务（DeepSeek兼容接口），超过并发上限时返回429。
+"""
+import asyncio
+import json
+import time
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.services.ai_analyzer import PerformanceAnalyzer
+from app.services.ai_config import AIServiceConfig, AIProvider
+from app.services.analysis_executor import AnalysisExecutor
+from app.services.rate_limiter import AdaptiveConcurrencyLimiter, SharedTokenBucket
+
+
+class MockLLM:
+    """模拟LLM服务：同时处理的请求超过上限时返回429"""
+
+    def __init__(self, max_concurrent=4, latency=0.02):
+        self.max_concurrent = max_concurrent
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def handle(self, request):
+        if self.in_flight >= self.max_concurrent:
+            self.rejected += 1
+            return web.json_response({"error": "rate limited"}, status=429, headers={"Retry-After": "0"})
+
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            self.completed += 1
+            content = json.dumps({"performance_score": 88, "bottleneck_analysis": {"primary_bottleneck": "慢查询"}})
+            chunk = json.dumps({"choices": [{"delta": {"content": content}}]})
+            return web.Response(text=f"data: {chunk}\n\ndata: [DONE]\n\n", content_type="text/event-stream")
+        finally:
+            self.in_flight -= 1
+
+
+@pytest_asyncio.fixture
+async def mock_llm():
+    llm = MockLLM()
+    app = web.Application()
+    app.router.add_post("/chat/completions", llm.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    llm.endpoint = f"http://127.0.0.1:{port}/chat/completions"
+    yield llm
+    await runner.cleanup()
+
+
+def make_analyzer(endpoint, **limits):
+    config = AIServiceConfig(
+        provider=AIProvider.DEEPSEEK,
+        model="deepseek-chat",
+        endpoint=endpoint,
+        max_retries=5,
+        retry_delay=0.01,
+        **limits
+    )
+    analyzer = PerformanceAnalyzer()
+    analyzer.config_manager = Mock()
+    analyzer.config_manager.get_service_async = AsyncMock(return_value=config)
+    analyzer.config_manager.get_template = Mock(return_value="分析 {request_path}")
+    return analyzer
+
+
+def make_record(record_id):
+    return {
+        "trace_id": record_id,
+        "project_key": "proj_a",
+        "request_info": {"path": "/api/orders", "method": "GET"},
+        "performance_metrics": {"total_duration": 0.8, "cpu_time": 0.2},
+        "function_calls": []
+    }
+
+
+@pytest.fixture
+def database():
+    with patch("app.services.ai_analyzer.get_database", return_value=Mock()), \
+         patch("app.services.rate_limiter.get_redis", return_value=None), \
+         patch("app.services.analysis_executor.db_manager") as db_manager:
+        db_manager.get_performance_record = AsyncMock(side_effect=make_record)
+        db_manager.save_analysis_record = AsyncMock(return_value=True)
+        yield db_manager
+
+
+class TestAnalysisExecutor:
+    """批量分析并发与限流测试"""
+
+    @pytest.mark.asyncio
+    async def test_batch_runs_concurrently_and_adapts_to_429(self, mock_llm, database):
+        analyzer = make_analyzer(mock_llm.endpoint, requests_per_minute=0, max_concurrency=16)
+        executor = AnalysisExecutor(analyzer=analyzer, max_in_flight=32)
+
+        result = await executor.run([f"trace_{i}" for i in range(40)], ai_service="deepseek")
+
+        assert result["success_count"] == 40
+        assert all(item["performance_score"] == 88 for item in result["results"])
+        assert mock_llm.completed == 40
+        # 多个请求同时进行，收到429后并发上限下降
+        assert mock_llm.peak > 1
+        assert mock_llm.rejected > 0
+        limiter = next(iter(analyzer.rate_limiters._limiters.values()))
+        assert limiter.concurrency.limit < 16
+        assert database.save_analysis_record.await_count == 40
+
+    @pytest.mark.asyncio
+    async def test_requests_per_minute_limit(self, mock_llm, database):
+        # 每秒10个请求，关闭突发后桶容量为1
+        with patch("app.services.rate_limiter.settings") as settings:
+            settings.ai_rate_limit_burst_seconds = 0
+            analyzer = make_analyzer(mock_llm.endpoint, requests_per_minute=600, max_concurrency=4)
+            executor = AnalysisExecutor(analyzer=analyzer)
+
+            started = time.monotonic()
+            result = await executor.run([f"trace_{i}" for i in range(4)])
+            elapsed = time.monotonic() - started
+
+        assert result["success_count"] == 4
+        assert elapsed >= 0.25
+
+
+class TestRateLimiter:
+    """令牌桶与自适应并发测试"""
+
+    @pytest.mark.asyncio
+    async def test_shared_bucket_falls_back_without_redis(self):
+        redis = Mock()
+        redis.eval = AsyncMock(side_effect=ConnectionError("down"))
+        bucket = SharedTokenBucket("ratelimit:test", rate=100.0, capacity=2.0)
+
+        with patch("app.services.rate_limiter.get_redis", return_value=redis):
+            assert await bucket.try_acquire(1) == 0
+            assert await bucket.try_acquire(1) == 0
+            assert await bucket.try_acquire(1) > 0
+
+    def test_aimd_limits(self):
+        limiter = AdaptiveConcurrencyLimiter(8, increase_after=2)
+
+        limiter.on_rate_limited()
+        limiter.on_rate_limited()
+        assert int(limiter.limit) == 2
+
+        for _ in range(4):
+            limiter.on_success()
+        assert int(limiter.limit) == 4
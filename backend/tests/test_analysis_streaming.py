@@ -0,0 +1,191 @@
+"""
+AI分析流式输出测试用例
+"""
+import json
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.services.ai_analyzer import PerformanceAnalyzer
+from app.services.ai_config import AIServiceConfig, AIProvider
+from app.services.analysis_progress import AnalysisProgressReporter, stream_analysis_events
+from app.utils.partial_json import PartialJSONParser
+
+ANALYSIS = {
+    "performance_score": 65,
+    "bottleneck_analysis": {"primary_bottleneck": "订单查询缺少索引"},
+    "optimization_recommendations": [
+        {"priority": "high", "action": "添加索引", "details": "为 orders.user_id 添加索引"},
+        {"priority": "medium", "action": "缓存结果", "details": "缓存热门商品, 减少查询"}
+    ],
+    "risk_assessment": {"high_risk": ["高峰期超时"]}
+}
+
+
+class TestPartialJSONParser:
+    """增量JSON解析测试"""
+
+    def test_sections_available_before_completion(self):
+        text = "```json\n" + json.dumps(ANALYSIS, ensure_ascii=False, indent=2) + "\n```"
+        parser = PartialJSONParser()
+
+        first_suggestion_at = None
+        for i in range(0, len(text), 5):
+            parser.feed(text[i:i + 5])
+            if first_suggestion_at is None and parser.snapshot().get("optimization_recommendations"):
+                first_suggestion_at = i
+
+        # 第一条建议在第二条建议输出前即可解析
+        assert first_suggestion_at < text.index("缓存结果")
+        assert parser.done
+        assert parser.snapshot() == ANALYSIS
+
+    def test_incomplete_values_not_reported(self):
+        parser = PartialJSONParser()
+        parser.feed('{"performance_score": 6')
+        assert parser.snapshot() == {}
+        parser.feed('5, "risk_assessment": {"high_risk": ["慢')
+        assert parser.snapshot() == {"performance_score": 65}
+
+
+@pytest_asyncio.fixture
+async def streaming_llm():
+    """按小块流式返回分析结果的模拟LLM服务"""
+    async def handle(request):
+        body = await request.json()
+        assert body["stream"] is True
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        content = json.dumps(ANALYSIS, ensure_ascii=False)
+        for i in range(0, len(content), 20):
+            chunk = json.dumps({"choices": [{"delta": {"content": content[i:i + 20]}}]}, ensure_ascii=False)
+            await response.write(f"data: {chunk}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/chat/completions", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    yield f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/chat/completions"
+    await runner.cleanup()
+
+
+@pytest_asyncio.fixture
+async def flaky_llm():
+    """第一次请求输出部分内容后断开连接，之后正常返回完整结果的模拟LLM服务"""
+    attempts = []
+
+    async def handle(request):
+        attempts.append(request)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        content = json.dumps(ANALYSIS, ensure_ascii=False)
+        if len(attempts) == 1:
+            content = content[:content.index("缓存结果")]
+        for i in range(0, len(content), 20):
+            chunk = json.dumps({"choices": [{"delta": {"content": content[i:i + 20]}}]}, ensure_ascii=False)
+            await response.write(f"data: {chunk}\n\n".encode("utf-8"))
+        if len(attempts) == 1:
+            request.transport.close()
+            return response
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/chat/completions", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    yield f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/chat/completions", attempts
+    await runner.cleanup()
+
+
+class TestStreamingAnalysis:
+    """流式分析与进度推送测试"""
+
+    @pytest.mark.asyncio
+    async def test_deepseek_streams_partial_results(self, streaming_llm):
+        database = Mock()
+        database.ai_analysis_results.update_one = AsyncMock()
+        redis = Mock()
+        redis.publish = AsyncMock()
+        config = AIServiceConfig(provider=AIProvider.DEEPSEEK, endpoint=streaming_llm, requests_per_minute=0)
+        analyzer = PerformanceAnalyzer()
+        analyzer.config_manager = Mock()
+        analyzer.config_manager.get_service_async = AsyncMock(return_value=config)
+        analyzer.config_manager.get_template = Mock(return_value="分析 {request_path}")
+        progress = []
+        reporter = AnalysisProgressReporter("analysis_1", on_progress=progress.append)
+
+        with patch("app.services.ai_analyzer.get_database", return_value=database), \
+             patch("app.services.analysis_progress.get_database", return_value=database), \
+             patch("app.services.analysis_progress.get_redis", return_value=redis):
+            result = await analyzer.analyze_performance(
+                {"request_info": {"path": "/api/orders"}}, ai_service="deepseek",
+                use_cache=False, on_content=reporter.on_content
+            )
+            await reporter.flush()
+        await analyzer.clients.close()
+
+        assert result.performance_score == 65
+        assert len(result.optimization_suggestions) == 2
+        events = [json.loads(call.args[1]) for call in redis.publish.call_args_list]
+        assert len(events) >= 4
+        assert events[0]["data"]["partial_results"] == {"performance_score": 65}
+        assert progress == sorted(progress) and progress[-1] <= 75
+        saved = database.ai_analysis_results.update_one.call_args.args[1]["$set"]
+        assert saved["partial_results"] == ANALYSIS
+
+    @pytest.mark.asyncio
+    async def test_retry_resets_partial_results(self, flaky_llm):
+        endpoint, attempts = flaky_llm
+        database = Mock()
+        database.ai_analysis_results.update_one = AsyncMock()
+        redis = Mock()
+        redis.publish = AsyncMock()
+        config = AIServiceConfig(provider=AIProvider.DEEPSEEK, endpoint=endpoint, requests_per_minute=0)
+        analyzer = PerformanceAnalyzer()
+        analyzer.config_manager = Mock()
+        analyzer.config_manager.get_service_async = AsyncMock(return_value=config)
+        analyzer.config_manager.get_template = Mock(return_value="分析 {request_path}")
+        reporter = AnalysisProgressReporter("analysis_1")
+
+        with patch("app.services.ai_analyzer.get_database", return_value=database), \
+             patch("app.services.analysis_progress.get_database", return_value=database), \
+             patch("app.services.analysis_progress.get_redis", return_value=redis):
+            result = await analyzer.analyze_performance(
+                {"request_info": {"path": "/api/orders"}}, ai_service="deepseek",
+                use_cache=False, on_content=reporter.on_content, on_restart=reporter.reset
+            )
+            await reporter.flush()
+        await analyzer.clients.close()
+
+        assert len(attempts) == 2
+        assert len(result.optimization_suggestions) == 2
+        events = [json.loads(call.args[1])["data"]["partial_results"] for call in redis.publish.call_args_list]
+        # 重试前推送清空的部分结果，之后按新一次输出重新解析
+        assert {} in events
+        assert events[-1] == ANALYSIS
+        saved = database.ai_analysis_results.update_one.call_args.args[1]["$set"]
+        assert saved["partial_results"] == ANALYSIS
+
+    @pytest.mark.asyncio
+    async def test_event_stream_without_redis(self):
+        docs = iter([
+            {"status": "IN_PROGRESS", "progress": 40, "partial_results": {"performance_score": 65}},
+            {"status": "IN_PROGRESS", "progress": 40, "partial_results": {"performance_score": 65}},
+            {"status": "SUCCESS", "results": {"performance_score": 65}}
+        ])
+        database = Mock()
+        database.ai_analysis_results.find_one = AsyncMock(side_effect=lambda *args: next(docs))
+
+        with patch("app.services.analysis_progress.get_database", return_value=database), \
+             patch("app.services.analysis_progress.get_redis", return_value=None):
+            events = [event async for event in stream_analysis_events("analysis_1", poll_interval=0.01)]
+
+        assert [event.split("\n")[0] for event in events] == ["event: partial", "event: completed"]
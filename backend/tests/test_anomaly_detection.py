@@ -0,0 +1,146 @@
+"""
+实时异常检测测试用例
+"""
+import time
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.models.performance import PerformanceRecord
+from app.services.anomaly_service import AnomalyDetector, ANOMALY_LATENCY, ANOMALY_ERROR_RATE, ANOMALY_TRAFFIC_DROP
+
+
+def make_record(duration=0.05, status_code=200, path="/api/users"):
+    """构造性能记录"""
+    return PerformanceRecord(
+        project_key="proj_test",
+        trace_id="t",
+        request_info={"method": "GET", "path": path},
+        response_info={"status_code": status_code},
+        performance_metrics={"total_duration": duration}
+    )
+
+
+@pytest.fixture
+def detector():
+    detector = AnomalyDetector()
+    detector._collection = Mock()
+    detector._collection.insert_one = AsyncMock()
+    detector._collection.update_one = AsyncMock()
+    return detector
+
+
+async def feed_window(detector, start, duration=0.05, status_code=200, count=30):
+    """在一个30秒窗口内上报多条记录"""
+    for i in range(count):
+        await detector.observe("proj_test", make_record(duration, status_code), now=start + i * 0.5)
+
+
+class TestAnomalyDetector:
+    """实时异常检测测试"""
+
+    @pytest.mark.asyncio
+    async def test_latency_spike_opens_and_closes_window(self, detector):
+        for window in range(8):
+            await feed_window(detector, window * 30)
+        detector._collection.insert_one.assert_not_called()
+
+        # 两个连续的慢窗口合并为一个异常区间
+        await feed_window(detector, 8 * 30, duration=0.8)
+        await feed_window(detector, 9 * 30, duration=0.8)
+        await feed_window(detector, 10 * 30)
+        assert detector._collection.insert_one.await_count == 1
+        anomaly = detector._collection.insert_one.call_args[0][0]
+        assert anomaly["anomaly_type"] == ANOMALY_LATENCY
+        assert anomaly["peak_value"] > 0.5
+
+        # 恢复正常后异常区间关闭
+        await feed_window(detector, 11 * 30)
+        updates = [call[0][1]["$set"] for call in detector._collection.update_one.call_args_list]
+        assert "end_time" in updates[0]
+        assert updates[-1]["status"] == "closed"
+
+    @pytest.mark.asyncio
+    async def test_error_rate_spike(self, detector):
+        for window in range(8):
+            await feed_window(detector, window * 30)
+
+        await feed_window(detector, 8 * 30, status_code=503)
+        await feed_window(detector, 9 * 30)
+
+        anomaly = detector._collection.insert_one.call_args[0][0]
+        assert anomaly["anomaly_type"] == ANOMALY_ERROR_RATE
+        assert anomaly["peak_value"] == pytest.approx(1.0)
+
+    @pytest.mark.asyncio
+    async def test_sparse_routes_are_not_flagged(self, detector):
+        for window in range(8):
+            await feed_window(detector, window * 30)
+        await feed_window(detector, 8 * 30, duration=2.0, count=5)
+        await feed_window(detector, 9 * 30)
+
+        detector._collection.insert_one.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_observe_is_constant_time_across_routes(self, detector):
+        """数千个路由时单条记录的处理耗时保持稳定"""
+        started = time.perf_counter()
+        for i in range(5000):
+            await detector.observe("proj_test", make_record(path=f"/api/r{i}"), now=1.0)
+        elapsed = time.perf_counter() - started
+
+        assert len(detector._routes) == 5000
+        assert elapsed / 5000 < 0.001
+
+
+class TestAnomalyWindowLifecycle:
+    """窗口关闭与路由淘汰测试"""
+
+    @pytest.mark.asyncio
+    async def test_silent_route_is_flagged_by_tick(self, detector):
+        for window in range(8):
+            await feed_window(detector, window * 30)
+
+        # 路由完全停止上报，由定时检查关闭窗口
+        await detector.tick(now=8 * 30 + 1)
+        await detector.tick(now=9 * 30 + 1)
+
+        assert detector._collection.insert_one.await_count == 1
+        anomaly = detector._collection.insert_one.call_args[0][0]
+        assert anomaly["anomaly_type"] == ANOMALY_TRAFFIC_DROP
+        assert anomaly["baseline_value"] == pytest.approx(30)
+
+    @pytest.mark.asyncio
+    async def test_low_traffic_window_keeps_latency_anomaly_open(self, detector):
+        for window in range(8):
+            await feed_window(detector, window * 30)
+        await feed_window(detector, 8 * 30, duration=0.8)
+        await feed_window(detector, 9 * 30, duration=0.8, count=5)
+        await feed_window(detector, 10 * 30, duration=0.8, count=5)
+
+        updates = [call[0][1]["$set"] for call in detector._collection.update_one.call_args_list]
+        assert detector._collection.insert_one.await_count == 1
+        assert not any(update.get("status") == "closed" for update in updates)
+
+    @pytest.mark.asyncio
+    async def test_evicted_route_closes_open_anomalies(self, detector):
+        for window in range(8):
+            await feed_window(detector, window * 30)
+        await feed_window(detector, 8 * 30, duration=0.8)
+        await feed_window(detector, 9 * 30, duration=0.8)
+        assert detector._collection.insert_one.await_count == 1
+
+        with patch("app.services.anomaly_service.settings.anomaly_max_routes", 1):
+            await detector.observe("proj_test", make_record(path="/api/other"), now=10 * 30)
+
+        update = detector._collection.update_one.call_args[0][1]["$set"]
+        assert update["status"] == "closed"
+        assert len(detector._routes) == 1
+
+    @pytest.mark.asyncio
+    async def test_idle_route_is_dropped(self, detector):
+        await feed_window(detector, 0)
+
+        with patch("app.services.anomaly_service.settings.anomaly_idle_seconds", 600):
+            await detector.tick(now=700)
+
+        assert len(detector._routes) == 0
@@ -0,0 +1,230 @@
+"""
+自动AI分析调度与阈值告警测试用例
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.services.auto_analysis_service import (
+    AutoAnalysisService, candidate_fingerprint, SCHEDULER_STATE_ID,
+    CANDIDATE_PENDING, CANDIDATE_QUEUED, CANDIDATE_DUPLICATE, CANDIDATE_SKIPPED
+)
+from conftest import FakeCollection
+
+NOW = datetime(2024, 1, 1, 12, 10)
+CLOSED = datetime(2024, 1, 1, 11)
+OPEN = datetime(2024, 1, 1, 12)
+
+
+def make_candidate(path="/api/orders", fingerprint="fp_a", count=1, duration=1.0, bucket=CLOSED, **fields):
+    return {
+        "project_key": "proj_test", "method": "GET", "path": path, "bucket": bucket,
+        "fingerprint": fingerprint, "trace_id": f"trace_{path}_{fingerprint}",
+        "count": count, "duration": duration, "status": CANDIDATE_PENDING, **fields
+    }
+
+
+def make_rollup(path, request_count, error_count, latency_counts, duration_max=5.0):
+    return {
+        "project_key": "proj_test", "method": "GET", "path": path, "bucket": CLOSED,
+        "request_count": request_count, "error_count": error_count,
+        "duration_max": duration_max, "latency_counts": latency_counts
+    }
+
+
+def make_service(candidates=(), rollups=(), config=None):
+    with patch("app.services.auto_analysis_service.get_database", return_value=None), \
+         patch("app.services.rollup_service.get_database", return_value=None):
+        service = AutoAnalysisService()
+    service.candidates_collection = FakeCollection(candidates)
+    service.alerts_collection = FakeCollection()
+    service.state_collection = FakeCollection([{"_id": SCHEDULER_STATE_ID, "last_bucket": CLOSED - timedelta(hours=1)}])
+    service.projects_collection = FakeCollection([{
+        "project_key": "proj_test", "status": "active",
+        "config": {"auto_analysis": True, **(config or {})}
+    }])
+    service.rollup_service.rollup_collection = FakeCollection(rollups)
+    return service
+
+
+def dispatcher():
+    return AsyncMock(side_effect=lambda trace_id, project_key: f"analysis_{trace_id}")
+
+
+def statuses(service):
+    return {(doc["path"], doc["fingerprint"]): doc["status"] for doc in service.candidates_collection.docs}
+
+
+class TestCandidateFingerprint:
+    """候选指纹测试"""
+
+    def test_same_shape_same_fingerprint(self):
+        record = {
+            "request_info": {"method": "get", "path": "/api/orders"},
+            "performance_metrics": {"total_duration": 1.3},
+            "local_analysis": {"findings": [{"type": "hotspot", "function": "render"}, {"type": "io_wait"}]}
+        }
+        similar = {
+            "request_info": {"method": "GET", "path": "/api/orders"},
+            "performance_metrics": {"total_duration": 1.35},
+            "local_analysis": {"findings": [{"type": "io_wait"}, {"type": "hotspot", "function": "render"}]}
+        }
+        other = {**similar, "local_analysis": {"findings": [{"type": "cpu_bound"}]}}
+
+        assert candidate_fingerprint(record) == candidate_fingerprint(similar)
+        assert candidate_fingerprint(record) != candidate_fingerprint(other)
+
+
+class TestAutoAnalysisSchedule:
+    """自动分析调度测试"""
+
+    @pytest.mark.asyncio
+    async def test_one_trace_per_route_window(self):
+        service = make_service([
+            make_candidate(fingerprint="fp_a", count=12),
+            make_candidate(fingerprint="fp_b", count=3),
+            make_candidate(path="/api/users", fingerprint="fp_c", count=5),
+            make_candidate(path="/api/users", fingerprint="fp_d", bucket=OPEN)
+        ])
+        dispatch = dispatcher()
+
+        result = await service.run(dispatch, now=NOW)
+
+        assert result["queued"] == 2
+        assert {call.args[0] for call in dispatch.call_args_list} == {"trace_/api/orders_fp_a", "trace_/api/users_fp_c"}
+        assert statuses(service) == {
+            ("/api/orders", "fp_a"): CANDIDATE_QUEUED,
+            ("/api/orders", "fp_b"): CANDIDATE_SKIPPED,
+            ("/api/users", "fp_c"): CANDIDATE_QUEUED,
+            # 未关闭的窗口留到下一轮
+            ("/api/users", "fp_d"): CANDIDATE_PENDING
+        }
+        # 调度只读取待处理候选，状态记录推进到已关闭的小时桶
+        assert all(query.get("status") == CANDIDATE_PENDING for query in service.candidates_collection.queries)
+        assert service.state_collection.docs[0]["last_bucket"] == CLOSED
+
+    @pytest.mark.asyncio
+    async def test_recently_analyzed_fingerprint_is_not_resubmitted(self):
+        service = make_service([
+            make_candidate(fingerprint="fp_a", bucket=CLOSED - timedelta(hours=3), status=CANDIDATE_QUEUED,
+                           queued_at=NOW - timedelta(hours=3), analysis_id="analysis_previous"),
+            make_candidate(fingerprint="fp_a", count=8)
+        ])
+        dispatch = dispatcher()
+
+        result = await service.run(dispatch, now=NOW)
+
+        assert result["queued"] == 0
+        dispatch.assert_not_awaited()
+        duplicate = service.candidates_collection.docs[1]
+        assert duplicate["status"] == CANDIDATE_DUPLICATE
+        assert duplicate["analysis_id"] == "analysis_previous"
+
+    @pytest.mark.asyncio
+    async def test_daily_budget_prefers_alerted_routes(self):
+        service = make_service(
+            [
+                make_candidate(path="/api/orders", fingerprint="fp_a", count=50, duration=1.0),
+                make_candidate(path="/api/users", fingerprint="fp_b", count=2, duration=0.8)
+            ],
+            rollups=[make_rollup("/api/users", 20, 5, {"3": 20}, duration_max=0.3)],
+            config={"auto_analysis_budget": 1}
+        )
+        dispatch = dispatcher()
+
+        result = await service.run(dispatch, now=NOW)
+
+        assert result == {"alerts": 1, "queued": 1}
+        dispatch.assert_awaited_once_with("trace_/api/users_fp_b", "proj_test")
+        orders = service.candidates_collection.docs[0]
+        assert orders["status"] == CANDIDATE_SKIPPED
+        assert orders["reason"] == "budget"
+
+    @pytest.mark.asyncio
+    async def test_disabled_project_is_not_scheduled(self):
+        service = make_service([make_candidate()], config={"auto_analysis": False})
+        dispatch = dispatcher()
+
+        result = await service.run(dispatch, now=NOW)
+
+        assert result["queued"] == 0
+        dispatch.assert_not_awaited()
+
+
+class TestThresholdAlerts:
+    """阈值告警测试"""
+
+    @pytest.mark.asyncio
+    async def test_p95_and_error_rate_alerts(self):
+        service = make_service(rollups=[
+            # P95落在 2.5s-5.0s 桶，超过默认阈值2.0s
+            make_rollup("/api/orders", 40, 0, {"6": 10, "9": 30}),
+            make_rollup("/api/users", 30, 3, {"3": 30}, duration_max=0.3),
+            # 请求数不足时不告警
+            make_rollup("/api/health", 5, 5, {"9": 5})
+        ], config={"auto_analysis": False})
+
+        result = await service.run(dispatcher(), now=NOW)
+
+        alerts = {(doc["path"], doc["metric"]): doc for doc in service.alerts_collection.docs}
+        assert result["alerts"] == 2
+        assert set(alerts) == {("/api/orders", "response_time"), ("/api/users", "error_rate")}
+        assert alerts[("/api/orders", "response_time")]["value"] > 2.0
+        assert alerts[("/api/users", "error_rate")]["value"] == pytest.approx(0.1)
+        assert alerts[("/api/users", "error_rate")]["threshold"] == 0.05
+
+    @pytest.mark.asyncio
+    async def test_alert_upsert_keeps_alert_id(self):
+        rollups = [make_rollup("/api/users", 30, 3, {"3": 30}, duration_max=0.3)]
+        service = make_service(rollups=rollups, config={"auto_analysis": False})
+        service.state_collection = FakeCollection()
+
+        await service.run(dispatcher(), now=NOW)
+        alert_id = service.alerts_collection.docs[0]["alert_id"]
+        await service.check_alerts({"proj_test": {"alert_threshold": {"error_rate": 0.05}}}, CLOSED - timedelta(hours=1), OPEN)
+
+        assert len(service.alerts_collection.docs) == 1
+        assert service.alerts_collection.docs[0]["alert_id"] == alert_id
+
+
+class TestIngestCandidate:
+    """数据上报写入候选测试"""
+
+    @pytest.mark.asyncio
+    async def test_only_unexplained_traces_become_candidates(self):
+        from app.models.performance import PerformanceRecordCreate
+        from app.services.performance_service import PerformanceService
+
+        database = Mock()
+        database.performance_records.insert_one = AsyncMock()
+        database.function_calls.insert_many = AsyncMock()
+        with patch("app.services.performance_service.get_database", return_value=database):
+            service = PerformanceService()
+        service.rollup_service = Mock(add_record=AsyncMock())
+        service.counter_service = Mock(increment_record=AsyncMock())
+
+        record = {
+            "trace_id": "trace_slow",
+            "request_info": {"method": "GET", "path": "/api/report"},
+            "response_info": {"status_code": 200},
+            "performance_metrics": {"total_duration": 2.0, "cpu_time": 1.0},
+            "function_calls": [
+                {"call_id": call_id, "parent_call_id": parent_id, "function_name": name,
+                 "file_path": "/srv/app/views.py", "line_number": 10, "duration": duration,
+                 "depth": 0 if parent_id is None else 1, "call_order": 0}
+                for call_id, parent_id, name, duration in [
+                    ("root", None, "handle", 2.0), ("a", "root", "render", 0.5),
+                    ("b", "root", "compute_report", 0.4), ("c", "root", "load_profile", 0.3)
+                ]
+            ]
+        }
+        with patch("app.services.performance_service.anomaly_detector") as detector, \
+             patch("app.services.performance_service.invalidate_project_cache", new=AsyncMock()), \
+             patch("app.services.performance_service.AutoAnalysisService") as auto_analysis:
+            detector.observe = AsyncMock()
+            auto_analysis.return_value.add_candidate = AsyncMock()
+            saved = await service.save_performance_record("proj", PerformanceRecordCreate(**record))
+
+        assert saved.local_analysis["needs_ai"] is True
+        auto_analysis.return_value.add_candidate.assert_awaited_once()
+        assert auto_analysis.return_value.add_candidate.call_args.args[0] == "proj"
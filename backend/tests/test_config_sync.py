@@ -0,0 +1,122 @@
+"""
+远程配置同步测试用例
+"""
+import json
+import pytest
+import sys
+import os
+from unittest.mock import Mock, AsyncMock, patch
+
+# 添加SDK路径到系统路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdk'))
+
+from performance_monitor.core.profiler import ProfilerManager
+from performance_monitor.utils.config import Config
+from app.services.project_service import ProjectService
+
+
+def make_response(status_code, payload=None):
+    """构造HTTP响应"""
+    response = Mock()
+    response.status_code = status_code
+    response.json.return_value = payload
+    return response
+
+
+class TestConfigSync:
+    """SDK配置同步测试"""
+
+    @pytest.fixture
+    def manager(self, tmp_path):
+        config = Config.from_dict({
+            "project_key": "proj_test",
+            "api_endpoint": "http://localhost:8000/api",
+            "async_send": False,
+            "sampling_rate": 0.3,
+            "remote_config": True,
+            "config_cache_path": str(tmp_path / "config.json")
+        })
+        with patch("performance_monitor.core.config_sync.ConfigSync.start"):
+            return ProfilerManager(config)
+
+    def test_poll_applies_and_caches_config(self, manager):
+        """拉取到新配置后热更新并写入磁盘缓存"""
+        sync = manager.config_sync
+        payload = {
+            "project_key": "proj_test",
+            "version": "v1",
+            "config": {"enabled": False, "sampling_rate": 0.05, "exclude_patterns": None}
+        }
+        sync.session.get = Mock(return_value=make_response(200, {"code": 0, "data": payload}))
+
+        assert sync.poll_once()
+        assert manager.config.sampling_rate == 0.05
+        assert manager._enabled is False
+        # 未被后端管理的配置项保持本地值
+        assert "/health" in manager.config.exclude_patterns
+
+        with open(sync.cache_path, encoding="utf-8") as f:
+            assert json.load(f)["version"] == "v1"
+
+    def test_not_modified_sends_etag(self, manager):
+        """配置未变化时携带ETag并跳过更新"""
+        sync = manager.config_sync
+        sync.version = "v1"
+        sync.session.get = Mock(return_value=make_response(304))
+
+        with patch.object(manager, "update_config") as update_config:
+            assert sync.poll_once()
+
+        assert sync.session.get.call_args[1]["headers"]["If-None-Match"] == '"v1"'
+        update_config.assert_not_called()
+
+    def test_cached_config_applied_on_startup(self, manager):
+        """启动时使用磁盘缓存的配置"""
+        sync = manager.config_sync
+        with open(sync.cache_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "project_key": "proj_test",
+                "version": "v2",
+                "config": {"sampling_rate": 0.8, "adaptive_sampling": True}
+            }, f)
+
+        assert sync.load_cached()
+        assert sync.version == "v2"
+        assert manager.config.sampling_rate == 0.8
+        assert manager.sampler is not None
+
+
+class TestSDKConfigService:
+    """后端SDK配置服务测试"""
+
+    @pytest.fixture
+    def service(self):
+        with patch("app.services.project_service.get_database", return_value=None):
+            service = ProjectService()
+        service.collection = Mock()
+        service.collection.find_one = AsyncMock(return_value={
+            "config": {"sampling_rate": 0.1, "enabled": True},
+            "status": "active"
+        })
+        return service
+
+    @pytest.mark.asyncio
+    async def test_cache_miss_loads_from_database(self, service):
+        """缓存未命中时读取数据库并写入缓存"""
+        with patch("app.services.project_service.RedisUtils.cache_get", AsyncMock(return_value=None)), \
+             patch("app.services.project_service.RedisUtils.cache_set", AsyncMock(return_value=True)) as cache_set:
+            payload = await service.get_sdk_config("proj_test")
+
+        assert payload["config"]["sampling_rate"] == 0.1
+        assert payload["version"]
+        cache_set.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_cache_hit_skips_database(self, service):
+        """缓存命中时不访问数据库"""
+        cached = json.dumps({"project_key": "proj_test", "version": "abc", "config": {}})
+        with patch("app.services.project_service.RedisUtils.cache_get", AsyncMock(return_value=cached)):
+            payload = await service.get_sdk_config("proj_test")
+
+        assert payload["version"] == "abc"
+        service.collection.find_one.assert_not_called()
@@ -0,0 +1,160 @@
+"""
+仪表盘计数器测试用例
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.services.counter_service import CounterService, GLOBAL_COUNTER_ID
+from app.services.performance_service import PerformanceService
+from conftest import matches
+
+
+def make_cursor(docs):
+    cursor = Mock()
+    cursor.to_list = AsyncMock(return_value=docs)
+    return cursor
+
+
+@pytest.fixture
+def counter_service():
+    with patch("app.services.counter_service.get_database", return_value=None):
+        service = CounterService()
+    service.collection = Mock()
+    service.collection.bulk_write = AsyncMock()
+    service.collection.update_many = AsyncMock()
+    service.performance_collection = Mock()
+    return service
+
+
+@pytest.fixture
+def performance_service(counter_service):
+    with patch("app.services.performance_service.get_database", return_value=None), \
+         patch("app.services.counter_service.get_database", return_value=None):
+        service = PerformanceService()
+    service.counter_service = counter_service
+    service.performance_collection = Mock()
+    return service
+
+
+class TestCounterService:
+    """计数器维护测试"""
+
+    @pytest.mark.asyncio
+    async def test_ingest_increments_global_and_project(self, counter_service):
+        await counter_service.increment_record("proj_a", 0.25, True)
+
+        operations = counter_service.collection.bulk_write.call_args[0][0]
+        assert [op._filter["_id"] for op in operations] == [GLOBAL_COUNTER_ID, "project:proj_a"]
+        assert operations[0]._doc["$inc"] == {"record_count": 1, "duration_sum": 0.25, "error_count": 1}
+        assert all(op._upsert for op in operations)
+
+    @pytest.mark.asyncio
+    async def test_reconcile_rebuilds_counters(self, counter_service):
+        counter_service.collection.find = Mock(return_value=make_cursor([
+            {"_id": "project:proj_c", "record_count": 4, "duration_sum": 0.8, "error_count": 2}
+        ]))
+        counter_service.performance_collection.aggregate = Mock(return_value=make_cursor([
+            {"_id": "proj_a", "record_count": 3, "duration_sum": 0.6, "error_count": 1},
+            {"_id": "proj_b", "record_count": 2, "duration_sum": 0.4, "error_count": 0}
+        ]))
+
+        result = await counter_service.reconcile()
+
+        assert result["record_count"] == 5
+        operations = counter_service.collection.bulk_write.call_args[0][0]
+        deltas = {op._filter["_id"]: op._doc["$inc"] for op in operations}
+        assert deltas[GLOBAL_COUNTER_ID]["duration_sum"] == pytest.approx(1.0)
+        assert deltas["project:proj_a"] == {"record_count": 3, "duration_sum": 0.6, "error_count": 1}
+        # 已无记录的项目计数清零
+        assert deltas["project:proj_c"] == {"record_count": -4, "duration_sum": -0.8, "error_count": -2}
+
+    @pytest.mark.asyncio
+    async def test_reconcile_keeps_increments_during_aggregation(self, counter_service):
+        counters = {
+            GLOBAL_COUNTER_ID: {"_id": GLOBAL_COUNTER_ID, "record_count": 10, "duration_sum": 2.0, "error_count": 0},
+            "project:proj_a": {"_id": "project:proj_a", "record_count": 10, "duration_sum": 2.0, "error_count": 0}
+        }
+        counter_service.collection.find = Mock(return_value=make_cursor([dict(doc) for doc in counters.values()]))
+
+        async def aggregate_with_concurrent_ingest(*args, **kwargs):
+            # 聚合期间有一条新记录上报，聚合结果未包含它
+            for doc in counters.values():
+                doc["record_count"] += 1
+            return [{"_id": "proj_a", "record_count": 8, "duration_sum": 1.6, "error_count": 0}]
+
+        counter_service.performance_collection.aggregate = Mock(return_value=Mock(to_list=aggregate_with_concurrent_ingest))
+
+        await counter_service.reconcile()
+
+        for op in counter_service.collection.bulk_write.call_args[0][0]:
+            counters[op._filter["_id"]]["record_count"] += op._doc["$inc"]["record_count"]
+        assert counters["project:proj_a"]["record_count"] == 9
+        assert counters[GLOBAL_COUNTER_ID]["record_count"] == 9
+
+    @pytest.mark.asyncio
+    async def test_reconcile_skips_records_written_after_snapshot(self, counter_service):
+        records = [{"project_key": "proj_a", "timestamp": datetime.utcnow() - timedelta(hours=1),
+                    "performance_metrics": {"total_duration": 0.2}, "response_info": {"status_code": 200}}]
+        counters = {
+            GLOBAL_COUNTER_ID: {"_id": GLOBAL_COUNTER_ID, "record_count": 1, "duration_sum": 0.2, "error_count": 0},
+            "project:proj_a": {"_id": "project:proj_a", "record_count": 1, "duration_sum": 0.2, "error_count": 0}
+        }
+        counter_service.collection.find = Mock(return_value=make_cursor([dict(doc) for doc in counters.values()]))
+
+        def aggregate_with_concurrent_ingest(pipeline, **kwargs):
+            # 快照之后、聚合扫描到之前写入一条新记录并递增计数器
+            records.append({**records[0], "timestamp": datetime.utcnow() + timedelta(seconds=1)})
+            for doc in counters.values():
+                doc["record_count"] += 1
+            matched = [record for record in records if matches(record, pipeline[0]["$match"])]
+            return make_cursor([{"_id": "proj_a", "record_count": len(matched), "duration_sum": 0.2 * len(matched),
+                                 "error_count": 0}])
+
+        counter_service.performance_collection.aggregate = Mock(side_effect=aggregate_with_concurrent_ingest)
+
+        await counter_service.reconcile()
+
+        for op in counter_service.collection.bulk_write.call_args[0][0]:
+            counters[op._filter["_id"]]["record_count"] += op._doc["$inc"]["record_count"]
+        assert counters["project:proj_a"]["record_count"] == 2
+        assert counters[GLOBAL_COUNTER_ID]["record_count"] == 2
+
+
+class TestDashboardCounters:
+    """仪表盘统计读取计数器测试"""
+
+    @pytest.mark.asyncio
+    async def test_stats_read_counters(self, performance_service):
+        performance_service.counter_service.collection.find_one = AsyncMock(return_value={
+            "_id": GLOBAL_COUNTER_ID, "record_count": 4, "duration_sum": 1.0
+        })
+        performance_service.performance_collection.count_documents = AsyncMock()
+        performance_service.performance_collection.aggregate = Mock()
+
+        assert await performance_service.get_total_records_count() == 4
+        assert await performance_service.get_average_response_time() == pytest.approx(250.0)
+        performance_service.performance_collection.count_documents.assert_not_called()
+        performance_service.performance_collection.aggregate.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_missing_counters_use_estimate(self, performance_service):
+        performance_service.counter_service.collection.find_one = AsyncMock(return_value=None)
+        performance_service.performance_collection.estimated_document_count = AsyncMock(return_value=42)
+
+        assert await performance_service.get_total_records_count() == 42
+
+    @pytest.mark.asyncio
+    async def test_project_counts_fall_back_for_missing_projects(self, performance_service):
+        performance_service.counter_service.collection.find = Mock(return_value=make_cursor([
+            {"_id": "project:proj_a", "record_count": 7}
+        ]))
+        performance_service.performance_collection.aggregate = Mock(return_value=make_cursor([
+            {"_id": "proj_b", "count": 2}
+        ]))
+
+        counts = await performance_service.get_record_counts_by_projects(["proj_a", "proj_b", "proj_c"])
+
+        assert counts == {"proj_a": 7, "proj_b": 2, "proj_c": 0}
+        pipeline = performance_service.performance_collection.aggregate.call_args[0][0]
+        assert pipeline[0]["$match"]["project_key"]["$in"] == ["proj_b", "proj_c"]
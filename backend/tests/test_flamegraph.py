@@ -0,0 +1,210 @@
+"""
+合并火焰图测试用例
+"""
+import time
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.models.performance import PerformanceRecord
+from app.utils.stacks import OTHER_STACK, stack_key
+from app.services.rollup_service import RollupService, cap_stacks
+from app.utils.flamegraph import build_flame_tree, prune_flame_tree, render_flame_graph
+
+
+STACKS = {
+    "view (app.py:10)": [10, 0.5],
+    "view (app.py:10);query (db.py:20)": [10, 2.0],
+    "view (app.py:10);render (tpl.py:30)": [10, 0.49],
+    "view (app.py:10);log (log.py:5)": [10, 0.01]
+}
+
+
+class AsyncCursor:
+    """模拟Motor异步游标"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def make_rollup_service():
+    with patch("app.services.rollup_service.get_database", return_value=None):
+        service = RollupService()
+    service.rollup_collection = Mock()
+    service.rollup_collection.update_one = AsyncMock()
+    service.rollup_collection.find_one = AsyncMock(return_value=None)
+    return service
+
+
+class TestFlameGraphRendering:
+    """火焰图构建与输出测试"""
+
+    def test_tree_totals_include_children(self):
+        root = build_flame_tree(STACKS)
+
+        view = root.children["view (app.py:10)"]
+        assert root.total == pytest.approx(3.0)
+        assert view.total == pytest.approx(3.0)
+        assert view.self_time == pytest.approx(0.5)
+
+    def test_pruned_weight_is_kept_in_parent(self):
+        root = build_flame_tree(STACKS)
+
+        assert prune_flame_tree(root, 0.01) == 1
+
+        view = root.children["view (app.py:10)"]
+        assert "log (log.py:5)" not in view.children
+        assert view.self_time == pytest.approx(0.51)
+        assert view.total == pytest.approx(3.0)
+
+    def test_collapsed_output(self):
+        result = render_flame_graph(STACKS, "collapsed", min_weight=0)
+
+        lines = result["data"].split("\n")
+        assert "view (app.py:10);query (db.py:20) 2000000" in lines
+        assert len(lines) == 4
+
+    def test_speedscope_output(self):
+        result = render_flame_graph(STACKS, "speedscope", min_weight=0.01, name="GET /api/users")
+
+        profile = result["data"]["profiles"][0]
+        frames = result["data"]["shared"]["frames"]
+        assert profile["type"] == "sampled"
+        assert len(profile["samples"]) == len(profile["weights"]) == 3
+        assert sum(profile["weights"]) == pytest.approx(3.0)
+        assert all(0 <= index < len(frames) for sample in profile["samples"] for index in sample)
+
+    def test_large_stack_table_renders_quickly(self):
+        """多天范围的调用栈表（数万个调用栈）应在1秒内完成合并与裁剪"""
+        stacks = {}
+        for i in range(200):
+            for j in range(200):
+                stacks[f"view (app.py:1);handler{i} (h.py:{i});leaf{j} (l.py:{j})"] = [1, 0.001 * (j + 1)]
+
+        started = time.perf_counter()
+        result = render_flame_graph(stacks, "tree", min_weight=0.001)
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < 1.0
+        assert result["pruned_nodes"] > 0
+        assert result["total_time"] == pytest.approx(sum(v[1] for v in stacks.values()))
+
+
+class TestRollupService:
+    """路由rollup测试"""
+
+    @pytest.mark.asyncio
+    async def test_record_is_folded_into_hourly_bucket(self):
+        service = make_rollup_service()
+        record = PerformanceRecord(
+            project_key="proj_test",
+            trace_id="t1",
+            timestamp=datetime(2024, 1, 1, 10, 35, 12),
+            request_info={"method": "GET", "path": "/api/users"},
+            response_info={"status_code": 503},
+            performance_metrics={"total_duration": 0.3},
+            version_info={"app_version": "1.2.0", "git_commit": "abc123"},
+            sampling_info={"mode": "fixed", "sampling_rate": 0.25},
+            function_calls=[
+                {"call_id": "0", "function_name": "view", "file_path": "app.py", "line_number": 10,
+                 "duration": 0.3, "depth": 0, "call_order": 0},
+                {"call_id": "1", "parent_call_id": "0", "function_name": "query", "file_path": "db.py",
+                 "line_number": 20, "duration": 0.2, "depth": 1, "call_order": 1}
+            ]
+        )
+
+        await service.add_record("proj_test", record)
+
+        query, update = service.rollup_collection.update_one.call_args[0]
+        assert query["bucket"] == datetime(2024, 1, 1, 10)
+        assert query["git_commit"] == "abc123"
+        assert update["$inc"]["weighted_count"] == pytest.approx(4.0)
+        assert update["$inc"]["error_count"] == 1
+        assert update["$inc"]["latency_counts.6"] == 1
+        key = stack_key("view (app.py:10);query (db.py:20)")
+        assert update["$inc"][f"stacks.{key}.self_time"] == pytest.approx(0.2)
+        assert update["$set"][f"stacks.{key}.stack"] == "view (app.py:10);query (db.py:20)"
+
+    @pytest.mark.asyncio
+    async def test_forced_sample_counts_once(self):
+        service = make_rollup_service()
+        # 旧版SDK的覆盖补采记录仍携带当时的自适应采样率
+        record = PerformanceRecord(
+            project_key="proj_test",
+            trace_id="t1",
+            timestamp=datetime(2024, 1, 1, 10, 35, 12),
+            request_info={"method": "GET", "path": "/api/rare"},
+            response_info={"status_code": 200},
+            performance_metrics={"total_duration": 0.1},
+            sampling_info={"mode": "adaptive", "sampling_rate": 0.001, "forced": True}
+        )
+
+        await service.add_record("proj_test", record)
+
+        update = service.rollup_collection.update_one.call_args[0][1]
+        assert update["$inc"]["weighted_count"] == pytest.approx(1.0)
+        assert service.rollup_collection.update_one.call_args[1]["upsert"] is True
+
+    def test_new_stacks_beyond_room_fold_into_other(self):
+        entries = {
+            stack_key(name): {"stack": name, "count": 1, "self_time": self_time}
+            for name, self_time in [("a", 0.3), ("b", 0.2), ("c", 0.1), ("known", 0.01)]
+        }
+
+        capped = cap_stacks(entries, known={stack_key("known")}, room=1)
+
+        # 已有的调用栈照常累加，新调用栈只保留耗时最高的一个
+        assert {entry["stack"] for entry in capped.values()} == {"a", "known", OTHER_STACK}
+        other = capped[stack_key(OTHER_STACK)]
+        assert other["count"] == 2
+        assert other["self_time"] == pytest.approx(0.3)
+
+    @pytest.mark.asyncio
+    async def test_full_rollup_document_only_grows_other(self):
+        service = make_rollup_service()
+        service.rollup_collection.find_one = AsyncMock(return_value={"stack_total": 500, "stacks": {}})
+        record = PerformanceRecord(
+            project_key="proj_test", trace_id="t1",
+            request_info={"method": "GET", "path": "/api/users"},
+            response_info={"status_code": 200},
+            performance_metrics={"total_duration": 0.3},
+            function_calls=[
+                {"call_id": "0", "function_name": "view", "file_path": "app.py", "line_number": 10,
+                 "duration": 0.3, "depth": 0, "call_order": 0}
+            ]
+        )
+
+        with patch("app.services.rollup_service.settings.rollup_max_stacks", 500):
+            await service.add_record("proj_test", record)
+
+        _, update = service.rollup_collection.update_one.call_args[0]
+        stack_fields = [field for field in update["$inc"] if field.startswith("stacks.")]
+        assert stack_fields == [f"stacks.{stack_key(OTHER_STACK)}.count", f"stacks.{stack_key(OTHER_STACK)}.self_time"]
+        assert update["$inc"][f"stacks.{stack_key(OTHER_STACK)}.self_time"] == pytest.approx(0.3)
+
+    @pytest.mark.asyncio
+    async def test_stack_tables_are_merged_across_buckets(self):
+        service = make_rollup_service()
+        stack = "view (app.py:10)"
+        docs = [
+            {"request_count": 3, "stacks": {stack_key(stack): {"stack": stack, "count": 3, "self_time": 0.3}}},
+            {"request_count": 2, "stacks": {stack_key(stack): {"stack": stack, "count": 2, "self_time": 0.2}}}
+        ]
+        service.rollup_collection.find = Mock(return_value=AsyncCursor(docs))
+
+        query = service.build_query("proj_test", datetime(2024, 1, 1, 10, 30), path="/api/users")
+        stacks, request_count = await service.get_stack_table(query)
+
+        assert query["bucket"] == {"$gte": datetime(2024, 1, 1, 10)}
+        assert request_count == 5
+        assert stacks[stack] == [5, pytest.approx(0.5)]
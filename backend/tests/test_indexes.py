@@ -0,0 +1,202 @@
+"""
+索引注册表测试用例
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, AsyncMock
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+from app.config.settings import settings
+from app.scripts.index_advisor import explain_query
+from app.utils.indexes import (
+    INDEX_REGISTRY, QUERY_SHAPES, serving_index, ensure_indexes, check_indexes, index_key
+)
+
+NOW = datetime(2024, 3, 1)
+
+
+class AsyncCursor:
+    def __init__(self, docs):
+        self._iter = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def make_collection(index_information=None, stats=None):
+    collection = Mock()
+    collection.create_index = AsyncMock()
+    collection.index_information = AsyncMock(return_value=index_information or {"_id_": {"key": [("_id", 1)]}})
+    collection.aggregate = Mock(side_effect=lambda pipeline: AsyncCursor(stats or []))
+    return collection
+
+
+class FakeDatabase:
+    def __init__(self, collections=None):
+        self.collections = collections or {}
+        self.command = AsyncMock()
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = make_collection()
+        return self.collections[name]
+
+
+class TestRegistry:
+    """注册表与查询形态测试"""
+
+    @pytest.mark.parametrize("collection,description,query,sort", QUERY_SHAPES,
+                             ids=[f"{shape[0]}:{shape[1]}" for shape in QUERY_SHAPES])
+    def test_every_query_has_index(self, collection, description, query, sort):
+        assert serving_index(collection, query, sort) is not None
+
+    def test_record_filters_use_compound_indexes(self):
+        path_index = serving_index("performance_records", {
+            "project_key": "proj", "request_info.normalized_path": {"$regex": "^/api/orders"}
+        }, [("timestamp", -1)])
+        status_index = serving_index("performance_records", {
+            "project_key": "proj", "response_info.status_code": 500
+        }, [("timestamp", -1)])
+
+        assert path_index == [("project_key", 1), ("request_info.normalized_path", 1), ("timestamp", -1)]
+        assert status_index == [("project_key", 1), ("response_info.status_code", 1), ("timestamp", -1)]
+
+    def test_no_redundant_prefix_indexes(self):
+        # 普通索引如果是同集合另一个索引的前缀，查询可以直接使用较长的索引
+        for name, specs in INDEX_REGISTRY.items():
+            keys = [index_key(spec_keys) for spec_keys, _ in specs]
+            for spec_keys, options in specs:
+                if options:
+                    continue
+                key = index_key(spec_keys)
+                assert not any(other != key and other[:len(key)] == key for other in keys), (name, key)
+
+
+class TestEnsureIndexes:
+    """索引创建测试"""
+
+    @pytest.mark.asyncio
+    async def test_conflict_does_not_abort_remaining_indexes(self):
+        db = FakeDatabase()
+        projects = make_collection()
+        projects.create_index.side_effect = [OperationFailure("conflict", code=85)] + [None] * 10
+        db.collections["projects"] = projects
+
+        result = await ensure_indexes(db, ["projects", "system_config"])
+
+        assert result["failed"] == 1
+        assert result["created"] == len(INDEX_REGISTRY["projects"]) - 1 + len(INDEX_REGISTRY["system_config"])
+        db.collections["system_config"].create_index.assert_awaited()
+
+    @pytest.mark.asyncio
+    async def test_ttl_conflict_updates_expiry(self):
+        db = FakeDatabase()
+        analysis = make_collection()
+
+        async def create_index(keys, **options):
+            if "expireAfterSeconds" in options:
+                raise OperationFailure("conflict", code=85)
+
+        analysis.create_index = AsyncMock(side_effect=create_index)
+        db.collections["ai_analysis_results"] = analysis
+
+        result = await ensure_indexes(db, ["ai_analysis_results"], update_ttl=True)
+
+        assert result == {"created": len(INDEX_REGISTRY["ai_analysis_results"]) - 1, "modified": 1, "failed": 0}
+        args, kwargs = db.command.call_args
+        assert args == ("collMod", "ai_analysis_results")
+        assert kwargs["index"] == {"keyPattern": {"created_at": 1}, "expireAfterSeconds": 15552000}
+
+    @pytest.mark.asyncio
+    async def test_ttl_conflict_not_modified_by_default(self):
+        db = FakeDatabase()
+        analysis = make_collection()
+
+        async def create_index(keys, **options):
+            if "expireAfterSeconds" in options:
+                raise OperationFailure("conflict", code=85)
+
+        analysis.create_index = AsyncMock(side_effect=create_index)
+        db.collections["ai_analysis_results"] = analysis
+
+        result = await ensure_indexes(db, ["ai_analysis_results"])
+
+        # 启动时不修改已有TTL，避免缩短过期时间删除数据
+        assert result == {"created": len(INDEX_REGISTRY["ai_analysis_results"]) - 1, "modified": 0, "failed": 1}
+        db.command.assert_not_called()
+
+
+class TestCheckIndexes:
+    """索引检查测试"""
+
+    @pytest.mark.asyncio
+    async def test_reports_missing_unregistered_and_unused(self):
+        information = {"_id_": {"key": [("_id", 1)]}}
+        information.update({
+            f"index_{i}": {"key": keys} for i, (keys, _) in enumerate(INDEX_REGISTRY["projects"][1:])
+        })
+        information["last_activity_1"] = {"key": [("last_activity", 1)]}
+        stats = [
+            {"name": "index_0", "key": dict(INDEX_REGISTRY["projects"][1][0]),
+             "accesses": {"ops": 0, "since": NOW - timedelta(days=30)}},
+            {"name": "index_1", "key": dict(INDEX_REGISTRY["projects"][2][0]),
+             "accesses": {"ops": 0, "since": NOW - timedelta(hours=1)}},
+            {"name": "index_2", "key": dict(INDEX_REGISTRY["projects"][3][0]),
+             "accesses": {"ops": 12, "since": NOW - timedelta(days=30)}}
+        ]
+        db = FakeDatabase({"projects": make_collection(information, stats)})
+
+        report = await check_indexes(db, now=NOW)
+
+        assert report["projects"] == {
+            "missing": ["project_key_1"],
+            "unregistered": ["last_activity_1"],
+            # 新建不久的索引不报告为未使用
+            "unused": ["index_0"]
+        }
+        assert len(report) == len(INDEX_REGISTRY)
+
+    @pytest.mark.asyncio
+    async def test_index_stats_permission_error_is_tolerated(self):
+        information = {"_id_": {"key": [("_id", 1)]}}
+        information.update({
+            f"index_{i}": {"key": keys} for i, (keys, _) in enumerate(INDEX_REGISTRY["system_config"])
+        })
+        collection = make_collection(information)
+        collection.aggregate = Mock(side_effect=OperationFailure("not authorized", code=13))
+        db = FakeDatabase({"system_config": collection})
+
+        report = await check_indexes(db, now=NOW)
+
+        assert "system_config" not in report
+
+
+@pytest.mark.asyncio
+async def test_service_queries_do_not_collscan():
+    """在真实MongoDB上对每个服务查询执行explain，不可连接时跳过"""
+    client = AsyncIOMotorClient(settings.mongodb_url, serverSelectionTimeoutMS=500)
+    try:
+        await client.admin.command("ping")
+    except Exception:
+        client.close()
+        pytest.skip("MongoDB不可用")
+
+    db_name = f"{settings.mongodb_database}_index_test"
+    db = client[db_name]
+    try:
+        result = await ensure_indexes(db)
+        assert result["failed"] == 0
+        for collection, description, query, sort in QUERY_SHAPES:
+            stages = await explain_query(db, collection, query, sort)
+            assert "COLLSCAN" not in stages, f"{collection}: {description}"
+    finally:
+        await client.drop_database(db_name)
+        client.close()
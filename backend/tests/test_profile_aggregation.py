@@ -0,0 +1,210 @@
+"""
+SDK进程内聚合测试用例
+"""
+import pytest
+import sys
+import os
+from unittest.mock import Mock, AsyncMock, patch
+
+# 添加SDK路径到系统路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdk'))
+
+from performance_monitor.core.aggregator import ProfileAggregator, collapse_function_calls, OTHER_STACK
+from performance_monitor.core.profiler import ProfilerManager
+from performance_monitor.utils.config import Config
+from app.models.performance import ProfileAggregateBatch, PerformanceRecordCreate
+from app.services.performance_service import PerformanceService
+from app.services.rollup_service import RollupService
+
+
+def make_config(**kwargs):
+    """创建测试配置"""
+    options = {
+        "project_key": "test_project",
+        "api_endpoint": "http://localhost:8000/api",
+        "async_send": False,
+        "aggregation_mode": True,
+        "aggregation_exemplars": 2
+    }
+    options.update(kwargs)
+    return Config.from_dict(options)
+
+
+def make_record(trace_id, duration=0.3, status_code=200, path="/api/users"):
+    """构造一条带调用链路的性能记录"""
+    return {
+        "trace_id": trace_id,
+        "request_info": {"method": "GET", "path": path},
+        "response_info": {"status_code": status_code},
+        "performance_metrics": {"total_duration": duration},
+        "sampling_info": {"mode": "fixed", "sampling_rate": 0.5, "forced": False},
+        "function_calls": [
+            {"call_id": f"{trace_id}_0", "parent_call_id": None, "function_name": "view",
+             "file_path": "app.py", "line_number": 10, "duration": 0.3},
+            {"call_id": f"{trace_id}_1", "parent_call_id": f"{trace_id}_0", "function_name": "query",
+             "file_path": "db.py", "line_number": 20, "duration": 0.2},
+            {"call_id": f"{trace_id}_2", "parent_call_id": f"{trace_id}_0", "function_name": "render",
+             "file_path": "tpl.py", "line_number": 30, "duration": 0.05}
+        ]
+    }
+
+
+class TestCollapseFunctionCalls:
+    """调用栈折叠测试"""
+
+    def test_self_time_excludes_children(self):
+        collapsed = collapse_function_calls(make_record("t1")["function_calls"])
+
+        assert collapsed["view (app.py:10)"] == (1, pytest.approx(0.05))
+        assert collapsed["view (app.py:10);query (db.py:20)"] == (1, pytest.approx(0.2))
+        assert collapsed["view (app.py:10);render (tpl.py:30)"] == (1, pytest.approx(0.05))
+
+    def test_deep_stack_does_not_recurse(self):
+        calls = [
+            {"call_id": str(i), "parent_call_id": str(i - 1) if i else None,
+             "function_name": f"f{i}", "file_path": "deep.py", "line_number": i, "duration": 1.0}
+            for i in range(3000)
+        ]
+        collapsed = collapse_function_calls(calls)
+
+        assert len(collapsed) == 3000
+
+
+class TestProfileAggregator:
+    """聚合器测试"""
+
+    def test_records_merge_into_one_aggregate_per_route(self):
+        aggregator = ProfileAggregator(make_config())
+        for i in range(10):
+            aggregator.add(make_record(f"t{i}", status_code=500 if i == 0 else 200))
+
+        aggregates, exemplars = aggregator.drain()
+
+        assert len(aggregates) == 1
+        aggregate = aggregates[0]
+        assert aggregate["request_count"] == 10
+        assert aggregate["weighted_count"] == pytest.approx(20.0)
+        assert aggregate["error_count"] == 1
+        assert sum(aggregate["latency_histogram"]["counts"]) == 10
+        query_stack = next(s for s in aggregate["stacks"] if s["stack"].endswith("query (db.py:20)"))
+        assert query_stack["count"] == 10
+        assert query_stack["self_time"] == pytest.approx(2.0)
+        assert len(exemplars) == 2
+        assert aggregate["exemplar_trace_ids"] == [r["trace_id"] for r in exemplars]
+
+        # 上报后开始新窗口
+        assert aggregator.drain() == ([], [])
+
+    def test_forced_samples_weighted_once(self):
+        aggregator = ProfileAggregator(make_config())
+        for i in range(3):
+            record = make_record(f"t{i}")
+            record["sampling_info"] = {"mode": "adaptive", "sampling_rate": 0.001, "forced": True}
+            aggregator.add(record)
+
+        aggregates, _ = aggregator.drain()
+
+        assert aggregates[0]["weighted_count"] == pytest.approx(3.0)
+
+    def test_low_weight_stacks_are_folded(self):
+        aggregator = ProfileAggregator(make_config(aggregation_max_stacks=1))
+        aggregator.add(make_record("t1"))
+
+        aggregates, _ = aggregator.drain()
+
+        stacks = aggregates[0]["stacks"]
+        assert len(stacks) == 2
+        assert stacks[0]["stack"].endswith("query (db.py:20)")
+        assert stacks[1]["stack"] == OTHER_STACK
+        assert stacks[1]["self_time"] == pytest.approx(0.1)
+
+    def test_payload_matches_backend_model(self):
+        aggregator = ProfileAggregator(make_config(git_commit="abc123"))
+        aggregator.add(make_record("t1"))
+
+        aggregates, _ = aggregator.drain()
+        batch = ProfileAggregateBatch(aggregates=aggregates)
+
+        assert batch.aggregates[0].version_info.git_commit == "abc123"
+        assert batch.aggregates[0].stacks[0].count == 1
+
+
+class TestProfilerManagerAggregation:
+    """分析器管理器聚合模式测试"""
+
+    def test_aggregation_mode_skips_per_request_send(self):
+        with patch("performance_monitor.core.aggregator.ProfileAggregator.start"):
+            manager = ProfilerManager(make_config(sampling_rate=1.0))
+
+        with patch.object(manager.data_sender, "send_sync") as send_sync, \
+             patch.object(manager.data_sender, "send_aggregates") as send_aggregates, \
+             patch.object(manager.data_sender, "send_batch") as send_batch:
+            manager.start_profiling({"method": "GET", "path": "/api/users"})
+            assert manager.stop_profiling({"status_code": 200})
+            send_sync.assert_not_called()
+
+            aggregates, exemplars = manager.aggregator.drain()
+            manager._ship_aggregates(aggregates, exemplars)
+
+        send_aggregates.assert_called_once_with(aggregates)
+        send_batch.assert_called_once_with(exemplars)
+
+    def test_shutdown_flushes_open_window(self):
+        with patch("performance_monitor.core.aggregator.ProfileAggregator.start"), \
+             patch("performance_monitor.core.profiler.atexit.register") as register:
+            manager = ProfilerManager(make_config(sampling_rate=1.0))
+        register.assert_called_once_with(manager.shutdown)
+        manager.aggregator._flush_callback = manager._ship_aggregates
+
+        with patch.object(manager.data_sender, "send_aggregates") as send_aggregates, \
+             patch.object(manager.data_sender, "send_batch"):
+            manager.start_profiling({"method": "GET", "path": "/api/users"})
+            assert manager.stop_profiling({"status_code": 200})
+            manager.shutdown()
+            manager.shutdown()
+
+        send_aggregates.assert_called_once()
+        assert send_aggregates.call_args[0][0][0]["path"] == "/api/users"
+        assert manager.aggregator.drain() == ([], [])
+
+
+class TestAggregationWindowTotals:
+    """聚合窗口上报后的rollup总量"""
+
+    @pytest.mark.asyncio
+    async def test_exemplars_not_counted_twice(self):
+        aggregator = ProfileAggregator(make_config())
+        for i in range(5):
+            aggregator.add(make_record(f"t{i}", status_code=500 if i == 0 else 200))
+        aggregates, exemplars = aggregator.drain()
+        assert len(exemplars) == 2
+
+        database = Mock()
+        database.performance_records.insert_one = AsyncMock()
+        database.function_calls.insert_many = AsyncMock()
+        database.profile_aggregates.insert_many = AsyncMock()
+        with patch("app.services.performance_service.get_database", return_value=database), \
+             patch("app.services.rollup_service.get_database", return_value=None):
+            service = PerformanceService()
+            service.rollup_service = RollupService()
+        service.rollup_service._upsert = AsyncMock()
+        service.counter_service = Mock(increment_record=AsyncMock())
+
+        with patch("app.services.performance_service.anomaly_detector") as detector, \
+             patch("app.services.performance_service.invalidate_project_cache", new=AsyncMock()):
+            detector.observe = AsyncMock()
+            batch = ProfileAggregateBatch(aggregates=aggregates)
+            await service.save_profile_aggregates("test_project", batch.aggregates)
+            for exemplar in exemplars:
+                calls = [{**call, "depth": 0, "call_order": index} for index, call in enumerate(exemplar["function_calls"])]
+                await service.save_performance_record(
+                    "test_project", PerformanceRecordCreate(**{**exemplar, "function_calls": calls})
+                )
+
+        upserts = [call.kwargs for call in service.rollup_service._upsert.call_args_list]
+        assert sum(upsert["request_count"] for upsert in upserts) == 5
+        assert sum(upsert["error_count"] for upsert in upserts) == 1
+        # 样例链路照常保存，但不计入计数器和异常检测
+        assert database.performance_records.insert_one.await_count == 2
+        service.counter_service.increment_record.assert_not_called()
+        detector.observe.assert_not_called()
@@ -0,0 +1,126 @@
+"""
+版本性能对比测试用例
+"""
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+from app.utils.latency import histogram_percentile
+from app.utils.stacks import stack_key
+from app.services.rollup_service import RollupService
+from app.utils.profile_diff import function_times, diff_profiles
+
+
+class AsyncCursor:
+    """模拟Motor异步游标"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def make_summary(request_count, stacks, latency_counts, duration_max=1.0):
+    """构造rollup汇总数据"""
+    counts = [0] * 12
+    for index, count in latency_counts.items():
+        counts[index] = count
+    return {
+        "request_count": request_count,
+        "weighted_count": float(request_count),
+        "error_count": 0,
+        "duration_sum": 0.1 * request_count,
+        "duration_max": duration_max,
+        "latency_counts": counts,
+        "stacks": stacks
+    }
+
+
+class TestHistogramPercentile:
+    """直方图分位数测试"""
+
+    def test_interpolates_within_bucket(self):
+        counts = [0] * 12
+        counts[4] = 100  # (0.05, 0.1]
+
+        assert histogram_percentile(counts, 50) == pytest.approx(0.075)
+        assert histogram_percentile(counts, 100) == pytest.approx(0.1)
+
+    def test_overflow_bucket_uses_max_duration(self):
+        counts = [0] * 12
+        counts[11] = 1
+
+        assert histogram_percentile(counts, 99, duration_max=30.0) == pytest.approx(29.8, rel=0.01)
+        assert histogram_percentile([0] * 12, 95) == 0.0
+
+
+class TestDiffProfiles:
+    """差异对比测试"""
+
+    def test_function_times_count_recursion_once(self):
+        times = function_times({
+            "a;b;a": [1, 1.0],
+            "a;b": [1, 0.5]
+        })
+
+        assert times["a"] == (pytest.approx(1.0), pytest.approx(1.5))
+        assert times["b"] == (pytest.approx(0.5), pytest.approx(1.5))
+
+    def test_reports_deltas_and_hot_frames(self):
+        baseline = make_summary(10, {
+            "view": [10, 0.5],
+            "view;cache_get": [10, 0.5]
+        }, {3: 10})
+        target = make_summary(20, {
+            "view": [20, 1.0],
+            "view;orm_query": [20, 8.0]
+        }, {6: 20})
+
+        result = diff_profiles(baseline, target)
+
+        # 按单请求平均耗时对比：view总耗时 0.1s -> 0.45s
+        view = next(item for item in result["functions"] if item["function"] == "view")
+        assert view["baseline_total_time"] == pytest.approx(0.1)
+        assert view["target_total_time"] == pytest.approx(0.45)
+        assert result["functions"][0]["function"] == "orm_query"
+        assert [item["function"] for item in result["new_hot_frames"]] == ["orm_query"]
+        assert [item["function"] for item in result["removed_hot_frames"]] == ["cache_get"]
+        assert result["latency_shift"]["p95"]["delta"] > 0
+        assert result["target"]["p50"] > result["baseline"]["p50"]
+
+
+class TestRouteSummary:
+    """rollup汇总测试"""
+
+    @pytest.mark.asyncio
+    async def test_version_filter_and_merge(self):
+        with patch("app.services.rollup_service.get_database", return_value=None):
+            service = RollupService()
+        docs = [
+            {"request_count": 2, "weighted_count": 4.0, "error_count": 1, "duration_sum": 0.4,
+             "duration_max": 0.3, "latency_counts": {"5": 2},
+             "stacks": {stack_key("view"): {"stack": "view", "count": 2, "self_time": 0.4}}},
+            {"request_count": 1, "weighted_count": 1.0, "error_count": 0, "duration_sum": 0.2,
+             "duration_max": 0.2, "latency_counts": {"5": 1},
+             "stacks": {stack_key("view"): {"stack": "view", "count": 1, "self_time": 0.2}}}
+        ]
+        service.rollup_collection = Mock()
+        service.rollup_collection.find = Mock(return_value=AsyncCursor(docs))
+
+        query = service.build_query("proj_test", datetime(2024, 1, 1), path="/api/users", git_commit="abc123")
+        summary = await service.get_route_summary(query)
+
+        assert query["git_commit"] == "abc123"
+        assert summary["request_count"] == 3
+        assert summary["error_count"] == 1
+        assert summary["duration_max"] == pytest.approx(0.3)
+        assert summary["latency_counts"][5] == 3
+        assert summary["stacks"]["view"] == [3, pytest.approx(0.6)]
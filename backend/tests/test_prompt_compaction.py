@@ -0,0 +1,120 @@
+"""
+AI分析提示词压缩测试用例
+"""
+import json
+import sys
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+from app.scripts.benchmark_prompt_compaction import synthetic_record
+from app.services.ai_analyzer import PerformanceAnalyzer
+from app.utils import prompt_compaction
+from app.utils.prompt_compaction import count_tokens, summarize_call_tree
+
+
+def call(call_id, parent_id, name, duration, file_path="/srv/app/views.py", depth=0):
+    return {
+        "call_id": call_id, "parent_call_id": parent_id, "function_name": name,
+        "file_path": file_path, "line_number": 10, "duration": duration,
+        "depth": depth, "call_order": 0
+    }
+
+
+class TestCallTreeSummary:
+    """调用树摘要测试"""
+
+    def test_deep_trace_fits_budget(self):
+        function_calls = synthetic_record(1000, 2, 500)["function_calls"]
+        summary = summarize_call_tree(function_calls, token_budget=800, top_k=5)
+
+        assert summary["tokens"] <= 800
+        assert summary["tokens"] == count_tokens(summary["text"])
+        assert summary["pruned_nodes"] > 0
+        assert "### 自身耗时最多的函数\n1. " in summary["text"]
+        assert count_tokens(json.dumps(function_calls)) > 50 * summary["tokens"]
+
+    def test_identical_paths_merged_and_recursion_collapsed(self):
+        function_calls = [call("root", None, "view", 1.0)]
+        parent = "root"
+        for i in range(30):
+            function_calls.append(call(f"r{i}", parent, "walk", 0.9 - i * 0.001, "/srv/app/tree.py", i + 1))
+            parent = f"r{i}"
+        for i in range(200):
+            function_calls.append(call(f"q{i}", parent, "execute_query", 0.004, "/srv/app/db/repository.py", 31))
+
+        summary = summarize_call_tree(function_calls, token_budget=1000)
+
+        assert summary["node_count"] == 32
+        assert "1. execute_query (db/repository.py:10) 自身800.0ms, 总800.0ms, 200次" in summary["text"]
+        assert "walk (app/tree.py:10) ×30" in summary["text"]
+        assert summary["truncated"] is False
+
+    def test_truncates_when_collapsing_is_not_enough(self):
+        # 交替的递归调用不会被省略，折叠后调用树仍超出预算
+        function_calls = [call("root", None, "view", 1.0)]
+        for branch in range(4):
+            parent = "root"
+            for level in range(120):
+                call_id = f"b{branch}_{level}"
+                name = f"visit_{branch}_{level // 2 % 2}"
+                function_calls.append(call(call_id, parent, name, 0.25 - level * 0.001, depth=level + 1))
+                parent = call_id
+
+        summary = summarize_call_tree(function_calls, token_budget=300, top_k=3)
+
+        assert summary["truncated"] is True
+        assert summary["tokens"] <= 300
+        assert "条调用链已省略" in summary["text"]
+
+
+class TestAnalysisPrompt:
+    """分析提示词测试"""
+
+    def test_prompt_uses_summary_instead_of_raw_calls(self):
+        analyzer = PerformanceAnalyzer()
+        analyzer.config_manager = Mock()
+        analyzer.config_manager.get_template = Mock(return_value="分析 {request_path}，慢函数:\n{slow_functions}")
+        record = synthetic_record(300, 3, 200)
+
+        processed = analyzer._preprocess_performance_data(record)
+        prompt = analyzer._build_analysis_prompt(processed)
+
+        assert "raw_data" not in processed
+        assert "function_calls" not in json.dumps(processed, default=str)
+        # 模板没有调用树占位符时摘要附加在末尾
+        assert "## 调用树摘要\n### 自身耗时最多的函数" in prompt
+        assert count_tokens(prompt) < 2000
+
+
+class TestTokenEncoding:
+    """tiktoken编码延迟加载测试"""
+
+    def test_encoding_loaded_in_background(self, monkeypatch):
+        released = threading.Event()
+        encoding = SimpleNamespace(encode=lambda text, disallowed_special=(): text.split())
+
+        def get_encoding(name):
+            # 模拟下载编码文件，放行前count_tokens不能被阻塞
+            released.wait(5)
+            return encoding
+
+        monkeypatch.setitem(sys.modules, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+        monkeypatch.setattr(prompt_compaction, "_ENCODING", None)
+        monkeypatch.setattr(prompt_compaction, "_encoding_loader", None)
+
+        assert count_tokens("select * from orders") == 7
+        released.set()
+        prompt_compaction._encoding_loader.join(5)
+        assert count_tokens("select * from orders") == 4
+
+    def test_load_failure_falls_back_to_estimate(self, monkeypatch):
+        def get_encoding(name):
+            raise OSError("network unreachable")
+
+        monkeypatch.setitem(sys.modules, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+        monkeypatch.setattr(prompt_compaction, "_ENCODING", None)
+        monkeypatch.setattr(prompt_compaction, "_encoding_loader", Mock())
+
+        assert prompt_compaction.load_encoding() is None
+        assert count_tokens("订单查询") == 4
@@ -0,0 +1,92 @@
+"""
+仪表盘与分析历史查询次数回归测试
+
+确保接口的数据库往返次数不随分页大小增长（避免N+1查询）。
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from app.api.v1 import dashboard, analysis
+from conftest import FakeCursor, FakeCollection, matches
+
+
+class CountingCollection(FakeCollection):
+    """按项目分组计数的聚合，对应仪表盘的记录数统计"""
+
+    def aggregate(self, pipeline):
+        counts = {}
+        for doc in self.docs:
+            if matches(doc, pipeline[0].get("$match")):
+                counts[doc["project_key"]] = counts.get(doc["project_key"], 0) + 1
+        return FakeCursor([{"_id": key, "count": count} for key, count in counts.items()], self)
+
+
+class FakeDatabase:
+    """模拟数据库，统计数据库往返次数"""
+
+    def __init__(self, project_count):
+        now = datetime.utcnow()
+        projects = [
+            {"project_key": f"proj_{i}", "name": f"项目{i}", "base_url": "http://localhost", "framework": "flask",
+             "created_at": now, "updated_at": now}
+            for i in range(project_count)
+        ]
+        self.collections = {
+            "projects": CountingCollection(projects),
+            "performance_records": CountingCollection([
+                {"project_key": f"proj_{i % project_count}"} for i in range(project_count * 3)
+            ]),
+            "ai_analysis_results": CountingCollection([
+                {"analysis_id": f"a{i}", "project_key": f"proj_{i % project_count}",
+                 "status": "completed", "created_at": now - timedelta(minutes=i)}
+                for i in range(project_count * 2)
+            ])
+        }
+
+    @property
+    def round_trips(self):
+        return sum(collection.round_trips for collection in self.collections.values())
+
+    def __getattr__(self, name):
+        collections = self.__dict__.get("collections", {})
+        if name not in collections:
+            collections[name] = CountingCollection()
+        return collections[name]
+
+
+async def count_round_trips(call, page_size):
+    database = FakeDatabase(project_count=100)
+    with patch("app.utils.database.mongodb_database", database):
+        await call(database, page_size)
+    return database.round_trips
+
+
+class TestQueryCount:
+    """数据库往返次数测试"""
+
+    @pytest.mark.asyncio
+    async def test_recent_projects(self):
+        async def call(database, size):
+            response = await dashboard.get_recent_projects(limit=size)
+            assert response["data"][0]["recordCount"] == 3
+
+        assert await count_round_trips(call, 5) == await count_round_trips(call, 50)
+
+    @pytest.mark.asyncio
+    async def test_recent_analysis(self):
+        async def call(database, size):
+            response = await dashboard.get_recent_analysis(limit=size)
+            assert response["data"][0]["projectName"] == "项目0"
+
+        assert await count_round_trips(call, 5) == await count_round_trips(call, 50)
+
+    @pytest.mark.asyncio
+    async def test_analysis_history(self):
+        async def call(database, size):
+            response = await analysis.get_all_analysis_history(
+                page=1, size=size, status=None, analysis_type=None, db=database
+            )
+            assert response["data"]["records"][0]["project_name"] == "项目0"
+
+        assert await count_round_trips(call, 5) == await count_round_trips(call, 50)
@@ -0,0 +1,120 @@
+"""
+性能记录列表摘要读取测试用例
+"""
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.api.v1 import performance as performance_api
+from app.models.performance import (
+    PerformanceRecordCreate, PerformanceRecordSummary, RECORD_SUMMARY_PROJECTION
+)
+from app.services.performance_service import PerformanceService
+
+
+def make_summary_doc(trace_id, **kwargs):
+    """构造按摘要投影返回的文档"""
+    doc = {
+        "trace_id": trace_id,
+        "project_key": "proj",
+        "request_info": {"method": "POST", "path": "/users/42", "route": "/users/{user_id}"},
+        "response_info": {"status_code": 201},
+        "performance_metrics": {"total_duration": 0.25, "cpu_time": 0.1, "memory_usage": {"peak_memory": 12}},
+        "timestamp": datetime(2024, 3, 1, 10),
+        "function_call_count": 3
+    }
+    doc.update(kwargs)
+    return doc
+
+
+class TestSummaryProjection:
+    """摘要投影测试"""
+
+    def test_projection_excludes_function_calls(self):
+        assert "function_calls" not in RECORD_SUMMARY_PROJECTION
+        assert "request_info.headers" not in RECORD_SUMMARY_PROJECTION
+        # 旧记录没有存储计数时由服务端计算调用链路长度
+        assert RECORD_SUMMARY_PROJECTION["function_call_count"]["$ifNull"][0] == "$function_call_count"
+
+    def test_from_doc_tolerates_missing_fields(self):
+        summary = PerformanceRecordSummary.from_doc({"trace_id": "t1", "timestamp": datetime(2024, 3, 1)})
+
+        assert summary.method == "GET"
+        assert summary.status_code == 200
+        assert summary.function_call_count == 0
+
+
+class TestRecordList:
+    """列表查询不构建完整记录模型"""
+
+    @pytest.mark.asyncio
+    async def test_list_uses_projection(self):
+        with patch("app.services.performance_service.get_database", return_value=None):
+            service = PerformanceService()
+        service.record_store = Mock(
+            count=AsyncMock(return_value=41),
+            find_page=AsyncMock(return_value=[make_summary_doc("t1"), make_summary_doc("t2")])
+        )
+
+        with patch("app.services.performance_service.PerformanceRecord.from_dict") as from_dict:
+            records, total = await service.get_performance_records({"project_key": "proj"}, page=3, size=20)
+
+        from_dict.assert_not_called()
+        service.record_store.find_page.assert_awaited_once_with(
+            {"project_key": "proj"}, 40, 20, RECORD_SUMMARY_PROJECTION
+        )
+        assert total == 41
+        assert [record.trace_id for record in records] == ["t1", "t2"]
+        assert records[0].memory_peak == 12
+
+    @pytest.mark.asyncio
+    async def test_endpoint_response_fields(self):
+        summary = PerformanceRecordSummary.from_doc(make_summary_doc("t1"))
+        project_service = Mock(get_project_by_key=AsyncMock(return_value={"project_key": "proj"}))
+        performance_service = Mock(get_performance_records=AsyncMock(return_value=([summary], 1)))
+
+        with patch.object(performance_api, "ProjectService", return_value=project_service), \
+             patch.object(performance_api, "PerformanceService", return_value=performance_service):
+            response = await performance_api.get_performance_records(
+                project_key="proj", page=1, size=20, start_time=None, end_time=None, path=None,
+                route=None, method=None, min_duration=None, max_duration=None, status_code=None
+            )
+
+        record = response["data"]["records"][0]
+        assert record["request_path"] == "/users/42"
+        assert record["request_method"] == "POST"
+        assert record["request_route"] == "/users/{user_id}"
+        assert record["status_code"] == 201
+        assert record["function_call_count"] == 3
+        assert record["timestamp"] == "2024-03-01T10:00:00"
+
+
+class TestStoredFunctionCallCount:
+    """写入时保存函数调用数量"""
+
+    @pytest.mark.asyncio
+    async def test_count_saved_with_record(self):
+        database = Mock()
+        database.performance_records.insert_one = AsyncMock()
+        database.function_calls.insert_many = AsyncMock()
+        with patch("app.services.performance_service.get_database", return_value=database):
+            service = PerformanceService()
+        service.rollup_service = Mock(add_record=AsyncMock())
+        service.counter_service = Mock(increment_record=AsyncMock())
+        record = PerformanceRecordCreate(
+            trace_id="t1", request_info={"method": "GET", "path": "/users"},
+            response_info={"status_code": 200}, performance_metrics={"total_duration": 0.1},
+            function_calls=[
+                {"call_id": f"c{i}", "function_name": "view", "file_path": "app.py",
+                 "line_number": 1, "duration": 0.01, "depth": 0, "call_order": i}
+                for i in range(4)
+            ]
+        )
+
+        with patch("app.services.performance_service.anomaly_detector") as detector, \
+             patch("app.services.performance_service.invalidate_project_cache", new=AsyncMock()):
+            detector.observe = AsyncMock()
+            await service.save_performance_record("proj", record)
+
+        saved = database.performance_records.insert_one.call_args.args[0]
+        assert saved["function_call_count"] == 4
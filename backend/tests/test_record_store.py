@@ -0,0 +1,202 @@
+"""
+性能记录分区存储测试用例
+"""
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
+
+from pymongo.errors import BulkWriteError
+
+from app.services import record_store
+from app.services.record_store import (
+    RecordStore, LAYOUT_SINGLE, LAYOUT_DAILY, partition_name, partition_day, query_time_range
+)
+from app.scripts import migrate_record_storage
+from conftest import FakeCursor, FakeCollection
+
+PARTITIONS = ["performance_records_20240301", "performance_records_20240302", "performance_records_20240303"]
+
+
+def make_collection(name, docs=()):
+    collection = Mock()
+    collection.name = name
+    collection.count_documents = AsyncMock(return_value=len(docs))
+    collection.find = Mock(side_effect=lambda *args, **kwargs: FakeCursor(list(docs)))
+    collection.find_one = AsyncMock(return_value=None)
+    collection.aggregate = Mock(return_value=FakeCursor([{"_id": None}]))
+    collection.create_index = AsyncMock()
+    collection.insert_one = AsyncMock()
+    return collection
+
+
+class FakeDatabase:
+    def __init__(self, partitions, docs=None):
+        docs = docs or {}
+        self.collections = {name: make_collection(name, docs.get(name, [])) for name in partitions}
+        self.performance_records = make_collection("performance_records", docs.get("performance_records", []))
+        self.list_collection_names = AsyncMock(side_effect=lambda **kwargs: list(self.collections))
+        self.drop_collection = AsyncMock(side_effect=lambda name: self.collections.pop(name))
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = make_collection(name)
+        return self.collections[name]
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    record_store.clear_partition_cache()
+    record_store._indexed_partitions.clear()
+    yield
+    record_store.clear_partition_cache()
+
+
+class TestPartitionNaming:
+    """分区命名测试"""
+
+    def test_partition_name_round_trip(self):
+        name = partition_name(datetime(2024, 3, 2, 23, 59))
+
+        assert name == "performance_records_20240302"
+        assert partition_day(name) == datetime(2024, 3, 2)
+        assert partition_day("performance_records") is None
+
+    def test_query_time_range(self):
+        start, end = datetime(2024, 3, 1), datetime(2024, 3, 2)
+
+        assert query_time_range({"timestamp": {"$gte": start, "$lte": end}}) == (start, end)
+        assert query_time_range({"timestamp": {"$gt": start}}) == (start, None)
+        assert query_time_range({"project_key": "proj"}) == (None, None)
+
+
+class TestRecordStoreRouting:
+    """存储路由测试"""
+
+    @pytest.mark.asyncio
+    async def test_single_layout_uses_base_collection(self):
+        db = FakeDatabase(PARTITIONS)
+        store = RecordStore(db, layout=LAYOUT_SINGLE)
+
+        await store.insert({"trace_id": "t1", "timestamp": datetime(2024, 3, 3)})
+        await store.aggregate([{"$match": {"project_key": "proj"}}])
+
+        db.performance_records.insert_one.assert_awaited_once()
+        assert db.performance_records.aggregate.call_args.args[0] == [{"$match": {"project_key": "proj"}}]
+        db.list_collection_names.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_insert_creates_partition_indexes_once(self):
+        db = FakeDatabase([])
+        store = RecordStore(db, layout=LAYOUT_DAILY)
+
+        await store.insert({"trace_id": "t1", "timestamp": datetime(2024, 3, 4, 8)})
+        await store.insert({"trace_id": "t2", "timestamp": datetime(2024, 3, 4, 9)})
+
+        partition = db.collections["performance_records_20240304"]
+        assert partition.insert_one.await_count == 2
+        assert partition.create_index.await_count == len(record_store.PARTITION_INDEXES)
+        # 分区上不创建TTL索引
+        assert all("expireAfterSeconds" not in call.kwargs for call in partition.create_index.call_args_list)
+
+    @pytest.mark.asyncio
+    async def test_aggregate_unions_partitions_in_range(self):
+        db = FakeDatabase(PARTITIONS)
+        store = RecordStore(db, layout=LAYOUT_DAILY)
+        match = {"project_key": "proj", "timestamp": {"$gte": datetime(2024, 3, 2, 12)}}
+
+        await store.aggregate([{"$match": match}, {"$group": {"_id": None, "count": {"$sum": 1}}}])
+
+        newest = db.collections["performance_records_20240303"]
+        pipeline = newest.aggregate.call_args.args[0]
+        assert pipeline[0] == {"$match": match}
+        assert [stage["$unionWith"]["coll"] for stage in pipeline[1:3]] == [
+            "performance_records_20240302", "performance_records"
+        ]
+        assert pipeline[3] == {"$group": {"_id": None, "count": {"$sum": 1}}}
+        db.collections["performance_records_20240301"].aggregate.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_page_skips_whole_partitions(self):
+        docs = {
+            "performance_records_20240303": [{"trace_id": f"c{i}"} for i in range(5)],
+            "performance_records_20240302": [{"trace_id": f"b{i}"} for i in range(5)],
+            "performance_records_20240301": [{"trace_id": f"a{i}"} for i in range(5)]
+        }
+        db = FakeDatabase(PARTITIONS, docs)
+        store = RecordStore(db, layout=LAYOUT_DAILY)
+
+        docs = await store.find_page({"project_key": "proj"}, skip=7, limit=4)
+
+        # 最新分区整页跳过，只计数不读取
+        db.collections["performance_records_20240303"].find.assert_not_called()
+        assert [doc["trace_id"] for doc in docs] == ["b2", "b3", "b4", "a0"]
+
+    @pytest.mark.asyncio
+    async def test_trace_lookup_searches_newest_first(self):
+        db = FakeDatabase(PARTITIONS)
+        db.collections["performance_records_20240302"].find_one = AsyncMock(return_value={"trace_id": "t1"})
+        store = RecordStore(db, layout=LAYOUT_DAILY)
+
+        doc = await store.find_by_trace_id("t1")
+
+        assert doc == {"trace_id": "t1"}
+        db.collections["performance_records_20240303"].find_one.assert_awaited_once()
+        db.collections["performance_records_20240301"].find_one.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_drop_partitions_before_cutoff(self):
+        db = FakeDatabase(PARTITIONS)
+        store = RecordStore(db, layout=LAYOUT_DAILY)
+
+        dropped = await store.drop_partitions_before(datetime(2024, 3, 2, 12))
+
+        assert dropped == ["performance_records_20240301"]
+        assert await store.list_partitions() == ["performance_records_20240303", "performance_records_20240302"]
+
+
+class PartitionCollection(FakeCollection):
+    """分区集合，trace_id唯一"""
+
+    async def insert_many(self, docs, ordered=True):
+        existing = {doc["trace_id"] for doc in self.docs}
+        fresh = [doc for doc in docs if doc["trace_id"] not in existing]
+        result = await super().insert_many(fresh)
+        if len(fresh) < len(docs):
+            raise BulkWriteError({"writeErrors": [{"code": 11000}], "nInserted": len(fresh)})
+        return result
+
+
+class MigrationDatabase:
+    def __init__(self, records):
+        self.performance_records = FakeCollection(records)
+        self.detector_state = FakeCollection()
+        self.partitions = {}
+
+    def __getitem__(self, name):
+        return self.partitions.setdefault(name, PartitionCollection())
+
+
+class TestRecordStorageMigration:
+    """存储布局迁移工具测试"""
+
+    @pytest.mark.asyncio
+    async def test_copy_then_delete_source(self):
+        db = MigrationDatabase([
+            {"_id": i, "trace_id": f"t{i}", "timestamp": datetime(2024, 3, 1 + i % 2, 8)} for i in range(5)
+        ])
+        client = MagicMock()
+        client.__getitem__.return_value = db
+
+        with patch.object(migrate_record_storage, "AsyncIOMotorClient", return_value=client):
+            await migrate_record_storage.migrate(2, delete_source=False, dry_run=False, restart=False)
+            assert len(db.performance_records.docs) == 5
+            assert db.detector_state.docs[0]["last_id"] == 4
+
+            # 删除模式不沿用复制进度，已复制的记录跳过写入并从原集合删除
+            await migrate_record_storage.migrate(2, delete_source=True, dry_run=False, restart=False)
+
+        assert db.performance_records.docs == []
+        assert db.detector_state.docs == []
+        assert sorted(doc["trace_id"] for partition in db.partitions.values() for doc in partition.docs) == [
+            f"t{i}" for i in range(5)
+        ]
@@ -0,0 +1,116 @@
+"""
+部署后性能回归检测测试用例
+"""
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.services.regression_service import RegressionService, mann_whitney_z, DETECTOR_STATE_ID
+
+
+def make_summary(request_count, bucket_counts, stacks):
+    """构造rollup汇总数据"""
+    counts = [0] * 12
+    for index, count in bucket_counts.items():
+        counts[index] = count
+    return {
+        "request_count": request_count,
+        "weighted_count": float(request_count),
+        "error_count": 0,
+        "duration_sum": 0.0,
+        "duration_max": 1.0,
+        "latency_counts": counts,
+        "stacks": stacks
+    }
+
+
+BASELINE = make_summary(200, {3: 150, 4: 50}, {"view": [200, 4.0], "view;cache_get": [200, 2.0]})
+REGRESSED = make_summary(100, {5: 70, 6: 30}, {"view": [100, 2.0], "view;orm_query": [100, 15.0]})
+UNCHANGED = make_summary(100, {3: 74, 4: 26}, {"view": [100, 2.0], "view;cache_get": [100, 1.0]})
+
+KEY = {"project_key": "proj_test", "method": "GET", "path": "/api/users",
+       "app_version": "1.3.0", "git_commit": "def456"}
+
+
+@pytest.fixture
+def service():
+    with patch("app.services.regression_service.get_database", return_value=None), \
+         patch("app.services.rollup_service.get_database", return_value=None):
+        service = RegressionService()
+    service.rollup_service.rollup_collection = Mock()
+    service.rollup_service.rollup_collection.find_one = AsyncMock(return_value={"bucket": datetime(2024, 1, 1, 10)})
+    service.events_collection = Mock()
+    service.events_collection.update_one = AsyncMock()
+    service.state_collection = Mock()
+    service.state_collection.update_one = AsyncMock()
+    return service
+
+
+class TestMannWhitney:
+    """直方图秩和检验测试"""
+
+    def test_identical_distributions(self):
+        assert mann_whitney_z([10, 20, 5], [20, 40, 10]) == pytest.approx(0.0)
+
+    def test_shifted_distribution_is_significant(self):
+        assert mann_whitney_z([150, 50, 0, 0], [0, 0, 70, 30]) > 10
+        assert mann_whitney_z([0, 0, 70, 30], [150, 50, 0, 0]) < -10
+        assert mann_whitney_z([], []) == 0.0
+
+
+class TestRegressionService:
+    """回归检测服务测试"""
+
+    @pytest.mark.asyncio
+    async def test_regression_event_is_recorded(self, service):
+        service.rollup_service.get_route_summary = AsyncMock(side_effect=[REGRESSED, BASELINE])
+
+        event = await service.evaluate(KEY, datetime(2024, 1, 1, 14))
+
+        assert event is not None
+        assert event["status"] == "open"
+        assert event["functions"][0]["function"] == "orm_query"
+        assert "target_commit=def456" in event["diff_url"]
+        baseline_query = service.rollup_service.get_route_summary.call_args_list[1][0][0]
+        assert baseline_query["git_commit"] == {"$ne": "def456"}
+        assert baseline_query["bucket"]["$lte"] == datetime(2024, 1, 1, 9)
+        filter_doc, update = service.events_collection.update_one.call_args[0]
+        assert filter_doc["git_commit"] == "def456"
+        assert "event_id" in update["$setOnInsert"]
+
+    @pytest.mark.asyncio
+    async def test_noise_does_not_raise_event(self, service):
+        service.rollup_service.get_route_summary = AsyncMock(side_effect=[UNCHANGED, BASELINE])
+
+        assert await service.evaluate(KEY, datetime(2024, 1, 1, 14)) is None
+
+        filter_doc, update = service.events_collection.update_one.call_args[0]
+        assert filter_doc["status"] == "open"
+        assert update["$set"]["status"] == "resolved"
+
+    @pytest.mark.asyncio
+    async def test_old_versions_are_skipped(self, service):
+        service.rollup_service.get_route_summary = AsyncMock()
+
+        assert await service.evaluate(KEY, datetime(2024, 1, 5, 14)) is None
+        service.rollup_service.get_route_summary.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_run_only_scans_new_closed_buckets(self, service):
+        service.state_collection.find_one = AsyncMock(return_value={
+            "_id": DETECTOR_STATE_ID, "last_bucket": datetime(2024, 1, 1, 12)
+        })
+        aggregate_result = Mock()
+        aggregate_result.to_list = AsyncMock(return_value=[{"_id": KEY}])
+        service.rollup_service.rollup_collection.aggregate = Mock(return_value=aggregate_result)
+        service.evaluate = AsyncMock(return_value={"status": "open"})
+
+        result = await service.run_detection(now=datetime(2024, 1, 1, 14, 5))
+
+        pipeline = service.rollup_service.rollup_collection.aggregate.call_args[0][0]
+        assert pipeline[0]["$match"]["bucket"] == {
+            "$gt": datetime(2024, 1, 1, 12), "$lt": datetime(2024, 1, 1, 14)
+        }
+        assert result == {"processed_groups": 1, "regressions": 1}
+        state_update = service.state_collection.update_one.call_args[0][1]
+        assert state_update["$set"]["last_bucket"] == datetime(2024, 1, 1, 13)
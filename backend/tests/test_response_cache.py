@@ -0,0 +1,162 @@
+"""
+响应缓存测试用例
+"""
+import asyncio
+import fnmatch
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+
+from app.utils import cache
+from app.utils.cache import cached, invalidate_project_cache, clear_cache, get_cache_metrics
+
+
+class FakeRedis:
+    """内存版异步Redis，仅实现缓存模块用到的命令"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def setex(self, key, expire, value):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def pipeline(self, transaction=False):
+        redis = self
+
+        class Pipeline:
+            def __init__(self):
+                self.keys = []
+
+            def incr(self, key):
+                self.keys.append(key)
+
+            async def execute(self):
+                return [await redis.incr(key) for key in self.keys]
+
+        return Pipeline()
+
+    async def scan_iter(self, match=None, count=None):
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+
+class StatsService:
+    """被缓存的示例服务"""
+
+    def __init__(self):
+        self.calls = 0
+
+    @cached("test_stats", ttl=60)
+    async def get_stats(self, project_key: str, start_time: datetime):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"calls": self.calls, "generated_at": datetime(2024, 1, 1, 12, 0)}
+
+
+@pytest.fixture
+def redis():
+    redis = FakeRedis()
+    cache.cache_metrics.clear()
+    cache._last_invalidation.clear()
+    with patch("app.utils.cache.get_redis", return_value=redis):
+        yield redis
+    for task in cache._pending_invalidation.values():
+        task.cancel()
+    cache._pending_invalidation.clear()
+
+
+class TestResponseCache:
+    """响应缓存测试"""
+
+    @pytest.mark.asyncio
+    async def test_hit_after_miss(self, redis):
+        service = StatsService()
+        start = datetime(2024, 1, 1, 11, 0, 5)
+
+        first = await service.get_stats("proj_a", start)
+        # 同一缓存周期内的时间参数命中同一缓存
+        second = await service.get_stats("proj_a", datetime(2024, 1, 1, 11, 0, 30))
+
+        assert service.calls == 1
+        assert second == first
+        assert isinstance(second["generated_at"], datetime)
+        metrics = get_cache_metrics()["namespaces"]["test_stats"]
+        assert metrics["hits"] == 1 and metrics["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_ingest_invalidates_project_only(self, redis):
+        service = StatsService()
+        start = datetime(2024, 1, 1, 11)
+        await service.get_stats("proj_a", start)
+        await service.get_stats("proj_b", start)
+
+        await invalidate_project_cache("proj_a")
+        # 节流时间内的重复失效不再写Redis
+        await invalidate_project_cache("proj_a")
+
+        await service.get_stats("proj_a", start)
+        await service.get_stats("proj_b", start)
+        assert service.calls == 3
+        assert redis.data["cache_gen:proj_a"] == "1"
+        assert redis.data["cache_gen:all"] == "1"
+
+    @pytest.mark.asyncio
+    async def test_throttled_invalidation_has_trailing_edge(self, redis):
+        with patch("app.utils.cache.INVALIDATION_INTERVAL", 0.05):
+            await invalidate_project_cache("proj_a")
+            # 节流时间内的写入在间隔结束时补做一次失效
+            await invalidate_project_cache("proj_a")
+            await invalidate_project_cache("proj_a")
+            assert redis.data["cache_gen:proj_a"] == "1"
+
+            await asyncio.sleep(0.1)
+
+        assert redis.data["cache_gen:proj_a"] == "2"
+        assert not cache._pending_invalidation
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_compute_once(self, redis):
+        service = StatsService()
+
+        results = await asyncio.gather(*[
+            service.get_stats("proj_a", datetime(2024, 1, 1, 11)) for _ in range(10)
+        ])
+
+        assert service.calls == 1
+        assert all(result == results[0] for result in results)
+
+    @pytest.mark.asyncio
+    async def test_clear_cache_purges_entries(self, redis):
+        service = StatsService()
+        await service.get_stats("proj_a", datetime(2024, 1, 1, 11))
+        redis.data["sdk_config:proj_a"] = "{}"
+        redis.data["other"] = "keep"
+
+        assert await clear_cache() == 2
+        assert list(redis.data) == ["other"]
+
+    @pytest.mark.asyncio
+    async def test_without_redis_calls_through(self):
+        service = StatsService()
+        with patch("app.utils.cache.get_redis", return_value=None):
+            await service.get_stats("proj_a", datetime(2024, 1, 1, 11))
+            await service.get_stats("proj_a", datetime(2024, 1, 1, 11))
+
+        assert service.calls == 2
@@ -0,0 +1,211 @@
+"""
+分层数据保留测试用例
+"""
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import Mock, AsyncMock, patch
+
+from app.services.retention_service import (
+    RetentionService, retention_policy, daily_rollup_update, TIER_EXEMPLAR, RETENTION_STATE_ID
+)
+from app.services.rollup_service import RollupService
+from conftest import FakeCollection
+
+NOW = datetime(2024, 3, 1, 12, 0)
+
+
+def make_record(trace_id, timestamp, duration, path="/api/orders", status_code=200, **fields):
+    return {
+        "trace_id": trace_id, "project_key": "proj_test", "timestamp": timestamp,
+        "request_info": {"method": "GET", "path": path},
+        "response_info": {"status_code": status_code},
+        "performance_metrics": {"total_duration": duration},
+        "retention_tier": None, **fields
+    }
+
+
+def make_service(records=(), analyses=(), rollups=(), config=None):
+    with patch("app.services.retention_service.get_database", return_value=None):
+        service = RetentionService()
+    service.db = Mock()
+    service.db.command = AsyncMock(return_value={"size": 0})
+    service.performance_collection = FakeCollection(records)
+    service.function_calls_collection = FakeCollection(
+        [{"trace_id": record["trace_id"], "call_id": f"{record['trace_id']}_0"} for record in records]
+    )
+    service.analysis_collection = FakeCollection(analyses)
+    service.rollup_collection = FakeCollection(rollups)
+    service.daily_collection = Mock(bulk_write=AsyncMock())
+    service.projects_collection = FakeCollection([{"project_key": "proj_test", "config": config or {}}])
+    service.state_collection = FakeCollection()
+    return service
+
+
+class TestRetentionPolicy:
+    """保留策略测试"""
+
+    def test_project_overrides_and_ordering(self):
+        policy = retention_policy({"retention_full_days": 14, "retention_exemplar_days": 10})
+
+        assert policy["retention_full_days"] == 14
+        # 样本层不能短于完整层
+        assert policy["retention_exemplar_days"] == 14
+        assert retention_policy(None)["retention_hourly_rollup_days"] == 30
+
+
+class TestTraceCompaction:
+    """链路压缩测试"""
+
+    @pytest.mark.asyncio
+    async def test_keeps_exemplars_per_route_hour(self):
+        old_hour = NOW - timedelta(days=10, minutes=30)
+        records = [
+            make_record("slow", old_hour, 2.0),
+            make_record("fast", old_hour + timedelta(minutes=5), 0.1),
+            make_record("error_a", old_hour + timedelta(minutes=6), 0.3, status_code=500),
+            make_record("error_b", old_hour + timedelta(minutes=7), 0.2, status_code=502),
+            make_record("analyzed", old_hour + timedelta(minutes=8), 0.05),
+            make_record("users", old_hour + timedelta(minutes=9), 0.4, path="/api/users"),
+            # 完整层内的记录不处理
+            make_record("recent", NOW - timedelta(days=1), 0.1)
+        ]
+        service = make_service(records, analyses=[{"performance_record_id": "analyzed"}])
+
+        report = await service.run(now=NOW)
+
+        remaining = {doc["trace_id"]: doc for doc in service.performance_collection.docs}
+        assert set(remaining) == {"slow", "error_a", "analyzed", "users", "recent"}
+        assert remaining["slow"]["retention_reason"] == "slowest"
+        assert remaining["error_a"]["retention_reason"] == "error"
+        assert remaining["analyzed"]["retention_reason"] == "analyzed"
+        assert remaining["recent"]["retention_tier"] is None
+        assert report["records_deleted"] == 2
+        assert report["function_calls_deleted"] == 2
+        assert report["exemplars_kept"] == 4
+        assert {doc["trace_id"] for doc in service.function_calls_collection.docs} == set(remaining)
+        assert service.state_collection.docs[0]["_id"] == RETENTION_STATE_ID
+
+    @pytest.mark.asyncio
+    async def test_hour_split_across_batches_keeps_one_exemplar(self):
+        hour = NOW - timedelta(days=10, minutes=30)
+        records = [make_record(f"t{i}", hour + timedelta(seconds=i), 1.0 - i * 0.01) for i in range(10)]
+        service = make_service(records)
+
+        with patch("app.services.retention_service.settings.retention_batch_size", 3):
+            await service.run(now=NOW)
+
+        exemplars = [doc for doc in service.performance_collection.docs if doc["retention_tier"] == TIER_EXEMPLAR]
+        assert [doc["trace_id"] for doc in exemplars] == ["t0"]
+        assert len(service.performance_collection.docs) == 1
+
+    @pytest.mark.asyncio
+    async def test_exemplars_expire_and_batches_are_bounded(self):
+        records = [
+            make_record(f"old{i}", NOW - timedelta(days=100, hours=i), 1.0, retention_tier=TIER_EXEMPLAR)
+            for i in range(5)
+        ]
+        service = make_service(records)
+
+        with patch("app.services.retention_service.settings.retention_batch_size", 2), \
+             patch("app.services.retention_service.settings.retention_max_batches", 2):
+            report = await service.run(now=NOW)
+
+        # 单次运行最多处理2批，剩余记录留到下次
+        assert report["records_deleted"] == 4
+        assert len(service.performance_collection.docs) == 1
+
+    @pytest.mark.asyncio
+    async def test_project_override_extends_full_tier(self):
+        records = [make_record("a", NOW - timedelta(days=10), 1.0), make_record("b", NOW - timedelta(days=10), 0.5)]
+        service = make_service(records, config={"retention_full_days": 30})
+
+        report = await service.run(now=NOW)
+
+        assert report["records_deleted"] == 0
+        assert len(service.performance_collection.docs) == 2
+
+    @pytest.mark.asyncio
+    async def test_partitions_dropped_after_longest_exemplar_tier(self):
+        service = make_service(config={"retention_exemplar_days": 120})
+        service.record_store.drop_partitions_before = AsyncMock(return_value=["performance_records_20231001"])
+
+        report = await service.run(now=NOW)
+
+        service.record_store.drop_partitions_before.assert_awaited_once_with(NOW - timedelta(days=120))
+        assert report["partitions_dropped"] == ["performance_records_20231001"]
+
+
+class TestRollupDownsampling:
+    """rollup降采样测试"""
+
+    def test_daily_update_merges_counts_and_stacks(self):
+        doc = {
+            "project_key": "proj_test", "method": "GET", "path": "/api/orders",
+            "bucket": datetime(2024, 1, 5, 13), "app_version": "1.0", "git_commit": None,
+            "request_count": 10, "weighted_count": 20.0, "error_count": 1, "duration_sum": 3.0,
+            "duration_max": 0.9, "latency_counts": {"3": 6, "5": 4},
+            "stacks": {"abc": {"stack": "view;query", "count": 10, "self_time": 2.5}}
+        }
+
+        update = daily_rollup_update(doc)
+
+        assert update._filter["bucket"] == datetime(2024, 1, 5)
+        assert update._doc["$inc"]["latency_counts.5"] == 4
+        assert update._doc["$inc"]["stacks.abc.self_time"] == 2.5
+        assert update._doc["$set"]["stacks.abc.stack"] == "view;query"
+        assert update._doc["$max"] == {"duration_max": 0.9}
+
+    @pytest.mark.asyncio
+    async def test_old_hourly_rollups_move_to_daily(self):
+        rollups = [
+            {"_id": 1, "project_key": "proj_test", "method": "GET", "path": "/a", "bucket": NOW - timedelta(days=40)},
+            {"_id": 2, "project_key": "proj_test", "method": "GET", "path": "/a", "bucket": NOW - timedelta(days=2)}
+        ]
+        service = make_service(rollups=rollups)
+
+        report = await service.run(now=NOW)
+
+        assert report["rollups_downsampled"] == 1
+        assert [doc["_id"] for doc in service.rollup_collection.docs] == [2]
+        operations = service.daily_collection.bulk_write.call_args.args[0]
+        assert len(operations) == 1
+
+    @pytest.mark.asyncio
+    async def test_hourly_rollups_of_a_day_merge_into_one_capped_update(self):
+        rollups = [
+            {"_id": hour, "project_key": "proj_test", "method": "GET", "path": "/a",
+             "bucket": NOW - timedelta(days=40, hours=hour), "request_count": 2, "latency_counts": {"1": 2},
+             "stacks": {f"k{hour}": {"stack": f"view;q{hour}", "count": 2, "self_time": 0.1 * (hour + 1)}}}
+            for hour in range(3)
+        ]
+        service = make_service(rollups=rollups)
+        service.daily_collection.find_one = AsyncMock(return_value={"stack_total": 9, "stacks": {}})
+
+        with patch("app.services.rollup_service.settings.rollup_max_stacks", 10):
+            await service.run(now=NOW)
+
+        operations = service.daily_collection.bulk_write.call_args.args[0]
+        assert len(operations) == 1
+        increments = operations[0]._doc["$inc"]
+        assert increments["request_count"] == 6
+        assert increments["latency_counts.1"] == 6
+        # 天级文档只剩一个空位：保留耗时最高的调用栈，其余合并为 [other]
+        names = {value for field, value in operations[0]._doc["$set"].items() if field.startswith("stacks.")}
+        assert names == {"view;q2", "[other]"}
+
+    @pytest.mark.asyncio
+    async def test_queries_read_daily_rollups(self):
+        with patch("app.services.rollup_service.get_database", return_value=None):
+            rollup_service = RollupService()
+        hourly = {"request_count": 5, "latency_counts": {"2": 5}, "stacks": {"k": {"stack": "view", "count": 5, "self_time": 1.0}}}
+        daily = {"request_count": 7, "latency_counts": {"2": 7}, "stacks": {"k": {"stack": "view", "count": 7, "self_time": 2.0}}}
+        rollup_service.rollup_collection = FakeCollection([hourly])
+        rollup_service.daily_collection = FakeCollection([daily])
+
+        summary = await rollup_service.get_route_summary({})
+        stacks, request_count = await rollup_service.get_stack_table({})
+
+        assert summary["request_count"] == 12
+        assert summary["latency_counts"][2] == 12
+        assert stacks == {"view": [12, 3.0]}
+        assert request_count == 12
@@ -0,0 +1,260 @@
+"""
+请求路径规范化测试用例
+"""
+import asyncio
+import os
+import re
+import sys
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, AsyncMock, patch
+
+# 添加SDK路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdk'))
+
+from performance_monitor.core.aggregator import ProfileAggregator
+from performance_monitor.fastapi import PerformanceMiddleware as ASGIPerformanceMiddleware
+from performance_monitor.fastapi import route_template as asgi_route_template
+from performance_monitor.core.profiler import ProfilerManager
+from performance_monitor.utils import routes as sdk_routes
+from performance_monitor.utils.config import Config
+from app.models.performance import PerformanceRecordCreate, PerformanceRecord
+from app.services.performance_service import PerformanceService
+from app.services.rollup_service import RollupService
+from app.services.retention_service import rollup_merge_update
+from app.utils.routes import normalize_path, route_template, path_prefix_filter, canonical_route, route_key
+
+
+class TestNormalizePath:
+    """路径规范化测试"""
+
+    def test_lowercases_and_strips(self):
+        assert normalize_path("/API//Users/42/?page=2") == "/api/users/42"
+        assert normalize_path("") == "/"
+        assert normalize_path("orders#top") == "/orders"
+
+    def test_route_template_collapses_ids(self):
+        assert route_template("/users/123") == route_template("/Users/456/") == "/users/{id}"
+        assert route_template("/orders/3f2a1b4c-9d8e-4f7a-8b6c-5d4e3f2a1b0c/items") == "/orders/{uuid}/items"
+        assert route_template("/files/5f1d7c2e9a3b4c6d8e0f1a2b") == "/files/{hash}"
+        assert route_template("/reports/2024-03-01") == "/reports/{date}"
+        assert route_template("/share/aB3dE5fG7hJ9kL1mN3pQ5r") == "/share/{token}"
+        # 普通单词不替换
+        assert route_template("/api/v1/health-check") == "/api/v1/health-check"
+
+
+class TestPathPrefixFilter:
+    """路径前缀过滤测试"""
+
+    def test_anchored_and_escaped(self):
+        condition = path_prefix_filter("/API/Orders.v2(")
+
+        assert condition["$regex"].startswith("^/api/orders")
+        assert "$options" not in condition
+        # 用户输入按字面匹配，不能构造任意正则
+        pattern = re.compile(condition["$regex"])
+        assert pattern.match("/api/orders.v2(/1")
+        assert not pattern.match("/api/ordersxv2(/1")
+
+    def test_root_prefix_is_unrestricted(self):
+        assert path_prefix_filter("/") is None
+        assert path_prefix_filter("") is None
+
+
+class TestSavedRouteFields:
+    """记录写入时补充路径字段"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("request_info,expected_route", [
+        ({"method": "GET", "path": "/Users/42/"}, "/users/{id}"),
+        ({"method": "GET", "path": "/users/42", "route": "/users/{user_id}"}, "/users/{user_id}")
+    ])
+    async def test_normalized_path_and_route_saved(self, request_info, expected_route):
+        database = Mock()
+        database.performance_records.insert_one = AsyncMock()
+        with patch("app.services.performance_service.get_database", return_value=database):
+            service = PerformanceService()
+        service.rollup_service = Mock(add_record=AsyncMock())
+        service.counter_service = Mock(increment_record=AsyncMock())
+        record = PerformanceRecordCreate(
+            trace_id="t1", request_info=request_info,
+            response_info={"status_code": 200}, performance_metrics={"total_duration": 0.1}
+        )
+
+        with patch("app.services.performance_service.anomaly_detector") as detector, \
+             patch("app.services.performance_service.invalidate_project_cache", new=AsyncMock()):
+            detector.observe = AsyncMock()
+            await service.save_performance_record("proj", record)
+
+        saved = database.performance_records.insert_one.call_args.args[0]
+        assert saved["request_info"]["path"] == request_info["path"]
+        assert saved["request_info"]["normalized_path"] == normalize_path(request_info["path"])
+        assert saved["request_info"]["route"] == expected_route
+
+
+class TestCanonicalRoute:
+    """框架路由模板统一测试"""
+
+    @pytest.mark.parametrize("route,expected", [
+        ("/users/<int:user_id>", "/users/{user_id}"),           # Flask
+        ("/files/<path:name>", "/files/{name}"),
+        ("users/<int:pk>/", "/users/{pk}"),                     # Django path()
+        ("^articles/(?P<year>[0-9]{4})/$", "/articles/{year}"),  # Django re_path()
+        ("/items/{item_id:int}", "/items/{item_id}"),           # Starlette
+        ("/Orders/{order_id}", "/orders/{order_id}")
+    ])
+    def test_framework_templates(self, route, expected):
+        assert canonical_route(route) == expected
+
+    def test_route_key_prefers_sdk_route(self):
+        assert route_key("/users/42", "/users/<int:user_id>") == "/users/{user_id}"
+        # 旧版SDK未上报路由时按路径启发式归并
+        assert route_key("/users/42") == route_key("/users/43", None) == "/users/{id}"
+
+
+class TestRouteRollupKeys:
+    """rollup按路由模板合并"""
+
+    @pytest.mark.asyncio
+    async def test_record_rollup_keyed_on_template(self):
+        with patch("app.services.rollup_service.get_database", return_value=None):
+            service = RollupService()
+        service._upsert = AsyncMock()
+        record = PerformanceRecord(
+            project_key="proj", trace_id="t1",
+            request_info={"method": "GET", "path": "/users/42"},
+            response_info={"status_code": 200}, performance_metrics={"total_duration": 0.1}
+        )
+
+        await service.add_record("proj", record)
+
+        assert service._upsert.call_args.kwargs["path"] == "/users/{id}"
+
+    def test_rekey_merges_into_template_bucket(self):
+        bucket = datetime(2024, 3, 1, 10)
+        doc = {"project_key": "proj", "method": "GET", "path": "/users/42", "bucket": bucket,
+               "request_count": 3, "weighted_count": 3.0, "error_count": 0,
+               "duration_sum": 0.3, "duration_max": 0.2, "latency_counts": {"2": 3}, "stacks": {}}
+
+        operation = rollup_merge_update(doc, bucket=bucket, path=canonical_route(doc["path"]))
+
+        assert operation._filter["path"] == "/users/{id}"
+        assert operation._filter["bucket"] == bucket
+        assert operation._doc["$inc"]["latency_counts.2"] == 3
+
+
+class TestSDKRouteTemplates:
+    """SDK记录路由模板"""
+
+    def test_aggregator_merges_paths_of_same_route(self):
+        aggregator = ProfileAggregator(Config.from_dict({
+            "project_key": "test_project", "api_endpoint": "http://localhost:8000/api",
+            "async_send": False, "aggregation_mode": True
+        }))
+        for user_id in (1, 2, 3):
+            aggregator.add({
+                "trace_id": f"t{user_id}",
+                "request_info": {"method": "GET", "path": f"/users/{user_id}", "route": "/users/<int:user_id>"},
+                "response_info": {"status_code": 200},
+                "performance_metrics": {"total_duration": 0.1},
+                "function_calls": []
+            })
+
+        aggregates, _ = aggregator.drain()
+
+        assert len(aggregates) == 1
+        assert aggregates[0]["route"] == "/users/<int:user_id>"
+        assert aggregates[0]["request_count"] == 3
+
+    def test_asgi_route_template_from_scope(self):
+        fastapi = pytest.importorskip("fastapi")
+        app = fastapi.FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def read_item(item_id: int):
+            return {"item_id": item_id}
+
+        route = next(r for r in app.router.routes if getattr(r, "endpoint", None) is read_item)
+        assert asgi_route_template({"route": route}) == "/items/{item_id}"
+        # 只有endpoint时在应用路由表中查找
+        assert asgi_route_template({"endpoint": read_item, "app": app}) == "/items/{item_id}"
+        assert asgi_route_template({}) is None
+
+    def test_asgi_route_matched_before_sampling(self):
+        fastapi = pytest.importorskip("fastapi")
+        app = fastapi.FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def read_item(item_id: int):
+            return {"item_id": item_id}
+
+        middleware = ASGIPerformanceMiddleware(app, config={
+            "project_key": "test_project", "api_endpoint": "http://localhost:8000/api", "async_send": False
+        })
+        scope = {"type": "http", "method": "GET", "path": "/items/5", "headers": [], "app": app}
+
+        assert middleware._build_request_context(scope)["route"] == "/items/{item_id}"
+        assert middleware._build_request_context({**scope, "path": "/missing"})["route"] is None
+
+    @pytest.mark.parametrize("path", [
+        "/users/123", "/Orders/550e8400-e29b-41d4-a716-446655440000/", "/reports/2024-03-01?x=1",
+        "/files/9f86d081884c7d659a2feaa0c55ad015", "/s/abc123def456ghi789jkl0", "/"
+    ])
+    def test_sdk_route_template_matches_backend(self, path):
+        assert sdk_routes.route_template(path) == route_template(path)
+
+    def test_sampler_keyed_on_inferred_template(self):
+        manager = ProfilerManager(Config.from_dict({
+            "project_key": "test_project", "api_endpoint": "http://localhost:8000/api",
+            "async_send": False, "adaptive_sampling": True
+        }))
+
+        with patch.object(manager.sampler, "decide", return_value=None) as decide:
+            manager.should_profile({"method": "GET", "path": "/users/42"})
+            manager.should_profile({"method": "GET", "path": "/users/42", "route": "/users/<int:user_id>"})
+
+        assert [call.args[0] for call in decide.call_args_list] == ["GET /users/{id}", "GET /users/<int:user_id>"]
+
+
+def crunch_orders():
+    return sum(i * i for i in range(60000))
+
+
+def crunch_users():
+    return sum(i * i for i in range(60000))
+
+
+class TestASGIConcurrentProfiling:
+    """ASGI并发请求分别采样"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_profiled_separately(self):
+        async def app(scope, receive, send):
+            work = crunch_orders if scope["path"] == "/orders" else crunch_users
+            for _ in range(5):
+                work()
+                await asyncio.sleep(0.001)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        middleware = ASGIPerformanceMiddleware(app, config={
+            "project_key": "test_project", "api_endpoint": "http://localhost:8000/api",
+            "async_send": False, "sampling_rate": 1.0
+        })
+
+        async def send(message):
+            pass
+
+        with patch.object(middleware.profiler_manager.data_sender, "send_sync") as send_sync:
+            await asyncio.gather(*(
+                middleware({"type": "http", "method": "GET", "path": path, "headers": []}, None, send)
+                for path in ("/orders", "/users")
+            ))
+
+        # 两个请求交替执行，各自的记录只包含本请求的调用
+        records = {call.args[0]["request_info"]["path"]: call.args[0] for call in send_sync.call_args_list}
+        assert set(records) == {"/orders", "/users"}
+        for path, own, other in (("/orders", "crunch_orders", "crunch_users"), ("/users", "crunch_users", "crunch_orders")):
+            functions = {call["function_name"] for call in records[path]["function_calls"]}
+            assert own in functions
+            assert other not in functions
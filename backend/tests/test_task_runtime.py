@@ -0,0 +1,45 @@
+"""
+Celery worker 运行时测试用例
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.tasks import runtime
+
+
+@pytest.fixture
+def database():
+    with patch("app.tasks.runtime.init_database", new_callable=AsyncMock) as init, \
+         patch("app.tasks.runtime.close_database", new_callable=AsyncMock) as close:
+        yield init, close
+    runtime.shutdown_worker_runtime()
+
+
+class TestWorkerRuntime:
+    """worker 进程级事件循环测试"""
+
+    def test_tasks_share_loop_and_connection(self, database):
+        init, _ = database
+        runtime.init_worker_runtime()
+
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        loops = {runtime.run_async(current_loop()) for _ in range(5)}
+
+        assert len(loops) == 1
+        init.assert_awaited_once_with(create_indexes_on_start=False)
+
+    def test_lazy_init_without_worker_signal(self, database):
+        init, close = database
+
+        async def answer():
+            return 42
+
+        assert runtime.run_async(answer()) == 42
+        assert runtime.run_async(answer()) == 42
+        assert init.await_count == 1
+
+        runtime.shutdown_worker_runtime()
+        close.assert_awaited_once()
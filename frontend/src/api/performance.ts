@@ -10,6 +10,7 @@ export const performanceApi = {
     start_time?: string
     end_time?: string
     path?: string
+    route?: string
     method?: string
     min_duration?: number
     max_duration?: number
@@ -32,6 +33,7 @@ export const performanceApi = {
     start_time?: string
     end_time?: string
     path?: string
+    route?: string
     method?: string
     min_duration?: number
     max_duration?: number
@@ -16,55 +16,17 @@ db.createUser({
   ]
 });
 
-// 创建集合并设置初始索引
-print('Creating collections and indexes...');
+// 创建集合
+// 索引由后端服务启动时按 backend/app/utils/indexes.py 中的注册表统一创建，此处不再重复定义
+print('Creating collections...');
 
-// 1. 项目集合
 db.createCollection('projects');
-db.projects.createIndex({ 'project_key': 1 }, { unique: true });
-db.projects.createIndex({ 'name': 1 });
-db.projects.createIndex({ 'status': 1 });
-db.projects.createIndex({ 'created_at': 1 });
-db.projects.createIndex({ 'last_activity': 1 });
-
-// 2. 性能记录集合
 db.createCollection('performance_records');
-db.performance_records.createIndex({ 'trace_id': 1 }, { unique: true });
-db.performance_records.createIndex({ 'project_key': 1 });
-db.performance_records.createIndex({ 'project_key': 1, 'timestamp': -1 });
-db.performance_records.createIndex({ 'request_info.path': 1 });
-db.performance_records.createIndex({ 'request_info.method': 1 });
-db.performance_records.createIndex({ 'response_info.status_code': 1 });
-db.performance_records.createIndex({ 'performance_metrics.total_duration': 1 });
-db.performance_records.createIndex({ 'timestamp': 1 }, { expireAfterSeconds: 7776000 }); // 90天自动删除
-
-// 3. 函数调用详情集合
 db.createCollection('function_calls');
-db.function_calls.createIndex({ 'call_id': 1 }, { unique: true });
-db.function_calls.createIndex({ 'trace_id': 1 });
-db.function_calls.createIndex({ 'trace_id': 1, 'call_context.call_order': 1 });
-db.function_calls.createIndex({ 'function_info.name': 1 });
-db.function_calls.createIndex({ 'execution_info.duration': 1 });
-db.function_calls.createIndex({ 'performance_tags': 1 });
-db.function_calls.createIndex({ 'created_at': 1 }, { expireAfterSeconds: 7776000 }); // 90天自动删除
-
-// 4. AI分析结果集合
 db.createCollection('ai_analysis_results');
-db.ai_analysis_results.createIndex({ 'analysis_id': 1 }, { unique: true });
-db.ai_analysis_results.createIndex({ 'project_key': 1 });
-db.ai_analysis_results.createIndex({ 'trace_id': 1 });
-db.ai_analysis_results.createIndex({ 'status': 1 });
-db.ai_analysis_results.createIndex({ 'project_key': 1, 'created_at': -1 });
-db.ai_analysis_results.createIndex({ 'analysis_type': 1 });
-db.ai_analysis_results.createIndex({ 'created_at': 1 }, { expireAfterSeconds: 15552000 }); // 180天自动删除
-
-// 5. 系统配置集合
 db.createCollection('system_config');
-db.system_config.createIndex({ 'config_key': 1 }, { unique: true });
-db.system_config.createIndex({ 'category': 1 });
-db.system_config.createIndex({ 'is_active': 1 });
 
-print('Collections and indexes created successfully!');
+print('Collections created successfully!');
 
 // 插入默认系统配置
 print('Inserting default system configurations...');
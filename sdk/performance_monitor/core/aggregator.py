@@ -0,0 +1,256 @@
+"""
+进程内性能数据聚合模块
+"""
+import os
+import time
+import random
+import socket
+import threading
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import logging
+
+from ..utils.routes import route_template
+
+logger = logging.getLogger(__name__)
+
+
+# 响应时间直方图的桶上界（秒），最后一个桶收集超出上界的请求
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# 被裁剪的低权重调用栈合并到该栈名下
+OTHER_STACK = "[other]"
+
+# 样例链路的采样模式：样例已计入聚合数据，服务端只保存链路，不再重复计数
+EXEMPLAR_MODE = "exemplar"
+
+
+def frame_name(call: Dict[str, Any]) -> str:
+    """生成调用栈中的帧名称"""
+    return f"{call.get('function_name', 'unknown')} ({call.get('file_path', '')}:{call.get('line_number', 0)})"
+
+
+def collapse_function_calls(function_calls: List[Dict[str, Any]]) -> Dict[str, Tuple[int, float]]:
+    """将扁平化的函数调用列表折叠为 {调用栈: (调用次数, 自身耗时)}
+
+    调用栈使用collapsed-stack格式，即以分号连接的从根到叶的帧名称。
+    """
+    calls_by_id = {}
+    child_time: Dict[str, float] = {}
+    for call in function_calls:
+        call_id = call.get("call_id")
+        if call_id is None:
+            continue
+        calls_by_id[call_id] = call
+        parent_id = call.get("parent_call_id")
+        if parent_id is not None:
+            child_time[parent_id] = child_time.get(parent_id, 0.0) + call.get("duration", 0.0)
+
+    stack_cache: Dict[str, str] = {}
+
+    def stack_of(call_id: str) -> str:
+        # 向上查找到第一个已缓存的祖先，再自顶向下补全缓存（避免深调用栈递归过深）
+        pending = []
+        current = call_id
+        while current in calls_by_id and current not in stack_cache:
+            pending.append(current)
+            current = calls_by_id[current].get("parent_call_id")
+            if len(pending) > len(calls_by_id):
+                break  # 防御父子关系成环
+        prefix = stack_cache.get(current)
+        for pending_id in reversed(pending):
+            name = frame_name(calls_by_id[pending_id])
+            prefix = f"{prefix};{name}" if prefix else name
+            stack_cache[pending_id] = prefix
+        return stack_cache[call_id]
+
+    collapsed: Dict[str, Tuple[int, float]] = {}
+    for call_id, call in calls_by_id.items():
+        stack = stack_of(call_id)
+        self_time = max(call.get("duration", 0.0) - child_time.get(call_id, 0.0), 0.0)
+        count, total = collapsed.get(stack, (0, 0.0))
+        collapsed[stack] = (count + call.get("call_count", 1), total + self_time)
+
+    return collapsed
+
+
+class RouteAggregate:
+    """单个路由在一个聚合窗口内的聚合数据"""
+
+    def __init__(self, method: str, path: str, route: Optional[str] = None):
+        self.method = method
+        self.path = path
+        self.route = route
+        self.request_count = 0
+        self.weighted_count = 0.0
+        self.error_count = 0
+        self.duration_sum = 0.0
+        self.duration_max = 0.0
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.stacks: Dict[str, List[float]] = {}
+        self.exemplars: List[Dict[str, Any]] = []
+
+    def add(self, record: Dict[str, Any], max_exemplars: int):
+        """合并一条性能记录"""
+        metrics = record.get("performance_metrics") or {}
+        duration = metrics.get("total_duration", 0.0)
+        status_code = (record.get("response_info") or {}).get("status_code", 200)
+        sampling_info = record.get("sampling_info") or {}
+        # 覆盖补采的请求不代表其他未采样请求
+        sampling_rate = 1.0 if sampling_info.get("forced") else sampling_info.get("sampling_rate") or 1.0
+
+        self.request_count += 1
+        self.weighted_count += 1.0 / sampling_rate
+        self.duration_sum += duration
+        self.duration_max = max(self.duration_max, duration)
+        if status_code >= 500:
+            self.error_count += 1
+        self.latency_counts[self._bucket_index(duration)] += 1
+
+        for stack, (count, self_time) in collapse_function_calls(record.get("function_calls") or []).items():
+            entry = self.stacks.get(stack)
+            if entry is None:
+                self.stacks[stack] = [count, self_time]
+            else:
+                entry[0] += count
+                entry[1] += self_time
+
+        # 蓄水池抽样保留少量完整调用链路作为样例
+        if len(self.exemplars) < max_exemplars:
+            self.exemplars.append(record)
+        else:
+            index = random.randint(0, self.request_count - 1)
+            if index < max_exemplars:
+                self.exemplars[index] = record
+
+    def to_payload(self, max_stacks: int) -> Dict[str, Any]:
+        """生成上报的聚合数据，超出数量上限的低权重调用栈合并为一条"""
+        ordered = sorted(self.stacks.items(), key=lambda item: item[1][1], reverse=True)
+        stacks = [
+            {"stack": stack, "count": int(count), "self_time": self_time}
+            for stack, (count, self_time) in ordered[:max_stacks]
+        ]
+        if len(ordered) > max_stacks:
+            stacks.append({
+                "stack": OTHER_STACK,
+                "count": int(sum(entry[0] for _, entry in ordered[max_stacks:])),
+                "self_time": sum(entry[1] for _, entry in ordered[max_stacks:])
+            })
+
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "request_count": self.request_count,
+            "weighted_count": self.weighted_count,
+            "error_count": self.error_count,
+            "duration_sum": self.duration_sum,
+            "duration_max": self.duration_max,
+            "latency_histogram": {
+                "bounds": LATENCY_BUCKETS,
+                "counts": self.latency_counts
+            },
+            "stacks": stacks
+        }
+
+    @staticmethod
+    def _bucket_index(duration: float) -> int:
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                return index
+        return len(LATENCY_BUCKETS)
+
+
+class ProfileAggregator:
+    """性能数据聚合器
+
+    按 (路由, 时间窗口) 将采样记录合并为加权调用栈表，每个窗口只上报一份聚合数据，
+    并为每个路由保留少量完整链路样例。
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteAggregate] = {}
+        self._window_start = time.time()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._flush_callback: Optional[Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None]] = None
+        self._source = f"{socket.gethostname()}:{os.getpid()}"
+
+    def add(self, record: Dict[str, Any]):
+        """合并一条性能记录"""
+        request_info = record.get("request_info") or {}
+        route = request_info.get("route")
+        # 按路由模板合并，同一模板的不同路径（如 /users/1、/users/2）合并为一条；没有模板时由路径推断
+        key = (request_info.get("method", "GET"), route or route_template(request_info.get("path", "/")))
+        with self._lock:
+            aggregate = self._routes.get(key)
+            if aggregate is None:
+                aggregate = RouteAggregate(key[0], request_info.get("path", "/"), route)
+                self._routes[key] = aggregate
+            aggregate.add(record, self.config.aggregation_exemplars)
+
+    def drain(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """结束当前窗口，返回 (聚合数据列表, 样例记录列表)"""
+        with self._lock:
+            routes = self._routes
+            window_start = self._window_start
+            self._routes = {}
+            self._window_start = time.time()
+
+        window_end = time.time()
+        aggregates = []
+        exemplars = []
+        for aggregate in routes.values():
+            payload = aggregate.to_payload(self.config.aggregation_max_stacks)
+            payload.update({
+                "window_start": window_start,
+                "window_end": window_end,
+                "source": self._source,
+                "exemplar_trace_ids": [record.get("trace_id") for record in aggregate.exemplars],
+                "version_info": {
+                    "app_version": self.config.app_version,
+                    "git_commit": self.config.git_commit,
+                    "deploy_time": self.config.deploy_time
+                }
+            })
+            aggregates.append(payload)
+            exemplars.extend(
+                {**record, "sampling_info": {**(record.get("sampling_info") or {}), "mode": EXEMPLAR_MODE}}
+                for record in aggregate.exemplars
+            )
+
+        return aggregates, exemplars
+
+    def start(self, flush_callback: Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None]):
+        """启动窗口刷新线程"""
+        self._flush_callback = flush_callback
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._flush_loop,
+            daemon=True,
+            name="performance-aggregator"
+        )
+        self._thread.start()
+        logger.debug("性能数据聚合线程已启动")
+
+    def stop(self):
+        """停止刷新线程并上报剩余数据"""
+        self._stop_event.set()
+        self.flush()
+
+    def flush(self):
+        """立即上报当前窗口"""
+        aggregates, exemplars = self.drain()
+        if aggregates and self._flush_callback:
+            try:
+                self._flush_callback(aggregates, exemplars)
+            except Exception as e:
+                logger.error(f"上报聚合数据失败: {str(e)}")
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.config.aggregation_window):
+            self.flush()
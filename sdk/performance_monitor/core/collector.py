@@ -12,17 +12,44 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 采样分析器每次采样消耗的CPU时间估计（秒），用于估算请求执行期间的分析开销
+SAMPLE_CPU_COST = 0.00002
+
+# 跳过的系统库和第三方库路径
+SKIP_PATH_PATTERNS = (
+    '/usr/lib/',
+    '/usr/local/lib/',
+    'site-packages/',
+    '<built-in>',
+    '<frozen',
+    'performance_monitor/',  # 跳过自身
+)
+# 序列化库的调用帧即使位于系统库或第三方库中也保留，服务端据此识别序列化开销
+SERIALIZATION_PATH_PATTERNS = (
+    '/json/', '/pickle.py', '/marshal', '/msgpack/', '/yaml/', '/pydantic/', 'serializ'
+)
+# 合计耗时低于该值（秒）的函数调用不上报
+MIN_CALL_DURATION = 0.001
+
 
 class PerformanceCollector:
-    """性能数据收集器"""
+    """性能数据收集器
+
+    async_mode 传给pyinstrument：同步框架使用 'disabled'；ASGI应用使用 'enabled'，
+    只记录当前请求（异步上下文）中的调用栈，等待期间其他协程的调用不计入。
+    """
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], async_mode: str = 'disabled'):
         self.config = config
+        self.async_mode = async_mode
         self.profiler: Optional[Profiler] = None
         self.start_time: Optional[float] = None
+        self.start_cpu_time: float = 0.0
         self.trace_id: Optional[str] = None
         self.request_info: Dict[str, Any] = {}
         self.start_memory: int = 0
+        self.sampling_info: Optional[Dict[str, Any]] = None
+        self.sample_count: int = 0
         
     def start_profiling(self, request_context: Dict[str, Any]) -> str:
         """开始性能分析"""
@@ -30,13 +57,14 @@ class PerformanceCollector:
             # 生成唯一的trace_id
             self.trace_id = f"trace_{uuid.uuid4().hex[:16]}"
             self.start_time = time.time()
+            self.start_cpu_time = time.thread_time()
             
             # 记录开始时的内存使用
             process = psutil.Process()
             self.start_memory = process.memory_info().rss // 1024 // 1024  # MB
             
             # 创建并启动profiler
-            self.profiler = Profiler(interval=0.001, async_mode='disabled')
+            self.profiler = Profiler(interval=0.001, async_mode=self.async_mode)
             self.profiler.start()
             
             # 保存请求上下文
@@ -58,17 +86,25 @@ class PerformanceCollector:
             
             # 停止profiler
             self.profiler.stop()
+            session = self.profiler.last_session
+            self.sample_count = getattr(session, "sample_count", 0) if session else 0
             
-            # 计算总耗时
+            # 计算总耗时和当前线程的CPU时间（扣除采样分析器自身的开销）
+            # 异步模式下事件循环线程交替执行多个请求，线程CPU时间无法归属到单个请求，不上报
             total_duration = time.time() - self.start_time
+            cpu_time = 0.0
+            if self.async_mode == 'disabled':
+                cpu_time = max(time.thread_time() - self.start_cpu_time - self.sampling_cost, 0.0)
             
             # 计算内存使用
             process = psutil.Process()
             end_memory = process.memory_info().rss // 1024 // 1024  # MB
             memory_delta = end_memory - self.start_memory
             
-            # 提取响应信息
+            # 提取响应信息（部分框架在请求处理完成后才能确定路由模板）
             response_info = self._extract_response_info(response_context)
+            if response_context.get("route"):
+                self.request_info["route"] = response_context["route"]
             
             # 解析函数调用栈
             function_calls = self._parse_function_calls()
@@ -80,7 +116,7 @@ class PerformanceCollector:
                 "response_info": response_info,
                 "performance_metrics": {
                     "total_duration": total_duration,
-                    "cpu_time": total_duration,  # 使用total_duration作为替代，因为Pyinstrument的Profiler没有cpu_time属性
+                    "cpu_time": cpu_time,
                     "memory_usage": {
                         "peak_memory": end_memory,
                         "memory_delta": memory_delta
@@ -98,7 +134,8 @@ class PerformanceCollector:
                 },
                 "function_calls": function_calls,
                 "version_info": self._get_version_info(),
-                "environment": self._get_environment_info()
+                "environment": self._get_environment_info(),
+                "sampling_info": self.sampling_info
             }
             
             logger.debug(f"性能分析完成: {self.trace_id}, 耗时: {total_duration:.3f}s")
@@ -111,12 +148,18 @@ class PerformanceCollector:
             # 清理状态
             self._reset_state()
     
+    @property
+    def sampling_cost(self) -> float:
+        """请求执行期间采样消耗的CPU时间估计（秒）"""
+        return self.sample_count * SAMPLE_CPU_COST
+    
     def _extract_request_info(self, request_context: Dict[str, Any]) -> Dict[str, Any]:
         """提取请求信息"""
         try:
             return {
                 "method": request_context.get("method", "GET"),
                 "path": request_context.get("path", "/"),
+                "route": request_context.get("route"),
                 "query_params": request_context.get("query_params", {}),
                 "headers": self._filter_headers(request_context.get("headers", {})),
                 "user_agent": request_context.get("headers", {}).get("User-Agent"),
@@ -147,40 +190,54 @@ class PerformanceCollector:
             function_calls = []
             call_order = 0
             
-            def traverse_frame(frame, parent_id=None, depth=0):
+            def visible_frames(frames):
+                # 过滤掉系统和库函数，由其子调用顶替
+                for frame in frames:
+                    if self._is_skipped_path(getattr(frame, 'file_path', '')):
+                        yield from visible_frames(frame.children)
+                    else:
+                        yield frame
+            
+            def traverse_frames(frames, parent_id=None, depth=0):
                 nonlocal call_order
                 
-                # 过滤掉系统和库函数
-                if self._should_skip_frame(frame):
-                    for child in frame.children:
-                        traverse_frame(child, parent_id, depth)
-                    return
-                
-                call_id = f"{self.trace_id}_call_{call_order}"
-                call_order += 1
+                # pyinstrument只合并连续的采样，循环中与其他调用交替执行的同一函数是多个兄弟节点。
+                # 同一父调用下的同一函数合并上报，call_count 记录合并的节点数（观察到的调用次数）；
+                # 两次调用之间未被采样到时仍合并为一个节点，因此是实际调用次数的下限
+                groups: Dict[str, List[Any]] = {}
+                for frame in visible_frames(frames):
+                    groups.setdefault(frame.identifier, []).append(frame)
                 
-                function_call = {
-                    "call_id": call_id,
-                    "parent_call_id": parent_id,
-                    "function_name": frame.function,
-                    "file_path": frame.file_path,
-                    "line_number": frame.line_no,
-                    "duration": frame.time,
-                    "depth": depth,
-                    "call_order": call_order
-                }
-                
-                function_calls.append(function_call)
-                
-                # 递归处理子函数
-                for child in frame.children:
-                    traverse_frame(child, call_id, depth + 1)
+                for group in groups.values():
+                    duration = sum(frame.time for frame in group)
+                    if duration < MIN_CALL_DURATION:
+                        continue
+                    
+                    frame = group[0]
+                    call_id = f"{self.trace_id}_call_{call_order}"
+                    call_order += 1
+                    
+                    function_call = {
+                        "call_id": call_id,
+                        "parent_call_id": parent_id,
+                        "function_name": frame.function,
+                        "file_path": frame.file_path,
+                        "line_number": frame.line_no,
+                        "duration": duration,
+                        "call_count": len(group),
+                        "depth": depth,
+                        "call_order": call_order
+                    }
+                    
+                    function_calls.append(function_call)
+                    
+                    # 递归处理子函数
+                    traverse_frames([child for frame in group for child in frame.children], call_id, depth + 1)
             
             # 遍历调用栈
             root_frame = self.profiler.last_session.root_frame()
             if root_frame:
-                for child in root_frame.children:
-                    traverse_frame(child, None, 0)
+                traverse_frames(root_frame.children)
             
             return function_calls
             
@@ -188,29 +245,17 @@ class PerformanceCollector:
             logger.error(f"解析函数调用栈失败: {str(e)}")
             return []
     
-    def _should_skip_frame(self, frame) -> bool:
-        """判断是否应该跳过某个调用帧"""
-        # 跳过系统库和第三方库
-        skip_patterns = [
-            '/usr/lib/',
-            '/usr/local/lib/',
-            'site-packages/',
-            '<built-in>',
-            '<frozen',
-            'performance_monitor/',  # 跳过自身
-        ]
-        
-        file_path = getattr(frame, 'file_path', '')
+    def _is_skipped_path(self, file_path: str) -> bool:
+        """判断调用帧所在文件是否为需要跳过的系统库、第三方库或SDK自身"""
         if not file_path:
             return True
-            
-        for pattern in skip_patterns:
-            if pattern in file_path:
-                return True
         
-        # 跳过耗时太短的函数（小于1ms）
-        if getattr(frame, 'time', 0) < 0.001:
-            return True
+        # 跳过系统库和第三方库（序列化库除外）
+        if any(pattern in file_path for pattern in SKIP_PATH_PATTERNS):
+            normalized = file_path.replace('\\', '/').lower()
+            return 'performance_monitor/' in normalized or not any(
+                pattern in normalized for pattern in SERIALIZATION_PATH_PATTERNS
+            )
         
         return False
     
@@ -259,6 +304,7 @@ class PerformanceCollector:
         """重置状态"""
         self.profiler = None
         self.start_time = None
+        self.start_cpu_time = 0.0
         self.trace_id = None
         self.request_info = {}
         self.start_memory = 0
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+远程配置同步模块
+"""
+import os
+import json
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+import requests
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# 允许由后端下发并热更新的配置项
+REMOTE_CONFIG_FIELDS = (
+    "enabled",
+    "sampling_rate",
+    "adaptive_sampling",
+    "exclude_patterns",
+    "include_patterns"
+)
+
+
+class ConfigSync:
+    """远程配置同步器
+
+    通过ETag轮询后端的项目配置，配置变化时经由 ProfilerManager.update_config 热更新，
+    并将最近一次成功获取的配置缓存到磁盘，保证离线时也能以上次的配置快速启动。
+    """
+
+    # 连续失败时轮询间隔的最大放大倍数
+    MAX_BACKOFF_FACTOR = 10
+
+    def __init__(self, config, profiler_manager):
+        self.config = config
+        self.profiler_manager = profiler_manager
+        self.endpoint = f"{config.api_endpoint}/v1/performance/config"
+        self.cache_path = config.config_cache_path or os.path.join(
+            tempfile.gettempdir(), f"performance_monitor_{config.project_key}.json"
+        )
+        self.version: Optional[str] = None
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "X-Project-Key": config.project_key,
+            "User-Agent": f"performance-monitor-sdk/{config.sdk_version}"
+        })
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._failures = 0
+
+    def start(self):
+        """加载本地缓存配置并启动后台轮询线程"""
+        self.load_cached()
+
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._poll_loop,
+            daemon=True,
+            name="performance-config-sync"
+        )
+        self._thread.start()
+        logger.debug("远程配置同步线程已启动")
+
+    def stop(self):
+        """停止轮询"""
+        self._stop_event.set()
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+    def load_cached(self) -> bool:
+        """从磁盘加载上次缓存的配置"""
+        try:
+            if not os.path.exists(self.cache_path):
+                return False
+
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+
+            if cached.get("project_key") != self.config.project_key:
+                return False
+
+            self._apply(cached)
+            logger.info(f"已加载缓存的远程配置: version={self.version}")
+            return True
+
+        except Exception as e:
+            logger.warning(f"加载缓存的远程配置失败: {str(e)}")
+            return False
+
+    def poll_once(self) -> bool:
+        """拉取一次远程配置
+
+        Returns:
+            请求是否成功（配置未变化同样视为成功）
+        """
+        headers = {}
+        if self.version:
+            headers["If-None-Match"] = f'"{self.version}"'
+
+        try:
+            response = self.session.get(
+                self.endpoint,
+                headers=headers,
+                timeout=self.config.request_timeout
+            )
+
+            if response.status_code == 304:
+                return True
+
+            if response.status_code != 200:
+                logger.warning(f"拉取远程配置失败: HTTP {response.status_code}")
+                return False
+
+            result = response.json()
+            if result.get("code") != 0:
+                logger.warning(f"拉取远程配置失败: {result.get('msg')}")
+                return False
+
+            payload = result.get("data") or {}
+            if payload.get("version") != self.version:
+                self._apply(payload)
+                self._save_cache(payload)
+                logger.info(f"远程配置已更新: version={self.version}")
+
+            return True
+
+        except Exception as e:
+            logger.warning(f"拉取远程配置异常: {str(e)}")
+            return False
+
+    def _poll_loop(self):
+        """轮询循环，连续失败时指数退避"""
+        while not self._stop_event.is_set():
+            if self.poll_once():
+                self._failures = 0
+            else:
+                self._failures += 1
+
+            backoff = min(2 ** self._failures, self.MAX_BACKOFF_FACTOR) if self._failures else 1
+            self._stop_event.wait(self.config.config_poll_interval * backoff)
+
+    def _apply(self, payload: Dict[str, Any]):
+        """应用远程配置中与当前值不同的配置项"""
+        remote_config = payload.get("config") or {}
+        changes = {}
+        for key in REMOTE_CONFIG_FIELDS:
+            value = remote_config.get(key)
+            # None表示后端未管理该配置项，沿用本地配置
+            if value is None:
+                continue
+            if getattr(self.config, key, None) != value:
+                changes[key] = value
+
+        if changes:
+            self.profiler_manager.update_config(**changes)
+
+        self.version = payload.get("version")
+
+    def _save_cache(self, payload: Dict[str, Any]):
+        """原子写入磁盘缓存"""
+        try:
+            cache_dir = os.path.dirname(self.cache_path) or "."
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".performance_monitor_")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            logger.warning(f"缓存远程配置失败: {str(e)}")
@@ -1,19 +1,28 @@
 """
 性能分析器管理模块
 """
-import threading
 import time
+import atexit
 import random
+from contextvars import ContextVar
 from typing import Dict, Any, Optional, Callable
 from contextlib import contextmanager
 import logging
 
 from .collector import PerformanceCollector
 from .sender import DataSender
+from .sampler import AdaptiveSampler
+from .config_sync import ConfigSync
+from .aggregator import ProfileAggregator
 from ..utils.config import Config
+from ..utils.routes import route_template
 
 logger = logging.getLogger(__name__)
 
+# 当前请求的收集器和采样信息：同步框架中每个线程独立，ASGI应用中每个请求任务的上下文独立
+_current_collector: ContextVar[Optional[PerformanceCollector]] = ContextVar("performance_collector", default=None)
+_current_sampling_info: ContextVar[Optional[Dict[str, Any]]] = ContextVar("performance_sampling_info", default=None)
+
 
 class ProfilerManager:
     """性能分析器管理器"""
@@ -21,28 +30,42 @@ class ProfilerManager:
     def __init__(self, config: Config):
         self.config = config
         self.data_sender = DataSender(config)
-        self._local = threading.local()
         self._enabled = config.enabled
+        self.sampler: Optional[AdaptiveSampler] = AdaptiveSampler(config) if config.adaptive_sampling else None
+        
+        # 进程内聚合：按窗口上报合并后的调用栈表，而非逐请求上报
+        self.aggregator: Optional[ProfileAggregator] = None
+        if config.aggregation_mode:
+            self.aggregator = ProfileAggregator(config)
+            self.aggregator.start(self._ship_aggregates)
+        
+        # 远程配置同步（启动时先应用磁盘缓存的配置）
+        self.config_sync: Optional[ConfigSync] = None
+        if config.remote_config:
+            self.config_sync = ConfigSync(config, self)
+            self.config_sync.start()
+        
+        # 进程退出时上报最后一个窗口的聚合数据并停止配置轮询
+        self._shutdown = False
+        if self.aggregator or self.config_sync:
+            atexit.register(self.shutdown)
         
     @property
     def collector(self) -> Optional[PerformanceCollector]:
-        """获取当前线程的收集器"""
-        return getattr(self._local, 'collector', None)
+        """获取当前请求的收集器"""
+        return _current_collector.get()
     
     @collector.setter
     def collector(self, value: Optional[PerformanceCollector]):
-        """设置当前线程的收集器"""
-        self._local.collector = value
+        """设置当前请求的收集器"""
+        _current_collector.set(value)
     
     def should_profile(self, request_context: Dict[str, Any]) -> bool:
         """判断是否应该进行性能分析"""
+        _current_sampling_info.set(None)
         if not self._enabled:
             return False
         
-        # 检查采样率
-        if random.random() > self.config.sampling_rate:
-            return False
-        
         # 检查排除路径
         path = request_context.get("path", "")
         if self._is_excluded_path(path):
@@ -52,20 +75,45 @@ class ProfilerManager:
         if self.config.include_patterns and not self._matches_include_patterns(path):
             return False
         
+        # 检查采样率（框架在采样前未能确定路由时按路径推断的路由模板统计）
+        if self.sampler:
+            route = f"{request_context.get('method', 'GET')} {request_context.get('route') or route_template(path)}"
+            sampling_info = self.sampler.decide(route)
+            if not sampling_info:
+                return False
+        else:
+            if random.random() > self.config.sampling_rate:
+                return False
+            sampling_info = {
+                "mode": "fixed",
+                "sampling_rate": self.config.sampling_rate,
+                "forced": False
+            }
+        
+        _current_sampling_info.set(sampling_info)
         return True
     
-    def start_profiling(self, request_context: Dict[str, Any]) -> Optional[str]:
-        """开始性能分析"""
+    def start_profiling(self, request_context: Dict[str, Any], async_mode: str = 'disabled') -> Optional[str]:
+        """开始性能分析
+
+        Args:
+            request_context: 请求上下文
+            async_mode: pyinstrument异步模式，ASGI应用传 'enabled' 以区分并发请求的调用栈
+        """
         try:
             if not self.should_profile(request_context):
                 return None
             
+            cpu_start = time.thread_time()
+            
             # 创建收集器
-            collector = PerformanceCollector(self.config.to_dict())
+            collector = PerformanceCollector(self.config.to_dict(), async_mode=async_mode)
+            collector.sampling_info = _current_sampling_info.get()
             trace_id = collector.start_profiling(request_context)
             
-            # 保存到线程本地存储
+            # 保存到当前请求的上下文
             self.collector = collector
+            self._record_profiling_cost(time.thread_time() - cpu_start)
             
             return trace_id
             
@@ -80,11 +128,19 @@ class ProfilerManager:
             if not collector:
                 return False
             
-            # 收集性能数据
+            cpu_start = time.thread_time()
+            
+            # 收集性能数据（采样开销发生在请求执行期间，按采样次数估算后一并计入）
             performance_data = collector.stop_profiling(response_context)
+            self._record_profiling_cost(time.thread_time() - cpu_start + collector.sampling_cost)
             if not performance_data:
                 return False
             
+            # 聚合模式下合并到当前窗口，由聚合线程按窗口上报
+            if self.aggregator:
+                self.aggregator.add(performance_data)
+                return True
+            
             # 异步发送数据
             if self.config.async_send:
                 self.data_sender.send_async(performance_data)
@@ -97,7 +153,7 @@ class ProfilerManager:
             logger.error(f"停止性能分析失败: {str(e)}")
             return False
         finally:
-            # 清理线程本地存储
+            # 清理当前请求的上下文
             self.collector = None
     
     @contextmanager
@@ -111,6 +167,28 @@ class ProfilerManager:
             if trace_id:
                 self.stop_profiling(response_context)
     
+    def shutdown(self):
+        """关闭分析器：上报未满窗口的聚合数据并停止后台线程（可重复调用）"""
+        if self._shutdown:
+            return
+        self._shutdown = True
+        
+        if self.aggregator:
+            self.aggregator.stop()
+        if self.config_sync:
+            self.config_sync.stop()
+    
+    def _ship_aggregates(self, aggregates, exemplars):
+        """上报一个窗口的聚合数据及样例链路"""
+        self.data_sender.send_aggregates(aggregates)
+        if exemplars:
+            self.data_sender.send_batch(exemplars)
+    
+    def _record_profiling_cost(self, cpu_seconds: float):
+        """向自适应采样器反馈性能分析消耗的CPU时间"""
+        if self.sampler:
+            self.sampler.record_cost(cpu_seconds)
+    
     def _is_excluded_path(self, path: str) -> bool:
         """检查路径是否被排除"""
         for pattern in self.config.exclude_patterns:
@@ -149,6 +227,18 @@ class ProfilerManager:
             if hasattr(self.config, key):
                 setattr(self.config, key, value)
         
+        if "enabled" in kwargs:
+            self._enabled = bool(self.config.enabled)
+        
+        # 同步自适应采样器状态
+        if self.config.adaptive_sampling:
+            if self.sampler is None:
+                self.sampler = AdaptiveSampler(self.config)
+            elif "sampling_rate" in kwargs:
+                self.sampler.reset(self.config.sampling_rate)
+        else:
+            self.sampler = None
+        
         logger.info(f"配置已更新: {kwargs}")
 
 
@@ -164,5 +254,7 @@ def get_profiler_manager() -> Optional[ProfilerManager]:
 def init_profiler_manager(config: Config) -> ProfilerManager:
     """初始化全局分析器管理器"""
     global _profiler_manager
+    if _profiler_manager is not None:
+        _profiler_manager.shutdown()
     _profiler_manager = ProfilerManager(config)
     return _profiler_manager
\ No newline at end of file
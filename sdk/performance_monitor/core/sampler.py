@@ -0,0 +1,144 @@
+"""
+自适应采样控制模块
+"""
+import time
+import random
+import threading
+from typing import Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveSampler:
+    """自适应采样器
+
+    以固定的性能分析开销预算为目标（每秒分析次数上限、分析CPU占比上限），
+    按调整周期统计请求量与分析开销，通过反馈回路平滑调整采样率，
+    并保证每个路由在覆盖周期内至少被采样一次。
+    """
+
+    # 路由覆盖表的最大条目数，防止高基数路径导致内存膨胀
+    MAX_TRACKED_ROUTES = 10000
+
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._rate = self._clamp(config.sampling_rate)
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._window_profiles = 0
+        self._window_cost = 0.0
+        self._route_last_sampled: Dict[str, float] = {}
+
+    @property
+    def rate(self) -> float:
+        """当前生效的采样率"""
+        return self._rate
+
+    def decide(self, route: str) -> Optional[Dict[str, Any]]:
+        """判断当前请求是否采样
+
+        Returns:
+            采样时返回采样信息（生效采样率、采样模式、是否为覆盖补采），否则返回None
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._maybe_adjust(now)
+            self._window_requests += 1
+
+            rate = self._rate
+            forced = False
+            sampled = random.random() < rate
+
+            if not sampled and self.config.route_coverage_interval > 0:
+                last_sampled = self._route_last_sampled.get(route)
+                if last_sampled is None or now - last_sampled >= self.config.route_coverage_interval:
+                    sampled = True
+                    forced = True
+
+            if not sampled:
+                return None
+
+            if len(self._route_last_sampled) >= self.MAX_TRACKED_ROUTES and route not in self._route_last_sampled:
+                self._route_last_sampled.clear()
+            self._route_last_sampled[route] = now
+            self._window_profiles += 1
+
+        # 覆盖补采的请求必定被采样，按采样率1.0上报，避免还原请求量时按 1/rate 放大
+        return {
+            "mode": "adaptive",
+            "sampling_rate": 1.0 if forced else rate,
+            "forced": forced
+        }
+
+    def record_cost(self, cpu_seconds: float):
+        """记录一次性能分析消耗的CPU时间（秒）"""
+        if cpu_seconds <= 0:
+            return
+        with self._lock:
+            self._window_cost += cpu_seconds
+
+    def reset(self, sampling_rate: Optional[float] = None):
+        """重置采样器状态（配置变更时调用）"""
+        with self._lock:
+            if sampling_rate is not None:
+                self._rate = self._clamp(sampling_rate)
+            self._start_window(time.monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取采样器状态"""
+        with self._lock:
+            return {
+                "sampling_rate": self._rate,
+                "window_requests": self._window_requests,
+                "window_profiles": self._window_profiles,
+                "window_cost": self._window_cost,
+                "tracked_routes": len(self._route_last_sampled)
+            }
+
+    def _maybe_adjust(self, now: float):
+        """调整周期结束时根据预算重新计算采样率（调用方持有锁）"""
+        elapsed = now - self._window_start
+        if elapsed < self.config.sampling_adjust_interval:
+            return
+
+        if self._window_requests > 0:
+            target = self._target_rate(elapsed)
+            smoothing = self.config.sampling_smoothing
+            new_rate = self._clamp(self._rate + smoothing * (target - self._rate))
+            if abs(new_rate - self._rate) > 1e-6:
+                logger.debug(f"自适应采样率调整: {self._rate:.4f} -> {new_rate:.4f}")
+            self._rate = new_rate
+
+        self._start_window(now)
+
+    def _target_rate(self, elapsed: float) -> float:
+        """根据上一周期的请求量和分析开销计算满足预算的目标采样率"""
+        requests_per_second = self._window_requests / elapsed
+        targets = []
+
+        # 每秒分析次数预算
+        if self.config.max_profiles_per_second > 0:
+            targets.append(self.config.max_profiles_per_second / requests_per_second)
+
+        # 分析CPU占比预算（按单核墙钟时间计算）
+        if self.config.max_profiling_cpu_percent > 0 and self._window_profiles > 0 and self._window_cost > 0:
+            cost_per_profile = self._window_cost / self._window_profiles
+            allowed_profiles_per_second = (self.config.max_profiling_cpu_percent / 100.0) / cost_per_profile
+            targets.append(allowed_profiles_per_second / requests_per_second)
+
+        if not targets:
+            return self.config.sampling_rate
+        return min(targets)
+
+    def _start_window(self, now: float):
+        """开始新的统计周期"""
+        self._window_start = now
+        self._window_requests = 0
+        self._window_profiles = 0
+        self._window_cost = 0.0
+
+    def _clamp(self, rate: float) -> float:
+        """将采样率限制在配置的上下限之间"""
+        return max(self.config.min_sampling_rate, min(self.config.max_sampling_rate, rate))
@@ -111,6 +111,37 @@ class DataSender:
             logger.error(f"批量发送异常: {str(e)}")
             return False
     
+    def send_aggregates(self, aggregates: List[Dict[str, Any]]) -> bool:
+        """发送一个窗口的聚合数据（带重试）"""
+        if not aggregates:
+            return True
+        
+        endpoint = f"{self.config.api_endpoint}/v1/performance/aggregates"
+        payload = {"aggregates": aggregates}
+        
+        for attempt in range(self.config.retry_times + 1):
+            try:
+                response = self.session.post(
+                    endpoint,
+                    json=payload,
+                    timeout=self.config.request_timeout * 2
+                )
+                
+                if response.status_code == 200 and response.json().get("code") == 0:
+                    logger.debug(f"聚合数据发送成功: {len(aggregates)} 个路由")
+                    return True
+                
+                logger.error(f"聚合数据发送失败: HTTP {response.status_code}")
+                
+            except Exception as e:
+                logger.error(f"聚合数据发送异常: {str(e)}")
+            
+            if attempt < self.config.retry_times:
+                time.sleep(self.config.retry_delay * (2 ** attempt))
+        
+        logger.error(f"聚合数据发送最终失败，丢弃 {len(aggregates)} 个路由的聚合数据")
+        return False
+    
     def _start_batch_processor(self):
         """启动批量处理线程"""
         if self._batch_thread and self._batch_thread.is_alive():
@@ -1,13 +1,105 @@
 """
 Django应用性能监控支持
 """
+from typing import Dict, Any, Optional
+import logging
+
+from ..core.profiler import init_profiler_manager
+from ..utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _format_route(match) -> Optional[str]:
+    route = getattr(match, "route", None) if match else None
+    if not route:
+        return None
+    return "/" + route.lstrip("^").rstrip("$").lstrip("/")
+
+
+def route_template(request) -> Optional[str]:
+    """请求匹配的路由模板，如 /users/<int:pk>/（re_path 路由为去掉首尾锚点的正则，由服务端统一转换）"""
+    return _format_route(getattr(request, "resolver_match", None))
+
+
+def resolve_route(request) -> Optional[str]:
+    """视图解析前按URL配置匹配路由模板（供采样按路由决策），未匹配返回None"""
+    try:
+        from django.urls import resolve
+        return _format_route(resolve(request.path_info, getattr(request, "urlconf", None)))
+    except Exception:
+        return None
+
 
 class PerformanceMiddleware:
-    """Django性能监控中间件（占位符）"""
-    
+    """Django性能监控中间件
+
+    配置读取 settings.PERFORMANCE_MONITOR，未配置时从环境变量读取。
+    采样前按URL配置预先解析路由，请求结束时以 resolver_match.route 作为路由模板。
+    """
+
     def __init__(self, get_response=None, **kwargs):
         self.get_response = get_response
-        
+        self.config = self._load_config(kwargs)
+        self.config.validate()
+        self.profiler_manager = init_profiler_manager(self.config)
+        logger.info(f"Django性能监控中间件已初始化: {self.config}")
+
     def __call__(self, request):
-        response = self.get_response(request)
-        return response
\ No newline at end of file
+        trace_id = None
+        try:
+            trace_id = self.profiler_manager.start_profiling(self._build_request_context(request))
+        except Exception as e:
+            logger.error(f"Django 请求开始处理失败: {str(e)}")
+
+        try:
+            response = self.get_response(request)
+        except Exception:
+            if trace_id:
+                self.profiler_manager.stop_profiling({"status_code": 500, "route": route_template(request)})
+            raise
+
+        if trace_id:
+            try:
+                self.profiler_manager.stop_profiling(self._build_response_context(request, response))
+            except Exception as e:
+                logger.error(f"Django 请求结束处理失败: {str(e)}")
+        return response
+
+    @staticmethod
+    def _load_config(kwargs: Dict[str, Any]) -> Config:
+        if kwargs:
+            return Config.from_dict(kwargs)
+        try:
+            from django.conf import settings
+            config_dict = getattr(settings, "PERFORMANCE_MONITOR", None)
+        except Exception:
+            config_dict = None
+        return Config.from_dict(config_dict) if config_dict else Config.from_env()
+
+    def _build_request_context(self, request) -> Dict[str, Any]:
+        """构建请求上下文"""
+        try:
+            return {
+                "method": request.method,
+                "path": request.path,
+                "route": resolve_route(request),
+                "query_params": request.GET.dict(),
+                "headers": dict(request.headers),
+                "remote_ip": request.META.get("REMOTE_ADDR"),
+                "content_length": int(request.META.get("CONTENT_LENGTH") or 0),
+                "content_type": request.content_type
+            }
+        except Exception as e:
+            logger.error(f"构建请求上下文失败: {str(e)}")
+            return {}
+
+    def _build_response_context(self, request, response) -> Dict[str, Any]:
+        """构建响应上下文"""
+        content = getattr(response, "content", b"") if not getattr(response, "streaming", False) else b""
+        return {
+            "status_code": response.status_code,
+            "response_size": len(content),
+            "content_type": response.get("Content-Type"),
+            "route": route_template(request)
+        }
@@ -1,9 +1,114 @@
 """
 FastAPI应用性能监控支持
 """
+from typing import Dict, Any, Optional
+import logging
+
+from ..core.profiler import init_profiler_manager
+from ..utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def route_template(scope: Dict[str, Any]) -> Optional[str]:
+    """请求匹配的路由模板，如 /users/{user_id}
+
+    FastAPI 路由匹配后在 scope["route"] 中保存路由对象；Starlette 路由只保存 endpoint，
+    在应用的顶层路由中按 endpoint 查找。
+    """
+    route = scope.get("route")
+    if route is None and scope.get("endpoint") is not None:
+        app = scope.get("app")
+        for candidate in getattr(getattr(app, "router", None), "routes", []):
+            if getattr(candidate, "endpoint", None) is scope["endpoint"]:
+                route = candidate
+                break
+    if route is None:
+        return None
+    return getattr(route, "path_format", None) or getattr(route, "path", None)
+
+
+def match_route(app, scope: Dict[str, Any]) -> Optional[str]:
+    """请求进入路由之前，按应用的顶层路由表匹配路由模板（供采样按路由决策），未匹配返回None"""
+    routes = getattr(getattr(app, "router", None), "routes", None)
+    if not routes:
+        return None
+    try:
+        from starlette.routing import Match
+        for route in routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path_format", None) or getattr(route, "path", None)
+    except Exception as e:
+        logger.debug(f"匹配路由失败: {str(e)}")
+    return None
+
 
 class PerformanceMiddleware:
-    """FastAPI性能监控中间件（占位符）"""
-    
-    def __init__(self, app=None, **kwargs):
-        self.app = app
\ No newline at end of file
+    """FastAPI/Starlette（ASGI）性能监控中间件
+
+    以pyinstrument的异步模式分析请求：每个请求在独立的任务上下文中记录调用栈，
+    并发请求可以同时采样且调用栈互不混入。
+    """
+
+    def __init__(self, app=None, config: Optional[Dict[str, Any]] = None, **kwargs):
+        self.app = app
+        if isinstance(config, Config):
+            self.config = config
+        else:
+            self.config = Config.from_dict(config or kwargs) if (config or kwargs) else Config.from_env()
+        self.config.validate()
+        self.profiler_manager = init_profiler_manager(self.config)
+        logger.info(f"FastAPI性能监控中间件已初始化: {self.config}")
+
+    async def __call__(self, scope, receive, send):
+        if scope.get("type") != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = self.profiler_manager.start_profiling(self._build_request_context(scope), async_mode="enabled")
+        if not trace_id:
+            await self.app(scope, receive, send)
+            return
+
+        response_context: Dict[str, Any] = {"status_code": 500, "response_size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response_context["status_code"] = message["status"]
+                headers = dict(message.get("headers") or [])
+                content_type = headers.get(b"content-type")
+                response_context["content_type"] = content_type.decode("latin-1") if content_type else None
+            elif message["type"] == "http.response.body":
+                response_context["response_size"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            response_context["route"] = route_template(scope)
+            self.profiler_manager.stop_profiling(response_context)
+
+    def _build_request_context(self, scope: Dict[str, Any]) -> Dict[str, Any]:
+        """构建请求上下文"""
+        try:
+            from urllib.parse import parse_qsl
+            headers = {
+                key.decode("latin-1").title(): value.decode("latin-1")
+                for key, value in scope.get("headers") or []
+            }
+            client = scope.get("client")
+            return {
+                "method": scope.get("method", "GET"),
+                "path": scope.get("path", "/"),
+                # 中间件位于路由之前，按路由表预先匹配；应用内注册时 scope["app"] 为应用本身
+                "route": match_route(scope.get("app") or self.app, scope),
+                "query_params": dict(parse_qsl((scope.get("query_string") or b"").decode("latin-1"))),
+                "headers": headers,
+                "remote_ip": client[0] if client else None,
+                "content_length": int(headers.get("Content-Length") or 0),
+                "content_type": headers.get("Content-Type")
+            }
+        except Exception as e:
+            logger.error(f"构建请求上下文失败: {str(e)}")
+            return {}
@@ -100,6 +100,8 @@ class PerformanceMiddleware:
             return {
                 "method": request.method,
                 "path": request.path,
+                # 请求钩子执行前已完成路由匹配
+                "route": request.url_rule.rule if request.url_rule else None,
                 "query_params": dict(request.args),
                 "headers": dict(request.headers),
                 "remote_ip": request.remote_addr,
@@ -24,6 +24,27 @@ class Config:
     sampling_rate: float = 0.3
     async_send: bool = True
     
+    # 自适应采样配置
+    adaptive_sampling: bool = False
+    min_sampling_rate: float = 0.001
+    max_sampling_rate: float = 1.0
+    max_profiles_per_second: float = 10.0
+    max_profiling_cpu_percent: float = 0.0  # 0表示不限制
+    sampling_adjust_interval: float = 5.0
+    sampling_smoothing: float = 0.5
+    route_coverage_interval: float = 60.0  # 每个路由的最小采样间隔，0表示不保证覆盖
+    
+    # 远程配置同步
+    remote_config: bool = False
+    config_poll_interval: float = 30.0
+    config_cache_path: Optional[str] = None
+    
+    # 进程内聚合配置
+    aggregation_mode: bool = False
+    aggregation_window: float = 60.0
+    aggregation_exemplars: int = 2
+    aggregation_max_stacks: int = 500
+    
     # 过滤配置
     exclude_patterns: List[str] = field(default_factory=lambda: [
         "/health", "/metrics", "/static/*", "*.css", "*.js", "*.ico"
@@ -63,7 +84,13 @@ class Config:
         # 获取有效字段（替代使用__dataclasses_fields__）
         valid_fields = {
             "project_key", "api_endpoint", "enabled", "sampling_rate", 
-            "async_send", "exclude_patterns", "include_patterns", "batch_size",
+            "async_send", "adaptive_sampling", "min_sampling_rate",
+            "max_sampling_rate", "max_profiles_per_second",
+            "max_profiling_cpu_percent", "sampling_adjust_interval",
+            "sampling_smoothing", "route_coverage_interval", "remote_config",
+            "config_poll_interval", "config_cache_path", "aggregation_mode",
+            "aggregation_window", "aggregation_exemplars", "aggregation_max_stacks",
+            "exclude_patterns", "include_patterns", "batch_size",
             "batch_timeout", "request_timeout", "retry_times", "retry_delay",
             "track_sql", "track_cache", "track_memory", "track_templates",
             "max_request_size", "max_response_size", "sdk_version",
@@ -118,6 +145,21 @@ class Config:
             "enabled": (f"{prefix}ENABLED", bool),
             "sampling_rate": (f"{prefix}SAMPLING_RATE", float),
             "async_send": (f"{prefix}ASYNC_SEND", bool),
+            "adaptive_sampling": (f"{prefix}ADAPTIVE_SAMPLING", bool),
+            "min_sampling_rate": (f"{prefix}MIN_SAMPLING_RATE", float),
+            "max_sampling_rate": (f"{prefix}MAX_SAMPLING_RATE", float),
+            "max_profiles_per_second": (f"{prefix}MAX_PROFILES_PER_SECOND", float),
+            "max_profiling_cpu_percent": (f"{prefix}MAX_PROFILING_CPU_PERCENT", float),
+            "sampling_adjust_interval": (f"{prefix}SAMPLING_ADJUST_INTERVAL", float),
+            "sampling_smoothing": (f"{prefix}SAMPLING_SMOOTHING", float),
+            "route_coverage_interval": (f"{prefix}ROUTE_COVERAGE_INTERVAL", float),
+            "remote_config": (f"{prefix}REMOTE_CONFIG", bool),
+            "config_poll_interval": (f"{prefix}CONFIG_POLL_INTERVAL", float),
+            "config_cache_path": (f"{prefix}CONFIG_CACHE_PATH", str),
+            "aggregation_mode": (f"{prefix}AGGREGATION_MODE", bool),
+            "aggregation_window": (f"{prefix}AGGREGATION_WINDOW", float),
+            "aggregation_exemplars": (f"{prefix}AGGREGATION_EXEMPLARS", int),
+            "aggregation_max_stacks": (f"{prefix}AGGREGATION_MAX_STACKS", int),
             "batch_size": (f"{prefix}BATCH_SIZE", int),
             "batch_timeout": (f"{prefix}BATCH_TIMEOUT", float),
             "request_timeout": (f"{prefix}REQUEST_TIMEOUT", int),
@@ -164,6 +206,21 @@ class Config:
             "enabled": self.enabled,
             "sampling_rate": self.sampling_rate,
             "async_send": self.async_send,
+            "adaptive_sampling": self.adaptive_sampling,
+            "min_sampling_rate": self.min_sampling_rate,
+            "max_sampling_rate": self.max_sampling_rate,
+            "max_profiles_per_second": self.max_profiles_per_second,
+            "max_profiling_cpu_percent": self.max_profiling_cpu_percent,
+            "sampling_adjust_interval": self.sampling_adjust_interval,
+            "sampling_smoothing": self.sampling_smoothing,
+            "route_coverage_interval": self.route_coverage_interval,
+            "remote_config": self.remote_config,
+            "config_poll_interval": self.config_poll_interval,
+            "config_cache_path": self.config_cache_path,
+            "aggregation_mode": self.aggregation_mode,
+            "aggregation_window": self.aggregation_window,
+            "aggregation_exemplars": self.aggregation_exemplars,
+            "aggregation_max_stacks": self.aggregation_max_stacks,
             "exclude_patterns": self.exclude_patterns,
             "include_patterns": self.include_patterns,
             "batch_size": self.batch_size,
@@ -199,6 +256,27 @@ class Config:
             if not 0 <= self.sampling_rate <= 1:
                 raise ValueError("采样率必须在0-1之间")
             
+            if not 0 <= self.min_sampling_rate <= self.max_sampling_rate <= 1:
+                raise ValueError("自适应采样率上下限必须满足 0 <= min <= max <= 1")
+            
+            if self.max_profiles_per_second < 0 or self.max_profiling_cpu_percent < 0:
+                raise ValueError("性能分析开销预算不能为负数")
+            
+            if self.sampling_adjust_interval <= 0:
+                raise ValueError("采样率调整周期必须大于0")
+            
+            if not 0 < self.sampling_smoothing <= 1:
+                raise ValueError("采样率平滑系数必须在0-1之间")
+            
+            if self.config_poll_interval <= 0:
+                raise ValueError("配置轮询间隔必须大于0")
+            
+            if self.aggregation_window <= 0:
+                raise ValueError("聚合窗口必须大于0")
+            
+            if self.aggregation_exemplars < 0 or self.aggregation_max_stacks <= 0:
+                raise ValueError("聚合样例数不能为负数，调用栈上限必须大于0")
+            
             if self.batch_size <= 0:
                 raise ValueError("批量大小必须大于0")
             
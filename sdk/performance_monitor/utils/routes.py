@@ -0,0 +1,32 @@
+"""
+请求路径的路由模板推断（与服务端 app/utils/routes.py 的规则一致）
+"""
+import re
+
+# 路径段中的动态参数，按顺序匹配，替换为占位符
+SEGMENT_PATTERNS = [
+    (re.compile(r"^\d+$"), "{id}"),
+    (re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"), "{uuid}"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "{date}"),
+    (re.compile(r"^[0-9a-f]{16,}$"), "{hash}"),
+    # 较长且包含数字的字母数字串（令牌、短链接等）
+    (re.compile(r"^(?=.*\d)[0-9a-z_\-]{20,}$"), "{token}"),
+]
+
+
+def normalize_path(path: str) -> str:
+    """规范化路径：去掉查询字符串、转小写、合并重复斜杠、去掉末尾斜杠"""
+    path = (path or "/").split("?", 1)[0].split("#", 1)[0].strip().lower()
+    return "/" + "/".join(segment for segment in path.split("/") if segment)
+
+
+def route_template(path: str) -> str:
+    """框架未提供路由模板时由路径推断，如 /users/123 -> /users/{id}"""
+    segments = []
+    for segment in normalize_path(path).split("/")[1:]:
+        for pattern, placeholder in SEGMENT_PATTERNS:
+            if pattern.match(segment):
+                segment = placeholder
+                break
+        segments.append(segment)
+    return "/" + "/".join(segments)